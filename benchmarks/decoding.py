@@ -0,0 +1,159 @@
+# Copyright 2018 Politecnico di Torino
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Benchmarks the decoding of the DARE messages, comparing the per-message sniffing path with the fast-path decoder.
+
+Usage: python benchmarks/decoding.py [--repeat N] [CSV file...]
+
+@author: Daniele Canavese
+"""
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+import argparse
+import logging
+import glob
+import re
+import time
+from csv import Sniffer
+from csv import reader
+from cybertop.cybertop import CyberTop
+from cybertop.decoding import DAREMessage
+from cybertop.decoding import MessageDecoder
+
+
+def getMessages(fileName, identifier, plugins):
+    """
+    Converts an attack file into the DARE messages announcing it.
+    @param fileName: The attack file name.
+    @param identifier: The attack id.
+    @param plugins: The parser plug-ins.
+    @return: The parser plug-in and the list of message bodies or None if the file cannot be used.
+    """
+    match = re.match("^(Very Low|Very low|very low|Low|low|High|high|Very High|Very high|high)-(.+)?-(\d+)\.csv$",
+                     os.path.basename(fileName))
+    if match is None:
+        return None
+    severity = match.group(1)
+    attackType = match.group(2)
+    plugin = None
+    for i in plugins:
+        if re.match(i.details.get("Core", "FileName"), attackType):
+            plugin = i.plugin_object
+            break
+    if plugin is None:
+        return None
+
+    prefix = "%d,%s,%s," % (identifier, severity, attackType)
+    messages = [(prefix + "start").encode()]
+    with open(fileName, "rt") as f:
+        for line in f:
+            # Only the valid events are kept.
+            try:
+                if plugin.parse(fileName, 2, line) is None:
+                    continue
+            except IOError:
+                continue
+            messages.append((prefix + ",".join(line.rstrip("\r\n").split("\t"))).encode())
+    messages.append((prefix + "stop").encode())
+    return plugin, messages
+
+
+def decodeLegacy(plugin, body):
+    """
+    Decodes and parses a message as done before the fast-path decoder was introduced.
+    @param plugin: The parser plug-in.
+    @param body: The message body.
+    @return: The parsed event or None.
+    """
+    line = body.decode()
+    dialect = Sniffer().sniff(line)
+    fields = []
+    for i in reader([line], dialect):
+        fields += i
+    if len(fields) == 4 and fields[0].isdigit() and re.match("(very\s+)?(low|high)", fields[1], re.IGNORECASE) and fields[3] == "start":
+        return None
+    elif len(fields) == 4 and fields[0].isdigit() and re.match("(very\s+)?(low|high)", fields[1], re.IGNORECASE) and fields[3] == "stop":
+        return None
+    elif len(fields) > 4 and fields[0].isdigit() and re.match("(very\s+)?(low|high)", fields[1], re.IGNORECASE):
+        return plugin.parse(None, 2, "\t".join(fields[3:]))
+    return None
+
+
+def decodeFast(plugin, decoder, body):
+    """
+    Decodes and parses a message with the fast-path decoder.
+    @param plugin: The parser plug-in.
+    @param decoder: The message decoder.
+    @param body: The message body.
+    @return: The parsed event or None.
+    """
+    message = decoder.decode(body)
+    if message is not None and message.kind == DAREMessage.EVENT:
+        return plugin.parse_fields(None, 2, message.fields)
+    return None
+
+
+def run(name, function, workload, repeat):
+    """
+    Runs a decoding function on a workload and prints its throughput.
+    @param name: The benchmark name.
+    @param function: The function decoding a message, it receives the parser plug-in and the message body.
+    @param workload: The list of (plug-in, message body) pairs.
+    @param repeat: The number of times the workload is decoded.
+    @return: The number of messages per second.
+    """
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for plugin, body in workload:
+            function(plugin, body)
+    elapsed = time.perf_counter() - start
+    rate = len(workload) * repeat / elapsed
+    print("%-8s %10d messages %10.3f s %12.1f messages/s" % (name, len(workload) * repeat, elapsed, rate))
+    return rate
+
+
+def main():
+    p = argparse.ArgumentParser(description="Benchmarks the DARE messages decoding.")
+    p.add_argument("--repeat", type=int, default=10, help="number of times the messages are decoded")
+    p.add_argument("files", nargs="*", help="the attack files to use (default: the test attacks)")
+    args = p.parse_args()
+
+    testDirectory = os.path.join(os.path.dirname(__file__), "..", "tests")
+    files = args.files
+    if len(files) == 0:
+        files = sorted(glob.glob(os.path.join(testDirectory, "*-*-*.csv")))
+
+    cyberTop = CyberTop(os.path.join(testDirectory, "cybertop.cfg"), os.path.join(testDirectory, "logging.ini"))
+    # The log would only slow down the measures.
+    logging.disable(logging.CRITICAL)
+    plugins = cyberTop.pluginManager.getPluginsOfCategory("Parser")
+    workload = []
+    for i, fileName in enumerate(files):
+        r = getMessages(fileName, i, plugins)
+        if r is not None:
+            plugin, messages = r
+            workload += [(plugin, body) for body in messages]
+
+    decoder = MessageDecoder()
+    legacy = run("legacy", decodeLegacy, workload, args.repeat)
+    fast = run("fast", lambda plugin, body: decodeFast(plugin, decoder, body), workload, args.repeat)
+    print("speed-up: %.2fx" % (fast / legacy))
+
+
+if __name__ == "__main__":
+    main()
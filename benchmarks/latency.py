@@ -0,0 +1,87 @@
+# Copyright 2018 Politecnico di Torino
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Benchmarks the latency between the stop message of an attack and its remediation, for attacks of increasing length,
+comparing the incremental processing with the processing of the whole event list.
+
+Usage: python benchmarks/latency.py [--sources N] [--events N...]
+
+@author: Daniele Canavese
+"""
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+import argparse
+import logging
+import random
+import time
+from cybertop.cybertop import AttackInfo
+from cybertop.cybertop import CyberTop
+
+
+def getEvents(count, sources):
+    """
+    Creates the fields of some DoS events.
+    @param count: The number of events.
+    @param sources: The number of distinct attackers.
+    @return: The list of event fields.
+    """
+    rng = random.Random(count)
+    events = []
+    for _ in range(count):
+        source = rng.randrange(sources)
+        events.append(["2017-08-09 17:33:00", "2017", "8", "9", "17", "33", "0", "0",
+                       "91.211.%d.%d" % (source // 250, source % 250 + 1), "147.83.110.33",
+                       str(rng.randrange(1024, 65536)), "22", "TCP", "1200", "72000", "0", "0", "1.0E-01"])
+    return events
+
+
+def main():
+    p = argparse.ArgumentParser(description="Benchmarks the stop-to-policy latency.")
+    p.add_argument("--sources", type=int, default=100, help="number of distinct attackers")
+    p.add_argument("--events", type=int, nargs="+", default=[1000, 10000, 50000], help="attack lengths")
+    args = p.parse_args()
+
+    testDirectory = os.path.join(os.path.dirname(__file__), "..", "tests")
+    cyberTop = CyberTop(os.path.join(testDirectory, "cybertop.cfg"), os.path.join(testDirectory, "logging.ini"))
+    # The log would only slow down the measures.
+    logging.disable(logging.CRITICAL)
+    cyberTop.policyCache = None
+    landscapeFileName = os.path.join(testDirectory, "landscape1.xml")
+
+    print("%10s %14s %14s %14s" % ("events", "list stop [s]", "incr. stop [s]", "incr. add [s]"))
+    for count in args.events:
+        events = getEvents(count, args.sources)
+
+        start = time.perf_counter()
+        cyberTop.getMSPLsFromList(1, 3, "DoS", events, landscapeFileName, "DoS")
+        listStop = time.perf_counter() - start
+
+        start = time.perf_counter()
+        attackInfo = AttackInfo(1, "high", "DoS", cyberTop.parser, cyberTop.recipesReasoner, cyberTop.hsplReasoner)
+        for i in events:
+            attackInfo.addEvent(i)
+        add = time.perf_counter() - start
+        start = time.perf_counter()
+        cyberTop.getMSPLsFromAttackInfo(attackInfo, landscapeFileName)
+        incrementalStop = time.perf_counter() - start
+
+        print("%10d %14.3f %14.3f %14.3f" % (count, listStop, incrementalStop, add))
+
+
+if __name__ == "__main__":
+    main()
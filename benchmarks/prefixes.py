@@ -0,0 +1,113 @@
+# Copyright 2018 Politecnico di Torino
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Benchmarks the prefix index used by the HSPL merging, with the same attackers written as IPv4 and as IPv6 addresses:
+the endpoint parsing, the insertion, the inclusion search at the address prefix length and, once per subnet, at the
+subnet prefix length and the removal. The IPv6 attackers have the same 24 free bits of the IPv4 ones, so both
+families should cost about the same.
+The whole merging of a synthetic attack is measured by stages.py, e.g. with --synthetic DoS:1000000:clustered:6.
+
+Usage: python benchmarks/prefixes.py [--addresses N] [--distribution uniform|clustered] [--seed N]
+
+@author: Daniele Canavese
+"""
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+import argparse
+import random
+import time
+from cybertop.endpoint import ADDRESS_BITS
+from cybertop.endpoint import PrefixTrie
+from cybertop.endpoint import formatEndpoint
+from cybertop.endpoint import getEndpoint
+from benchmarks.synthetic import AttackerPool
+
+# The operations, in execution order.
+OPERATIONS = ("parse", "add", "find-address", "find-subnet", "remove")
+# The subnet prefix lengths are this number of bits shorter than the addresses, as a /24 for IPv4.
+SUBNET_BITS = 8
+
+
+def benchmark(addresses, version):
+    """
+    Measures the prefix index operations on a set of addresses.
+    @param addresses: The address texts.
+    @param version: The IP version of the addresses.
+    @return: A dictionary mapping each operation to its time in seconds.
+    """
+    seconds = {}
+    trie = PrefixTrie(version)
+    subnetLength = ADDRESS_BITS[version] - SUBNET_BITS
+
+    start = time.perf_counter()
+    endpoints = [getEndpoint(formatEndpoint(i, 80)) for i in addresses]
+    seconds["parse"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i, endpoint in enumerate(endpoints):
+        trie.add(endpoint, i)
+    seconds["add"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for endpoint in endpoints:
+        trie.find(endpoint.network, endpoint.prefixLength, "*")
+    seconds["find-address"] = time.perf_counter() - start
+
+    # Like the merging passes, each subnet is searched once.
+    start = time.perf_counter()
+    for network in set(i.getNetwork(subnetLength) for i in endpoints):
+        trie.find(network, subnetLength, "*")
+    seconds["find-subnet"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i, endpoint in enumerate(endpoints):
+        trie.remove(endpoint, i)
+    seconds["remove"] = time.perf_counter() - start
+
+    return seconds
+
+
+def main():
+    p = argparse.ArgumentParser(description="Benchmarks the prefix index with IPv4 and IPv6 addresses.")
+    p.add_argument("--addresses", type=int, default=1000000, help="number of distinct addresses")
+    p.add_argument("--distribution", default="clustered", choices=("uniform", "clustered"),
+                   help="address distribution")
+    p.add_argument("--seed", type=int, default=0, help="random seed")
+    args = p.parse_args()
+
+    results = {}
+    for version in (4, 6):
+        pool = AttackerPool(random.Random(args.seed), args.addresses, args.distribution, version=version)
+        # The endpoints are parsed once, as during a remediation.
+        getEndpoint.cache_clear()
+        results[version] = benchmark(pool.addresses, version)
+        del pool
+
+    print("%-14s %12s %12s %12s %12s %8s" % ("operation", "IPv4 [s]", "IPv4 ops/s", "IPv6 [s]", "IPv6 ops/s",
+                                             "IPv6/4"))
+    for i in OPERATIONS:
+        seconds4 = results[4][i]
+        seconds6 = results[6][i]
+        print("%-14s %12.3f %12.0f %12.3f %12.0f %8.2f" % (i, seconds4, args.addresses / max(seconds4, 1e-9),
+                                                           seconds6, args.addresses / max(seconds6, 1e-9),
+                                                           seconds6 / max(seconds4, 1e-9)))
+    print("The ops/s are addresses per second for every operation.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+# Copyright 2018 Politecnico di Torino
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Replays a DARE attack flood against an in-process broker stand-in, measuring the ingestion throughput for several
+batch sizes of the event lines and of the acknowledgments.
+
+Usage: python benchmarks/replay.py [--events N] [--lines N...] [--acks N...]
+
+@author: Daniele Canavese
+"""
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+import argparse
+import logging
+import random
+import time
+from cybertop.cybertop import CyberTop
+from tests.fakebroker import FakeConsumerChannel
+
+
+def deliver(cyberTop, bodies):
+    """
+    Delivers some messages to CyberTop through an in-process stand-in of the DARE broker.
+    @param cyberTop: The CyberTop instance.
+    @param bodies: The message bodies to deliver.
+    @return: The channel, with the acknowledgment frames received.
+    """
+    channel = FakeConsumerChannel()
+    for body in bodies:
+        cyberTop.processMessage(channel, channel.deliver(), None, body)
+    cyberTop.flushAcknowledgments()
+    return channel
+
+
+def getLines(identifier, count, sources):
+    """
+    Creates the DARE message lines of a DoS attack.
+    @param identifier: The attack id.
+    @param count: The number of events.
+    @param sources: The number of distinct attackers.
+    @return: The list of message lines.
+    """
+    rng = random.Random(identifier)
+    prefix = "%d,high,DoS," % identifier
+    lines = [prefix + "start"]
+    for _ in range(count):
+        source = rng.randrange(sources)
+        lines.append(prefix + "2017-08-09 17:33:00,2017,8,9,17,33,0,0,91.211.%d.%d,147.83.110.33,%d,22,TCP,1200,"
+                              "72000,0,0,1.0E-01" % (source // 250, source % 250 + 1, rng.randrange(1024, 65536)))
+    lines.append(prefix + "stop")
+    return lines
+
+
+def main():
+    p = argparse.ArgumentParser(description="Replays a DARE attack flood.")
+    p.add_argument("--events", type=int, default=20000, help="number of attack events")
+    p.add_argument("--sources", type=int, default=100, help="number of distinct attackers")
+    p.add_argument("--lines", type=int, nargs="+", default=[1, 10, 100], help="event lines per message")
+    p.add_argument("--acks", type=int, nargs="+", default=[1, 50], help="messages per acknowledgment")
+    args = p.parse_args()
+
+    testDirectory = os.path.join(os.path.dirname(__file__), "..", "tests")
+    cyberTop = CyberTop(os.path.join(testDirectory, "cybertop.cfg"), os.path.join(testDirectory, "logging.ini"))
+    # The log would only slow down the measures.
+    logging.disable(logging.CRITICAL)
+    cyberTop.configParser.set("global", "landscapeFile", os.path.join(testDirectory, "landscape1.xml"))
+    cyberTop.configParser.remove_option("global", "hsplsFile")
+    cyberTop.configParser.remove_option("global", "msplsFile")
+    cyberTop.send = lambda hsplSet, msplSet: None
+
+    print("%8s %8s %10s %10s %10s %14s" % ("lines", "acks", "messages", "frames", "time [s]", "events/s"))
+    for lines in args.lines:
+        for acks in args.acks:
+            attackLines = getLines(1, args.events, args.sources)
+            bodies = ["\n".join(attackLines[i:i + lines]).encode() for i in range(0, len(attackLines), lines)]
+            cyberTop.ackBatchSize = acks
+            cyberTop.ackBatcher = None
+
+            start = time.perf_counter()
+            channel = deliver(cyberTop, bodies)
+            elapsed = time.perf_counter() - start
+            assert len(channel.acks) == len(bodies)
+            print("%8d %8d %10d %10d %10.3f %14.1f" % (lines, acks, len(bodies), len(channel.frames), elapsed,
+                                                       args.events / elapsed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+# Copyright 2018 Politecnico di Torino
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Benchmarks each stage of the remediation of the bundled attack files: parsing, recipe selection, HSPL building, each
+HSPL merging pass, MSPL building and serialization. The wall time, the events per second and the peak memory of each
+stage can be saved as a baseline, which the later runs are compared against.
+
+Usage: python benchmarks/stages.py [--repeat N] [--save FILE] [--baseline FILE [--tolerance R]]
+                                   [--synthetic TYPE:EVENTS:DISTRIBUTION[:VERSION]...] [CSV file...]
+
+@author: Daniele Canavese
+"""
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+import argparse
+import glob
+import json
+import logging
+import platform
+import shutil
+import tempfile
+import time
+import tracemalloc
+from configparser import ConfigParser
+from lxml import etree
+from cybertop.reasoning import getReasoners
+from cybertop.metrics import METRICS
+from benchmarks.synthetic import getAttackFileName
+from benchmarks.synthetic import writeAttack
+
+# The stages, in execution order.
+STAGES = ("parse", "recipes", "hspl", "merge-inclusions", "merge-anyPorts", "merge-subnets", "mspl", "serialize")
+# The merging stages, accounted by the HSPL reasoner.
+MERGE_STAGES = ("merge-inclusions", "merge-anyPorts", "merge-subnets")
+
+
+def getMergeSeconds():
+    """
+    Retrieves the time spent in each HSPL merging pass.
+    @return: A dictionary mapping the merging stages to their total times in seconds.
+    """
+    seconds = dict((i, 0.0) for i in MERGE_STAGES)
+    for (name, labels), histogram in METRICS.getHistograms().items():
+        stage = dict(labels).get("stage")
+        if name == "cybertop_stage_seconds" and stage in seconds:
+            seconds[stage] += histogram.sum
+    return seconds
+
+
+def runStages(reasoners, fileName, landscape, stageCallback):
+    """
+    Remediates an attack file one stage at a time.
+    @param reasoners: The parser, the recipes reasoner, the HSPL reasoner and the MSPL reasoner.
+    @param fileName: The attack file name.
+    @param landscape: The landscape.
+    @param stageCallback: The function called with the stage name at the end of each stage.
+    @return: The number of events.
+    """
+    parser, recipesReasoner, hsplReasoner, msplReasoner = reasoners
+    attack = parser.getAttackFromFile(fileName)
+    stageCallback("parse")
+    recipes = recipesReasoner.getRecipes(attack, landscape)
+    stageCallback("recipes")
+    # The merging passes run at the end of the HSPL building and are accounted separately.
+    hsplSet = hsplReasoner.getHSPLs(attack, recipes, landscape)
+    stageCallback("hspl")
+    msplSet = msplReasoner.getMSPLs(hsplSet, landscape, attack.anomaly_name)
+    stageCallback("mspl")
+    if hsplSet is not None:
+        etree.tostring(hsplSet)
+    if msplSet is not None:
+        etree.tostring(msplSet)
+    stageCallback("serialize")
+    return len(attack.events)
+
+
+def measureTimes(reasoners, fileName, landscape):
+    """
+    Measures the wall time of each stage.
+    @param reasoners: The reasoners.
+    @param fileName: The attack file name.
+    @param landscape: The landscape.
+    @return: The number of events and a dictionary mapping the stages to their times in seconds.
+    """
+    times = {}
+    start = [time.perf_counter()]
+
+    def onStage(stage):
+        now = time.perf_counter()
+        times[stage] = now - start[0]
+        start[0] = now
+
+    METRICS.reset()
+    events = runStages(reasoners, fileName, landscape, onStage)
+    times.update(getMergeSeconds())
+    times["hspl"] -= sum(getMergeSeconds().values())
+    return events, times
+
+
+def measurePeaks(reasoners, fileName, landscape):
+    """
+    Measures the peak memory allocated by each stage. The merging passes are accounted in the HSPL building.
+    @param reasoners: The reasoners.
+    @param fileName: The attack file name.
+    @param landscape: The landscape.
+    @return: A dictionary mapping the stages to their peak memory in bytes.
+    """
+    peaks = {}
+
+    def onStage(stage):
+        current, peak = tracemalloc.get_traced_memory()
+        peaks[stage] = peak - base[0]
+        base[0] = current
+        tracemalloc.reset_peak()
+
+    tracemalloc.start()
+    base = [tracemalloc.get_traced_memory()[0]]
+    try:
+        runStages(reasoners, fileName, landscape, onStage)
+    finally:
+        tracemalloc.stop()
+    for i in MERGE_STAGES:
+        peaks[i] = peaks["hspl"]
+    return peaks
+
+
+def benchmark(reasoners, fileName, landscape, repeat):
+    """
+    Benchmarks the stages of an attack file.
+    @param reasoners: The reasoners.
+    @param fileName: The attack file name.
+    @param landscape: The landscape.
+    @param repeat: The number of runs, of which the fastest one is kept for each stage.
+    @return: A dictionary mapping the stages to their seconds, events per second and peak bytes.
+    """
+    best = None
+    for _ in range(repeat):
+        events, times = measureTimes(reasoners, fileName, landscape)
+        if best is None:
+            best = times
+        else:
+            best = dict((i, min(best[i], times[i])) for i in STAGES)
+    peaks = measurePeaks(reasoners, fileName, landscape)
+    return dict((i, {"seconds": best[i], "eventsPerSecond": events / max(best[i], 1e-9), "peakBytes": peaks[i],
+                     "events": events}) for i in STAGES)
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compares the results with a baseline.
+    @param results: The results.
+    @param baseline: The baseline results.
+    @param tolerance: The relative slowdown or memory growth considered a regression.
+    @return: The list of regressions, as tuples of file, stage, metric, baseline value and current value.
+    """
+    regressions = []
+    for fileName, stages in sorted(results.items()):
+        for stage in STAGES:
+            old = baseline.get(fileName, {}).get(stage)
+            if old is None:
+                continue
+            for metric in ("seconds", "peakBytes"):
+                # The tiny values are dominated by the noise.
+                floor = 0.001 if metric == "seconds" else 65536
+                if stages[stage][metric] > max(old[metric], floor) * (1 + tolerance):
+                    regressions.append((fileName, stage, metric, max(old[metric], floor), stages[stage][metric]))
+    return regressions
+
+
+def main():
+    p = argparse.ArgumentParser(description="Benchmarks the remediation stages.")
+    p.add_argument("--repeat", type=int, default=3, help="runs per file, the fastest one is kept")
+    p.add_argument("--save", metavar="FILE", help="saves the results as a baseline")
+    p.add_argument("--baseline", metavar="FILE", help="compares the results with a baseline")
+    p.add_argument("--tolerance", type=float, default=0.2, help="relative change considered a regression")
+    p.add_argument("--synthetic", nargs="+", default=[], metavar="TYPE:EVENTS:DISTRIBUTION[:VERSION]",
+                   help="synthetic attacks to add, e.g. DoS:1000000:clustered or DoS:1000000:clustered:6")
+    p.add_argument("--attackers", type=int, default=1000, help="number of distinct synthetic attackers")
+    p.add_argument("files", nargs="*", help="attack files, by default the bundled ones")
+    args = p.parse_args()
+
+    testDirectory = os.path.join(os.path.dirname(__file__), "..", "tests")
+    configParser = ConfigParser()
+    configParser.read(os.path.join(testDirectory, "cybertop.cfg"))
+    # The log would only slow down the measures.
+    logging.disable(logging.CRITICAL)
+    reasoners = getReasoners(configParser)
+    # The landscape, the schemas and the recipes are loaded before the measures.
+    landscape = reasoners[0].getLandscape(os.path.join(testDirectory, "landscape1.xml"))
+    if len(args.files) > 0 or len(args.synthetic) > 0:
+        fileNames = args.files
+    else:
+        fileNames = sorted(glob.glob(os.path.join(testDirectory, "*.csv")))
+    files = [(os.path.basename(i), i) for i in fileNames]
+    syntheticDirectory = tempfile.mkdtemp(prefix="cybertop-")
+    for i, spec in enumerate(args.synthetic):
+        attackType, events, distribution, version = (spec + ":4").split(":")[:4]
+        fileName = getAttackFileName(syntheticDirectory, "High", attackType, i + 1)
+        writeAttack(fileName, attackType, int(events), args.attackers, distribution, seed=i, version=int(version))
+        files.append(("synthetic:" + spec, fileName))
+
+    results = {}
+    print("%-40s %-18s %10s %12s %12s %12s" % ("file", "stage", "events", "time [s]", "events/s", "peak [KiB]"))
+    for name, fileName in files:
+        try:
+            runStages(reasoners, fileName, landscape, lambda stage: None)
+        except Exception as e:
+            print("%-40s skipped: %s" % (name, e))
+            continue
+        results[name] = benchmark(reasoners, fileName, landscape, args.repeat)
+        for stage in STAGES:
+            r = results[name][stage]
+            print("%-40s %-18s %10d %12.4f %12.1f %12.1f" % (name, stage, r["events"], r["seconds"],
+                                                             r["eventsPerSecond"], r["peakBytes"] / 1024))
+
+    shutil.rmtree(syntheticDirectory)
+
+    print()
+    print("%-18s %12s %12s" % ("stage", "time [s]", "events/s"))
+    events = sum(i[STAGES[0]]["events"] for i in results.values())
+    for stage in STAGES:
+        seconds = sum(i[stage]["seconds"] for i in results.values())
+        print("%-18s %12.4f %12.1f" % (stage, seconds, events / max(seconds, 1e-9)))
+
+    if args.save is not None:
+        with open(args.save, "w") as f:
+            json.dump({"python": platform.python_version(), "machine": platform.machine(), "files": results}, f,
+                      indent=2, sort_keys=True)
+        print("Baseline saved to '%s'." % args.save)
+
+    if args.baseline is not None:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)["files"]
+        regressions = compare(results, baseline, args.tolerance)
+        print()
+        for fileName, stage, metric, old, new in regressions:
+            print("REGRESSION %-40s %-18s %-10s %14.4f -> %14.4f (%+.0f%%)" % (fileName, stage, metric, old, new,
+                                                                               100 * (new / old - 1)))
+        print("%d regressions over the baseline '%s'." % (len(regressions), args.baseline))
+        if len(regressions) > 0:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# Copyright 2018 Politecnico di Torino
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Benchmarks the startup of CyberTop and of the batch tools, each in a fresh interpreter: the time to import the modules
+and to load the plug-ins and reasoners, with and without the plug-in manifest.
+
+Usage: python benchmarks/startup.py [--repeat N]
+
+@author: Daniele Canavese
+"""
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+import argparse
+import json
+import subprocess
+import tempfile
+
+# The measured startups, as code run in a fresh interpreter which prints the import and initialization times.
+TARGETS = {
+    "cybertop": "from cybertop.cybertop import CyberTop\n"
+                "imported = time.perf_counter()\n"
+                "CyberTop(os.path.join(tests, 'cybertop.cfg'), os.path.join(tests, 'logging.ini'))\n",
+    "batch": "from cybertop.reasoning import getReasoners\n"
+             "from configparser import ConfigParser\n"
+             "imported = time.perf_counter()\n"
+             "configParser = ConfigParser()\n"
+             "configParser.read(os.path.join(tests, 'cybertop.cfg'))\n"
+             "getReasoners(configParser)\n",
+}
+# The code run before and after a target.
+PROLOGUE = "import os, sys, time, logging\nstart = time.perf_counter()\nlogging.disable(logging.CRITICAL)\n"
+EPILOGUE = "print(imported - start, time.perf_counter() - imported)\n"
+
+
+def measure(code, environment):
+    """
+    Runs a startup in a fresh interpreter.
+    @param code: The startup code.
+    @param environment: The environment variables.
+    @return: The import time and the initialization time in seconds.
+    """
+    output = subprocess.check_output([sys.executable, "-c", PROLOGUE + code + EPILOGUE], env=environment)
+    importSeconds, initializationSeconds = output.decode().split()
+    return float(importSeconds), float(initializationSeconds)
+
+
+def main():
+    p = argparse.ArgumentParser(description="Benchmarks the startup.")
+    p.add_argument("--repeat", type=int, default=5, help="runs per target, the fastest one is kept")
+    args = p.parse_args()
+
+    root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+    with tempfile.TemporaryDirectory() as cacheDirectory:
+        # The manifest is written to an empty cache, so the cold runs always scan the plug-ins.
+        environment = dict(os.environ, PYTHONPATH=root, XDG_CACHE_HOME=cacheDirectory)
+        manifestFileName = os.path.join(cacheDirectory, "cybertop", "plugins.json")
+        print("%-10s %-10s %12s %12s %12s" % ("target", "manifest", "import [s]", "init [s]", "total [s]"))
+        for name, code in sorted(TARGETS.items()):
+            code = "tests = %s\n%s" % (json.dumps(os.path.join(root, "tests")), code)
+            for manifest in ("cold", "warm"):
+                best = None
+                for _ in range(args.repeat):
+                    if manifest == "cold" and os.path.exists(manifestFileName):
+                        os.remove(manifestFileName)
+                    times = measure(code, environment)
+                    if best is None or sum(times) < sum(best):
+                        best = times
+                print("%-10s %-10s %12.4f %12.4f %12.4f" % (name, manifest, best[0], best[1], sum(best)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+# Copyright 2018 Politecnico di Torino
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Generates synthetic attack files, in the same layouts of the DARE files read by the parser plug-ins, to test the HSPL
+merging and refinement at scale.
+
+Usage: python benchmarks/synthetic.py DIRECTORY [--type TYPE] [--severity SEVERITY] [--events N] [--attackers N]
+                                      [--distribution uniform|clustered|zipf] [--ports N] [--tcp RATIO] [--seed N]
+                                      [--ipv6]
+
+@author: Daniele Canavese
+"""
+
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+import argparse
+import bisect
+import datetime
+import ipaddress
+import random
+import string
+
+# The attack types and the names used in their file names.
+ATTACK_TYPES = {"DoS": "DoS", "Worm": "Worm", "Cryptomining": "Cryptocurrency Mining", "DNS tunneling": "DNS tunneling"}
+# The attacker distributions.
+DISTRIBUTIONS = ("uniform", "clustered", "zipf")
+# The severities used in the file names.
+SEVERITIES = ("Very low", "Low", "High", "Very high")
+# The header of the flow files.
+FLOW_HEADER = "timereceived\tYear\tM\tD\th\tm\ts\tdur\tsrc_ip\tdst_ip\ts_prt\td_prt\tproto\tin_pkt\tin_bytes\tout_pkts\t" \
+              "out_bytes\tscore\n"
+# The well known ports, used first as destination ports.
+WELL_KNOWN_PORTS = (22, 80, 443, 53, 25, 21, 23, 110, 143, 3389, 8080, 445)
+# The domains of the tunneling queries.
+TUNNELING_DOMAINS = ("t1.olympiakara.com", "nuid.imrworldwide.com", "d.example-c2.net", "cdn.tunnel-svc.org")
+# The attacked networks of each IP version.
+VICTIM_NETWORKS = {4: ipaddress.ip_network("147.83.0.0/16"), 6: ipaddress.ip_network("2001:db8:147:83::/64")}
+# The attacker networks of each IP version, with the same 24 free bits.
+ATTACKER_NETWORKS = {4: ipaddress.ip_network("91.0.0.0/8"), 6: ipaddress.ip_network("2001:db8:91::/104")}
+
+
+class AttackerPool(object):
+    """
+    A set of attacker addresses, drawn with a given distribution.
+    """
+
+    def __init__(self, rng, count, distribution, zipfExponent=1.2, version=4):
+        """
+        Constructor.
+        @param rng: The random number generator.
+        @param count: The number of distinct attackers.
+        @param distribution: The attacker distribution, that is "uniform" (scattered addresses, drawn uniformly),
+                             "clustered" (addresses packed in as few /24 networks as possible, drawn uniformly) or
+                             "zipf" (scattered addresses, drawn with a Zipf law).
+        @param zipfExponent: The exponent of the Zipf law.
+        @param version: The IP version of the addresses, 4 or 6.
+        @raise ValueError: If the distribution is unknown.
+        """
+        if distribution not in DISTRIBUTIONS:
+            raise ValueError("Unknown attacker distribution '%s'" % distribution)
+        self.rng = rng
+        self.addresses = []
+        base = int(ATTACKER_NETWORKS[version].network_address)
+        if distribution == "clustered":
+            networks = rng.sample(range(1 << 16), (count + 253) // 254)
+            for i in range(count):
+                network = networks[i // 254]
+                self.addresses.append(str(ipaddress.ip_address(base | (network << 8) | (i % 254 + 1))))
+        else:
+            for i in rng.sample(range(1, 1 << 24), count):
+                self.addresses.append(str(ipaddress.ip_address(base | i)))
+        if distribution == "zipf":
+            weights = [1 / (i + 1) ** zipfExponent for i in range(count)]
+            self.cumulativeWeights = []
+            total = 0
+            for i in weights:
+                total += i
+                self.cumulativeWeights.append(total)
+        else:
+            self.cumulativeWeights = None
+
+    def next(self):
+        """
+        Draws an attacker.
+        @return: The attacker address.
+        """
+        if self.cumulativeWeights is None:
+            return self.addresses[self.rng.randrange(len(self.addresses))]
+        else:
+            i = bisect.bisect_left(self.cumulativeWeights, self.rng.random() * self.cumulativeWeights[-1])
+            return self.addresses[min(i, len(self.addresses) - 1)]
+
+
+def getAttackFileName(directory, severity, attackType, identifier):
+    """
+    Retrieves the name of an attack file, as expected by the parser.
+    @param directory: The directory.
+    @param severity: The severity, e.g. "High".
+    @param attackType: The attack type, e.g. "DoS".
+    @param identifier: The attack id.
+    @return: The file name.
+    """
+    return os.path.join(directory, "%s-%s-%d.csv" % (severity, ATTACK_TYPES[attackType], identifier))
+
+
+def getFlowLines(rng, attackType, events, attackers, ports, tcpRatio, start, version=4):
+    """
+    Generates the event lines of a DoS, Worm or Cryptomining attack.
+    @param rng: The random number generator.
+    @param attackType: The attack type.
+    @param events: The number of events.
+    @param attackers: The attacker pool.
+    @param ports: The number of distinct destination ports.
+    @param tcpRatio: The ratio of TCP events, the others are UDP.
+    @param start: The timestamp of the first event.
+    @param version: The IP version of the victims, 4 or 6.
+    @return: An iterator over the lines.
+    """
+    destinationPorts = list(WELL_KNOWN_PORTS[:ports])
+    destinationPorts += rng.sample(range(1025, 65536), max(0, ports - len(WELL_KNOWN_PORTS)))
+    victimNetwork = VICTIM_NETWORKS[version]
+    victims = [str(victimNetwork[rng.randrange(1, min(victimNetwork.num_addresses, 1 << 16) - 1)]) for _ in range(8)]
+    for i in range(events):
+        t = start + datetime.timedelta(seconds=i // 100)
+        source = attackers.next()
+        destination = rng.choice(victims)
+        protocol = "TCP" if rng.random() < tcpRatio else "UDP"
+        sourcePort = rng.randrange(1024, 65536)
+        destinationPort = rng.choice(destinationPorts)
+        packets = rng.randrange(1, 2000)
+        if attackType == "Cryptomining":
+            # The miners are the internal hosts contacting the mining pools.
+            source, destination = destination, source
+        yield "%s\t%d\t%d\t%d\t%d\t%d\t%d\t0\t%s\t%s\t%d\t%d\t%s\t%d\t%d\t0\t0\t1.0E-01\n" % (
+            t.strftime("%Y-%m-%d %H:%M:%S"), t.year, t.month, t.day, t.hour, t.minute, t.second, source, destination,
+            sourcePort, destinationPort, protocol, packets, packets * rng.randrange(40, 1500))
+
+
+def getTunnelingLines(rng, events, attackers, start):
+    """
+    Generates the event lines of a DNS tunneling attack.
+    @param rng: The random number generator.
+    @param events: The number of events.
+    @param attackers: The attacker pool, that is the internal hosts sending the queries.
+    @param start: The timestamp of the first event.
+    @return: An iterator over the lines.
+    """
+    alphabet = string.ascii_lowercase + string.digits
+    for i in range(events):
+        t = start + datetime.timedelta(seconds=i // 100)
+        label = "".join(rng.choice(alphabet) for _ in range(rng.randrange(8, 60)))
+        yield "%s.%09d EEST\t%d\t%d\t%s\t%s.%s\t0x00000001\t%d\t0\t2.8798E-5\n" % (
+            t.strftime("%b %d %Y %H:%M:%S"), rng.randrange(10 ** 9), int(t.timestamp()), rng.randrange(60, 400),
+            attackers.next(), label, rng.choice(TUNNELING_DOMAINS), rng.choice((1, 5, 16, 28)))
+
+
+def writeAttack(fileName, attackType, events, attackers=100, distribution="uniform", ports=1, tcpRatio=1.0, seed=0,
+                version=4):
+    """
+    Writes a synthetic attack file, one line at a time so that even millions of events take little memory.
+    @param fileName: The attack file name.
+    @param attackType: The attack type, that is "DoS", "Worm", "Cryptomining" or "DNS tunneling".
+    @param events: The number of events.
+    @param attackers: The number of distinct attackers.
+    @param distribution: The attacker distribution, that is "uniform", "clustered" or "zipf".
+    @param ports: The number of distinct destination ports.
+    @param tcpRatio: The ratio of TCP events, the others are UDP.
+    @param seed: The random seed.
+    @param version: The IP version of the addresses, 4 or 6.
+    @raise ValueError: If the attack type or the distribution are unknown.
+    """
+    if attackType not in ATTACK_TYPES:
+        raise ValueError("Unknown attack type '%s'" % attackType)
+    rng = random.Random(seed)
+    pool = AttackerPool(rng, attackers, distribution, version=version)
+    start = datetime.datetime(2018, 1, 20, 15, 30, 0)
+    with open(fileName, "w") as f:
+        if attackType == "DNS tunneling":
+            f.writelines(getTunnelingLines(rng, events, pool, start))
+        else:
+            f.write(FLOW_HEADER)
+            f.writelines(getFlowLines(rng, attackType, events, pool, ports, tcpRatio, start, version))
+
+
+def main():
+    p = argparse.ArgumentParser(description="Generates a synthetic attack file.")
+    p.add_argument("directory", help="output directory")
+    p.add_argument("--type", default="DoS", choices=sorted(ATTACK_TYPES), help="attack type")
+    p.add_argument("--severity", default="High", choices=SEVERITIES, help="attack severity")
+    p.add_argument("--id", type=int, default=1, help="attack id")
+    p.add_argument("--events", type=int, default=100000, help="number of attack events")
+    p.add_argument("--attackers", type=int, default=1000, help="number of distinct attackers")
+    p.add_argument("--distribution", default="uniform", choices=DISTRIBUTIONS, help="attacker distribution")
+    p.add_argument("--ports", type=int, default=1, help="number of distinct destination ports")
+    p.add_argument("--tcp", type=float, default=1.0, help="ratio of TCP events, the others are UDP")
+    p.add_argument("--seed", type=int, default=0, help="random seed")
+    p.add_argument("--ipv6", action="store_true", help="IPv6 addresses instead of IPv4 ones")
+    args = p.parse_args()
+
+    os.makedirs(args.directory, exist_ok=True)
+    fileName = getAttackFileName(args.directory, args.severity, args.type, args.id)
+    writeAttack(fileName, args.type, args.events, args.attackers, args.distribution, args.ports, args.tcp, args.seed,
+                6 if args.ipv6 else 4)
+    print(fileName)
+
+
+if __name__ == "__main__":
+    main()
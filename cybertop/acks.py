@@ -0,0 +1,144 @@
+# Copyright 2018 Politecnico di Torino
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Batched AMQP acknowledgments.
+
+@author: Daniele Canavese
+"""
+
+import threading
+from cybertop.metrics import METRICS
+
+
+class AckBatcher(object):
+    """
+    Acknowledges the messages received from a channel in batches. When enough messages are processed, a single
+    basic_ack(multiple=True) acknowledges all of them up to the oldest message still in progress, e.g. a stop message
+    waiting for its remediation. The processed messages after it are acknowledged one by one when the batch is flushed
+    by the time window, so they never wait longer than that.
+    """
+
+    def __init__(self, channel, size, delay):
+        """
+        Constructor.
+        @param channel: The channel the messages are received from.
+        @param size: The number of processed messages triggering an acknowledgment.
+        @param delay: The time window in seconds, that is the interval between two calls of flush() by the caller.
+        """
+        self.channel = channel
+        self.size = size
+        self.delay = delay
+        self.__inProgress = set()
+        self.__processed = []
+        self.__lock = threading.Lock()
+
+    def receive(self, deliveryTag):
+        """
+        Records a received message.
+        @param deliveryTag: The message delivery tag.
+        """
+        with self.__lock:
+            self.__inProgress.add(deliveryTag)
+
+    def complete(self, deliveryTag):
+        """
+        Records a processed message, acknowledging the batch if it is full.
+        @param deliveryTag: The message delivery tag.
+        """
+        with self.__lock:
+            self.__inProgress.discard(deliveryTag)
+            self.__processed.append(deliveryTag)
+            if len(self.__processed) >= self.size:
+                self.__flush(False)
+
+    def flush(self, force=True):
+        """
+        Acknowledges the processed messages.
+        @param force: A value stating if the processed messages received after a message still in progress must be
+                      acknowledged too, one by one.
+        """
+        with self.__lock:
+            self.__flush(force)
+
+    def getPendingCount(self):
+        """
+        Retrieves the number of processed messages not yet acknowledged.
+        @return: The number of pending acknowledgments.
+        """
+        with self.__lock:
+            return len(self.__processed)
+
+    def __flush(self, force):
+        """
+        Acknowledges the processed messages. It must be called with the lock held.
+        @param force: A value stating if the processed messages received after a message still in progress must be
+                      acknowledged too, one by one.
+        """
+        if len(self.__processed) == 0:
+            return
+
+        if len(self.__inProgress) > 0:
+            limit = min(self.__inProgress)
+            batch = [i for i in self.__processed if i < limit]
+            others = [i for i in self.__processed if i > limit]
+        else:
+            batch = self.__processed
+            others = []
+
+        # All the messages before the last one of the batch are processed and thus acknowledged.
+        if len(batch) > 0:
+            self.channel.basic_ack(delivery_tag=max(batch), multiple=True)
+            METRICS.increment("cybertop_amqp_acks_total", mode="multiple")
+            METRICS.increment("cybertop_amqp_acked_messages_total", len(batch))
+        if force:
+            for i in others:
+                self.channel.basic_ack(delivery_tag=i)
+            METRICS.increment("cybertop_amqp_acks_total", len(others), mode="single")
+            METRICS.increment("cybertop_amqp_acked_messages_total", len(others))
+            others = []
+        self.__processed = others
+
+
+class AckCountdown(object):
+    """
+    Acknowledges a message only when all its parts are processed, e.g. the stop lines of a batch waiting for their
+    remediations.
+    """
+
+    def __init__(self, acknowledge):
+        """
+        Constructor. The message itself counts as a part, which is done with the last call of done().
+        @param acknowledge: The function acknowledging the message.
+        """
+        self.acknowledge = acknowledge
+        self.__count = 1
+        self.__lock = threading.Lock()
+
+    def add(self):
+        """
+        Adds a part to wait for.
+        """
+        with self.__lock:
+            self.__count += 1
+
+    def done(self):
+        """
+        Marks a part as processed, acknowledging the message if it was the last one.
+        """
+        with self.__lock:
+            self.__count -= 1
+            last = self.__count == 0
+        if last:
+            self.acknowledge()
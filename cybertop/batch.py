@@ -0,0 +1,212 @@
+# Copyright 2018 Politecnico di Torino
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Offline policy generation over a directory of attack files.
+
+Usage: cybertop-batch DIRECTORY --out DIRECTORY [--jobs N] [-c FILE] [-l FILE] [--landscape FILE] [--pattern PATTERN]
+
+@author: Daniele Canavese
+"""
+
+import argparse
+import fnmatch
+import functools
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from configparser import ConfigParser
+from lxml import etree
+from cybertop import log
+from cybertop.log import LOG
+from cybertop.reasoning import getReasoners
+from cybertop.reasoning import getConfigurationDictionary
+from cybertop.reasoning import getAttackRemediation
+from cybertop.reasoning import warmUp
+from cybertop.util import getConfigurationFile
+from cybertop.util import getVersion
+
+# The reasoners of a worker process, loaded once and reused for all its files.
+_reasoners = None
+
+
+class BatchResult(object):
+    """
+    The outcome of the processing of an attack file.
+    """
+
+    def __init__(self, fileName, events, seconds, remediated, error=None):
+        """
+        Constructor.
+        @param fileName: The attack file name.
+        @param events: The number of attack events.
+        @param seconds: The processing time in seconds.
+        @param remediated: A value stating if a remediation was written.
+        @param error: The error message or None if the file was processed.
+        """
+        self.fileName = fileName
+        self.events = events
+        self.seconds = seconds
+        self.remediated = remediated
+        self.error = error
+
+
+def _initializeWorker(configuration, landscapeFileName):
+    """
+    Loads the reasoners of a worker process.
+    @param configuration: The configuration, as a dictionary of sections.
+    @param landscapeFileName: The name of the landscape file to preload.
+    """
+    global _reasoners
+    configParser = ConfigParser()
+    configParser.read_dict(configuration)
+    _reasoners = getReasoners(configParser)
+    warmUp(_reasoners[0], _reasoners[1], landscapeFileName)
+
+
+def getOutputFileNames(attackFileName, outputDirectory):
+    """
+    Retrieves the names of the HSPL and MSPL files of an attack file.
+    @param attackFileName: The attack file name.
+    @param outputDirectory: The output directory.
+    @return: The names of the HSPL and MSPL files.
+    """
+    baseName = os.path.splitext(os.path.basename(attackFileName))[0]
+    return (os.path.join(outputDirectory, baseName + ".hspl.xml"),
+            os.path.join(outputDirectory, baseName + ".mspl.xml"))
+
+
+def processFile(attackFileName, landscapeFileName, outputDirectory):
+    """
+    Remediates an attack file in a worker process and writes its HSPL and MSPL sets.
+    @param attackFileName: The attack file name.
+    @param landscapeFileName: The name of the landscape file to parse.
+    @param outputDirectory: The output directory.
+    @return: The outcome of the processing.
+    """
+    parser, recipesReasoner, hsplReasoner, msplReasoner = _reasoners
+    start = time.perf_counter()
+    events = 0
+    try:
+        attack = parser.getAttackFromFile(attackFileName)
+        events = len(attack.events)
+        r = getAttackRemediation(parser, recipesReasoner, hsplReasoner, msplReasoner, attack, landscapeFileName)
+        if r is not None:
+            # The files are written by the worker, so the XML trees never reach the main process.
+            for fileName, tree in zip(getOutputFileNames(attackFileName, outputDirectory), r):
+                with open(fileName, "w") as f:
+                    f.write(etree.tostring(tree, pretty_print=True).decode())
+    except Exception as e:
+        return BatchResult(attackFileName, events, time.perf_counter() - start, False, str(e))
+    return BatchResult(attackFileName, events, time.perf_counter() - start, r is not None)
+
+
+def getAttackFileNames(directory, pattern="*.csv"):
+    """
+    Finds the attack files of a directory.
+    @param directory: The directory.
+    @param pattern: The pattern of the attack file names.
+    @return: The attack file names, from the biggest one so that the workers finish at about the same time.
+    """
+    fileNames = []
+    for root, _, files in os.walk(directory):
+        fileNames += [os.path.join(root, i) for i in files if not i.startswith(".") and fnmatch.fnmatch(i, pattern)]
+    fileNames.sort(key=lambda i: os.path.getsize(i), reverse=True)
+    return fileNames
+
+
+def runBatch(configParser, directory, outputDirectory, jobs, landscapeFileName=None, pattern="*.csv",
+             output=sys.stdout):
+    """
+    Remediates all the attack files of a directory, reporting the throughput of each file as soon as it is written.
+    @param configParser: The configuration parser.
+    @param directory: The directory of the attack files.
+    @param outputDirectory: The directory where the HSPL and MSPL sets are written.
+    @param jobs: The number of worker processes.
+    @param landscapeFileName: The name of the landscape file to use or None to use the configured one.
+    @param pattern: The pattern of the attack file names.
+    @param output: The stream where the report is written.
+    @return: The list of outcomes, in completion order.
+    """
+    if landscapeFileName is None:
+        landscapeFileName = configParser.get("global", "landscapeFile")
+    os.makedirs(outputDirectory, exist_ok=True)
+    fileNames = getAttackFileNames(directory, pattern)
+    LOG.info("Processing %d attack files with %d workers.", len(fileNames), jobs)
+
+    results = []
+    start = time.perf_counter()
+    output.write("%-40s %10s %10s %12s %s\n" % ("file", "events", "time [s]", "events/s", "result"))
+    with multiprocessing.Pool(jobs, _initializeWorker,
+                              (getConfigurationDictionary(configParser), landscapeFileName)) as pool:
+        function = functools.partial(processFile, landscapeFileName=landscapeFileName,
+                                     outputDirectory=outputDirectory)
+        for i in pool.imap_unordered(function, fileNames):
+            results.append(i)
+            if i.error is not None:
+                status = "error: " + i.error
+            elif i.remediated:
+                status = "ok"
+            else:
+                status = "no remediation"
+            output.write("%-40s %10d %10.3f %12.1f %s\n" % (os.path.relpath(i.fileName, directory), i.events,
+                                                           i.seconds, i.events / max(i.seconds, 1e-9), status))
+            output.flush()
+    elapsed = time.perf_counter() - start
+
+    events = sum(i.events for i in results)
+    errors = sum(1 for i in results if i.error is not None)
+    busy = sum(i.seconds for i in results)
+    output.write("%d files (%d errors), %d events in %.3f s: %.2f files/s, %.1f events/s, %.2fx parallelism\n" %
+                 (len(results), errors, events, elapsed, len(results) / max(elapsed, 1e-9),
+                  events / max(elapsed, 1e-9), busy / max(elapsed, 1e-9)))
+    return results
+
+
+def main(argv=None):
+    """
+    Runs the batch processing from the command line.
+    @param argv: The command line arguments or None to use the ones of the process.
+    @return: The exit status, that is 1 if some files could not be processed.
+    """
+    p = argparse.ArgumentParser(description="Generates the HSPL and MSPL sets of a directory of attack files.")
+    p.add_argument("-v", "--version", action="version", version="%(prog)s " + getVersion())
+    p.add_argument("directory", help="the directory of the attack files")
+    p.add_argument("-o", "--out", required=True, metavar="DIRECTORY", help="the directory of the HSPL and MSPL sets")
+    p.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="the number of worker processes")
+    p.add_argument("-c", "--conf", default=getConfigurationFile(), metavar="FILE",
+                   help="the configuration file")
+    p.add_argument("-l", "--log-conf", dest="log_conf", metavar="FILE", help="the logging configuration file")
+    p.add_argument("--landscape", metavar="FILE", help="the landscape file, overriding the configured one")
+    p.add_argument("--pattern", default="*.csv", help="the pattern of the attack file names")
+    args = p.parse_args(argv)
+
+    if args.log_conf is None:
+        # Only the report is printed by default.
+        LOG.setLevel(logging.WARNING)
+    else:
+        log.load_settings(args.log_conf)
+    configParser = ConfigParser()
+    if len(configParser.read(args.conf)) == 0:
+        LOG.critical("Cannot read the configuration file from '%s'.", args.conf)
+        return 1
+
+    results = runBatch(configParser, args.directory, args.out, args.jobs, args.landscape, args.pattern)
+    return 1 if any(i.error is not None for i in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,189 @@
+# Copyright 2018 Politecnico di Torino
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Caching of the generated policies.
+
+@author: Daniele Canavese
+"""
+
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from cybertop.util import getHSPLNamespace
+from cybertop.util import getMSPLNamespace
+from cybertop.metrics import METRICS
+from cybertop.log import LOG
+
+
+class AttackDigest(object):
+    """
+    An order-independent digest of the events of an attack, which can be updated while the events are received. The
+    event timestamps are ignored.
+    """
+
+    # The digest modulus.
+    MODULUS = 2 ** 256
+
+    def __init__(self):
+        """
+        Creates the digest of an attack without events.
+        """
+        self.count = 0
+        self.value = 0
+
+    def add(self, event):
+        """
+        Adds an event to the digest.
+        @param event: The attack event.
+        """
+        h = hashlib.sha256(("%s|%s|%s" % (event.attacker, event.target, sorted(event.fields.items()))).encode())
+        # The sum of the event hashes does not depend on the event order.
+        self.value = (self.value + int.from_bytes(h.digest(), "big")) % self.MODULUS
+        self.count += 1
+
+    def getFingerprint(self, attack, landscapeVersion, recipesVersion):
+        """
+        Computes the fingerprint of an attack with the events added to this digest.
+        @param attack: The attack.
+        @param landscapeVersion: The landscape version.
+        @param recipesVersion: The recipes version.
+        @return: The hexadecimal fingerprint.
+        """
+        h = hashlib.sha256()
+        h.update(("%s|%s|%s|%s|%s|%d|%064x" % (attack.type, attack.severity, attack.anomaly_name, landscapeVersion,
+                                               recipesVersion, self.count, self.value)).encode())
+        return h.hexdigest()
+
+
+class PolicyCache(object):
+    """
+    A bounded LRU cache of the HSPL and MSPL recommendations, whose entries expire after a while.
+    """
+
+    def __init__(self, size, ttl):
+        """
+        Constructor.
+        @param size: The maximum number of entries. If it is 0 the cache is disabled.
+        @param ttl: The number of seconds after which an entry expires.
+        """
+        self.__size = size
+        self.__ttl = ttl
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+        self.__hits = 0
+        self.__misses = 0
+
+    def get(self, fingerprint, timestamp):
+        """
+        Retrieves a copy of some cached recommendations.
+        @param fingerprint: The attack fingerprint.
+        @param timestamp: The attack timestamp to use in the recommendations context.
+        @return: The HSPL and MSPL recommendations or None if they are not cached.
+        """
+        if self.__size <= 0:
+            return None
+
+        with self.__lock:
+            entry = self.__entries.get(fingerprint)
+            if entry is not None and time.monotonic() - entry[0] > self.__ttl:
+                del self.__entries[fingerprint]
+                METRICS.increment("cybertop_policy_cache_evictions_total", reason="expired")
+                entry = None
+            if entry is None:
+                self.__misses += 1
+                METRICS.increment("cybertop_policy_cache_misses_total")
+                self.__updateGauges()
+                return None
+            self.__entries.move_to_end(fingerprint)
+            self.__hits += 1
+            METRICS.increment("cybertop_policy_cache_hits_total")
+            self.__updateGauges()
+
+        [hsplSet, msplSet] = copy.deepcopy(entry[1])
+        if timestamp is not None:
+            for i in hsplSet.iterfind("{%s}hspl-set/{%s}context/{%s}timestamp" %
+                                      (getHSPLNamespace(), getHSPLNamespace(), getHSPLNamespace())):
+                i.text = timestamp.isoformat()
+            for i in msplSet.iterfind("{%s}mspl-set/{%s}context/{%s}timestamp" %
+                                      (getMSPLNamespace(), getMSPLNamespace(), getMSPLNamespace())):
+                i.text = timestamp.isoformat()
+        LOG.debug("Policy cache hit for the attack %s.", fingerprint)
+        return [hsplSet, msplSet]
+
+    def put(self, fingerprint, hsplSet, msplSet):
+        """
+        Caches some recommendations.
+        @param fingerprint: The attack fingerprint.
+        @param hsplSet: The HSPL recommendations.
+        @param msplSet: The MSPL recommendations.
+        """
+        if self.__size <= 0:
+            return
+
+        value = copy.deepcopy([hsplSet, msplSet])
+        with self.__lock:
+            self.__entries[fingerprint] = (time.monotonic(), value)
+            self.__entries.move_to_end(fingerprint)
+            while len(self.__entries) > self.__size:
+                self.__entries.popitem(last=False)
+                METRICS.increment("cybertop_policy_cache_evictions_total", reason="size")
+            self.__updateGauges()
+
+    def clear(self):
+        """
+        Removes all the entries.
+        """
+        with self.__lock:
+            self.__entries.clear()
+            self.__updateGauges()
+
+    def getHits(self):
+        """
+        Retrieves the number of cache hits.
+        @return: The number of hits.
+        """
+        return self.__hits
+
+    def getMisses(self):
+        """
+        Retrieves the number of cache misses.
+        @return: The number of misses.
+        """
+        return self.__misses
+
+    def getHitRatio(self):
+        """
+        Retrieves the cache hit ratio.
+        @return: The ratio between the hits and the lookups, or 0 if no lookup was performed.
+        """
+        lookups = self.__hits + self.__misses
+        if lookups == 0:
+            return 0.0
+        else:
+            return self.__hits / lookups
+
+    def __updateGauges(self):
+        """
+        Updates the cache gauges. It must be called with the lock held.
+        """
+        METRICS.set("cybertop_policy_cache_entries", len(self.__entries))
+        lookups = self.__hits + self.__misses
+        if lookups > 0:
+            METRICS.set("cybertop_policy_cache_hit_ratio", self.__hits / lookups)
+
+    def __len__(self):
+        return len(self.__entries)
@@ -0,0 +1,207 @@
+# Copyright 2018 Politecnico di Torino
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Typed configuration snapshots and their reload.
+
+@author: Daniele Canavese
+"""
+
+import signal
+import threading
+from configparser import ConfigParser
+from configparser import Error
+from cybertop.log import LOG
+
+
+class Settings(object):
+    """
+    An immutable snapshot of the options read while reasoning on an attack, validated once. A new snapshot is created
+    when the configuration is reloaded, so the snapshot taken by an attack never changes under its feet.
+    """
+
+    __slots__ = ("hsplMergeInclusions", "hsplMergeWithAnyPorts", "hsplMergeWithSubnets", "hsplMergingThreshold",
+                 "hsplMergingMinBits", "hsplMergingMaxBits", "hsplMergingMinBitsIPv6", "hsplMergingMaxBitsIPv6",
+                 "msplSharding", "dashboardContent", "limitMaxConnections", "limitRateLimit", "vnsfoEnabled",
+                 "vnsfoBaseURL", "vnsfoTimeout", "vnsfoCacheTTL")
+
+    # The valid dashboard contents.
+    DASHBOARD_CONTENTS = ("HSPL+MSPL", "HSPL", "MSPL")
+
+    def __init__(self, configParser):
+        """
+        Constructor.
+        @param configParser: The configuration parser.
+        @raise ValueError: If an option is not valid.
+        @raise configparser.Error: If a mandatory option is missing.
+        """
+        values = {
+            "hsplMergeInclusions": configParser.getboolean("global", "hsplMergeInclusions"),
+            "hsplMergeWithAnyPorts": configParser.getboolean("global", "hsplMergeWithAnyPorts"),
+            "hsplMergeWithSubnets": configParser.getboolean("global", "hsplMergeWithSubnets"),
+            "hsplMergingThreshold": configParser.getint("global", "hsplMergingThreshold"),
+            "hsplMergingMinBits": configParser.getint("global", "hsplMergingMinBits"),
+            "hsplMergingMaxBits": configParser.getint("global", "hsplMergingMaxBits"),
+            "hsplMergingMinBitsIPv6": configParser.getint("global", "hsplMergingMinBitsIPv6", fallback=128),
+            "hsplMergingMaxBitsIPv6": configParser.getint("global", "hsplMergingMaxBitsIPv6", fallback=64),
+            "msplSharding": configParser.getboolean("global", "msplSharding", fallback=True),
+            "dashboardContent": configParser.get("global", "dashboardContent", fallback="HSPL+MSPL"),
+            "limitMaxConnections": configParser.getint("limit", "maxConnections", fallback=20),
+            "limitRateLimit": configParser.get("limit", "rateLimit", fallback="100kbit/s"),
+            "vnsfoEnabled": configParser.getboolean("vnsfo", "enable_vnsfo_api_call", fallback=False),
+            "vnsfoBaseURL": configParser.get("vnsfo", "vnsfo_base_url", fallback=""),
+            "vnsfoTimeout": configParser.getint("vnsfo", "vnsfo_timeout", fallback=5),
+            "vnsfoCacheTTL": configParser.getint("vnsfo", "vnsfo_cache_ttl", fallback=30),
+        }
+        if values["hsplMergingThreshold"] < 0:
+            raise ValueError("Invalid hsplMergingThreshold %d" % values["hsplMergingThreshold"])
+        if not 0 <= values["hsplMergingMaxBits"] <= values["hsplMergingMinBits"] <= 32:
+            raise ValueError("Invalid hsplMergingMinBits/hsplMergingMaxBits %d/%d" %
+                             (values["hsplMergingMinBits"], values["hsplMergingMaxBits"]))
+        if not 0 <= values["hsplMergingMaxBitsIPv6"] <= values["hsplMergingMinBitsIPv6"] <= 128:
+            raise ValueError("Invalid hsplMergingMinBitsIPv6/hsplMergingMaxBitsIPv6 %d/%d" %
+                             (values["hsplMergingMinBitsIPv6"], values["hsplMergingMaxBitsIPv6"]))
+        if values["dashboardContent"] not in self.DASHBOARD_CONTENTS:
+            raise ValueError("Invalid dashboardContent '%s'" % values["dashboardContent"])
+        if values["limitMaxConnections"] <= 0:
+            raise ValueError("Invalid maxConnections %d" % values["limitMaxConnections"])
+        if values["vnsfoTimeout"] <= 0:
+            raise ValueError("Invalid vnsfo_timeout %d" % values["vnsfoTimeout"])
+        if values["vnsfoCacheTTL"] < 0:
+            raise ValueError("Invalid vnsfo_cache_ttl %d" % values["vnsfoCacheTTL"])
+        self.__setstate__(values)
+
+    def isMapped(self):
+        """
+        Checks if the HSPL maps are needed.
+        @return: True if at least one merging technique is enabled, False otherwise.
+        """
+        return self.hsplMergeInclusions or self.hsplMergeWithAnyPorts or self.hsplMergeWithSubnets
+
+    def __setattr__(self, name, value):
+        raise AttributeError("The settings are read-only")
+
+    def __getstate__(self):
+        return dict((i, getattr(self, i)) for i in self.__slots__)
+
+    def __setstate__(self, state):
+        # Also used when a snapshot is sent to a worker process.
+        for i in self.__slots__:
+            object.__setattr__(self, i, state[i])
+
+    def __repr__(self):
+        return "Settings(%s)" % ", ".join("%s=%r" % (i, getattr(self, i)) for i in self.__slots__)
+
+
+class Configuration(object):
+    """
+    The current settings, shared by the reasoners and the plug-ins. Reloading the configuration file, e.g. with SIGHUP,
+    atomically replaces the snapshot: the attacks being reasoned on keep the one they started with. The options not in
+    the snapshot, such as the connections and the workers, still require a restart. The SIGHUP handler only wakes a
+    background thread, since reloading takes locks that the interrupted code may already hold.
+    """
+
+    # The signal reloading the configuration.
+    RELOAD_SIGNAL = getattr(signal, "SIGHUP", None)
+
+    def __init__(self, configParser, fileName=None, callback=None):
+        """
+        Constructor.
+        @param configParser: The configuration parser.
+        @param fileName: The configuration file name to reload or None.
+        @param callback: The function called after the settings are reloaded or None.
+        @raise ValueError: If an option is not valid.
+        @raise configparser.Error: If a mandatory option is missing.
+        """
+        self.fileName = fileName
+        self.settings = Settings(configParser)
+        self.__previousHandler = None
+        self.__callback = callback
+        self.__reloading = threading.Event()
+        self.__stopping = threading.Event()
+        self.__thread = None
+
+    def update(self, settings):
+        """
+        Replaces the current settings.
+        @param settings: The new settings.
+        """
+        self.settings = settings
+
+    def reload(self):
+        """
+        Reloads the configuration file. The current settings are kept if the file is not valid.
+        @return: True if the settings were replaced, False otherwise.
+        """
+        configParser = ConfigParser()
+        try:
+            if self.fileName is None or len(configParser.read(self.fileName)) == 0:
+                raise IOError("Cannot read the configuration file from '%s'" % self.fileName)
+            settings = Settings(configParser)
+        except (IOError, ValueError, Error) as e:
+            LOG.error("Configuration not reloaded: %s", str(e))
+            return False
+        self.update(settings)
+        LOG.info("Configuration reloaded from '%s'.", self.fileName)
+        if self.__callback is not None:
+            self.__callback()
+        return True
+
+    def watch(self):
+        """
+        Reloads the configuration file on SIGHUP, in a background thread. Only done if called from the main thread.
+        """
+        if (self.RELOAD_SIGNAL is not None and self.fileName is not None and self.__previousHandler is None and
+                threading.current_thread() is threading.main_thread()):
+            self.__stopping.clear()
+            self.__thread = threading.Thread(target=self.__reloadLoop, name="cybertop-config", daemon=True)
+            self.__thread.start()
+            self.__previousHandler = signal.signal(self.RELOAD_SIGNAL, self.__onReload)
+
+    def close(self):
+        """
+        Restores the previous SIGHUP handler and stops the background thread.
+        """
+        if self.__previousHandler is not None:
+            signal.signal(self.RELOAD_SIGNAL, self.__previousHandler)
+            self.__previousHandler = None
+        if self.__thread is not None:
+            self.__stopping.set()
+            self.__reloading.set()
+            self.__thread.join()
+            self.__thread = None
+
+    def __onReload(self, signalNumber, frame):
+        """
+        Wakes the background thread on SIGHUP. Nothing else is done here, since the interrupted code may hold the
+        locks taken while reloading.
+        @param signalNumber: The signal number.
+        @param frame: The interrupted frame.
+        """
+        self.__reloading.set()
+
+    def __reloadLoop(self):
+        """
+        Reloads the configuration file each time SIGHUP is received, until stopped. Several signals received during a
+        reload cause a single further reload.
+        """
+        while True:
+            self.__reloading.wait()
+            self.__reloading.clear()
+            if self.__stopping.is_set():
+                return
+            try:
+                self.reload()
+            except Exception as e:
+                LOG.error("Configuration not reloaded: %s", str(e))
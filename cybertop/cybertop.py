@@ -17,35 +17,53 @@ The CyberSecurity Topologies related stuff.
 @author: Daniele Canavese
 """
 
+import functools
 import threading
-import pyinotify
+import time
 from configparser import ConfigParser
-from yapsy.PluginManager import PluginManager
-from cybertop.plugins import ActionPlugin
-from cybertop.plugins import ParserPlugin
-from cybertop.plugins import FilterPlugin
+from cybertop.plugins import getPluginManager
+from cybertop.config import Configuration
 from cybertop.parsing import Parser
+from cybertop.attacks import Attack
 from cybertop.recipes import RecipesReasoner
 from cybertop.hspl import HSPLReasoner
 from cybertop.mspl import MSPLReasoner
-import pika
+from cybertop.delta import PolicyStore
+from cybertop.delta import DeltaReasoner
+from cybertop.cache import PolicyCache
+from cybertop.cache import AttackDigest
+from cybertop.outbox import Outbox
+from cybertop.decoding import DAREMessage
+from cybertop.decoding import MessageDecoder
+from cybertop.acks import AckBatcher
+from cybertop.acks import AckCountdown
+from cybertop.registry import AttackRegistry
+from cybertop.reasoning import ReasoningPool
+from cybertop.reasoning import getRemediation
+from cybertop.reasoning import getAttackRemediation
+from cybertop.reasoning import warmUp
+from cybertop.exporter import getMetricsExporter
+from cybertop.watcher import ArtifactWatcher
+from cybertop.profiling import PROFILER
+from cybertop.vnsfo import closeClients
 from lxml import etree
-from cybertop.util import getPluginDirectory
 from cybertop import log
 from cybertop.log import LOG
+from cybertop.metrics import METRICS
+from cybertop.metrics import StageTimer
 from cybertop.util import getPIDFile
+from cybertop.util import getHSPLNamespace
 from cybertop.util import getConfigurationFile
-from csv import reader
-from csv import Sniffer
-from re import match
-from re import IGNORECASE
 
 
-class CyberTop(pyinotify.ProcessEvent):
+class CyberTop(object):
     """
     The CyberSecurity Topologies main class.
     """
 
+    # The number of seconds between two checks of the idle attacks.
+    ATTACKS_CHECK_INTERVAL = 60
+
     def __init__(self, configurationFileName=None,
                  logConfigurationFileName=None):
         """
@@ -55,6 +73,7 @@ class CyberTop(pyinotify.ProcessEvent):
         @param logConfigurationFileName: the name of the log configuration file
                                          to use.
         """
+        start = time.perf_counter()
         # Configures the logging.
         log.load_settings(logConfigurationFileName)
 
@@ -72,13 +91,17 @@ class CyberTop(pyinotify.ProcessEvent):
             raise IOError("Cannot read the configuration file from '%s'" %
                           configurationFileName)
 
+        # Validates the settings used while reasoning, which are reloaded on
+        # SIGHUP, discarding the remediations cached with the old ones.
+        self.configuration = Configuration(self.configParser, c[0],
+                                           self.__onReload)
+
+        # Profiles the remediations on request, also in the worker processes
+        # forked below.
+        PROFILER.setup(self.configParser)
+
         # Configures the plug-ins.
-        self.pluginManager = PluginManager()
-        self.pluginManager.setPluginPlaces([getPluginDirectory()])
-        self.pluginManager.setCategoriesFilter({"Action": ActionPlugin,
-                                                "Parser": ParserPlugin,
-                                                "Filter": FilterPlugin})
-        self.pluginManager.collectPlugins()
+        self.pluginManager = getPluginManager()
         pluginsCount = len(self.pluginManager.getPluginsOfCategory("Parser"))
         if pluginsCount > 1:
             LOG.info("Found %d attack event parser plug-ins.", pluginsCount)
@@ -99,19 +122,102 @@ class CyberTop(pyinotify.ProcessEvent):
         self.parser = Parser(self.configParser, self.pluginManager)
         self.recipesReasoner = RecipesReasoner(self.configParser,
                                                self.pluginManager)
-        self.hsplReasoner = HSPLReasoner(self.configParser, self.pluginManager)
-        self.msplReasoner = MSPLReasoner(self.configParser, self.pluginManager)
+        self.hsplReasoner = HSPLReasoner(self.configParser, self.pluginManager,
+                                         self.configuration)
+        self.msplReasoner = MSPLReasoner(self.configParser, self.pluginManager,
+                                         self.configuration)
+        warmUp(self.parser, self.recipesReasoner,
+               self.configParser.get("global", "landscapeFile", fallback=None))
+        # Reasons on the stopped attacks in background, if requested. The
+        # worker processes are forked before any other thread is started.
+        reasoningWorkers = self.configParser.getint("global", "reasoningWorkers", fallback=0)
+        if reasoningWorkers > 0:
+            self.reasoningPool = ReasoningPool(
+                self.configParser.get("global", "reasoningWorkerKind", fallback="process"),
+                reasoningWorkers, self.configParser, self.parser,
+                self.recipesReasoner, self.hsplReasoner, self.msplReasoner)
+        else:
+            self.reasoningPool = None
+        # Only pushes the differences with respect to the previous remediations, if requested.
+        if self.configParser.getboolean("global", "dashboardDelta", fallback=False):
+            policyStore = PolicyStore(self.configParser.get("global", "dashboardDeltaStore", fallback=None))
+            self.deltaReasoner = DeltaReasoner(self.configParser, policyStore)
+        else:
+            self.deltaReasoner = None
+        # Reuses the remediations of the attacks already seen, if requested.
+        policyCacheSize = self.configParser.getint("global", "policyCacheSize", fallback=128)
+        if policyCacheSize > 0:
+            self.policyCache = PolicyCache(policyCacheSize,
+                                           self.configParser.getint("global", "policyCacheTTL", fallback=300))
+        else:
+            self.policyCache = None
+        # Publishes the remediations on a long-lived dashboard connection.
+        if (self.configParser.has_option("global", "dashboardHost") and
+            self.configParser.has_option("global", "dashboardPort") and
+            self.configParser.has_option("global", "dashboardExchange") and
+            self.configParser.has_option("global", "dashboardTopic") and
+            self.configParser.has_option("global", "dashboardAttempts") and
+                self.configParser.has_option("global", "dashboardRetryDelay")):
+            from cybertop.publisher import DashboardPublisher
+            self.publisher = DashboardPublisher(
+                self.configParser.get("global", "dashboardHost"),
+                self.configParser.getint("global", "dashboardPort"),
+                self.configParser.get("global", "dashboardExchange"),
+                self.configParser.get("global", "dashboardTopic"),
+                self.configParser.getint("global", "dashboardAttempts"),
+                self.configParser.getint("global", "dashboardRetryDelay"))
+        else:
+            self.publisher = None
+        # Delivers the remediations in background, if requested.
+        outboxSize = self.configParser.getint("global", "outboxSize", fallback=1000)
+        if self.publisher is not None and outboxSize > 0:
+            self.outbox = Outbox(self.publisher, outboxSize,
+                                 self.configParser.get("global", "outboxSpoolDirectory", fallback=None),
+                                 self.configParser.getint("global", "outboxRetryDelay", fallback=5))
+        else:
+            self.outbox = None
         # Starts with no attack info.
-        self.attacks = {}
+        if self.configParser.getboolean("global", "attacksAutoFinalize", fallback=False):
+            evictionCallback = self.finalizeAttack
+        else:
+            evictionCallback = None
+        self.attacks = AttackRegistry(
+            self.configParser.getint("global", "attacksMaxCount", fallback=1000),
+            self.configParser.getint("global", "attacksMaxBufferedEvents", fallback=100000),
+            self.configParser.getint("global", "attacksIdleTimeout", fallback=3600),
+            self.configParser.get("global", "attacksSpoolDirectory", fallback=None),
+            evictionCallback)
         # Connection to the DARE rabbitMQ queue
         self.r_connection = None
         self.r_channel = None
         self.r_closingConnection = False
-        LOG.info("CyberSecurity Topologies initialized.")
+        self.decoder = MessageDecoder()
+        # Acknowledges the messages in batches, if requested.
+        self.ackBatchSize = self.configParser.getint("global", "serverAckBatchSize", fallback=1)
+        self.ackBatchDelay = self.configParser.getfloat("global", "serverAckBatchDelay", fallback=1.0)
+        self.ackBatcher = None
+        self.__sendLock = threading.Lock()
+        # Exports the metrics, if requested.
+        self.metricsExporter = getMetricsExporter(self.configParser)
+        # Reloads the changed recipes, landscape and plug-ins in background,
+        # once started.
+        self.artifactWatcher = None
+        startupSeconds = time.perf_counter() - start
+        METRICS.set("cybertop_startup_seconds", startupSeconds)
+        LOG.info("CyberSecurity Topologies initialized in %.3f s.", startupSeconds)
 
     def start(self):
         input = self.configParser.get("global", "inputMethod")
         LOG.info("Input method: " + input)
+        self.watch()
+        if self.configParser.get("global", "inputEngine", fallback="threads") == "asyncio":
+            if input not in ("queue", "csv", "all"):
+                LOG.error("Unknown input method chosen (queue, csv allowed)")
+                return
+            # The transport libraries are only imported when needed.
+            from cybertop.engine import IngestionEngine
+            IngestionEngine(self).run(input)
+            return
         if input == "queue":
             self.listenRabbitMQ()
         elif input == "csv":
@@ -123,6 +229,20 @@ class CyberTop(pyinotify.ProcessEvent):
             return
         LOG.info("Cybertop started")
 
+    def watch(self):
+        """
+        Starts reloading the configuration on SIGHUP and the changed recipes,
+        landscape and plug-ins in background, until closed. Only the daemon
+        does it, so that the other instances start no threads.
+        """
+        self.configuration.watch()
+        if self.artifactWatcher is None:
+            self.artifactWatcher = ArtifactWatcher(
+                self.configParser, self.parser, self.recipesReasoner,
+                self.hsplReasoner, self.msplReasoner,
+                self.configParser.getint("global", "reloadInterval", fallback=5),
+                self.__onArtifactsReload)
+
     def spawnThreads(self):
         t_rabbit = threading.Thread(target=self.listenRabbitMQ)
         t_csv = threading.Thread(target=self.listenFolder)
@@ -142,16 +262,7 @@ class CyberTop(pyinotify.ProcessEvent):
         @raise SyntaxError: When the generated XML is not valid.
         """
         attack = self.parser.getAttackFromFile(attackFileName)
-        landscape = self.parser.getLandscape(landscapeFileName)
-        recipes = self.recipesReasoner.getRecipes(attack, landscape)
-        hsplSet = self.hsplReasoner.getHSPLs(attack, recipes, landscape)
-        msplSet = self.msplReasoner.getMSPLs(hsplSet, landscape,
-                                             attack.anomaly_name)
-
-        if hsplSet is None or msplSet is None:
-            return None
-        else:
-            return [hsplSet, msplSet]
+        return self.__getMSPLs(attack, landscapeFileName)
 
     def getMSPLsFromList(self, identifier, severity, attackType, attackList,
                          landscapeFileName, anomaly_name):
@@ -170,30 +281,104 @@ class CyberTop(pyinotify.ProcessEvent):
         attack = self.parser.getAttackFromList(identifier, severity, attackType,
                                                attackList, anomaly_name)
         LOG.debug("Got attack from list")
-        landscape = self.parser.getLandscape(landscapeFileName)
-        LOG.debug("Got landscape")
-        recipes = self.recipesReasoner.getRecipes(attack, landscape)
-        LOG.debug("Got recipes")
-        hsplSet = self.hsplReasoner.getHSPLs(attack, recipes, landscape)
-        LOG.debug("Got HSPL set")
-        msplSet = self.msplReasoner.getMSPLs(hsplSet, landscape, anomaly_name)
-        LOG.debug("Got MSPL set")
-        if hsplSet is None or msplSet is None:
-            return None
-        else:
-            return [hsplSet, msplSet]
+        return self.__getMSPLs(attack, landscapeFileName)
+
+    def getMSPLsFromAttackInfo(self, attackInfo, landscapeFileName):
+        """
+        Retrieve the HSPLs that can be used to mitigate an attack whose events
+        were already parsed, filtered and turned into HSPLs while received.
+        @param attackInfo: the attack info.
+        @param landscapeFileName: the name of the landscape file to parse.
+        @return: The HSPL set and MSPL set that can mitigate the attack. It is
+                 None if the attack is not manageable.
+        @raise IOError: if the attack events have an invalid format.
+        @raise SyntaxError: When the generated XML is not valid.
+        """
+        attack = attackInfo.getAttack()
+        timestamp = attackInfo.getTimestamp()
+        fingerprint, r = self.__getCachedMSPLs(attack, attackInfo.getDigest(),
+                                               timestamp, landscapeFileName)
+        if r is not None:
+            return r
+
+        r = getRemediation(self.parser, self.recipesReasoner,
+                           self.hsplReasoner, self.msplReasoner, attack,
+                           timestamp, attackInfo.getBuilders(),
+                           landscapeFileName)
+        if r is not None and fingerprint is not None:
+            self.policyCache.put(fingerprint, r[0], r[1])
+        return r
+
+    def __getMSPLs(self, attack, landscapeFileName):
+        """
+        Retrieve the HSPLs that can be used to mitigate a parsed attack,
+        reusing the cached ones when the same attack was already seen.
+        @param attack: the attack to mitigate.
+        @param landscapeFileName: the name of the landscape file to parse.
+        @return: The HSPL set and MSPL set that can mitigate the attack. It is
+                 None if the attack is not manageable.
+        @raise SyntaxError: When the generated XML is not valid.
+        """
+        digest = None
+        if self.__isCaching():
+            digest = AttackDigest()
+            for i in attack.events:
+                digest.add(i)
+        fingerprint, r = self.__getCachedMSPLs(attack, digest,
+                                               attack.getTimestamp(),
+                                               landscapeFileName)
+        if r is not None:
+            return r
+
+        r = getAttackRemediation(self.parser, self.recipesReasoner,
+                                 self.hsplReasoner, self.msplReasoner, attack,
+                                 landscapeFileName)
+        if r is not None and fingerprint is not None:
+            self.policyCache.put(fingerprint, r[0], r[1])
+        return r
+
+    def __isCaching(self):
+        """
+        Checks if the remediations can be cached. They cannot with the vNSFO
+        integration, since the running IT resources may change at any time.
+        @return: True if the remediations can be cached, False otherwise.
+        """
+        return (self.policyCache is not None and
+                not self.configuration.settings.vnsfoEnabled)
+
+    def __getCachedMSPLs(self, attack, digest, timestamp, landscapeFileName):
+        """
+        Retrieve the cached HSPLs of an attack.
+        @param attack: the attack to mitigate.
+        @param digest: the digest of the attack events.
+        @param timestamp: the attack timestamp.
+        @param landscapeFileName: the name of the landscape file to use.
+        @return: The attack fingerprint, None if the cache is disabled, and
+                 the cached HSPL set and MSPL set, None if they are not cached.
+        """
+        if not self.__isCaching():
+            return None, None
+
+        fingerprint = digest.getFingerprint(
+            attack, self.parser.getLandscapeVersion(landscapeFileName),
+            self.recipesReasoner.getRecipesVersion())
+        r = self.policyCache.get(fingerprint, timestamp)
+        if r is not None:
+            LOG.info("Cached remediation reused (hit ratio: %.2f)",
+                     self.policyCache.getHitRatio())
+        return fingerprint, r
 
     def listenFolder(self):
         """
         Starts the CyberTop policy engine by listening to a folder.
         """
         LOG.debug("Request for directory listening")
-        directory = self.configParser.get("global", "watchedDirectory")
-        LOG.debug("Starting directory listener: " + directory)
-        wm = pyinotify.WatchManager()
-        notifier = pyinotify.Notifier(wm, self)
-        wm.add_watch(directory, pyinotify.IN_CLOSE_WRITE, rec=True, auto_add=True)
-        notifier.loop(daemonize=False)
+        from cybertop.folder import FolderIngestion
+        self.folderIngestion = FolderIngestion(self)
+        try:
+            self.folderIngestion.run()
+        finally:
+            self.folderIngestion.close()
 
     def send(self, hsplSet, msplSet):
         """
@@ -202,49 +387,111 @@ class CyberTop(pyinotify.ProcessEvent):
         @param msplSet: the MSPL set.
         """
 
-        if (self.configParser.has_option("global", "dashboardHost") and
-            self.configParser.has_option("global", "dashboardPort") and
-            self.configParser.has_option("global", "dashboardExchange") and
-            self.configParser.has_option("global", "dashboardTopic") and
-            self.configParser.has_option("global", "dashboardAttempts") and
-                self.configParser.has_option("global", "dashboardRetryDelay")):
+        if self.publisher is None:
+            return
 
-            host = self.configParser.get("global", "dashboardHost")
-            port = self.configParser.getint("global", "dashboardPort")
-            connectionAttempts = self.configParser.getint("global",
-                                                          "dashboardAttempts")
-            retryDelay = self.configParser.getint("global",
-                                                  "dashboardRetryDelay")
-            connection = pika.BlockingConnection(pika.ConnectionParameters(
-                host=host,
-                port=port,
-                connection_attempts=connectionAttempts,
-                retry_delay=retryDelay,
-                blocked_connection_timeout=300))
-            self.channel = connection.channel()
-            self.channel.exchange_declare(exchange=self.configParser.
-                                          get("global", "dashboardExchange"),
-                                          exchange_type="topic")
-            LOG.info("Connected to the dashboard at " + host + ":" + str(port))
-            hsplString = etree.tostring(hsplSet).decode()
-            msplString = etree.tostring(msplSet).decode()
-            content = self.configParser.get("global", "dashboardContent")
-            if content == "HSPL":
-                message = hsplString
-            elif content == "MSPL":
-                message = msplString
+        # Computes the delta with respect to the last remediation, if needed.
+        if self.deltaReasoner is None:
+            delta = None
+            messages = [(self.__getMessage(hsplSet, msplSet), None)]
+        else:
+            delta = self.deltaReasoner.getDelta(hsplSet, msplSet)
+            if delta is None:
+                LOG.info("Remediation unchanged since the last push, nothing to forward")
+                return
+            messages = []
+            if delta.addedHSPLs is not None or delta.addedMSPLs is not None:
+                messages.append((self.__getMessage(delta.addedHSPLs, delta.addedMSPLs), "add"))
+            if delta.removedHSPLs is not None or delta.removedMSPLs is not None:
+                messages.append((self.__getMessage(delta.removedHSPLs, delta.removedMSPLs), "remove"))
+
+        LOG.info("Pushing the remediation to the dashboard")
+        # The delta is recorded as pushed only once its last message has been delivered.
+        callback = None
+        if delta is not None:
+            callback = functools.partial(self.deltaReasoner.commit, delta)
+        for index, (message, operation) in enumerate(messages):
+            if operation is None:
+                headers = None
+            else:
+                LOG.info("Pushing the delta remediation (%s)" % operation)
+                headers = {"delta": operation}
+            if self.outbox is None:
+                self.publisher.publish(message, headers)
             else:
-                message = hsplString + msplString
-
-            LOG.info("Pushing the remediation to the dashboard")
-            exchange = self.configParser.get("global", "dashboardExchange")
-            topic = self.configParser.get("global", "dashboardTopic")
-            self.channel.basic_publish(exchange=exchange,
-                                       routing_key=topic, body=message)
-            LOG.debug("Dashboard RabbitMQ exchange: " + exchange + " topic: " + topic)
+                # The outbox takes care of the delivery, even across restarts.
+                self.outbox.put(message, headers,
+                                callback if index == len(messages) - 1 else None)
+        if self.outbox is None:
             LOG.info("Remediation forwarded to the dashboard")
-            self.channel.close()
-            LOG.info("Connection with the dashboard closed")
+            if callback is not None:
+                callback()
+        else:
+            LOG.info("Remediation queued for the dashboard")
+
+    def close(self):
+        """
+        Waits for the attacks being reasoned on, stops the remediation delivery
+        and releases the connection with the dashboard. The queued
+        remediations are delivered first, for a while, and the undelivered
+        ones are left in the spool.
+        """
+        if self.reasoningPool is not None:
+            self.reasoningPool.close()
+        if self.outbox is not None:
+            self.outbox.close()
+        if self.publisher is not None:
+            self.publisher.close()
+        if self.metricsExporter is not None:
+            self.metricsExporter.close()
+        if self.artifactWatcher is not None:
+            self.artifactWatcher.close()
+            self.artifactWatcher = None
+        self.configuration.close()
+        closeClients()
+        PROFILER.close()
+
+    def __onReload(self):
+        """
+        Discards the remediations cached before the configuration was
+        reloaded.
+        """
+        if self.policyCache is not None:
+            self.policyCache.clear()
+
+    def __onArtifactsReload(self, artifacts):
+        """
+        Discards the remediations cached before the plug-ins were reloaded,
+        since the recipes and the landscape are already part of their
+        fingerprints.
+        @param artifacts: The reloaded artifact names.
+        """
+        if ArtifactWatcher.PLUGINS in artifacts:
+            self.pluginManager = self.parser.pluginManager
+            self.__onReload()
+
+    def __getMessage(self, hsplSet, msplSet):
+        """
+        Creates the message to send to the dashboard.
+        @param hsplSet: the HSPL set or None if there are no HSPLs to send.
+        @param msplSet: the MSPL set or None if there are no MSPLs to send.
+        @return: the message content.
+        """
+        if hsplSet is None:
+            hsplString = ""
+        else:
+            hsplString = etree.tostring(hsplSet).decode()
+        if msplSet is None:
+            msplString = ""
+        else:
+            msplString = etree.tostring(msplSet).decode()
+        content = self.configuration.settings.dashboardContent
+        if content == "HSPL":
+            return hsplString
+        elif content == "MSPL":
+            return msplString
+        else:
+            return hsplString + msplString
 
     def process_IN_CLOSE_WRITE(self, event):
         """
@@ -252,31 +499,20 @@ class CyberTop(pyinotify.ProcessEvent):
         @param event: The file event.
         """
         LOG.debug("Callback from event in directory")
-        try:
-            # First, translate the CSV in HSPL, MSPL sets
-            [hsplSet, msplSet] = self.getMSPLsFromFile(event.pathname,
-                                               self.configParser.
-                                               get("global",
-                                                   "landscapeFile"))
-
-            # Then, if extra logging is activated, print HSPL (and/or MSPL)
-            # to an external file
-            if self.configParser.has_option("global", "hsplsFile"):
-                with open(self.configParser.get("global", "hsplsFile"), "w") as f:
-                    f.write(etree.tostring(hsplSet, pretty_print=True).
-                            decode())
-            if self.configParser.has_option("global", "msplsFile"):
-                with open(self.configParser.get("global", "msplsFile"), "w") as f:
-                    f.write(etree.tostring(msplSet, pretty_print=True).
-                            decode())
+        self.processFile(event.pathname)
 
-            # Finally, sends everything to RabbitMQ.
-            self.send(hsplSet, msplSet)
+    def processFile(self, fileName):
+        """
+        Remediates the attack contained in a file and sends the policies.
+        @param fileName: The attack file name.
+        """
+        try:
+            # First, translate the CSV in HSPL, MSPL sets, then dumps and
+            # sends them.
+            self.sendRemediation(self.getMSPLsFromFile(
+                fileName, self.configParser.get("global", "landscapeFile")))
         except BaseException as e:
             LOG.critical(str(e))
-            if self.channel is not None:
-                if not self.channel.is_closed:
-                    self.channel.close()
 
     def processMessage(self, channel, method, header, body):
         """
@@ -287,79 +523,244 @@ class CyberTop(pyinotify.ProcessEvent):
         @param body: The message body.
         """
         LOG.debug("Callback from event in RabbitMQ")
-        line = body.decode()
-        dialect = Sniffer().sniff(line)
-        fields = []
-        for i in reader([line], dialect):
-            fields += i
-
-        LOG.debug("DARE RabbitMQ message: " + line)
-        if len(fields) == 4 and fields[0].isdigit() and match("(very\s+)?(low|high)", fields[1], IGNORECASE) and fields[3] == "start":
-            identifier = int(fields[0])
-            severity = " ".join(fields[1].lower().split())
-            attackType = fields[2]
-            LOG.info("Attack started (id: %d, severity: %s, type: %s)" % (identifier, severity, attackType))
-
-            key = "%d-%s-%s" % (identifier, severity, attackType)
+        if self.ackBatchSize > 1:
+            if self.ackBatcher is None or self.ackBatcher.channel is not channel:
+                self.ackBatcher = AckBatcher(channel, self.ackBatchSize,
+                                             self.ackBatchDelay)
+            self.ackBatcher.receive(method.delivery_tag)
+        self.handleMessage(body, functools.partial(self.__acknowledge, channel,
+                                                   method.delivery_tag))
+
+    def flushAcknowledgments(self):
+        """
+        Acknowledges all the processed messages whose acknowledgment is
+        still batched.
+        """
+        if self.ackBatcher is not None:
+            self.ackBatcher.flush()
+
+    def handleMessage(self, body, acknowledge, finalize=None):
+        """
+        Handles a DARE message, regardless of how it was received.
+        @param body: The message body, that is a single message or a batch of
+                     messages, one per line.
+        @param acknowledge: The function acknowledging the message, called
+                            when the message has been processed or, for the
+                            stop messages, when their remediations are ready.
+        @param finalize: The function finalizing a stopped attack, called
+                         with the attack key, the attack info and the
+                         acknowledge function, or None to use
+                         finalizeAttack(). With attacksAutoFinalize, it also
+                         finalizes the attacks evicted to make room, without
+                         the acknowledge function.
+        """
+        if finalize is None:
+            finalize = self.finalizeAttack
+        # A body can contain a batch of messages, one per line: it is
+        # acknowledged when all of them are processed.
+        countdown = AckCountdown(acknowledge)
+        for line, message in self.decoder.decodeAll(body):
+            self.__handleDecodedMessage(line, message, countdown, finalize)
+        countdown.done()
+
+    def __handleDecodedMessage(self, line, message, countdown, finalize):
+        """
+        Handles a single DARE message.
+        @param line: The message line.
+        @param message: The decoded message or None if it has an unknown
+                        format.
+        @param countdown: The countdown of the body containing the message.
+        @param finalize: The function finalizing a stopped attack.
+        """
+        if message is None:
+            LOG.warning("Unknown message format: " + line)
+        elif message.kind == DAREMessage.START:
+            LOG.info("Attack started (id: %d, severity: %s, type: %s)" % (message.identifier, message.severity, message.attackType))
+
+            key = message.getKey()
             if key in self.attacks:
                 LOG.warning("Duplicate start message")
             else:
-                self.attacks[key] = AttackInfo(identifier, severity, attackType)
-        elif len(fields) == 4 and fields[0].isdigit() and match("(very\s+)?(low|high)", fields[1], IGNORECASE) and fields[3] == "stop":
-            identifier = int(fields[0])
-            severity = " ".join(fields[1].lower().split())
-            attackType = fields[2]
-            LOG.info("Attack stopped (id: %d, severity: %s, type: %s)" % (identifier, severity, attackType))
+                try:
+                    attackInfo = AttackInfo(message.identifier, message.severity, message.attackType,
+                                            self.parser, self.recipesReasoner, self.hsplReasoner)
+                except IOError as e:
+                    LOG.error("The attack cannot be handled: " + str(e))
+                    # Its events are silently discarded.
+                    attackInfo = None
+                # The attacks evicted to make room are finalized like the
+                # stopped ones, so the caller decides where they are reasoned
+                # on.
+                if self.attacks.evictionCallback is None:
+                    self.attacks.put(key, attackInfo)
+                else:
+                    self.attacks.put(key, attackInfo, finalize)
+        elif message.kind == DAREMessage.STOP:
+            LOG.info("Attack stopped (id: %d, severity: %s, type: %s)" % (message.identifier, message.severity, message.attackType))
 
             # store the anomaly detection name in a variable
-            anomaly_name = attackType
+            anomaly_name = message.attackType
             LOG.debug("Anomaly name is: " + anomaly_name)
 
-            key = "%d-%s-%s" % (identifier, severity, attackType)
+            key = message.getKey()
             if key not in self.attacks:
                 LOG.warning("Stop message without initial start message")
-            else:
-                attackInfo = self.attacks[key]
+            elif self.attacks[key] is None:
                 self.attacks.pop(key)
-                identifier = attackInfo.getIdentifier()
-                severity = attackInfo.getSeverity()
-                attackType = attackInfo.getType()
-                events = attackInfo.getEvents()
-                landscapeFileName = self.configParser.get("global", "landscapeFile")
-
-                LOG.debug("Get mspls from list")
-                # First, translate the CSV in HSPL, MSPL sets
-                [hsplSet, msplSet] = self.getMSPLsFromList(identifier, severity, attackType, events, landscapeFileName, anomaly_name)
-                LOG.debug("Got mspls from list")
-                # Then, if extra logging is activated, print HSPL (and/or MSPL)
-                # to an external file
-                if self.configParser.has_option("global", "hsplsFile"):
-                    with open(self.configParser.get("global", "hsplsFile"), "w") as f:
-                        f.write(etree.tostring(hsplSet, pretty_print=True).
-                                decode())
-                if self.configParser.has_option("global", "msplsFile"):
-                    with open(self.configParser.get("global", "msplsFile"), "w") as f:
-                        f.write(etree.tostring(msplSet, pretty_print=True).
-                                decode())
-
-                # Finally, sends everything to RabbitMQ.
-                self.send(hsplSet, msplSet)
-
-        elif len(fields) > 4 and fields[0].isdigit() and match("(very\s+)?(low|high)", fields[1], IGNORECASE):
-            identifier = int(fields[0])
-            severity = " ".join(fields[1].lower().split())
-            attackType = fields[2]
-            LOG.debug("Attack event (id: %d, severity: %s, type: %s, body: %s)" % (identifier, severity, attackType, line))
-
-            key = "%d-%s-%s" % (identifier, severity, attackType)
+                LOG.warning("Stop message of an attack that cannot be handled")
+            else:
+                # The stop message is acknowledged only when its remediation
+                # is ready, so the prefetch limit also bounds the attacks
+                # being reasoned on.
+                countdown.add()
+                finalize(key, self.attacks.pop(key), countdown.done)
+        else:
+            LOG.debug("Attack event (id: %d, severity: %s, type: %s)" % (message.identifier, message.severity, message.attackType))
+
+            key = message.getKey()
             if key not in self.attacks:
                 LOG.warning("Attack event without initial start message")
             else:
-                self.attacks[key].addEvent("\t".join(fields[3:]))
+                # The event is parsed and turned into HSPLs straight away.
+                self.attacks.addEvent(key, message.fields)
+
+    def finalizeAttack(self, key, attackInfo, done=None):
+        """
+        Generates and sends the remediation of an attack whose events were
+        already processed. The reasoning is carried out by the worker pool,
+        if any.
+        @param key: The attack key.
+        @param attackInfo: The attack info.
+        @param done: The function called when the remediation is sent or when
+                     the reasoning fails in background, or None.
+        """
+        landscapeFileName = self.configParser.get("global", "landscapeFile")
+        if self.reasoningPool is None:
+            try:
+                LOG.debug("Get mspls from attack info")
+                # First, finalize the HSPL, MSPL sets, the events were already processed.
+                r = self.getMSPLsFromAttackInfo(attackInfo, landscapeFileName)
+                LOG.debug("Got mspls from attack info")
+            finally:
+                attackInfo.close()
+            self.sendRemediation(r)
+            if done is not None:
+                done()
+            return
+
+        try:
+            attack = attackInfo.getAttack()
+            timestamp = attackInfo.getTimestamp()
+            fingerprint, r = self.__getCachedMSPLs(attack, attackInfo.getDigest(),
+                                                   timestamp, landscapeFileName)
+        except BaseException:
+            attackInfo.close()
+            raise
+        if r is not None:
+            attackInfo.close()
+            self.sendRemediation(r)
+            if done is not None:
+                done()
+            return
+
+        def onResult(r):
+            try:
+                attackInfo.close()
+                if r is not None and fingerprint is not None:
+                    self.policyCache.put(fingerprint, r[0], r[1])
+                self.sendRemediation(r)
+            finally:
+                if done is not None:
+                    done()
+
+        def onError(e):
+            attackInfo.close()
+            LOG.critical("Unable to mitigate the attack '%s': %s", key, str(e))
+            if done is not None:
+                done()
+
+        LOG.debug("Attack '%s' submitted to the reasoning workers", key)
+        try:
+            self.reasoningPool.submit(attack, timestamp, attackInfo.getBuilders(),
+                                      landscapeFileName, onResult, onError)
+        except BaseException:
+            attackInfo.close()
+            raise
+
+    def sendRemediation(self, r, hsplsFileName=None, msplsFileName=None):
+        """
+        Dumps and sends a remediation.
+        @param r: The HSPL set and MSPL set or None if the attack is not
+                  manageable.
+        @param hsplsFileName: The HSPL dump file name or None to use the
+                              configured one, if any.
+        @param msplsFileName: The MSPL dump file name or None to use the
+                              configured one, if any.
+        """
+        if r is None:
+            LOG.warning("No remediation available for the attack")
+            return
+        [hsplSet, msplSet] = r
+        if hsplsFileName is None:
+            hsplsFileName = self.configParser.get("global", "hsplsFile", fallback=None)
+        if msplsFileName is None:
+            msplsFileName = self.configParser.get("global", "msplsFile", fallback=None)
+
+        # The remediations completed by the workers are sent one at a time.
+        with self.__sendLock:
+            ns = getHSPLNamespace()
+            timer = StageTimer(hsplSet.findtext("{%s}hspl-set/{%s}context/{%s}type" % (ns, ns, ns)),
+                               hsplSet.findtext("{%s}hspl-set/{%s}context/{%s}severity" % (ns, ns, ns)))
+            # Then, if extra logging is activated, print HSPL (and/or MSPL)
+            # to an external file
+            if hsplsFileName is not None:
+                with open(hsplsFileName, "w") as f:
+                    f.write(etree.tostring(hsplSet, pretty_print=True).
+                            decode())
+            if msplsFileName is not None:
+                with open(msplsFileName, "w") as f:
+                    f.write(etree.tostring(msplSet, pretty_print=True).
+                            decode())
+            timer.lap("serialize")
+
+            # Finally, sends everything to RabbitMQ.
+            self.send(hsplSet, msplSet)
+            timer.lap("publish")
+
+    def __acknowledge(self, channel, deliveryTag):
+        """
+        Acknowledges a message, from any thread.
+        @param channel: The channel the message was received from.
+        @param deliveryTag: The message delivery tag.
+        """
+        if self.reasoningPool is None or self.r_connection is None:
+            self.__complete(channel, deliveryTag)
         else:
-            LOG.warning("Unknown message format: " + line)
+            # Only the ioloop thread can use the channel.
+            self.r_connection.ioloop.add_callback_threadsafe(
+                functools.partial(self.__acknowledgeNow, channel, deliveryTag))
 
-        channel.basic_ack(delivery_tag = method.delivery_tag)
+    def __acknowledgeNow(self, channel, deliveryTag):
+        """
+        Acknowledges a message from the ioloop thread.
+        @param channel: The channel the message was received from.
+        @param deliveryTag: The message delivery tag.
+        """
+        if channel is not self.r_channel or not channel.is_open:
+            LOG.warning("Channel closed, the stop message will be delivered again")
+            return
+        self.__complete(channel, deliveryTag)
+
+    def __complete(self, channel, deliveryTag):
+        """
+        Acknowledges a processed message, possibly in a batch.
+        @param channel: The channel the message was received from.
+        @param deliveryTag: The message delivery tag.
+        """
+        if self.ackBatcher is not None and self.ackBatcher.channel is channel:
+            self.ackBatcher.complete(deliveryTag)
+        else:
+            channel.basic_ack(delivery_tag=deliveryTag)
 
     def listenRabbitMQ(self):
         """
@@ -376,14 +777,31 @@ class CyberTop(pyinotify.ProcessEvent):
 
     def on_connection_open(self, new_connection):
         LOG.debug('Opened connection')
+        # The dialect is learned again, since the sender may be different.
+        self.decoder.reset()
         self.r_connection.add_on_close_callback(self.on_connection_closed)
         self.open_channel()
+        self.r_connection.ioloop.call_later(self.ATTACKS_CHECK_INTERVAL, self.on_attacks_check)
+        if self.ackBatchSize > 1:
+            self.r_connection.ioloop.call_later(self.ackBatchDelay, self.on_ack_flush)
+
+    def on_attacks_check(self):
+        self.attacks.expire()
+        if self.r_connection is not None and not self.r_closingConnection:
+            self.r_connection.ioloop.call_later(self.ATTACKS_CHECK_INTERVAL, self.on_attacks_check)
+
+    def on_ack_flush(self):
+        self.flushAcknowledgments()
+        if self.r_connection is not None and not self.r_closingConnection:
+            self.r_connection.ioloop.call_later(self.ackBatchDelay, self.on_ack_flush)
 
-    def on_connection_closed(self, connection, reply_code, reply_text):
-        LOG.debug("Detected a closed connection... Reconnecting in a while...")
+    def on_connection_closed(self, connection, reason):
+        LOG.debug("Detected a closed connection (%s)... Reconnecting in a while...", str(reason))
         self.r_channel = None
+        # The unacknowledged messages will be delivered again.
+        self.ackBatcher = None
         if not self.r_closingConnection:
-            self.r_connection.add_timeout(5, self.reconnect)
+            self.r_connection.ioloop.call_later(5, self.reconnect)
         else:
             self.r_connection.ioloop.stop()
 
@@ -408,13 +826,14 @@ class CyberTop(pyinotify.ProcessEvent):
         exchange = self.configParser.get("global", "serverExchange")
 
         self.r_channel = channel
-        self.r_channel.exchange_declare(self.on_exchange_declareok,
-                                        exchange, "topic")
+        self.r_channel.exchange_declare(exchange=exchange, exchange_type="topic",
+                                        callback=self.on_exchange_declareok)
 
     def on_exchange_declareok(self, unused_frame):
         LOG.debug("Exchange declare is ok, declaring queue")
         queue = self.configParser.get("global", "serverQueue")
-        self.r_channel.queue_declare(self.on_queue_declareok, queue, durable=True)
+        self.r_channel.queue_declare(queue=queue, durable=True,
+                                     callback=self.on_queue_declareok)
 
     def on_queue_declareok(self, frame):
         LOG.debug("Queue declare is ok, binding queue")
@@ -422,13 +841,19 @@ class CyberTop(pyinotify.ProcessEvent):
         exchange = self.configParser.get("global", "serverExchange")
         topic = self.configParser.get("global", "serverTopic")
 
-        self.r_channel.queue_bind(self.on_bindok, queue, exchange, topic)
+        self.r_channel.queue_bind(queue=queue, exchange=exchange,
+                                  routing_key=topic, callback=self.on_bindok)
 
     def on_bindok(self, frame):
         LOG.debug("Binding queue is ok, start consuming")
         queue = self.configParser.get("global", "serverQueue")
         self.r_channel.add_on_cancel_callback(self.on_consumer_cancelled)
-        self.r_channel.basic_consume(self.processMessage, queue=queue)
+        # Limits the unacknowledged messages, that is the backpressure.
+        prefetch = self.configParser.getint("global", "serverPrefetch", fallback=100)
+        if prefetch > 0:
+            self.r_channel.basic_qos(prefetch_count=prefetch)
+        self.r_channel.basic_consume(queue=queue,
+                                     on_message_callback=self.processMessage)
 
     def on_consumer_cancelled(self, frame):
         LOG.debug("Consumer cancelled")
@@ -439,23 +864,31 @@ class CyberTop(pyinotify.ProcessEvent):
         LOG.debug("RabbitMQ connect invoked")
         address = self.configParser.get("global", "serverAddress")
         port = self.configParser.getint("global", "serverPort")
+        import pika
         return pika.SelectConnection(
             pika.ConnectionParameters(host=address, port=port),
-            self.on_connection_open, self.on_connection_error,
-            stop_ioloop_on_close=False)
+            on_open_callback=self.on_connection_open,
+            on_open_error_callback=self.on_connection_error)
 
 
 class AttackInfo:
     """
-    The attack information class use to perform multi-attack analysis.
+    The attack information class use to perform multi-attack analysis. The
+    events are parsed, filtered and turned into HSPLs as soon as they are
+    received, so only the final steps are left when the attack stops.
     """
 
-    def __init__(self, identifier, severity, attackType):
+    def __init__(self, identifier, severity, attackType, parser,
+                 recipesReasoner, hsplReasoner):
         """
         Creates the attack info object.
         @param identifier: the attack id.
         @param severity: the attack severity.
         @param attackType: the attack type.
+        @param parser: the parser.
+        @param recipesReasoner: the recipes reasoner.
+        @param hsplReasoner: the HSPL reasoner.
+        @raise IOError: if no suitable parser plug-in is available.
         """
 
         self.__identifier = identifier
@@ -468,23 +901,132 @@ class AttackInfo:
         else:
             self.__severity = 4
         self.__attackType = attackType
-        self.__events = []
+
+        self.__parser = parser
+        plugin = parser.getParserPlugin(attackType)
+        self.__parserPlugin = plugin.plugin_object
+        # The attack object never stores the events.
+        self.__attack = Attack(self.__severity,
+                               plugin.details.get("Core", "Attack"),
+                               identifier, attackType)
+        self.__builders = hsplReasoner.getBuilders(
+            recipesReasoner.getCandidateRecipes(self.__attack))
+        self.__digest = AttackDigest()
+        self.__timestamp = None
+        self.__count = 0
+        self.__eventsCount = 0
+        self.__parseSeconds = 0.0
+        self.__accounted = False
+        self.__error = None
 
     def addEvent(self, event):
         """
         Adds an attack event.
-        @param event: the event to add.
+        @param event: the event to add, that is the list of its fields.
+        """
+
+        self.__count += 1
+        if self.__error is not None:
+            return
+        start = time.perf_counter()
+        try:
+            attackEvent = self.__parserPlugin.parse_fields(None, self.__count,
+                                                           event)
+        except IOError as e:
+            # The error is reported when the attack stops.
+            self.__error = e
+            return
+        finally:
+            self.__parseSeconds += time.perf_counter() - start
+        if attackEvent is None:
+            return
+
+        self.__eventsCount += 1
+        if self.__timestamp is None or attackEvent.timestamp < self.__timestamp:
+            self.__timestamp = attackEvent.timestamp
+        self.__digest.add(attackEvent)
+        for i in self.__builders:
+            i.add(attackEvent)
+
+    def getAttack(self):
+        """
+        Retrieves the attack, without its events.
+        @return: the attack.
+        @raise IOError: if an event has an invalid format or if there are no
+                        events.
+        """
+
+        if self.__error is not None:
+            raise self.__error
+        if self.__count == 0:
+            LOG.critical("The list is empty")
+            raise IOError("The list is empty")
+
+        LOG.info("Parsed an attack of type '%s' with severity %d and containing %d events.", self.__attack.type, self.__attack.severity, self.__eventsCount)
+        if not self.__accounted:
+            self.__accounted = True
+            self.__parser.accountAttack(self.__attack, self.__eventsCount,
+                                        self.__parseSeconds)
+        return self.__attack
+
+    def getTimestamp(self):
+        """
+        Retrieves the attack timestamp.
+        @return: the timestamp of the oldest event or None if there are no
+                 events.
+        """
+
+        return self.__timestamp
+
+    def getDigest(self):
+        """
+        Retrieves the digest of the attack events.
+        @return: the attack digest.
+        """
+
+        return self.__digest
+
+    def getBuilders(self):
+        """
+        Retrieves the HSPL builders of the candidate recipes.
+        @return: the list of HSPL builders.
+        """
+
+        return self.__builders
+
+    def getBufferedEvents(self):
+        """
+        Retrieves the number of events buffered in memory, as HSPLs.
+        @return: the number of buffered events.
+        """
+
+        return sum(i.getBufferedCount() for i in self.__builders)
+
+    def spill(self, directory=None):
+        """
+        Moves the buffered events to temporary files.
+        @param directory: the directory of the temporary files or None to use
+                          the default one.
+        @return: the number of spilled events.
+        """
+
+        return sum(i.spill(directory) for i in self.__builders)
+
+    def close(self):
+        """
+        Releases the temporary files, if any.
         """
 
-        self.__events.append(event)
+        for i in self.__builders:
+            i.close()
 
-    def getEvents(self):
+    def getEventsCount(self):
         """
-        Retrieves the attack events.
-        @return: the attack events.
+        Retrieves the number of parsed attack events.
+        @return: the number of events.
         """
 
-        return self.__events
+        return self.__eventsCount
 
     def getIdentifier(self):
         """
@@ -0,0 +1,157 @@
+# Copyright 2018 Politecnico di Torino
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+DARE messages decoding.
+
+@author: Daniele Canavese
+"""
+
+import csv
+import re
+from cybertop.log import LOG
+
+# The severity format.
+SEVERITY_PATTERN = re.compile(r"(very\s+)?(low|high)", re.IGNORECASE)
+
+
+class DAREMessage(object):
+    """
+    A decoded DARE message, that is an attack start, an attack event or an attack stop.
+    """
+
+    # The message kinds.
+    START = "start"
+    EVENT = "event"
+    STOP = "stop"
+
+    def __init__(self, kind, identifier, severity, attackType, fields=None):
+        """
+        Constructor.
+        @param kind: The message kind.
+        @param identifier: The attack id.
+        @param severity: The normalized attack severity, e.g. "very low".
+        @param attackType: The attack type.
+        @param fields: The event fields or None if this is not an event.
+        """
+        self.kind = kind
+        self.identifier = identifier
+        self.severity = severity
+        self.attackType = attackType
+        self.fields = fields
+
+    def getKey(self):
+        """
+        Retrieves the key identifying the attack this message belongs to.
+        @return: The attack key.
+        """
+        return "%d-%s-%s" % (self.identifier, self.severity, self.attackType)
+
+
+class MessageDecoder(object):
+    """
+    A decoder of the DARE start/event/stop messages, possibly batched one per line in a single body. The CSV dialect is
+    sniffed only once, on the first message, and then the messages are simply split on its delimiter. The dialect is
+    sniffed again only when a message cannot be decoded with the current one.
+    """
+
+    def __init__(self):
+        """
+        Constructor.
+        """
+        self.dialect = None
+
+    def reset(self):
+        """
+        Forgets the learned dialect, e.g. when a new connection is opened.
+        """
+        self.dialect = None
+
+    def decode(self, body):
+        """
+        Decodes a message.
+        @param body: The message body, as a string or as bytes.
+        @return: The decoded message or None if the message has an unknown format.
+        """
+        if isinstance(body, bytes):
+            body = body.decode()
+        line = body.rstrip("\r\n")
+
+        if self.dialect is not None:
+            message = self.__getMessage(self.__split(line, self.dialect))
+            if message is not None:
+                return message
+
+        # Learns a new dialect.
+        try:
+            dialect = csv.Sniffer().sniff(line)
+        except csv.Error:
+            return None
+        message = self.__getMessage(self.__split(line, dialect))
+        if message is not None:
+            if self.dialect is None or self.dialect.delimiter != dialect.delimiter:
+                LOG.debug("DARE message delimiter: %s", repr(dialect.delimiter))
+            self.dialect = dialect
+        return message
+
+    def decodeAll(self, body):
+        """
+        Decodes a batch of messages, one per line. A single message is simply a batch of one line.
+        @param body: The batch body, as a string or as bytes.
+        @return: The list of the (line, decoded message) pairs, where the message is None if the line has an unknown
+                 format. The empty lines are skipped.
+        """
+        if isinstance(body, bytes):
+            body = body.decode()
+        return [(i, self.decode(i)) for i in body.splitlines() if len(i.strip()) > 0]
+
+    def __split(self, line, dialect):
+        """
+        Splits a line into fields.
+        @param line: The line to split.
+        @param dialect: The CSV dialect to use.
+        @return: The list of fields.
+        """
+        # The CSV reader is only needed for the quoted fields.
+        if dialect.quotechar is not None and dialect.quotechar in line:
+            fields = []
+            for i in csv.reader([line], dialect):
+                fields += i
+            return fields
+
+        fields = line.split(dialect.delimiter)
+        if dialect.skipinitialspace:
+            fields = [i.lstrip(" ") for i in fields]
+        return fields
+
+    def __getMessage(self, fields):
+        """
+        Creates a message from its fields.
+        @param fields: The message fields.
+        @return: The message or None if the fields have an unknown format.
+        """
+        if len(fields) < 4 or not fields[0].isdigit() or not SEVERITY_PATTERN.match(fields[1]):
+            return None
+
+        identifier = int(fields[0])
+        severity = " ".join(fields[1].lower().split())
+        attackType = fields[2]
+        if len(fields) > 4:
+            return DAREMessage(DAREMessage.EVENT, identifier, severity, attackType, fields[3:])
+        elif fields[3] == "start":
+            return DAREMessage(DAREMessage.START, identifier, severity, attackType)
+        elif fields[3] == "stop":
+            return DAREMessage(DAREMessage.STOP, identifier, severity, attackType)
+        else:
+            return None
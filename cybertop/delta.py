@@ -0,0 +1,270 @@
+# Copyright 2018 Politecnico di Torino
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Delta policies, i.e. what changed since the last remediation pushed.
+
+@author: Daniele Canavese
+"""
+
+import copy
+import hashlib
+import json
+import os
+import threading
+from lxml import etree
+from cybertop.util import getHSPLNamespace
+from cybertop.util import getMSPLNamespace
+from cybertop.log import LOG
+
+# The path of the rules inside an IT resource.
+RULE_PATH = "{%s}configuration/{%s}rule" % (getMSPLNamespace(), getMSPLNamespace())
+# The tags ignored when comparing HSPLs and rules.
+IGNORED_TAGS = frozenset(["{%s}name" % getHSPLNamespace(), "{%s}priority" % getMSPLNamespace()])
+
+
+class PolicyStore(object):
+    """
+    The store of the last policy pushed to each IT resource.
+    Each entry is keyed by the IT resource identifier, the attack type and the recipe name and contains the content hash
+    of the last policy plus the canonical form of all its HSPLs and MSPL rules.
+    """
+
+    def __init__(self, fileName=None):
+        """
+        Constructor.
+        @param fileName: The JSON file where the store is persisted or None to keep it only in memory.
+        """
+        self.__fileName = fileName
+        self.__entries = {}
+        self.__lock = threading.Lock()
+
+        if fileName is not None and os.path.exists(fileName):
+            try:
+                with open(fileName, "rt") as f:
+                    self.__entries = json.load(f)
+                LOG.debug("Policy store with %d entries read from '%s'.", len(self.__entries), fileName)
+            except ValueError:
+                LOG.warning("The policy store '%s' is invalid, starting from scratch.", fileName)
+
+    def get(self, key):
+        """
+        Retrieves the last policy pushed for a key.
+        @param key: The key to search for.
+        @return: The policy entry or None if nothing was pushed before.
+        """
+        with self.__lock:
+            return self.__entries.get(key)
+
+    def update(self, entries):
+        """
+        Replaces some entries and persists the store, if needed.
+        @param entries: A dictionary with the new entries.
+        """
+        with self.__lock:
+            self.__entries.update(entries)
+            if self.__fileName is not None:
+                temporaryFileName = self.__fileName + ".tmp"
+                with open(temporaryFileName, "wt") as f:
+                    json.dump(self.__entries, f)
+                os.replace(temporaryFileName, self.__fileName)
+
+    def clear(self):
+        """
+        Forgets all the policies pushed.
+        """
+        with self.__lock:
+            self.__entries = {}
+
+    def __len__(self):
+        return len(self.__entries)
+
+
+class PolicyDelta(object):
+    """
+    The difference between a remediation and the last one pushed to the same IT resources.
+    """
+
+    def __init__(self, addedHSPLs, addedMSPLs, removedHSPLs, removedMSPLs, entries):
+        """
+        Constructor.
+        @param addedHSPLs: The HSPL recommendations containing only the new HSPLs or None if there are none.
+        @param addedMSPLs: The MSPL recommendations containing only the new rules or None if there are none.
+        @param removedHSPLs: The HSPL recommendations containing only the withdrawn HSPLs or None if there are none.
+        @param removedMSPLs: The MSPL recommendations containing only the withdrawn rules or None if there are none.
+        @param entries: The policy store entries to commit when the delta has been delivered.
+        """
+        self.addedHSPLs = addedHSPLs
+        self.addedMSPLs = addedMSPLs
+        self.removedHSPLs = removedHSPLs
+        self.removedMSPLs = removedMSPLs
+        self.entries = entries
+
+
+class DeltaReasoner(object):
+    """
+    Computes the delta policies with respect to the last remediations pushed.
+    """
+
+    def __init__(self, configParser, policyStore):
+        """
+        Constructor.
+        @param configParser: The configuration parser.
+        @param policyStore: The policy store to use.
+        """
+        self.configParser = configParser
+        self.policyStore = policyStore
+
+    def getDelta(self, hsplRecommendations, msplRecommendations):
+        """
+        Computes the HSPLs and MSPL rules added and removed since the last remediation on the same IT resources.
+        @param hsplRecommendations: The HSPL recommendations to push.
+        @param msplRecommendations: The MSPL recommendations to push.
+        @return: The policy delta or None if the remediation is unchanged.
+        """
+        addedHSPLs = copy.deepcopy(hsplRecommendations)
+        addedMSPLs = copy.deepcopy(msplRecommendations)
+        removedHSPLs = copy.deepcopy(hsplRecommendations)
+        removedMSPLs = copy.deepcopy(msplRecommendations)
+        entries = {}
+        changed = False
+
+        # The HSPL and MSPL sets are generated in the same order.
+        for addedHSPLSet, addedMSPLSet, removedHSPLSet, removedMSPLSet in zip(list(addedHSPLs), list(addedMSPLs),
+                                                                             list(removedHSPLs), list(removedMSPLs)):
+            attackType = addedHSPLSet.findtext("{%s}context/{%s}type" % (getHSPLNamespace(), getHSPLNamespace()))
+            recipeName = addedHSPLSet.findtext("{%s}hspl/{%s}name" % (getHSPLNamespace(), getHSPLNamespace()))
+            recipeName = recipeName.rsplit(" #", 1)[0]
+            hspls = self.__getCanonicalForms(addedHSPLSet, "{%s}hspl" % getHSPLNamespace())
+            oldHSPLs = {}
+
+            for itResource, removedITResource in zip(addedMSPLSet.findall("{%s}it-resource" % getMSPLNamespace()),
+                                                     removedMSPLSet.findall("{%s}it-resource" % getMSPLNamespace())):
+                key = "%s/%s/%s" % (itResource.attrib["id"], attackType, recipeName)
+                rules = self.__getCanonicalForms(itResource, RULE_PATH)
+                contentHash = self.__getContentHash(hspls, rules)
+                entry = self.policyStore.get(key)
+
+                if entry is not None and entry["hash"] == contentHash:
+                    oldHSPLs.update(hspls)
+                    oldRules = rules
+                else:
+                    changed = True
+                    if entry is not None:
+                        oldHSPLs.update(entry["hspls"])
+                        oldRules = entry["rules"]
+                    else:
+                        oldRules = {}
+                    entries[key] = {"hash": contentHash, "hspls": hspls, "rules": rules}
+
+                # Keeps the new rules in the added recommendations and the old ones in the removed recommendations.
+                self.__prune(itResource, RULE_PATH, oldRules)
+                self.__replace(removedITResource.find("{%s}configuration" % getMSPLNamespace()), "{%s}rule" %
+                               getMSPLNamespace(), [v for k, v in oldRules.items() if k not in rules])
+
+            # Does the same for the HSPLs.
+            self.__prune(addedHSPLSet, "{%s}hspl" % getHSPLNamespace(), oldHSPLs)
+            self.__replace(removedHSPLSet, "{%s}hspl" % getHSPLNamespace(),
+                           [v for k, v in oldHSPLs.items() if k not in hspls])
+
+        if not changed:
+            return None
+
+        return PolicyDelta(self.__dropEmpty(addedHSPLs, "{%s}hspl" % getHSPLNamespace()),
+                           self.__dropEmpty(addedMSPLs, "{%s}it-resource/%s" % (getMSPLNamespace(), RULE_PATH)),
+                           self.__dropEmpty(removedHSPLs, "{%s}hspl" % getHSPLNamespace()),
+                           self.__dropEmpty(removedMSPLs, "{%s}it-resource/%s" % (getMSPLNamespace(), RULE_PATH)),
+                           entries)
+
+    def commit(self, delta):
+        """
+        Records a delta as pushed.
+        @param delta: The delta that has been delivered.
+        """
+        self.policyStore.update(delta.entries)
+
+    def __getCanonicalForm(self, element):
+        """
+        Retrieves the canonical form of an HSPL or rule. The HSPL name and the rule priority are ignored, since they are
+        just counters.
+        @param element: The HSPL or rule to use.
+        @return: The canonical form of the element.
+        """
+        return "|".join(etree.tostring(i).decode() for i in element if i.tag not in IGNORED_TAGS)
+
+    def __getCanonicalForms(self, parent, path):
+        """
+        Retrieves the canonical form of some HSPLs or rules.
+        @param parent: The element containing the HSPLs or rules.
+        @param path: The path of the HSPLs or rules.
+        @return: A dictionary mapping the canonical form of each HSPL or rule to its serialization.
+        """
+        forms = {}
+        for i in parent.iterfind(path):
+            forms[self.__getCanonicalForm(i)] = etree.tostring(i).decode()
+        return forms
+
+    def __getContentHash(self, hspls, rules):
+        """
+        Computes the content hash of a policy.
+        @param hspls: The canonical HSPLs.
+        @param rules: The canonical MSPL rules.
+        @return: The hexadecimal content hash.
+        """
+        h = hashlib.sha256()
+        for i in sorted(hspls.keys()):
+            h.update(i.encode())
+        h.update(b"\0")
+        for i in sorted(rules.keys()):
+            h.update(i.encode())
+        return h.hexdigest()
+
+    def __prune(self, parent, path, forms):
+        """
+        Removes the HSPLs or rules whose canonical form is known.
+        @param parent: The element to edit.
+        @param path: The path of the HSPLs or rules to check.
+        @param forms: The canonical forms to remove.
+        """
+        for i in parent.findall(path):
+            if self.__getCanonicalForm(i) in forms:
+                i.getparent().remove(i)
+
+    def __replace(self, container, tag, serializations):
+        """
+        Replaces the HSPLs or rules of an element with some serialized ones.
+        @param container: The element containing the HSPLs or rules.
+        @param tag: The tag of the HSPLs or rules.
+        @param serializations: The serialized HSPLs or rules to add.
+        """
+        for i in container.findall(tag):
+            container.remove(i)
+        for i in serializations:
+            container.append(etree.fromstring(i))
+
+    def __dropEmpty(self, recommendations, path):
+        """
+        Removes the sets without any HSPL or rule.
+        @param recommendations: The recommendations to edit.
+        @param path: The path of the HSPLs or rules inside a set.
+        @return: The edited recommendations or None if they are empty.
+        """
+        for i in list(recommendations):
+            if i.find(path) is None:
+                recommendations.remove(i)
+
+        if len(recommendations) == 0:
+            return None
+        else:
+            return recommendations
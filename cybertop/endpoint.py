@@ -0,0 +1,265 @@
+# Copyright 2018 Politecnico di Torino
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+The attack endpoints, that is the addresses and ports of the attack events and of the HSPL subjects and objects.
+
+@author: Daniele Canavese
+"""
+
+import functools
+import re
+from collections import namedtuple
+from ipaddress import ip_address
+from ipaddress import ip_network
+
+# The number of bits of the addresses of each IP version.
+ADDRESS_BITS = {4: 32, 6: 128}
+# The IPv4 addresses and networks of an endpoint.
+ADDRESS_PATTERN = re.compile(r"\d+\.\d+\.\d+\.\d+(/\d+)?$")
+# The ports matching any port.
+ANY_PORTS = ("*", "any")
+
+
+class Endpoint(namedtuple("Endpoint", ("address", "version", "network", "prefixLength", "port"))):
+    """
+    An immutable endpoint: the address text, the IP version, the network as an integer with its prefix length (single
+    addresses are networks with a prefix length of 32 or 128) and the port text, which can be * or any. The version,
+    the network and the prefix length are None if the address is *. The endpoints are interned by getEndpoint(), so
+    they are parsed once.
+    """
+
+    __slots__ = ()
+
+    @property
+    def bits(self):
+        """
+        The number of bits of the endpoint addresses.
+        """
+        return ADDRESS_BITS[self.version]
+
+    def isWildcard(self):
+        """
+        Checks if the endpoint matches any address.
+        @return: True if the address is *, False otherwise.
+        """
+        return self.network is None
+
+    def isAnyPort(self):
+        """
+        Checks if the endpoint matches any port.
+        @return: True if the port is * or any, False otherwise.
+        """
+        return self.port in ANY_PORTS
+
+    def getNetwork(self, prefixLength):
+        """
+        Retrieves the network including the endpoint address.
+        @param prefixLength: The network prefix length, at most the endpoint one.
+        @return: The network address, as an integer.
+        """
+        shift = ADDRESS_BITS[self.version] - prefixLength
+        return (self.network >> shift) << shift
+
+    def getSupernet(self, prefixLength):
+        """
+        Retrieves the endpoint of the network including the endpoint address, with any port.
+        @param prefixLength: The network prefix length, at most the endpoint one.
+        @return: The network endpoint.
+        """
+        return getEndpoint(formatEndpoint("%s/%d" % (ip_address(self.getNetwork(prefixLength)), prefixLength), "*"))
+
+    def withAnyPort(self):
+        """
+        Retrieves the endpoint with the same address and any port.
+        @return: The endpoint with the * port.
+        """
+        return getEndpoint(formatEndpoint(self.address, "*"))
+
+    def __str__(self):
+        return formatEndpoint(self.address, self.port)
+
+
+def formatEndpoint(address, port):
+    """
+    Formats an endpoint. The IPv6 addresses are enclosed in brackets, so that their colons are not confused with the
+    port separator.
+    @param address: The address, network or *, as an ipaddress object or as a text.
+    @param port: The port.
+    @return: The endpoint text, such as 10.0.0.1:80 or [2001:db8::1]:80.
+    """
+    address = str(address)
+    if ":" in address:
+        return "[%s]:%s" % (address, port)
+    return "%s:%s" % (address, port)
+
+
+@functools.lru_cache(maxsize=65536)
+def getEndpoint(text):
+    """
+    Parses an endpoint, such as 10.0.0.1:80, 10.0.0.0/24:*, [2001:db8::/64]:* or *:any. The same text always returns
+    the same object, until it is evicted from the cache.
+    @param text: The endpoint text. The port is optional.
+    @return: The endpoint or None if the text is not an endpoint.
+    @raise ValueError: If the network has host bits set.
+    """
+    if text.startswith("["):
+        address, separator, port = text[1:].partition("]")
+        if not separator or (port and not port.startswith(":")):
+            return None
+        port = port[1:] if port else None
+        try:
+            if ip_address(address.partition("/")[0]).version != 6:
+                return None
+        except ValueError:
+            return None
+    else:
+        address, separator, port = text.partition(":")
+        if not separator:
+            port = None
+        if address == "*":
+            return Endpoint(address, None, None, None, port)
+        if ADDRESS_PATTERN.match(address) is None:
+            return None
+    network = ip_network(address)
+    return Endpoint(address, network.version, int(network.network_address), network.prefixlen, port)
+
+
+class PrefixNode(object):
+    """
+    A node of a prefix trie.
+    """
+
+    __slots__ = ("network", "prefixLength", "children", "values")
+
+    def __init__(self, network, prefixLength):
+        """
+        Constructor.
+        @param network: The network address, as an integer.
+        @param prefixLength: The network prefix length.
+        """
+        self.network = network
+        self.prefixLength = prefixLength
+        self.children = [None, None]
+        # The values of the endpoints with this network, grouped by port.
+        self.values = None
+
+
+class PrefixTrie(object):
+    """
+    A path-compressed binary trie of the endpoints of a single IP version, each with a set of values. Only the nodes
+    where two networks diverge are kept, so adding, removing and finding an endpoint visit at most a node per bit of
+    its prefix length, whatever the address width: an IPv6 /64 costs as much as an IPv4 /24 with the same number of
+    endpoints.
+    """
+
+    def __init__(self, version):
+        """
+        Creates an empty trie.
+        @param version: The IP version of the endpoints.
+        """
+        self.bits = ADDRESS_BITS[version]
+        self.root = PrefixNode(0, 0)
+
+    def add(self, endpoint, value):
+        """
+        Adds a value to an endpoint.
+        @param endpoint: The endpoint.
+        @param value: The value to add.
+        """
+        node = self.__getNode(endpoint.network, endpoint.prefixLength, True)
+        if node.values is None:
+            node.values = {}
+        if endpoint.port not in node.values:
+            node.values[endpoint.port] = set()
+        node.values[endpoint.port].add(value)
+
+    def remove(self, endpoint, value):
+        """
+        Removes a value from an endpoint, if present.
+        @param endpoint: The endpoint.
+        @param value: The value to remove.
+        """
+        node = self.__getNode(endpoint.network, endpoint.prefixLength, False)
+        if node is not None and node.values is not None and endpoint.port in node.values:
+            values = node.values[endpoint.port]
+            values.discard(value)
+            if len(values) == 0:
+                del node.values[endpoint.port]
+
+    def find(self, network, prefixLength, port):
+        """
+        Finds the values of all the endpoints included in a network.
+        @param network: The network address, as an integer.
+        @param prefixLength: The network prefix length.
+        @param port: The endpoint port or * for any port.
+        @return: The set of the found values.
+        """
+        found = set()
+        node = self.root
+        while node is not None and node.prefixLength < prefixLength:
+            node = node.children[(network >> (self.bits - node.prefixLength - 1)) & 1]
+            if node is not None and self.__getCommonLength(node, network, prefixLength) < min(node.prefixLength,
+                                                                                              prefixLength):
+                node = None
+        stack = [node] if node is not None else []
+        while len(stack) > 0:
+            node = stack.pop()
+            if node.values is not None:
+                if port == "*":
+                    for i in node.values.values():
+                        found.update(i)
+                elif port in node.values:
+                    found.update(node.values[port])
+            stack.extend(i for i in node.children if i is not None)
+        return found
+
+    def __getCommonLength(self, node, network, prefixLength):
+        """
+        Retrieves the length of the common prefix of a node and a network.
+        @param node: The node.
+        @param network: The network address, as an integer.
+        @param prefixLength: The network prefix length.
+        @return: The number of leading bits shared by the node and the network, at most the shortest prefix length.
+        """
+        return min(self.bits - (node.network ^ network).bit_length(), node.prefixLength, prefixLength)
+
+    def __getNode(self, network, prefixLength, create):
+        """
+        Retrieves the node of a network.
+        @param network: The network address, as an integer.
+        @param prefixLength: The network prefix length.
+        @param create: True to create the node if missing, False otherwise.
+        @return: The network node or None if missing and not created.
+        """
+        node = self.root
+        while node.prefixLength < prefixLength:
+            bit = (network >> (self.bits - node.prefixLength - 1)) & 1
+            child = node.children[bit]
+            if child is None:
+                if not create:
+                    return None
+                child = node.children[bit] = PrefixNode(network, prefixLength)
+            else:
+                common = self.__getCommonLength(child, network, prefixLength)
+                if common < child.prefixLength:
+                    # The network diverges from the child, or includes it: a node is inserted where they split.
+                    if not create:
+                        return None
+                    shift = self.bits - common
+                    split = node.children[bit] = PrefixNode((network >> shift) << shift, common)
+                    split.children[(child.network >> (shift - 1)) & 1] = child
+                    child = split
+            node = child
+        return node
@@ -0,0 +1,285 @@
+# Copyright 2018 Politecnico di Torino
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Event loop based ingestion of the attacks.
+
+@author: Daniele Canavese
+"""
+
+import asyncio
+import functools
+import pika
+import pyinotify
+from concurrent.futures import ThreadPoolExecutor
+from cybertop.acks import AckBatcher
+from cybertop.folder import FolderIngestion
+from cybertop.folder import FolderEventHandler
+from cybertop.folder import FOLDER_EVENTS
+from cybertop.log import LOG
+
+
+class IngestionEngine(object):
+    """
+    A single event loop receiving the attacks from the DARE queue and from the watched directory. The queue consumption
+    and the directory watching run as coroutines, while the reasoning on the stopped attacks is handed to an executor
+    (or to the reasoning workers, if any) and the attack files to the workers of the folder ingestion, so the loop is
+    never blocked.
+    """
+
+    # The number of seconds between two reconnection attempts.
+    RECONNECTION_DELAY = 5
+
+    def __init__(self, cyberTop, executor=None, connectionFactory=None):
+        """
+        Constructor.
+        @param cyberTop: The CyberTop instance handling the attacks.
+        @param executor: The executor of the reasoning or None to create a thread pool.
+        @param connectionFactory: The callable used to open an AMQP connection, with the same arguments of the pika
+                                  asyncio connection, or None to use a pika asyncio connection.
+        """
+        self.cyberTop = cyberTop
+        self.configParser = cyberTop.configParser
+        self.__ownedExecutor = executor is None
+        if executor is None:
+            self.executor = ThreadPoolExecutor(self.configParser.getint("global", "inputExecutorWorkers",
+                                                                        fallback=4))
+        else:
+            self.executor = executor
+        if connectionFactory is None:
+            from pika.adapters.asyncio_connection import AsyncioConnection
+            self.connectionFactory = AsyncioConnection
+        else:
+            self.connectionFactory = connectionFactory
+        self.loop = None
+        self.__connection = None
+        self.__channel = None
+        self.__deliveries = None
+        self.__ackBatcher = None
+        self.__stopping = None
+        self.__closing = False
+
+    def run(self, inputMethod):
+        """
+        Runs the engine in a new event loop until it is stopped.
+        @param inputMethod: The input method, that is "queue", "csv" or "all".
+        @raise ValueError: If the input method is unknown.
+        """
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(self.serve(inputMethod))
+        finally:
+            if self.__ownedExecutor:
+                self.executor.shutdown()
+            loop.close()
+
+    def stop(self):
+        """
+        Stops the engine, from any thread.
+        """
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.__stopping.set)
+
+    async def serve(self, inputMethod):
+        """
+        Runs the engine in the current event loop until it is stopped.
+        @param inputMethod: The input method, that is "queue", "csv" or "all".
+        @raise ValueError: If the input method is unknown.
+        """
+        if inputMethod not in ("queue", "csv", "all"):
+            raise ValueError("Unknown input method '%s'" % inputMethod)
+
+        self.loop = asyncio.get_event_loop()
+        self.__stopping = asyncio.Event()
+        self.__closing = False
+        tasks = [asyncio.ensure_future(self.__checkAttacks())]
+        if inputMethod in ("queue", "all"):
+            self.__deliveries = asyncio.Queue()
+            tasks.append(asyncio.ensure_future(self.__consume()))
+            if self.cyberTop.ackBatchSize > 1:
+                tasks.append(asyncio.ensure_future(self.__flushAcknowledgments()))
+            self.__connect()
+        if inputMethod in ("csv", "all"):
+            tasks.append(asyncio.ensure_future(self.__watchFolder()))
+        LOG.info("Ingestion engine started (input method: %s)", inputMethod)
+
+        await self.__stopping.wait()
+        self.__closing = True
+        for i in tasks:
+            i.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self.__ackBatcher is not None and self.__ackBatcher.channel is self.__channel:
+            self.__ackBatcher.flush()
+        if self.__connection is not None and self.__connection.is_open:
+            self.__connection.close()
+        LOG.info("Ingestion engine stopped")
+
+    def __connect(self):
+        """
+        Opens the connection with the DARE broker.
+        """
+        LOG.debug("Connecting to the DARE broker")
+        parameters = pika.ConnectionParameters(host=self.configParser.get("global", "serverAddress"),
+                                               port=self.configParser.getint("global", "serverPort"))
+        self.__connection = self.connectionFactory(parameters, on_open_callback=self.__onConnectionOpen,
+                                                   on_open_error_callback=self.__onConnectionError,
+                                                   on_close_callback=self.__onConnectionClosed,
+                                                   custom_ioloop=self.loop)
+
+    def __onConnectionOpen(self, connection):
+        LOG.debug("Connection opened")
+        # The dialect is learned again, since the sender may be different.
+        self.cyberTop.decoder.reset()
+        connection.channel(on_open_callback=self.__onChannelOpen)
+
+    def __onConnectionError(self, connection, error):
+        LOG.warning("Unable to connect to the DARE broker: %s", str(error))
+        if not self.__closing:
+            self.loop.call_later(self.RECONNECTION_DELAY, self.__connect)
+
+    def __onConnectionClosed(self, connection, reason):
+        self.__channel = None
+        # The unacknowledged messages will be delivered again.
+        self.__ackBatcher = None
+        if not self.__closing:
+            LOG.warning("Connection with the DARE broker closed: %s", str(reason))
+            self.loop.call_later(self.RECONNECTION_DELAY, self.__connect)
+
+    def __onChannelOpen(self, channel):
+        LOG.debug("Channel open, declaring exchange")
+        self.__channel = channel
+        channel.exchange_declare(exchange=self.configParser.get("global", "serverExchange"), exchange_type="topic",
+                                 callback=self.__onExchangeDeclareOk)
+
+    def __onExchangeDeclareOk(self, frame):
+        LOG.debug("Exchange declare is ok, declaring queue")
+        self.__channel.queue_declare(queue=self.configParser.get("global", "serverQueue"), durable=True,
+                                     callback=self.__onQueueDeclareOk)
+
+    def __onQueueDeclareOk(self, frame):
+        LOG.debug("Queue declare is ok, binding queue")
+        self.__channel.queue_bind(queue=self.configParser.get("global", "serverQueue"),
+                                  exchange=self.configParser.get("global", "serverExchange"),
+                                  routing_key=self.configParser.get("global", "serverTopic"),
+                                  callback=self.__onBindOk)
+
+    def __onBindOk(self, frame):
+        LOG.debug("Binding queue is ok, start consuming")
+        # Limits the unacknowledged messages, that is the backpressure.
+        prefetch = self.configParser.getint("global", "serverPrefetch", fallback=100)
+        if prefetch > 0:
+            self.__channel.basic_qos(prefetch_count=prefetch)
+        self.__channel.basic_consume(queue=self.configParser.get("global", "serverQueue"),
+                                     on_message_callback=self.__onMessage)
+
+    def __onMessage(self, channel, method, properties, body):
+        self.__deliveries.put_nowait((channel, method.delivery_tag, body))
+
+    async def __consume(self):
+        """
+        Handles the DARE messages received.
+        """
+        while True:
+            channel, deliveryTag, body = await self.__deliveries.get()
+            if self.cyberTop.ackBatchSize > 1:
+                if self.__ackBatcher is None or self.__ackBatcher.channel is not channel:
+                    self.__ackBatcher = AckBatcher(channel, self.cyberTop.ackBatchSize, self.cyberTop.ackBatchDelay)
+                self.__ackBatcher.receive(deliveryTag)
+            try:
+                self.cyberTop.handleMessage(body, functools.partial(self.__acknowledge, channel, deliveryTag),
+                                            self.__finalize)
+            except Exception as e:
+                LOG.critical("Unable to handle a DARE message: %s", str(e))
+                self.__acknowledge(channel, deliveryTag)
+
+    def __finalize(self, key, attackInfo, done=None):
+        """
+        Finalizes a stopped or evicted attack without blocking the event loop.
+        @param key: The attack key.
+        @param attackInfo: The attack info.
+        @param done: The function called when the remediation is ready or None.
+        """
+        if self.cyberTop.reasoningPool is not None:
+            # The reasoning workers already run in background.
+            self.cyberTop.finalizeAttack(key, attackInfo, done)
+            return
+
+        def onDone(future):
+            if not future.cancelled() and future.exception() is not None:
+                LOG.critical("Unable to mitigate the attack '%s': %s", key, str(future.exception()))
+                if done is not None:
+                    done()
+
+        future = self.loop.run_in_executor(self.executor, self.cyberTop.finalizeAttack, key, attackInfo, done)
+        future.add_done_callback(onDone)
+
+    def __acknowledge(self, channel, deliveryTag):
+        """
+        Acknowledges a message, from any thread.
+        @param channel: The channel the message was received from.
+        @param deliveryTag: The message delivery tag.
+        """
+        self.loop.call_soon_threadsafe(self.__acknowledgeNow, channel, deliveryTag)
+
+    def __acknowledgeNow(self, channel, deliveryTag):
+        """
+        Acknowledges a message from the event loop.
+        @param channel: The channel the message was received from.
+        @param deliveryTag: The message delivery tag.
+        """
+        if channel is not self.__channel or not channel.is_open:
+            LOG.warning("Channel closed, the message will be delivered again")
+            return
+        if self.__ackBatcher is not None and self.__ackBatcher.channel is channel:
+            self.__ackBatcher.complete(deliveryTag)
+        else:
+            channel.basic_ack(delivery_tag=deliveryTag)
+
+    async def __flushAcknowledgments(self):
+        """
+        Periodically acknowledges the batched messages.
+        """
+        while True:
+            await asyncio.sleep(self.cyberTop.ackBatchDelay)
+            if self.__ackBatcher is not None and self.__ackBatcher.channel is self.__channel:
+                self.__ackBatcher.flush()
+
+    async def __watchFolder(self):
+        """
+        Handles the attack files written in the watched directory.
+        """
+        ingestion = FolderIngestion(self.cyberTop)
+        LOG.debug("Starting directory listener: " + ingestion.directory)
+        watchManager = pyinotify.WatchManager()
+        notifier = pyinotify.AsyncioNotifier(watchManager, self.loop,
+                                             default_proc_fun=FolderEventHandler(ingestion=ingestion))
+        watchManager.add_watch(ingestion.directory, FOLDER_EVENTS, rec=True, auto_add=True)
+        try:
+            ingestion.scan()
+            # The files are processed by the workers of the ingestion, so only the debouncing runs in the loop.
+            while True:
+                await asyncio.sleep(min(ingestion.debounce / 4, 0.25))
+                ingestion.poll()
+        finally:
+            notifier.stop()
+            await self.loop.run_in_executor(self.executor, ingestion.close)
+
+    async def __checkAttacks(self):
+        """
+        Periodically evicts the idle attacks.
+        """
+        while True:
+            await asyncio.sleep(self.cyberTop.ATTACKS_CHECK_INTERVAL)
+            await self.loop.run_in_executor(self.executor, self.cyberTop.attacks.expire)
@@ -0,0 +1,216 @@
+# Copyright 2018 Politecnico di Torino
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Export of the run-time metrics in the Prometheus text format.
+
+@author: Daniele Canavese
+"""
+
+import os
+import socketserver
+import threading
+from http.server import BaseHTTPRequestHandler
+from http.server import HTTPServer
+from cybertop.metrics import METRICS
+from cybertop.log import LOG
+
+# The content type of the Prometheus text format.
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    """
+    Escapes a label value.
+    @param value: The label value.
+    @return: The escaped value.
+    """
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _formatSample(name, labels, value):
+    """
+    Formats a sample line.
+    @param name: The sample name.
+    @param labels: The sample labels, as a sequence of (name, value) pairs.
+    @param value: The sample value.
+    @return: The sample line.
+    """
+    if len(labels) == 0:
+        return "%s %s\n" % (name, repr(float(value)))
+    return "%s{%s} %s\n" % (name, ",".join("%s=\"%s\"" % (k, _escape(v)) for k, v in labels), repr(float(value)))
+
+
+def formatMetrics(metrics=METRICS):
+    """
+    Formats all the metrics of a registry in the Prometheus text format.
+    @param metrics: The metrics registry.
+    @return: The formatted metrics.
+    """
+    families = {}
+    for kind, snapshot in (("counter", metrics.getCounters()), ("gauge", metrics.getGauges()),
+                           ("histogram", metrics.getHistograms())):
+        for (name, labels), value in snapshot.items():
+            families.setdefault((name, kind), []).append((labels, value))
+
+    lines = []
+    for (name, kind), samples in sorted(families.items()):
+        lines.append("# TYPE %s %s\n" % (name, kind))
+        for labels, value in sorted(samples, key=lambda i: i[0]):
+            if kind != "histogram":
+                lines.append(_formatSample(name, labels, value))
+                continue
+            for bound, count in zip(value.buckets, value.getCumulativeCounts()):
+                lines.append(_formatSample(name + "_bucket", labels + (("le", repr(float(bound))),), count))
+            lines.append(_formatSample(name + "_bucket", labels + (("le", "+Inf"),), value.count))
+            lines.append(_formatSample(name + "_sum", labels, value.sum))
+            lines.append(_formatSample(name + "_count", labels, value.count))
+    return "".join(lines)
+
+
+def writeMetrics(fileName, metrics=METRICS):
+    """
+    Writes the metrics to a text file, atomically so that a collector never reads a partial file.
+    @param fileName: The file name.
+    @param metrics: The metrics registry.
+    """
+    temporaryFileName = "%s.%d.tmp" % (fileName, os.getpid())
+    with open(temporaryFileName, "w") as f:
+        f.write(formatMetrics(metrics))
+    os.replace(temporaryFileName, fileName)
+
+
+class _MetricsServer(socketserver.ThreadingMixIn, HTTPServer):
+    """
+    An HTTP server handling each request in its own thread.
+    """
+
+    daemon_threads = True
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    """
+    Serves the metrics on /metrics.
+    """
+
+    def do_GET(self):
+        """
+        Handles a GET request.
+        """
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = formatMetrics(self.server.metrics).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        """
+        Logs a request.
+        @param format: The message format.
+        @param args: The message arguments.
+        """
+        LOG.debug("Metrics request: " + format, *args)
+
+
+class MetricsExporter(object):
+    """
+    Exposes the metrics on a local HTTP endpoint, periodically writes them to a text file for the node exporter, or
+    both.
+    """
+
+    def __init__(self, port=None, address="127.0.0.1", textFileName=None, interval=15, metrics=METRICS):
+        """
+        Constructor. It also starts the background threads.
+        @param port: The HTTP port, 0 to pick a free one, or None to disable the endpoint.
+        @param address: The HTTP address.
+        @param textFileName: The text file name or None to disable the file.
+        @param interval: The number of seconds between two writes of the text file.
+        @param metrics: The metrics registry.
+        """
+        self.textFileName = textFileName
+        self.interval = interval
+        self.metrics = metrics
+        self.__stopping = threading.Event()
+        self.__server = None
+        self.__threads = []
+
+        if port is not None:
+            self.__server = _MetricsServer((address, port), _MetricsHandler)
+            self.__server.metrics = metrics
+            self.__threads.append(threading.Thread(target=self.__server.serve_forever, name="cybertop-metrics-http",
+                                                   daemon=True))
+            LOG.info("Serving the metrics on http://%s:%d/metrics.", address, self.getPort())
+        if textFileName is not None:
+            self.__threads.append(threading.Thread(target=self.__writeLoop, name="cybertop-metrics-file",
+                                                   daemon=True))
+            LOG.info("Writing the metrics to '%s' every %d seconds.", textFileName, interval)
+        for i in self.__threads:
+            i.start()
+
+    def getPort(self):
+        """
+        Retrieves the HTTP port.
+        @return: The port the endpoint is bound to or None if the endpoint is disabled.
+        """
+        if self.__server is None:
+            return None
+        return self.__server.server_address[1]
+
+    def close(self):
+        """
+        Stops the endpoint and writes the text file a last time.
+        """
+        self.__stopping.set()
+        if self.__server is not None:
+            self.__server.shutdown()
+            self.__server.server_close()
+        for i in self.__threads:
+            i.join()
+        if self.textFileName is not None:
+            self.__write()
+
+    def __writeLoop(self):
+        """
+        Writes the text file until the exporter is closed.
+        """
+        while not self.__stopping.is_set():
+            self.__write()
+            self.__stopping.wait(self.interval)
+
+    def __write(self):
+        """
+        Writes the text file, logging the errors.
+        """
+        try:
+            writeMetrics(self.textFileName, self.metrics)
+        except OSError as e:
+            LOG.error("Cannot write the metrics to '%s': %s", self.textFileName, str(e))
+
+
+def getMetricsExporter(configParser):
+    """
+    Creates the metrics exporter, as configured.
+    @param configParser: The configuration parser.
+    @return: The metrics exporter or None if neither the endpoint nor the text file are enabled.
+    """
+    port = configParser.getint("global", "metricsPort", fallback=None)
+    textFileName = configParser.get("global", "metricsTextFile", fallback=None)
+    if port is None and textFileName is None:
+        return None
+    return MetricsExporter(port, configParser.get("global", "metricsAddress", fallback="127.0.0.1"), textFileName,
+                           configParser.getint("global", "metricsInterval", fallback=15))
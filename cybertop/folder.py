@@ -0,0 +1,250 @@
+# Copyright 2018 Politecnico di Torino
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Ingestion of the attack files of a watched directory.
+
+@author: Daniele Canavese
+"""
+
+import fnmatch
+import os
+import threading
+import time
+import pyinotify
+from cybertop.reasoning import ReasoningPool
+from cybertop.metrics import METRICS
+from cybertop.log import LOG
+
+# The file events handled.
+FOLDER_EVENTS = pyinotify.IN_CLOSE_WRITE | pyinotify.IN_MOVED_TO
+
+
+class FolderEventHandler(pyinotify.ProcessEvent):
+    """
+    Forwards the file events to a folder ingestion.
+    """
+
+    def my_init(self, ingestion):
+        """
+        Initializes the handler.
+        @param ingestion: The folder ingestion.
+        """
+        self.ingestion = ingestion
+
+    def process_IN_CLOSE_WRITE(self, event):
+        """
+        Handles a written file.
+        @param event: The file event.
+        """
+        self.ingestion.notify(event.pathname)
+
+    def process_IN_MOVED_TO(self, event):
+        """
+        Handles a file moved in the directory.
+        @param event: The file event.
+        """
+        self.ingestion.notify(event.pathname)
+
+
+class FolderIngestion(object):
+    """
+    Ingests the attack files of a watched directory. The files already in the directory are processed on start, the
+    file events are filtered by name and debounced, and the files are processed concurrently by a pool of workers. Each
+    file has its own HSPL/MSPL dumps.
+    """
+
+    def __init__(self, cyberTop, pool=None):
+        """
+        Constructor.
+        @param cyberTop: The CyberTop instance sending the remediations.
+        @param pool: The reasoning pool to use or None to create one as configured.
+        """
+        self.cyberTop = cyberTop
+        self.configParser = cyberTop.configParser
+        self.directory = self.configParser.get("global", "watchedDirectory")
+        self.pattern = self.configParser.get("global", "folderPattern", fallback="*.csv")
+        self.debounce = self.configParser.getfloat("global", "folderDebounce", fallback=1.0)
+        self.dumpDirectory = self.configParser.get("global", "folderDumpDirectory", fallback=None)
+        self.__ownedPool = pool is None
+        if pool is None:
+            self.pool = ReasoningPool(self.configParser.get("global", "folderWorkerKind", fallback="process"),
+                                      self.configParser.getint("global", "folderWorkers", fallback=2),
+                                      self.configParser, cyberTop.parser, cyberTop.recipesReasoner,
+                                      cyberTop.hsplReasoner, cyberTop.msplReasoner)
+        else:
+            self.pool = pool
+        # Maps the notified files to the time they will be processed.
+        self.__due = {}
+        self.__inProgress = set()
+        # The files notified again while being processed.
+        self.__again = set()
+        self.__lock = threading.Lock()
+        self.__stopped = False
+
+    def accept(self, fileName):
+        """
+        Checks if a file must be processed.
+        @param fileName: The file name.
+        @return: True if the file name matches the pattern and it is not hidden, False otherwise.
+        """
+        baseName = os.path.basename(fileName)
+        return not baseName.startswith(".") and fnmatch.fnmatch(baseName, self.pattern)
+
+    def scan(self):
+        """
+        Processes the files already in the directory, from the oldest one.
+        @return: The number of files submitted.
+        """
+        fileNames = []
+        for root, _, files in os.walk(self.directory):
+            fileNames += [os.path.join(root, i) for i in files if self.accept(i)]
+        fileNames.sort(key=lambda i: os.stat(i).st_mtime)
+        LOG.info("%d attack files found in '%s'", len(fileNames), self.directory)
+        for i in fileNames:
+            self.submit(i)
+        return len(fileNames)
+
+    def notify(self, fileName):
+        """
+        Notifies that a file was written. The file is processed after the debounce delay, which is restarted if the
+        file is written again.
+        @param fileName: The file name.
+        """
+        if not self.accept(fileName):
+            LOG.debug("File '%s' ignored", fileName)
+            return
+        with self.__lock:
+            self.__due[fileName] = time.monotonic() + self.debounce
+
+    def poll(self):
+        """
+        Processes the notified files whose debounce delay has expired.
+        @return: The number of files submitted.
+        """
+        now = time.monotonic()
+        with self.__lock:
+            fileNames = [i for i, due in self.__due.items() if due <= now]
+            for i in fileNames:
+                del self.__due[i]
+        for i in fileNames:
+            self.submit(i)
+        return len(fileNames)
+
+    def submit(self, fileName):
+        """
+        Processes a file in background. If the file is already being processed, it is processed again afterwards.
+        @param fileName: The file name.
+        """
+        with self.__lock:
+            if fileName in self.__inProgress:
+                self.__again.add(fileName)
+                return
+            self.__inProgress.add(fileName)
+            METRICS.set("cybertop_folder_files_in_progress", len(self.__inProgress))
+
+        hsplsFileName, msplsFileName = self.getDumpFileNames(fileName)
+
+        def onResult(r):
+            try:
+                self.cyberTop.sendRemediation(r, hsplsFileName, msplsFileName)
+                METRICS.increment("cybertop_folder_files_total", result="success")
+            finally:
+                self.__done(fileName)
+
+        def onError(e):
+            LOG.critical("Unable to remediate the attack file '%s': %s", fileName, str(e))
+            METRICS.increment("cybertop_folder_files_total", result="error")
+            self.__done(fileName)
+
+        LOG.debug("Attack file '%s' submitted", fileName)
+        self.pool.submitFile(fileName, self.configParser.get("global", "landscapeFile"), onResult, onError)
+
+    def getDumpFileNames(self, fileName):
+        """
+        Retrieves the names of the dumps of an attack file. The dumps are stored in the dump directory, if configured,
+        or beside the configured HSPL and MSPL dumps, with the attack file name appended.
+        @param fileName: The attack file name.
+        @return: The names of the HSPL and MSPL dumps, which are None if the dumps are disabled.
+        """
+        baseName = os.path.splitext(os.path.basename(fileName))[0]
+        fileNames = []
+        for option, kind in (("hsplsFile", "hspl"), ("msplsFile", "mspl")):
+            if self.dumpDirectory is not None:
+                fileNames.append(os.path.join(self.dumpDirectory, "%s.%s.xml" % (baseName, kind)))
+            elif self.configParser.has_option("global", option):
+                root, extension = os.path.splitext(self.configParser.get("global", option))
+                fileNames.append("%s-%s%s" % (root, baseName, extension))
+            else:
+                fileNames.append(None)
+        return fileNames
+
+    def getPendingCount(self):
+        """
+        Retrieves the number of files notified or being processed.
+        @return: The number of pending files.
+        """
+        with self.__lock:
+            return len(self.__due) + len(self.__inProgress)
+
+    def run(self):
+        """
+        Watches the directory until stop() is called.
+        """
+        LOG.debug("Starting directory listener: " + self.directory)
+        watchManager = pyinotify.WatchManager()
+        # The timeout lets the debounced files be processed.
+        notifier = pyinotify.Notifier(watchManager, FolderEventHandler(ingestion=self),
+                                      timeout=max(10, int(self.debounce * 250)))
+        watchManager.add_watch(self.directory, FOLDER_EVENTS, rec=True, auto_add=True)
+        self.scan()
+        try:
+            notifier.loop(callback=self.__onLoop)
+        finally:
+            notifier.stop()
+
+    def stop(self):
+        """
+        Stops watching the directory, from any thread.
+        """
+        self.__stopped = True
+
+    def close(self):
+        """
+        Waits for the files being processed and stops the workers, if owned.
+        """
+        if self.__ownedPool:
+            self.pool.close()
+
+    def __onLoop(self, notifier):
+        """
+        Called by the notifier after each event check.
+        @param notifier: The notifier.
+        @return: True if the loop must be stopped.
+        """
+        self.poll()
+        return self.__stopped
+
+    def __done(self, fileName):
+        """
+        Marks a file as processed.
+        @param fileName: The file name.
+        """
+        with self.__lock:
+            self.__inProgress.discard(fileName)
+            again = fileName in self.__again
+            self.__again.discard(fileName)
+            METRICS.set("cybertop_folder_files_in_progress", len(self.__inProgress))
+        if again:
+            self.submit(fileName)
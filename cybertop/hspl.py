@@ -18,27 +18,38 @@ HSPL and stuff.
 """
 from lxml import etree
 from cybertop.util import getHSPLXSDFile
+from cybertop.util import getSchema
 from cybertop.util import getRecipeNamespace
 from cybertop.util import getHSPLNamespace
 from cybertop.util import getXSINamespace
+from cybertop.recipes import RecipeFilter
+from cybertop.config import Configuration
+from cybertop.endpoint import ADDRESS_BITS
+from cybertop.endpoint import formatEndpoint
+from cybertop.endpoint import getEndpoint
+from cybertop.endpoint import PrefixTrie
+from cybertop.metrics import observeStage
 from cybertop.log import LOG
-import re
-from ipaddress import ip_address
-from ipaddress import ip_network
+import tempfile
+import time
 
 class HSPLReasoner(object):
     """
     Finds the HSPLs that can be used to mitigate an attack.
     """
 
-    def __init__(self, configParser, pluginManager):
+    def __init__(self, configParser, pluginManager, configuration=None):
         """
         Constructor.
         @param configParser: The configuration parser.
         @param pluginManager: The plug-in manager.
+        @param configuration: The shared configuration or None to create one from the configuration parser.
         """
         self.configParser = configParser
         self.pluginManager = pluginManager
+        if configuration is None:
+            configuration = Configuration(configParser)
+        self.configuration = configuration
 
     def getHSPLs(self, attack, recipes, landscape):
         """
@@ -52,138 +63,123 @@ class HSPLReasoner(object):
         if recipes is None:
             return None
 
-        schema = etree.XMLSchema(etree.parse(getHSPLXSDFile()))
-        
+        builders = self.getBuilders(recipes)
+        for i in attack.events:
+            for j in builders:
+                j.add(i)
+
+        return self.getHSPLsFromBuilders(attack.severity, attack.type, attack.getTimestamp(), builders)
+
+    def getBuilders(self, recipes):
+        """
+        Creates the objects incrementally building the HSPLs of some recipes.
+        @param recipes: The recipes to use.
+        @return: The list of HSPL builders, one for each recipe.
+        """
+        # The builders keep the settings they were created with until the attack ends.
+        settings = self.configuration.settings
+
+        return [HSPLBuilder(i, self.pluginManager, settings) for i in recipes]
+
+    def getBuilderFromState(self, state):
+        """
+        Recreates an HSPL builder from its content, e.g. in another process. The builder is only suitable to be
+        finalized with getHSPLsFromBuilders().
+        @param state: The builder content, as returned by HSPLBuilder.getState().
+        @return: The HSPL builder.
+        """
+        recipe, count, hspls = state
+        builder = HSPLBuilder(etree.fromstring(recipe), self.pluginManager, self.configuration.settings, False)
+        builder.count = count
+        for i in hspls:
+            hspl = etree.fromstring(i)
+            builder.hsplSet.append(hspl)
+            if builder.mapped:
+                builder.hsplMap.add(hspl)
+
+        return builder
+
+    def getHSPLsFromBuilders(self, severity, attackType, timestamp, builders):
+        """
+        Retrieve the HSPLs incrementally built for an attack. The builders cannot be used anymore after this call.
+        @param severity: The attack severity.
+        @param attackType: The attack type.
+        @param timestamp: The attack timestamp.
+        @param builders: The HSPL builders of the recipes to use.
+        @return: The XML HSPL set that can mitigate the attack.
+        @raise SyntaxError: When the generated XML is not valid.
+        """
+        schema = getSchema(getHSPLXSDFile())
+
         recommendations = etree.Element("{%s}recommendations" % getHSPLNamespace(), nsmap = {None : getHSPLNamespace(), "xsi" : getXSINamespace()})
 
-        for recipe in recipes:
-            hsplSet = etree.SubElement(recommendations, "{%s}hspl-set" % getHSPLNamespace(), nsmap = {None : getHSPLNamespace(), "xsi" : getXSINamespace()})
-    
-            # Gather some data about the recipe.
-            recipeName = recipe.findtext("{%s}name" % getRecipeNamespace())
-            recipeAction = recipe.findtext("{%s}action" % getRecipeNamespace())
-            recipeSubjectAnyAddress = recipe.findtext("{%s}subject-constraints/{%s}any-address" % (getRecipeNamespace(), getRecipeNamespace()))
-            recipeSubjectAnyPort = recipe.findtext("{%s}subject-constraints/{%s}any-port" % (getRecipeNamespace(), getRecipeNamespace()))
-            recipeObjectAnyAddress = recipe.findtext("{%s}object-constraints/{%s}any-address" % (getRecipeNamespace(), getRecipeNamespace()))
-            recipeObjectAnyPort = recipe.findtext("{%s}object-constraints/{%s}any-port" % (getRecipeNamespace(), getRecipeNamespace()))
-            recipeType = recipe.findtext("{%s}traffic-constraints/{%s}type" % (getRecipeNamespace(), getRecipeNamespace()))
-            recipeMaxConnections = recipe.findtext("{%s}traffic-constraints/{%s}max-connections" % (getRecipeNamespace(), getRecipeNamespace()))
-            recipeRateLimit = recipe.findtext("{%s}traffic-constraints/{%s}rate-limit" % (getRecipeNamespace(), getRecipeNamespace()))
-     
+        if len(builders) > 0:
+            settings = builders[0].settings
+        else:
+            settings = self.configuration.settings
+        hsplMaps = []
+        for builder in builders:
+            builder.load()
+            hsplSet = builder.hsplSet
+
             # Adds the context.
-            context = etree.SubElement(hsplSet, "{%s}context" % getHSPLNamespace())
-            etree.SubElement(context, "{%s}severity" % getHSPLNamespace()).text = str(attack.severity)
-            etree.SubElement(context, "{%s}type" % getHSPLNamespace()).text = attack.type
-            etree.SubElement(context, "{%s}timestamp" % getHSPLNamespace()).text = attack.getTimestamp().isoformat()
-     
-            # Filters the events.
-            events = []
-            recipeFilters = recipe.find("{%s}filters" % getRecipeNamespace())
-            evaluation = "or"
-            if recipeFilters is None:
-                events = attack.events
-            else:
-                if "evaluation" in recipeFilters.attrib.keys():
-                    evaluation = recipeFilters.attrib["evaluation"]
-                for i in attack.events:
-                    if evaluation == "or":
-                        test = False
-                    else:
-                        test = True
-                    for j in self.pluginManager.getPluginsOfCategory("Filter"):
-                        pluginTag = j.details.get("Core", "Tag")
-                        filterValues = recipeFilters.findall("{%s}%s" % (getRecipeNamespace(), pluginTag))
-                        for k in filterValues:
-                            t = j.plugin_object.filter(k.text, i)
-                            if evaluation == "or":
-                                test = test or t
-                            else:
-                                test = test and t
-                    if not test:
-                        events.append(i)
-     
-            # Adds an HSPL for each event.
-            count = 0
-            for i in events:
-                count += 1
-                hspl = etree.SubElement(hsplSet, "{%s}hspl" % getHSPLNamespace())
-                etree.SubElement(hspl, "{%s}name" % getHSPLNamespace()).text = "%s #%d" % (recipeName, count)
-                m = re.match("(\d+\.\d+\.\d+\.\d+(/\d+)?)(:(\d+|\*|any))?", i.target)
-                targetAddress = m.group(1)
-                targetPort = m.group(4)
-                if recipeSubjectAnyAddress is not None:
-                    targetAddress = "*"
-                if recipeSubjectAnyPort is not None:
-                    targetPort = "*"
-                etree.SubElement(hspl, "{%s}subject" % getHSPLNamespace()).text = "%s:%s" % (targetAddress, targetPort)
-                etree.SubElement(hspl, "{%s}action" % getHSPLNamespace()).text = recipeAction
-                m = re.match("(\d+\.\d+\.\d+\.\d+(/\d+)?)(:(\d+|\*|any))?", i.attacker)
-                attackerAddress = m.group(1)
-                attackerPort = m.group(4)
-                if recipeObjectAnyAddress is not None:
-                    attackerAddress = "*"
-                if recipeObjectAnyPort is not None:
-                    attackerPort = "*"
-                etree.SubElement(hspl, "{%s}object" % getHSPLNamespace()).text = "%s:%s" % (attackerAddress, attackerPort)
-                trafficConstraints = etree.SubElement(hspl, "{%s}traffic-constraints" % getHSPLNamespace())
-                if recipeType is not None:
-                    eventType = recipeType
-                else:
-                    eventType = i.fields["protocol"]
-                etree.SubElement(trafficConstraints, "{%s}type" % getHSPLNamespace()).text = eventType
-                if eventType == "TCP" and recipeMaxConnections is not None:
-                    etree.SubElement(trafficConstraints, "{%s}max-connections" % getHSPLNamespace()).text = recipeMaxConnections
-                if recipeRateLimit is not None:
-                    etree.SubElement(trafficConstraints, "{%s}rate-limit" % getHSPLNamespace()).text = recipeRateLimit
-     
+            context = etree.Element("{%s}context" % getHSPLNamespace())
+            etree.SubElement(context, "{%s}severity" % getHSPLNamespace()).text = str(severity)
+            etree.SubElement(context, "{%s}type" % getHSPLNamespace()).text = attackType
+            etree.SubElement(context, "{%s}timestamp" % getHSPLNamespace()).text = timestamp.isoformat()
+            hsplSet.insert(0, context)
+
+            recommendations.append(hsplSet)
+            hsplMaps.append(builder.hsplMap)
+
         LOG.debug(etree.tostring(recommendations, pretty_print = True).decode())
         
         if schema.validate(recommendations):
-            return self.__cleanAndMerge(recommendations)
+            return self.__cleanAndMerge(recommendations, hsplMaps, settings)
         else:
             LOG.critical("Invalid HSPL recommendations generated.")
             raise SyntaxError("Invalid HSPL recommendations generated.")
 
-    def __cleanAndMerge(self, recommendations):
+    def __cleanAndMerge(self, recommendations, hsplMaps, settings):
         """
         Polish an HSPL set by removing the duplicate HSPLs and merging them together, if needed. We only work on the objects.
         @param recommendations: The HSPL recommendations set to use.
+        @param hsplMaps: The HSPL maps of the HSPL sets, in the same order.
+        @param settings: The settings to use.
         @return: The cleaned HSPL set.
         """
-        hsplMergeInclusions = int(self.configParser.getboolean("global", "hsplMergeInclusions"))
-        hsplMergeWithAnyPorts = int(self.configParser.getboolean("global", "hsplMergeWithAnyPorts"))
-        hsplMergeWithSubnets = int(self.configParser.getboolean("global", "hsplMergeWithSubnets"))
-
-        if not hsplMergeInclusions and not hsplMergeWithAnyPorts and not hsplMergeWithSubnets:
+        if not settings.isMapped():
             return recommendations
         
         count = 0
-        for hsplSet in recommendations:
-            # Pass 0: create the map.
-            hsplMap = HSPLMap()
-            for i in hsplSet:
-                if i.tag == "{%s}hspl" % getHSPLNamespace():
-                    hsplMap.add(i)
-    
+        for hsplSet, hsplMap in zip(recommendations, hsplMaps):
+            attackType = hsplSet.findtext("{%s}context/{%s}type" % (getHSPLNamespace(), getHSPLNamespace()))
+            severity = hsplSet.findtext("{%s}context/{%s}severity" % (getHSPLNamespace(), getHSPLNamespace()))
             # Pass 1: removes the included HSPLs.
-            if hsplMergeInclusions:
+            if settings.hsplMergeInclusions:
+                start = time.perf_counter()
                 includedHSPLs = self.__mergeInclusions(hsplSet, hsplMap)
+                observeStage("merge-inclusions", time.perf_counter() - start, attackType, severity)
                 if includedHSPLs > 1:
                     LOG.debug("%d included HSPLs removed for the HSPL set %d.", includedHSPLs, count)
                 else:
                     LOG.debug("%d included HSPL removed for the HSPL set %d.", includedHSPLs, count)
     
             # Pass 2: merges the IP address using * as the port number.
-            if hsplMergeWithAnyPorts:
-                mergedHSPLs = self.__mergeWithAnyPorts(hsplSet, hsplMap)
+            if settings.hsplMergeWithAnyPorts:
+                start = time.perf_counter()
+                mergedHSPLs = self.__mergeWithAnyPorts(hsplSet, hsplMap, settings)
+                observeStage("merge-anyPorts", time.perf_counter() - start, attackType, severity)
                 if mergedHSPLs > 1:
                     LOG.debug("%d HSPLs merged using any ports for the HSPL set %d.", mergedHSPLs, count)
                 else:
                     LOG.debug("%d HSPL merged using any port for the HSPL set %d.", mergedHSPLs, count)
     
             # Pass 3: merges the HSPLs, if needed.
-            if hsplMergeWithSubnets:
-                mergedHSPLs = self.__mergeWithSubnets(hsplSet, hsplMap)
+            if settings.hsplMergeWithSubnets:
+                start = time.perf_counter()
+                mergedHSPLs = self.__mergeWithSubnets(hsplSet, hsplMap, settings)
+                observeStage("merge-subnets", time.perf_counter() - start, attackType, severity)
                 if mergedHSPLs > 1:
                     LOG.debug("%d HSPLs merged using subnets for the HSPL set %d.", mergedHSPLs, count)
                 else:
@@ -207,17 +203,14 @@ class HSPLReasoner(object):
         trafficConstraints1 = hspl1.find("{%s}traffic-constraints" % getHSPLNamespace())
         trafficConstraints2 = hspl2.find("{%s}traffic-constraints" % getHSPLNamespace())
 
-        m1 = re.match("(\d+\.\d+\.\d+\.\d+(/\d+)?)(:(\d+|\*|any))?", object1)
-        m2 = re.match("(\d+\.\d+\.\d+\.\d+(/\d+)?)(:(\d+|\*|any))?", object2)
+        endpoint1 = getEndpoint(object1)
+        endpoint2 = getEndpoint(object2)
         objectCheck = False
-        if m1 and m2:
-            address1 = ip_network(m1.group(1))
-            address2 = ip_network(m2.group(1))
-            n1 = int(address1.network_address) >> (32 - address1.prefixlen)
-            n2 = int(address2.network_address) >> (32 - address1.prefixlen)
-            port1 = m1.group(4)
-            port2 = m2.group(4)
-            if n1 == n2 and (port1 == port2 or port1 == "*" or port1 == "any"):
+        if (endpoint1 is not None and endpoint2 is not None and not endpoint1.isWildcard() and
+                endpoint1.version == endpoint2.version):
+            n1 = endpoint1.network
+            n2 = endpoint2.getNetwork(endpoint1.prefixLength)
+            if n1 == n2 and (endpoint1.port == endpoint2.port or endpoint1.isAnyPort()):
                 objectCheck = True
 
         if subject1 == subject2 and action1 == action2 and objectCheck and self.__checkEqualXML(trafficConstraints1, trafficConstraints2):
@@ -281,13 +274,14 @@ class HSPLReasoner(object):
 
         return len(hspls)
 
-    def __mergeWithAnyPorts(self, hsplSet, hsplMap):
+    def __mergeWithAnyPorts(self, hsplSet, hsplMap, settings):
         """
         Merges together several HSPLs by using * as a port.
         @param hsplSet: The HSPL set to edit.
+        @param settings: The settings to use.
         @return: The number of merged HSPLs removed.
         """
-        hsplMergingThreshold = int(self.configParser.get("global", "hsplMergingThreshold"))
+        hsplMergingThreshold = settings.hsplMergingThreshold
 
         if len(hsplSet) <= hsplMergingThreshold:
             return 0
@@ -306,9 +300,7 @@ class HSPLReasoner(object):
             s = set(i)
             first = s.pop()
             firstObject = first.find("{%s}object" % getHSPLNamespace())
-            m = re.match("(\d+\.\d+\.\d+\.\d+(/\d+)?)(:(\d+|\*|any))?", firstObject.text)
-            address = m.group(1)
-            firstObject.text = "%s:*" % address
+            firstObject.text = str(getEndpoint(firstObject.text).withAnyPort())
             for j in s:
                 hsplMap.remove(j)
                 if j in hsplSet:
@@ -316,64 +308,230 @@ class HSPLReasoner(object):
 
         return len(hspls) - len(mergedHSPLs)
 
-    def __mergeWithSubnets(self, hsplSet, hsplMap):
+    def __mergeWithSubnets(self, hsplSet, hsplMap, settings):
         """
-        Merges together several HSPLs by using subnets.
+        Merges together several HSPLs by using subnets, first the IPv4 ones and then the IPv6 ones. Only the prefix
+        lengths where at least two HSPLs share a network are tried, so the cost depends on the merged prefix lengths
+        rather than on the address width.
         @param hsplSet: The HSPL set to edit.
+        @param settings: The settings to use.
         @return: The number of merged HSPLs removed.
         """
-        hsplMergingThreshold = int(self.configParser.get("global", "hsplMergingThreshold"))
-        hsplMergingMinBits = int(self.configParser.get("global", "hsplMergingMinBits"))
-        hsplMergingMaxBits = int(self.configParser.get("global", "hsplMergingMaxBits"))
-        bits = hsplMergingMinBits
+        hsplMergingThreshold = settings.hsplMergingThreshold
 
         merged = set()
-        while len(hsplMap.getHSPLs()) > hsplMergingThreshold and bits >= hsplMergingMaxBits:
-            hspls = set()
-            mergedHSPLs = []
-
-            for i in hsplMap.getHSPLs():
-                if i not in hspls:
-                    inclusions = hsplMap.find(i, bits, True)
-                    if len(inclusions) > 1:
-                        mergedHSPLs.append(inclusions)
-                        hspls.update(inclusions)
-
-            for i in mergedHSPLs:
-                s = set(i)
-                first = s.pop()
-                firstObject = first.find("{%s}object" % getHSPLNamespace())
-                m = re.match("((\d+\.\d+\.\d+\.\d+)(/\d+)?)(:(\d+|\*|any))?", firstObject.text)
-                address = ip_address(m.group(2))
-                number = int(address)
-                n = (number >> (32 - bits)) << (32 - bits)
-                firstObject.text = "%s/%d:*" % (ip_address(n), bits)
-                for j in s:
-                    hsplMap.remove(j)
-                    hsplSet.remove(j)
-                merged.update(s)
-
-            bits -= 1
+        for version, bits, hsplMergingMaxBits in (
+                (4, settings.hsplMergingMinBits, settings.hsplMergingMaxBits),
+                (6, settings.hsplMergingMinBitsIPv6, settings.hsplMergingMaxBitsIPv6)):
+            while len(hsplMap.getHSPLs()) > hsplMergingThreshold and bits >= hsplMergingMaxBits:
+                subnets = {}
+                # The longest prefix length of the HSPLs that cannot be merged yet.
+                nextBits = -1
+                for hspl, (key, endpoint) in hsplMap.getEndpoints().items():
+                    if endpoint.version != version:
+                        continue
+                    if endpoint.prefixLength >= bits:
+                        subnet = (key, endpoint.getNetwork(bits))
+                        if subnet not in subnets:
+                            subnets[subnet] = set()
+                        subnets[subnet].add(hspl)
+                    else:
+                        nextBits = max(nextBits, endpoint.prefixLength)
+
+                for i in subnets.values():
+                    if len(i) > 1:
+                        s = set(i)
+                        first = s.pop()
+                        firstObject = first.find("{%s}object" % getHSPLNamespace())
+                        firstObject.text = str(getEndpoint(firstObject.text).getSupernet(bits))
+                        for j in s:
+                            hsplMap.remove(j)
+                            hsplSet.remove(j)
+                        merged.update(s)
+
+                # The next merge happens at the longest prefix shared by two of the remaining networks.
+                previousKey = None
+                previousNetwork = None
+                for key, network in sorted(subnets):
+                    if key == previousKey:
+                        nextBits = max(nextBits, ADDRESS_BITS[version] - (network ^ previousNetwork).bit_length())
+                    previousKey = key
+                    previousNetwork = network
+                bits = nextBits
 
         return len(merged)
 
+class HSPLBuilder(object):
+    """
+    Incrementally builds the HSPL set of a recipe, one attack event at a time. The events discarded by the recipe
+    filters are skipped and the HSPL map is kept up to date, so that nothing is left to do when the attack ends.
+    """
+
+    def __init__(self, recipe, pluginManager, settings, deduplicate=None):
+        """
+        Constructor.
+        @param recipe: The recipe to use.
+        @param pluginManager: The plug-in manager.
+        @param settings: The settings used until the HSPLs are finalized.
+        @param deduplicate: A value stating if the HSPLs identical to an already created one must be skipped or None
+                            to only skip them when the inclusions are merged, since they would be removed anyway.
+        """
+        self.recipe = recipe
+        self.filter = RecipeFilter(recipe, pluginManager)
+        self.hsplSet = etree.Element("{%s}hspl-set" % getHSPLNamespace(), nsmap = {None : getHSPLNamespace(), "xsi" : getXSINamespace()})
+        self.hsplMap = HSPLMap()
+        self.settings = settings
+        self.mapped = settings.isMapped()
+        if deduplicate is None:
+            deduplicate = settings.hsplMergeInclusions
+        # The number of events not discarded by the filters.
+        self.count = 0
+        # The temporary file containing the spilled HSPLs.
+        self.__spoolFile = None
+        if deduplicate:
+            self.__keys = set()
+        else:
+            self.__keys = None
+
+        # Gather some data about the recipe.
+        self.recipeName = recipe.findtext("{%s}name" % getRecipeNamespace())
+        self.recipeAction = recipe.findtext("{%s}action" % getRecipeNamespace())
+        self.recipeSubjectAnyAddress = recipe.findtext("{%s}subject-constraints/{%s}any-address" % (getRecipeNamespace(), getRecipeNamespace()))
+        self.recipeSubjectAnyPort = recipe.findtext("{%s}subject-constraints/{%s}any-port" % (getRecipeNamespace(), getRecipeNamespace()))
+        self.recipeObjectAnyAddress = recipe.findtext("{%s}object-constraints/{%s}any-address" % (getRecipeNamespace(), getRecipeNamespace()))
+        self.recipeObjectAnyPort = recipe.findtext("{%s}object-constraints/{%s}any-port" % (getRecipeNamespace(), getRecipeNamespace()))
+        self.recipeType = recipe.findtext("{%s}traffic-constraints/{%s}type" % (getRecipeNamespace(), getRecipeNamespace()))
+        self.recipeMaxConnections = recipe.findtext("{%s}traffic-constraints/{%s}max-connections" % (getRecipeNamespace(), getRecipeNamespace()))
+        self.recipeRateLimit = recipe.findtext("{%s}traffic-constraints/{%s}rate-limit" % (getRecipeNamespace(), getRecipeNamespace()))
+
+    def add(self, event):
+        """
+        Adds an HSPL for an attack event, if it is not discarded by the recipe filters.
+        @param event: The attack event.
+        @return: True if the event is mitigated by the recipe, False if it was discarded.
+        """
+        if not self.filter.accept(event):
+            return False
+        self.count += 1
+
+        target = getEndpoint(event.target)
+        targetAddress = target.address
+        targetPort = target.port
+        if self.recipeSubjectAnyAddress is not None:
+            targetAddress = "*"
+        if self.recipeSubjectAnyPort is not None:
+            targetPort = "*"
+        attacker = getEndpoint(event.attacker)
+        attackerAddress = attacker.address
+        attackerPort = attacker.port
+        if self.recipeObjectAnyAddress is not None:
+            attackerAddress = "*"
+        if self.recipeObjectAnyPort is not None:
+            attackerPort = "*"
+        if self.recipeType is not None:
+            eventType = self.recipeType
+        else:
+            eventType = event.fields["protocol"]
+        subject = formatEndpoint(targetAddress, targetPort)
+        hsplObject = formatEndpoint(attackerAddress, attackerPort)
+
+        if self.__keys is not None:
+            key = (subject, hsplObject, eventType)
+            if key in self.__keys:
+                return True
+            self.__keys.add(key)
+
+        hspl = etree.SubElement(self.hsplSet, "{%s}hspl" % getHSPLNamespace())
+        etree.SubElement(hspl, "{%s}name" % getHSPLNamespace()).text = "%s #%d" % (self.recipeName, self.count)
+        etree.SubElement(hspl, "{%s}subject" % getHSPLNamespace()).text = subject
+        etree.SubElement(hspl, "{%s}action" % getHSPLNamespace()).text = self.recipeAction
+        etree.SubElement(hspl, "{%s}object" % getHSPLNamespace()).text = hsplObject
+        trafficConstraints = etree.SubElement(hspl, "{%s}traffic-constraints" % getHSPLNamespace())
+        etree.SubElement(trafficConstraints, "{%s}type" % getHSPLNamespace()).text = eventType
+        if eventType == "TCP" and self.recipeMaxConnections is not None:
+            etree.SubElement(trafficConstraints, "{%s}max-connections" % getHSPLNamespace()).text = self.recipeMaxConnections
+        if self.recipeRateLimit is not None:
+            etree.SubElement(trafficConstraints, "{%s}rate-limit" % getHSPLNamespace()).text = self.recipeRateLimit
+
+        if self.mapped:
+            self.hsplMap.add(hspl)
+        return True
+
+    def getBufferedCount(self):
+        """
+        Retrieves the number of HSPLs kept in memory.
+        @return: The number of HSPLs in memory.
+        """
+        return len(self.hsplSet)
+
+    def spill(self, directory=None):
+        """
+        Moves the HSPLs kept in memory to a temporary file.
+        @param directory: The directory of the temporary file or None to use the default one.
+        @return: The number of spilled HSPLs.
+        """
+        if len(self.hsplSet) == 0:
+            return 0
+        if self.__spoolFile is None:
+            self.__spoolFile = tempfile.TemporaryFile(prefix="cybertop-", suffix=".hspl", dir=directory)
+
+        count = len(self.hsplSet)
+        for i in self.hsplSet:
+            self.__spoolFile.write(etree.tostring(i))
+            self.__spoolFile.write(b"\n")
+        self.hsplSet.clear()
+        self.hsplMap = HSPLMap()
+        return count
+
+    def load(self):
+        """
+        Moves back in memory the spilled HSPLs, before the ones added later.
+        """
+        if self.__spoolFile is None:
+            return
+
+        self.__spoolFile.seek(0)
+        hspls = [etree.fromstring(i) for i in self.__spoolFile if len(i.strip()) > 0]
+        self.close()
+        for i, hspl in enumerate(hspls):
+            self.hsplSet.insert(i, hspl)
+        if self.mapped:
+            self.hsplMap = HSPLMap()
+            for i in self.hsplSet:
+                self.hsplMap.add(i)
+
+    def getState(self):
+        """
+        Retrieves the builder content in a picklable form, e.g. to finalize the HSPLs in another process.
+        @return: The serialized recipe, the number of events not discarded by the filters and the list of the
+                 serialized HSPLs.
+        """
+        self.load()
+        return etree.tostring(self.recipe), self.count, [etree.tostring(i) for i in self.hsplSet]
+
+    def close(self):
+        """
+        Removes the temporary file, if any.
+        """
+        if self.__spoolFile is not None:
+            self.__spoolFile.close()
+            self.__spoolFile = None
+
 class HSPLMap:
     """
     An HSPL map.
-    So, the internal map is basically a multi-level dictionary:
-     + the keys are the HSPL constant hash, the object IPv4 prefix length, the object IPv4 network address and the port
-     + the values are a list of HSPLs
-    This dictionary maps an HSPL to a set of HSPLs that are included.
-    Note that a single HSPL can appear in several different buckets.
-    Note also that single IPv4 addresses are treated as networks with a prefix length of 32.
+    The HSPLs are grouped by their constant hash and by the IP version of their objects, and each group is indexed by
+    a prefix trie of the object networks, so finding the HSPLs included in a network costs as much as its prefix
+    length, for both IPv4 and IPv6.
+    Note that single addresses are treated as networks with a prefix length of 32 (IPv4) or 128 (IPv6).
     """
 
     def __init__(self):
         """
         Creates an empty map.
         """
-        self.__map = {}
-        self.__hspls = set()
+        self.__tries = {}
+        self.__endpoints = {}
 
     def __getHash(self, hspl):
         """
@@ -395,34 +553,15 @@ class HSPLMap:
         Adds a new HSPL to the map.
         @param hspl: The HSPL to add.
         """
-        hsplObject = hspl.findtext("{%s}object" % getHSPLNamespace())
-        m = re.match("(\d+\.\d+\.\d+\.\d+(/\d+)?)(:(\d+|\*|any))?", hsplObject)
-
-        if m:
-            key = self.__getHash(hspl)
-            address = ip_network(m.group(1))
-            port = m.group(4)
-            prefixLength = address.prefixlen
-            number = int(address.network_address)
-            if key not in self.__map:
-                self.__map[key] = {}
-            mapPrefixes = self.__map[key]
-            for i in range(0, prefixLength + 1):
-                if i not in mapPrefixes:
-                    mapPrefixes[i] = {}
-                mapAddresses = mapPrefixes[i]
-                n = (number >> (32 - i)) << (32 - i)
-                if n not in mapAddresses:
-                    mapAddresses[n] = {}
-                mapPort = mapAddresses[n]
-                if "*" not in mapPort:
-                    mapPort["*"] = set()
-                mapPort["*"].add(hspl)
-                if port not in mapPort:
-                    mapPort[port] = set()
-                mapPort[port].add(hspl)
-
-                self.__hspls.add(hspl)
+        endpoint = getEndpoint(hspl.findtext("{%s}object" % getHSPLNamespace()))
+
+        if endpoint is not None and not endpoint.isWildcard():
+            key = (self.__getHash(hspl), endpoint.version)
+            if key not in self.__tries:
+                self.__tries[key] = PrefixTrie(endpoint.version)
+            self.__tries[key].add(endpoint, hspl)
+            # The merges edit the objects, so an HSPL is removed with the endpoint it was added with.
+            self.__endpoints[hspl] = (key, endpoint)
 
     def find(self, hspl, forcePrefixLength = None, forceAnyPort = False):
         """
@@ -432,68 +571,41 @@ class HSPLMap:
         @param forceAnyPort: A value stating if we want to force an any port address or keep the original value.
         @return: The set of HSPLs included by the passed HSPL.
         """
-        inclusions = set()
-
-        hsplObject = hspl.findtext("{%s}object" % getHSPLNamespace())
-        m = re.match("(\d+\.\d+\.\d+\.\d+(/\d+)?)(:(\d+|\*|any))?", hsplObject)
+        endpoint = getEndpoint(hspl.findtext("{%s}object" % getHSPLNamespace()))
 
-        if m:
-            key = self.__getHash(hspl)
-            address = ip_network(m.group(1))
-            port = m.group(4)
+        if endpoint is not None and not endpoint.isWildcard():
+            key = (self.__getHash(hspl), endpoint.version)
+            port = endpoint.port
             if port == "any" or forceAnyPort:
                 port = "*"
             if forcePrefixLength is not None:
                 prefixLength = forcePrefixLength
             else:
-                prefixLength = address.prefixlen
-            number = int(address.network_address)
-            if key in self.__map:
-                mapPrefixes = self.__map[key]
-                mapAddresses = mapPrefixes[prefixLength]
-                n = (number >> (32 - prefixLength)) << (32 - prefixLength)
-                if n in mapAddresses:
-                    mapPort = mapAddresses[n]
-                    if port in mapPort:
-                        inclusions.update(mapPort[port])
-
-        return inclusions
+                prefixLength = endpoint.prefixLength
+            if key in self.__tries:
+                return self.__tries[key].find(endpoint.getNetwork(prefixLength), prefixLength, port)
+
+        return set()
 
     def remove(self, hspl):
         """
         Removes an HSPL from the map.
         @param hspl: The HSPL to remove.
         """
+        if hspl in self.__endpoints:
+            key, endpoint = self.__endpoints.pop(hspl)
+            self.__tries[key].remove(endpoint, hspl)
 
-        hsplObject = hspl.findtext("{%s}object" % getHSPLNamespace())
-        m = re.match("(\d+\.\d+\.\d+\.\d+(/\d+)?)(:(\d+|\*|any))?", hsplObject)
-
-        if m:
-            key = self.__getHash(hspl)
-            address = ip_network(m.group(1))
-            port = m.group(4)
-            if port == "any":
-                port = "*"
-            prefixLength = address.prefixlen
-            number = int(address.network_address)
-            mapPrefixes = self.__map[key]
-            for i in range(0, prefixLength + 1):
-                if i in mapPrefixes:
-                    mapAddresses = mapPrefixes[i]
-                    n = (number >> (32 - i)) << (32 - i)
-                    if n in mapAddresses:
-                        mapPort = mapAddresses[n]
-                        if port in mapPort:
-                            mapPort[port].remove(hspl)
-                        if port != "*" and "*" in mapPort:
-                            mapPort["*"].remove(hspl)
-
-            if hspl in self.__hspls:
-                self.__hspls.remove(hspl)
+    def getEndpoints(self):
+        """
+        Retrieves the object endpoints of all the HSPLs inserted, as they were when inserted.
+        @return: A dictionary mapping each HSPL to its group key and its object endpoint.
+        """
+        return self.__endpoints
 
     def getHSPLs(self):
         """
         Retrieves the set of all the HSPLs inserted.
         @return: All the inserted HSPLs.
         """
-        return self.__hspls
+        return self.__endpoints.keys()
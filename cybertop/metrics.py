@@ -0,0 +1,295 @@
+# Copyright 2018 Politecnico di Torino
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Run-time metrics.
+
+@author: Daniele Canavese
+"""
+
+import bisect
+import threading
+import time
+
+# The default histogram buckets, in seconds.
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 60.0)
+
+
+class Metrics(object):
+    """
+    A thread-safe registry of counters, gauges and histograms. Each metric is identified by its name and an optional set
+    of labels.
+    """
+
+    def __init__(self):
+        """
+        Creates an empty registry.
+        """
+        self.__lock = threading.Lock()
+        self.__counters = {}
+        self.__gauges = {}
+        self.__histograms = {}
+
+    def __getKey(self, name, labels):
+        """
+        Retrieves the internal key of a metric.
+        @param name: The metric name.
+        @param labels: The metric labels.
+        @return: The metric key.
+        """
+        return (name, tuple(sorted(labels.items())))
+
+    def increment(self, name, value=1, **labels):
+        """
+        Increments a counter.
+        @param name: The counter name.
+        @param value: The increment.
+        @param labels: The counter labels.
+        """
+        key = self.__getKey(name, labels)
+        with self.__lock:
+            self.__counters[key] = self.__counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        """
+        Sets a gauge.
+        @param name: The gauge name.
+        @param value: The gauge value.
+        @param labels: The gauge labels.
+        """
+        key = self.__getKey(name, labels)
+        with self.__lock:
+            self.__gauges[key] = value
+
+    def observe(self, name, value, **labels):
+        """
+        Adds an observation to a histogram.
+        @param name: The histogram name.
+        @param value: The observed value.
+        @param labels: The histogram labels.
+        """
+        key = self.__getKey(name, labels)
+        with self.__lock:
+            histogram = self.__histograms.get(key)
+            if histogram is None:
+                histogram = Histogram(DEFAULT_BUCKETS)
+                self.__histograms[key] = histogram
+            histogram.observe(value)
+
+    def getHistogram(self, name, **labels):
+        """
+        Retrieves a histogram.
+        @param name: The histogram name.
+        @param labels: The histogram labels.
+        @return: A copy of the histogram or None if nothing was observed.
+        """
+        key = self.__getKey(name, labels)
+        with self.__lock:
+            histogram = self.__histograms.get(key)
+            if histogram is None:
+                return None
+            return histogram.copy()
+
+    def get(self, name, **labels):
+        """
+        Retrieves the value of a counter or gauge.
+        @param name: The metric name.
+        @param labels: The metric labels.
+        @return: The metric value or 0 if the metric was never set.
+        """
+        key = self.__getKey(name, labels)
+        with self.__lock:
+            if key in self.__counters:
+                return self.__counters[key]
+            return self.__gauges.get(key, 0)
+
+    def getCounters(self):
+        """
+        Retrieves a snapshot of all the counters.
+        @return: A dictionary mapping (name, labels) to the counter values.
+        """
+        with self.__lock:
+            return dict(self.__counters)
+
+    def getGauges(self):
+        """
+        Retrieves a snapshot of all the gauges.
+        @return: A dictionary mapping (name, labels) to the gauge values.
+        """
+        with self.__lock:
+            return dict(self.__gauges)
+
+    def getHistograms(self):
+        """
+        Retrieves a snapshot of all the histograms.
+        @return: A dictionary mapping (name, labels) to copies of the histograms.
+        """
+        with self.__lock:
+            return dict((k, v.copy()) for k, v in self.__histograms.items())
+
+    def drain(self):
+        """
+        Retrieves and removes the counters and the histograms, for example to send them from a worker process to the
+        main one. The gauges are kept.
+        @return: The counters and the histograms, in a form accepted by merge().
+        """
+        with self.__lock:
+            counters = self.__counters
+            histograms = self.__histograms
+            self.__counters = {}
+            self.__histograms = {}
+        return counters, histograms
+
+    def merge(self, metrics):
+        """
+        Adds the counters and the histograms drained from another registry.
+        @param metrics: The counters and the histograms, as returned by drain().
+        """
+        counters, histograms = metrics
+        with self.__lock:
+            for key, value in counters.items():
+                self.__counters[key] = self.__counters.get(key, 0) + value
+            for key, histogram in histograms.items():
+                if key in self.__histograms:
+                    self.__histograms[key].add(histogram)
+                else:
+                    self.__histograms[key] = histogram.copy()
+
+    def reset(self):
+        """
+        Removes all the metrics.
+        """
+        with self.__lock:
+            self.__counters = {}
+            self.__gauges = {}
+            self.__histograms = {}
+
+
+class Histogram(object):
+    """
+    A histogram with cumulative buckets.
+    """
+
+    def __init__(self, buckets):
+        """
+        Creates an empty histogram.
+        @param buckets: The sorted upper bounds of the buckets.
+        """
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        """
+        Adds an observation.
+        @param value: The observed value.
+        """
+        i = bisect.bisect_left(self.buckets, value)
+        if i < len(self.counts):
+            self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+    def add(self, histogram):
+        """
+        Adds the observations of another histogram with the same buckets.
+        @param histogram: The other histogram.
+        """
+        for i, count in enumerate(histogram.counts):
+            self.counts[i] += count
+        self.count += histogram.count
+        self.sum += histogram.sum
+
+    def getCumulativeCounts(self):
+        """
+        Retrieves the number of observations less than or equal to each bucket bound.
+        @return: The list of cumulative counts.
+        """
+        counts = []
+        total = 0
+        for i in self.counts:
+            total += i
+            counts.append(total)
+        return counts
+
+    def copy(self):
+        """
+        Copies the histogram.
+        @return: A new histogram with the same observations.
+        """
+        histogram = Histogram(self.buckets)
+        histogram.counts = list(self.counts)
+        histogram.count = self.count
+        histogram.sum = self.sum
+        return histogram
+
+
+class StageTimer(object):
+    """
+    Measures the consecutive stages of the remediation of an attack. The duration of each stage is added to the
+    cybertop_stage_seconds histogram and the whole remediation to the cybertop_remediation_seconds one, both labelled
+    with the attack type and severity.
+    """
+
+    def __init__(self, attackType, severity, start=None):
+        """
+        Constructor.
+        @param attackType: The attack type.
+        @param severity: The attack severity.
+        @param start: The starting time, as returned by time.perf_counter(), or None to start now.
+        """
+        self.attackType = attackType
+        self.severity = str(severity)
+        self.__start = time.perf_counter() if start is None else start
+        self.__last = self.__start
+
+    def lap(self, stage):
+        """
+        Ends a stage and starts the next one.
+        @param stage: The name of the ended stage.
+        """
+        now = time.perf_counter()
+        observeStage(stage, now - self.__last, self.attackType, self.severity)
+        self.__last = now
+
+    def count(self, name, value):
+        """
+        Increments a counter of the attack.
+        @param name: The counter name.
+        @param value: The increment.
+        """
+        METRICS.increment(name, value, type=self.attackType, severity=self.severity)
+
+    def finish(self):
+        """
+        Ends the remediation.
+        """
+        METRICS.observe("cybertop_remediation_seconds", time.perf_counter() - self.__start, type=self.attackType,
+                        severity=self.severity)
+
+
+def observeStage(stage, seconds, attackType, severity):
+    """
+    Records the duration of a remediation stage.
+    @param stage: The stage name.
+    @param seconds: The stage duration in seconds.
+    @param attackType: The attack type.
+    @param severity: The attack severity.
+    """
+    METRICS.observe("cybertop_stage_seconds", seconds, stage=stage, type=attackType, severity=str(severity))
+
+
+# The global metrics registry.
+METRICS = Metrics()
@@ -20,27 +20,38 @@ MSPL and stuff.
 
 from lxml import etree
 import re
-import random
+import time
 from cybertop.util import getMSPLXSDFile
+from cybertop.util import getSchema
 from cybertop.util import getHSPLNamespace
 from cybertop.util import getMSPLNamespace
 from cybertop.util import getXSINamespace
+from cybertop.config import Configuration
+from cybertop.metrics import METRICS
+from cybertop.metrics import observeStage
+from cybertop.placement import ShardRing
 from cybertop.log import LOG
-from cybertop.vnsfo import retrieve_vnsfr_id
+from cybertop.vnsfo import getClient
 
 class MSPLReasoner(object):
     """
     Finds the MSPLs that can be used to mitigate an attack.
     """
 
-    def __init__(self, configParser, pluginManager):
+    def __init__(self, configParser, pluginManager, configuration=None):
         """
         Constructor.
         @param configParser: The configuration parser.
         @param pluginManager: The plug-in manager.
+        @param configuration: The shared configuration or None to create one from the configuration parser.
         """
         self.configParser = configParser
         self.pluginManager = pluginManager
+        if configuration is None:
+            configuration = Configuration(configParser)
+        self.configuration = configuration
+        # The last ring built, with the capacities it was built from.
+        self.__ring = (None, None)
 
     def getMSPLs(self, hsplRecommendations, landscape, anomaly_name):
         """
@@ -53,9 +64,16 @@ class MSPLReasoner(object):
         if hsplRecommendations is None:
             return None
         
-        schema = etree.XMLSchema(etree.parse(getMSPLXSDFile()))
+        schema = getSchema(getMSPLXSDFile())
+        settings = self.configuration.settings
 
         recommendations = etree.Element("{%s}recommendations" % getMSPLNamespace(), nsmap = {None : getMSPLNamespace(), "xsi" : getXSINamespace()})
+        # The MSPL sets, IT resource identifiers, plug-ins and HSPL sets of the IT resources to configure.
+        placements = []
+        # The attack type and severity labelling the vNSFO stage, the same for all the HSPL sets.
+        attackContext = "{%s}hspl-set/{%s}context/{%s}" % (getHSPLNamespace(), getHSPLNamespace(), getHSPLNamespace())
+        attackType = hsplRecommendations.findtext(attackContext + "type")
+        attackSeverity = hsplRecommendations.findtext(attackContext + "severity")
         
         for hsplSet in hsplRecommendations:
             msplSet = etree.SubElement(recommendations, "{%s}mspl-set" % getMSPLNamespace(), nsmap = {None : getMSPLNamespace(), "xsi" : getXSINamespace()})
@@ -72,37 +90,29 @@ class MSPLReasoner(object):
             etree.SubElement(context, "{%s}type" % getMSPLNamespace()).text = anomaly_name
             etree.SubElement(context, "{%s}timestamp" % getMSPLNamespace()).text = msplTimestamp
     
-            # Finds a plug-in that can create a configured IT resource.
-            [plugin, identifier] = self.__findLocation(hsplSet, landscape)
-            plugin.plugin_object.setup(self.configParser)
-    
-            LOG.info("Check if VNSFO API call (experimental) is enabled")
-    
-            # Check if VNSFO is integrated to recommendations engine
-            vnsfo_integration = self.configParser.getboolean("vnsfo",
-                                                             "enable_vnsfo_api_call")
-            if vnsfo_integration:
-                # Creates the IT resource.
-                LOG.info("Experimental: contact vNSFO API")
-                vnsfo_base_url = self.configParser.get("vnsfo", "vnsfo_base_url")
-                vnsfo_timeout = int(self.configParser.get("vnsfo", "vnsfo_timeout"))
-                if not vnsfo_base_url:
-                    LOG.info("VNSFO base URL empty. Fallback to stable.")
-                else:
-                    LOG.info("Retrieving VNSF running ID for: " + identifier)
-                    vnfr_id = retrieve_vnsfr_id(vnsfo_base_url,
-                                                identifier,
-                                                anomaly_name,
-                                                vnsfo_timeout)
-                    if vnfr_id:
-                        LOG.info("VNSF running ID is: " + vnfr_id)
-                        identifier = vnfr_id
-            else:
-                LOG.info("Stable solution selected.")
-            itResource = etree.SubElement(msplSet, "{%s}it-resource" % getMSPLNamespace(), {"id" : identifier})
+            # Finds the plug-ins and the IT resources that can enforce the HSPLs, and shares the HSPLs among them.
+            locations = self.__findLocations(hsplSet, landscape)
+            if not settings.msplSharding and len(locations) > 1:
+                # The IT resource with the largest capacity enforces everything.
+                identifier = min(locations, key = lambda i: (-landscape.getCapacity(i), i))
+                locations = {identifier: locations[identifier]}
+            ring = self.__getRing(dict((i, landscape.getCapacity(i)) for i in locations))
+
+            for identifier, shard in ring.getShards(hsplSet) if ring is not None else []:
+                METRICS.increment("cybertop_mspl_shard_hspls_total",
+                                  len(shard.findall("{%s}hspl" % getHSPLNamespace())), resource = identifier)
+                placements.append((msplSet, identifier, locations[identifier], shard))
+
+        # The running identifiers of all the HSPL sets are retrieved at once.
+        runningIdentifiers = self.__getRunningIdentifiers(set(i[1] for i in placements), anomaly_name, attackType,
+                                                          attackSeverity, settings)
+        for msplSet, identifier, plugin, shard in placements:
+            plugin.plugin_object.setup(self.configParser, settings)
+            itResource = etree.SubElement(msplSet, "{%s}it-resource" % getMSPLNamespace(),
+                                          {"id" : runningIdentifiers[identifier]})
             # Calls the plug-in to configure the IT resource.
-            plugin.plugin_object.configureITResource(itResource, hsplSet)
-        
+            plugin.plugin_object.configureITResource(itResource, shard)
+
         if schema.validate(recommendations):
             LOG.debug(etree.tostring(recommendations, pretty_print = True).decode())
 
@@ -111,35 +121,70 @@ class MSPLReasoner(object):
             LOG.critical("Invalid MSPL recommendations generated.")
             raise SyntaxError("Invalid MSPL recommendations generated.")
 
-    def __findLocation(self, hsplSet, landscape):
+    def __getRunningIdentifiers(self, identifiers, anomaly_name, attackType, attackSeverity, settings):
+        """
+        Retrieves the identifiers of the running instances of some IT resources from the vNSFO, if enabled.
+        @param identifiers: The IT resource identifiers.
+        @param anomaly_name: The anomaly name.
+        @param attackType: The attack type.
+        @param attackSeverity: The attack severity.
+        @param settings: The settings to use.
+        @return: A dictionary mapping the IT resource identifiers to the running ones, or to themselves if not
+                 available.
+        """
+        runningIdentifiers = dict((i, i) for i in identifiers)
+        LOG.info("Check if VNSFO API call (experimental) is enabled")
+
+        # Check if VNSFO is integrated to recommendations engine
+        if settings.vnsfoEnabled:
+            LOG.info("Experimental: contact vNSFO API")
+            if not settings.vnsfoBaseURL:
+                LOG.info("VNSFO base URL empty. Fallback to stable.")
+            elif len(identifiers) > 0:
+                LOG.info("Retrieving VNSF running IDs for: " + ", ".join(sorted(identifiers)))
+                start = time.perf_counter()
+                client = getClient(settings.vnsfoBaseURL, settings.vnsfoTimeout, settings.vnsfoCacheTTL)
+                for identifier, vnfr_id in client.getRunningIdentifiers(identifiers, anomaly_name).items():
+                    if vnfr_id:
+                        LOG.info("VNSF running ID is: " + vnfr_id)
+                        runningIdentifiers[identifier] = vnfr_id
+                observeStage("vnsfo", time.perf_counter() - start, attackType, attackSeverity)
+        else:
+            LOG.info("Stable solution selected.")
+
+        return runningIdentifiers
+
+    def __findLocations(self, hsplSet, landscape):
         """
-        Finds a suitable plug-in and location for the HSPL refinement.
+        Finds the suitable plug-ins and locations for the HSPL refinement.
         @param hsplSet: The HSPL set to use.
         @param landscape: The landscape.
-        @return: The plug-in and IT resource identifier, or [None, None] if nobody is useful. What a shame.
+        @return: A dictionary mapping the IT resource identifiers to the plug-ins configuring them, empty if nobody is
+                 useful. What a shame.
         """
-        plugins = set()
-        identifiers = set()
+        locations = {}
         hsplAction = hsplSet.findtext("{%s}hspl/{%s}action" % (getHSPLNamespace(), getHSPLNamespace()))
-        for i in self.pluginManager.getPluginsOfCategory("Action"):
+        # The plug-ins are sorted, so the same one is always picked for an IT resource.
+        for i in sorted(self.pluginManager.getPluginsOfCategory("Action"), key = lambda i: i.name):
             pluginAction = i.details.get("Core", "Action")
             pluginCapabilities = set(re.split("\s*,\s*", i.details.get("Core", "Capabilities")))
             if hsplAction == pluginAction:
                 for identifier, capabilities in landscape.items():
-                    if pluginCapabilities.issubset(capabilities):
-                        plugins.add(i)
-                        identifiers.add(identifier)
+                    if pluginCapabilities.issubset(capabilities) and identifier not in locations:
+                        locations[identifier] = i
 
-        # Picks a random plug-in.
-        if len(plugins) == 0:
-            plugin = None
-        else:
-            plugin = random.sample(plugins, 1)[0]
+        return locations
 
-        # Picks a random identifier.
-        if len(identifiers) == 0:
-            identifier = None
-        else:
-            identifier = random.sample(identifiers, 1)[0]
-
-        return [plugin, identifier]
+    def __getRing(self, capacities):
+        """
+        Retrieves the ring of some IT resources. The last ring is reused if the IT resources did not change.
+        @param capacities: A dictionary mapping the IT resource identifiers to their capacities.
+        @return: The ring or None if there are no IT resources.
+        """
+        if len(capacities) == 0:
+            return None
+        lastCapacities, ring = self.__ring
+        if lastCapacities != capacities:
+            ring = ShardRing(capacities)
+            self.__ring = (capacities, ring)
+        return ring
@@ -0,0 +1,332 @@
+# Copyright 2018 Politecnico di Torino
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Asynchronous delivery of the remediations.
+
+@author: Daniele Canavese
+"""
+
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+from cybertop.metrics import METRICS
+from cybertop.log import LOG
+from cybertop.publisher import PublishRejected
+
+
+class Outbox(object):
+    """
+    A bounded queue of messages drained by a background thread that publishes them to the dashboard. When the dashboard
+    cannot be reached, or the queue is full, the messages are spilled into an on-disk spool and replayed, in order, as
+    soon as the dashboard is back. The messages rejected by the dashboard are dropped, so that they do not block the
+    following ones.
+    """
+
+    # The spool file extension.
+    SPOOL_EXTENSION = ".msg"
+
+    def __init__(self, publisher, size, spoolDirectory=None, retryDelay=5):
+        """
+        Constructor. It also starts the publishing thread.
+        @param publisher: The dashboard publisher.
+        @param size: The maximum number of messages kept in memory.
+        @param spoolDirectory: The directory where the undelivered messages are stored or None to keep them only in
+                               memory.
+        @param retryDelay: The delay in seconds between two delivery attempts when the dashboard is down.
+        """
+        self.publisher = publisher
+        self.spoolDirectory = spoolDirectory
+        self.retryDelay = retryDelay
+        self.size = size
+        self.__queue = queue.Queue(size)
+        self.__counter = itertools.count()
+        self.__spoolLock = threading.Lock()
+        self.__stopping = threading.Event()
+        # Set while the dashboard cannot be reached.
+        self.__failing = threading.Event()
+        # The messages that could not be delivered when no spool is available.
+        self.__pending = []
+        self.__spooledFiles = 0
+        # The delivery callbacks of the spooled messages, by spool file name.
+        self.__callbacks = {}
+
+        if spoolDirectory is not None:
+            os.makedirs(spoolDirectory, exist_ok=True)
+            self.__spooledFiles = len(self.__getSpoolFiles())
+            if self.__spooledFiles > 0:
+                LOG.info("Found %d undelivered remediations in the spool '%s'.", self.__spooledFiles,
+                         spoolDirectory)
+        else:
+            LOG.warning("No outbox spool directory, the remediations not delivered at shutdown will be lost")
+
+        self.__thread = threading.Thread(target=self.__run, name="cybertop-outbox", daemon=True)
+        self.__thread.start()
+
+    def put(self, message, headers=None, callback=None):
+        """
+        Enqueues a message without waiting for its delivery.
+        @param message: The message body.
+        @param headers: The optional AMQP headers.
+        @param callback: The optional function called, without parameters, once the message has been delivered. It is
+                         not called if the message is dropped or rejected, or was spooled before a restart.
+        """
+        item = (time.time(), message, headers, callback)
+        try:
+            self.__queue.put_nowait(item)
+        except queue.Full:
+            LOG.warning("The outbox is full, spilling the remediations")
+            # The queued messages are older, so they are moved to the spool too in order to keep the delivery order.
+            while True:
+                try:
+                    self.__spill(self.__queue.get_nowait())
+                    self.__queue.task_done()
+                except queue.Empty:
+                    break
+            self.__spill(item)
+        self.__updateGauges()
+
+    def getDepth(self):
+        """
+        Retrieves the number of messages waiting for the delivery, both in memory and in the spool.
+        @return: The number of undelivered messages.
+        """
+        return self.__queue.qsize() + self.__getSpoolDepth()
+
+    def flush(self, timeout=None):
+        """
+        Waits until all the in-memory messages have been handled.
+        @param timeout: The maximum number of seconds to wait or None to wait forever.
+        @return: True if the in-memory queue is empty, False if the timeout expired.
+        """
+        end = None
+        if timeout is not None:
+            end = time.monotonic() + timeout
+        while self.__queue.unfinished_tasks > 0:
+            if end is not None and time.monotonic() > end:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def close(self, timeout=10):
+        """
+        Tries to deliver the messages kept in memory, then stops the publishing thread. The messages not yet delivered
+        are left in the spool, or lost if there is no spool directory.
+        @param timeout: The maximum number of seconds to wait for the delivery, and then for the thread.
+        """
+        end = time.monotonic() + timeout
+        while self.__getMemoryDepth() > 0 and time.monotonic() < end:
+            # The spool keeps the messages anyway, so there is no point in waiting for a dashboard that is down.
+            if self.spoolDirectory is not None and self.__failing.is_set():
+                break
+            time.sleep(0.01)
+        self.__stopping.set()
+        self.__thread.join(timeout)
+        # Saves whatever is left.
+        while True:
+            try:
+                self.__spill(self.__queue.get_nowait())
+                self.__queue.task_done()
+            except queue.Empty:
+                break
+        with self.__spoolLock:
+            lost = len(self.__pending)
+        if lost > 0:
+            METRICS.increment("cybertop_outbox_dropped_total", lost)
+            LOG.error("No spool directory available, %d undelivered remediations have been lost", lost)
+        self.__updateGauges()
+
+    def __run(self):
+        """
+        The publishing thread body.
+        """
+        while not self.__stopping.is_set():
+            # The spooled messages are older, so they must be replayed first.
+            if self.__getSpoolDepth() > 0 and not self.__replay():
+                self.__updateGauges()
+                self.__stopping.wait(self.retryDelay)
+                continue
+
+            try:
+                item = self.__queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                if self.__getSpoolDepth() > 0 or not self.__deliver(item):
+                    self.__spill(item)
+            finally:
+                self.__queue.task_done()
+                self.__updateGauges()
+
+    def __deliver(self, item):
+        """
+        Publishes a message. A message rejected by the dashboard is dropped.
+        @param item: The queued message.
+        @return: True if the message was delivered or dropped, False if it must be retried.
+        """
+        enqueued, message, headers, callback = item
+        try:
+            self.publisher.publish(message, headers)
+        except PublishRejected as e:
+            self.__failing.clear()
+            METRICS.increment("cybertop_outbox_dropped_total")
+            LOG.error("Remediation dropped: " + str(e))
+            return True
+        except IOError as e:
+            LOG.warning("Dashboard unreachable, the remediation will be retried: " + str(e))
+            self.__failing.set()
+            return False
+        self.__failing.clear()
+        METRICS.increment("cybertop_outbox_delivered_total")
+        METRICS.observe("cybertop_outbox_wait_seconds", max(0.0, time.time() - enqueued))
+        LOG.info("Remediation forwarded to the dashboard")
+        if callback is not None:
+            try:
+                callback()
+            except Exception as e:
+                LOG.error("Delivery callback failed: " + str(e))
+        return True
+
+    def __replay(self):
+        """
+        Replays the spooled messages, in order.
+        @return: True if the spool has been emptied, False if the dashboard is still down.
+        """
+        with self.__spoolLock:
+            pending = list(self.__pending)
+        for item in pending:
+            if not self.__deliver(item):
+                return False
+            with self.__spoolLock:
+                self.__pending.remove(item)
+            self.__updateGauges()
+
+        for fileName in self.__getSpoolFiles():
+            try:
+                with open(fileName, "rt") as f:
+                    content = json.load(f)
+            except (IOError, ValueError):
+                LOG.error("Discarding the invalid spool file '%s'.", fileName)
+                self.__removeSpoolFile(fileName)
+                continue
+            with self.__spoolLock:
+                callback = self.__callbacks.get(fileName)
+            if not self.__deliver((content["time"], content["body"], content["headers"], callback)):
+                return False
+            self.__removeSpoolFile(fileName)
+            self.__updateGauges()
+
+        LOG.info("All the spooled remediations have been delivered")
+        return True
+
+    def __spill(self, item):
+        """
+        Stores a message in the spool. The spool is sorted by enqueuing time, so a message can be spilled at any moment
+        without altering the delivery order.
+        @param item: The queued message.
+        """
+        METRICS.increment("cybertop_outbox_spooled_total")
+        if self.spoolDirectory is None:
+            with self.__spoolLock:
+                if len(self.__pending) >= self.size:
+                    self.__pending.pop(0)
+                    METRICS.increment("cybertop_outbox_dropped_total")
+                    LOG.error("No spool directory available, the oldest undelivered remediation has been dropped")
+                i = len(self.__pending)
+                while i > 0 and self.__pending[i - 1][0] > item[0]:
+                    i -= 1
+                self.__pending.insert(i, item)
+            return
+
+        enqueued, message, headers, callback = item
+        name = "%020d-%06d" % (int(enqueued * 1000000), next(self.__counter) % 1000000)
+        fileName = os.path.join(self.spoolDirectory, name + self.SPOOL_EXTENSION)
+        with self.__spoolLock:
+            with open(fileName + ".tmp", "wt") as f:
+                json.dump({"time": enqueued, "body": message, "headers": headers}, f)
+            os.replace(fileName + ".tmp", fileName)
+            self.__spooledFiles += 1
+            if callback is not None:
+                self.__callbacks[fileName] = callback
+
+    def __removeSpoolFile(self, fileName):
+        """
+        Removes a message from the spool.
+        @param fileName: The spool file name.
+        """
+        with self.__spoolLock:
+            os.remove(fileName)
+            self.__spooledFiles -= 1
+            self.__callbacks.pop(fileName, None)
+
+    def __getSpoolFiles(self):
+        """
+        Retrieves the spool files, from the oldest to the newest.
+        @return: The list of spool file names.
+        """
+        if self.spoolDirectory is None:
+            return []
+        with self.__spoolLock:
+            return [os.path.join(self.spoolDirectory, i) for i in sorted(os.listdir(self.spoolDirectory))
+                    if i.endswith(self.SPOOL_EXTENSION)]
+
+    def __getSpoolDepth(self):
+        """
+        Retrieves the number of spooled messages.
+        @return: The number of spooled messages.
+        """
+        with self.__spoolLock:
+            return len(self.__pending) + self.__spooledFiles
+
+    def __getMemoryDepth(self):
+        """
+        Retrieves the number of undelivered messages that would be lost by a shutdown, that is the queued ones and the
+        ones spooled in memory.
+        @return: The number of undelivered messages kept in memory.
+        """
+        with self.__spoolLock:
+            return self.__queue.unfinished_tasks + len(self.__pending)
+
+    def __getOldestTime(self):
+        """
+        Retrieves the enqueuing time of the oldest undelivered message.
+        @return: The enqueuing time or None if there are no undelivered messages.
+        """
+        with self.__spoolLock:
+            if len(self.__pending) > 0:
+                return self.__pending[0][0]
+            spooledFiles = self.__spooledFiles
+        if spooledFiles > 0:
+            spoolFiles = self.__getSpoolFiles()
+            if len(spoolFiles) > 0:
+                return int(os.path.basename(spoolFiles[0]).split("-")[0]) / 1000000
+        with self.__queue.mutex:
+            if len(self.__queue.queue) > 0:
+                return self.__queue.queue[0][0]
+        return None
+
+    def __updateGauges(self):
+        """
+        Updates the outbox gauges.
+        """
+        METRICS.set("cybertop_outbox_depth", self.__queue.qsize())
+        METRICS.set("cybertop_outbox_spool_depth", self.__getSpoolDepth())
+        oldest = self.__getOldestTime()
+        if oldest is None:
+            METRICS.set("cybertop_outbox_oldest_age_seconds", 0)
+        else:
+            METRICS.set("cybertop_outbox_oldest_age_seconds", max(0.0, time.time() - oldest))
@@ -23,9 +23,36 @@ import re
 from lxml import etree
 from cybertop.attacks import Attack
 from cybertop.util import getLandscapeXSDFile
+from cybertop.util import getSchema
 from cybertop.util import getLandscapeNamespace
+from cybertop.util import getContentHash
+from cybertop.metrics import METRICS
+from cybertop.metrics import observeStage
 from cybertop.log import LOG
 import os.path
+import time
+
+class Landscape(dict):
+    """
+    A landscape map, that is a dictionary mapping the IT resource identifiers to their sets of capabilities, with the
+    capacities of the IT resources.
+    """
+
+    def __init__(self):
+        """
+        Creates an empty landscape.
+        """
+        dict.__init__(self)
+        self.capacities = {}
+
+    def getCapacity(self, identifier):
+        """
+        Retrieves the capacity of an IT resource.
+        @param identifier: The IT resource identifier.
+        @return: The relative number of rules the IT resource can enforce, 1 if not declared.
+        """
+        return self.capacities.get(identifier, 1)
+
 
 class Parser(object):
     """
@@ -40,6 +67,23 @@ class Parser(object):
         """
         self.configParser = configParser
         self.pluginManager = pluginManager
+        # Maps the landscape file names to their modification stamps, content hashes and landscapes.
+        self.__landscapes = {}
+
+    def getParserPlugin(self, attackType):
+        """
+        Finds the parser plug-in suitable for an attack type.
+        @param attackType: the attack type, as reported in the file name or in the DARE messages.
+        @return: the parser plug-in.
+        @raise IOError: if no suitable parser plug-in is available.
+        """
+        for i in self.pluginManager.getPluginsOfCategory("Parser"):
+            pluginFileName = i.details.get("Core", "FileName")
+            if re.match(pluginFileName, attackType):
+                return i
+
+        LOG.critical("No suitable attack event parser found.")
+        raise IOError("No suitable attack event parser found")
 
     def getAttackFromFile(self, fileName):
         """
@@ -49,6 +93,7 @@ class Parser(object):
         @raise IOError: if the file has an invalid format or if no suitable parser plug-in is available.
         """
 
+        start = time.perf_counter()
         # First: checks if the file is a regular file.
         if not ntpath.isfile(fileName):
             LOG.critical("The file '%s' is not a regular file.", fileName)
@@ -76,15 +121,7 @@ class Parser(object):
         anomaly_name = attackType
 
         # Finds a suitable parser.
-        plugin = None
-        for i in self.pluginManager.getPluginsOfCategory("Parser"):
-            pluginFileName = i.details.get("Core", "FileName")
-            if re.match(pluginFileName, attackType):
-                plugin = i
-                break
-        if plugin is None:
-            LOG.critical("No suitable attack event parser found.")
-            raise IOError("No suitable attack event parser found")
+        plugin = self.getParserPlugin(attackType)
 
         # Creates an attack object.
         attackType = plugin.details.get("Core", "Attack")
@@ -105,6 +142,7 @@ class Parser(object):
             raise IOError("The file '%s' is empty." % fileName)
 
         LOG.info("Parsed an attack of type '%s' with severity %d and containing %d events.", attack.type, attack.severity, len(attack.events))
+        self.accountAttack(attack, len(attack.events), time.perf_counter() - start)
         return attack
 
     def getAttackFromList(self, identifier, severity, attackType, attackList, anomaly_name):
@@ -113,21 +151,14 @@ class Parser(object):
         @param identifier: the attack id.
         @param severity: the attack severity.
         @param attackType: the attack type.
-        @param attackList: the list to parse.
+        @param attackList: the list to parse. Each element is either an event line or the list of the fields of an event.
         @return: the attack object.
         @raise IOError: if the file has an invalid format or if no suitable parser plug-in is available.
         """
 
+        start = time.perf_counter()
         # Finds a suitable parser.
-        plugin = None
-        for i in self.pluginManager.getPluginsOfCategory("Parser"):
-            pluginFileName = i.details.get("Core", "FileName")
-            if re.match(pluginFileName, attackType):
-                plugin = i
-                break
-        if plugin is None:
-            LOG.critical("No suitable attack event parser found.")
-            raise IOError("No suitable attack event parser found")
+        plugin = self.getParserPlugin(attackType)
 
         # Creates an attack object.
         attackType = plugin.details.get("Core", "Attack")
@@ -137,8 +168,10 @@ class Parser(object):
         count = 0
         for line in attackList:
             count += 1
-            event = plugin.plugin_object.parse(None, count, line)
-            print(">>>>>>", event)
+            if isinstance(line, str):
+                event = plugin.plugin_object.parse(None, count, line)
+            else:
+                event = plugin.plugin_object.parse_fields(None, count, line)
             if event is not None:
                 attack.events.append(event)
 
@@ -148,30 +181,75 @@ class Parser(object):
             raise IOError("The list is empty")
 
         LOG.info("Parsed an attack of type '%s' with severity %d and containing %d events.", attack.type, attack.severity, len(attack.events))
+        self.accountAttack(attack, len(attack.events), time.perf_counter() - start)
         return attack
 
+    def accountAttack(self, attack, events, seconds):
+        """
+        Records the metrics of a parsed attack, including the ones whose events were parsed while received.
+        @param attack: the attack.
+        @param events: the number of events.
+        @param seconds: the parsing time in seconds.
+        """
+        observeStage("parse", seconds, attack.type, attack.severity)
+        METRICS.increment("cybertop_events_total", events, type=attack.type, severity=str(attack.severity))
+
     def getLandscape(self, fileName):
         """
-        Creates a landscape map by parsing an XML file.
+        Creates a landscape map by parsing an XML file. The file is parsed again only if it is modified, so the
+        landscape map must not be changed.
         @param fileName: the file name of the XML file to parse.
         @return: the landscape map.
         @raise IOError: if the file has an invalid format.
         """
-        schema = etree.XMLSchema(etree.parse(getLandscapeXSDFile()))
-        parser = etree.XMLParser(schema = schema)
-
         if not os.path.exists(fileName):
             LOG.critical("The file '%s' does not exist", fileName)
             raise IOError("The file '%s' does not exist", fileName)
 
+        return self.__getLandscapeEntry(fileName)[2]
+
+    def __getLandscapeEntry(self, fileName):
+        """
+        Retrieves a parsed landscape. The file is hashed again only if its modification stamp changes, and parsed again
+        only if its content changes.
+        @param fileName: the file name of the XML file to parse.
+        @return: the modification stamp, the content hash and the landscape map.
+        @raise IOError: if the file has an invalid format.
+        """
+        status = os.stat(fileName)
+        stamp = (status.st_mtime_ns, status.st_size)
+        cached = self.__landscapes.get(fileName)
+        if cached is not None and cached[0] == stamp:
+            return cached
+        version = getContentHash([fileName])
+        if cached is not None and cached[1] == version:
+            # Only touched, the landscape map is kept.
+            cached = (stamp, version, cached[2])
+            self.__landscapes[fileName] = cached
+            return cached
+
+        schema = getSchema(getLandscapeXSDFile())
+        parser = etree.XMLParser(schema = schema)
         root = etree.parse(fileName, parser).getroot()
-        landscape = {}
+        landscape = Landscape()
         for i in root:
             identifier = i.attrib["id"]
             capabilities = set()
             for j in i.findall("{%s}capability" % getLandscapeNamespace()):
                 capabilities.add(j.text)
             landscape[identifier] = capabilities
+            landscape.capacities[identifier] = int(i.attrib.get("capacity", "1"))
 
         LOG.info("Landscape with %d IT resources read.", len(landscape))
-        return landscape
+        cached = (stamp, version, landscape)
+        self.__landscapes[fileName] = cached
+        return cached
+
+    def getLandscapeVersion(self, fileName):
+        """
+        Retrieves the version of a landscape, that is the hash of its content.
+        @param fileName: the file name of the XML file to use.
+        @return: the landscape version.
+        @raise IOError: if the file cannot be read.
+        """
+        return self.__getLandscapeEntry(fileName)[1]
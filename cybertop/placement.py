@@ -0,0 +1,118 @@
+# Copyright 2018 Politecnico di Torino
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Placement of the HSPLs on the IT resources able to enforce them.
+
+@author: Daniele Canavese
+"""
+
+import bisect
+import copy
+import hashlib
+import math
+from lxml import etree
+from cybertop.endpoint import getEndpoint
+from cybertop.util import getHSPLNamespace
+
+# The points of an IT resource on the ring, for each unit of capacity.
+REPLICAS = 64
+# The attacker prefix lengths used to shard the HSPLs, so that the HSPLs of an attacker network stay together.
+SHARD_PREFIX_LENGTHS = {4: 24, 6: 64}
+# The maximum number of HSPLs of an IT resource, relative to its share of the HSPLs.
+LOAD_FACTOR = 1.25
+
+
+def getRingHash(text):
+    """
+    Hashes a text on the ring. The hash does not depend on the process, unlike the built-in one.
+    @param text: The text to hash.
+    @return: The hash, as a 64 bit integer.
+    """
+    return int.from_bytes(hashlib.sha1(text.encode()).digest()[:8], "big")
+
+
+def getShardKey(hspl):
+    """
+    Retrieves the key used to shard an HSPL, that is its attacker prefix.
+    @param hspl: The HSPL.
+    @return: The shard key.
+    """
+    hsplObject = hspl.findtext("{%s}object" % getHSPLNamespace())
+    endpoint = getEndpoint(hsplObject)
+    if endpoint is None or endpoint.isWildcard():
+        return hsplObject
+    return str(endpoint.getSupernet(min(endpoint.prefixLength, SHARD_PREFIX_LENGTHS[endpoint.version])))
+
+
+class ShardRing(object):
+    """
+    A consistent hashing ring of IT resources, with bounded loads. Each IT resource has a number of points on the ring
+    proportional to its capacity, and an HSPL goes to the first IT resource following the hash of its attacker prefix
+    that is not full yet, that is that has less than LOAD_FACTOR times its share of the HSPLs. Adding or removing an IT
+    resource only moves the HSPLs of its neighbours, so most of the rules stay where they were already enforced.
+    """
+
+    def __init__(self, capacities):
+        """
+        Constructor.
+        @param capacities: A dictionary mapping the IT resource identifiers to their capacities, as positive integers.
+        """
+        self.capacities = capacities
+        self.__points = sorted((getRingHash("%s#%d" % (identifier, i)), identifier)
+                               for identifier, capacity in capacities.items() for i in range(REPLICAS * capacity))
+        self.__hashes = [i[0] for i in self.__points]
+
+    def getIdentifiers(self, keys):
+        """
+        Assigns some items to the IT resources.
+        @param keys: The list of the item keys. Several items can have the same key.
+        @return: The list of the IT resource identifiers of the items, in the same order.
+        """
+        total = sum(self.capacities.values())
+        limits = dict((i, max(1, math.ceil(LOAD_FACTOR * len(keys) * j / total))) for i, j in self.capacities.items())
+        loads = dict.fromkeys(self.capacities, 0)
+        identifiers = []
+        for key in keys:
+            position = bisect.bisect(self.__hashes, getRingHash(key))
+            # The limits are larger than the items, so a free IT resource is always found.
+            for i in range(len(self.__points)):
+                identifier = self.__points[(position + i) % len(self.__points)][1]
+                if loads[identifier] < limits[identifier]:
+                    break
+            loads[identifier] += 1
+            identifiers.append(identifier)
+        return identifiers
+
+    def getShards(self, hsplSet):
+        """
+        Partitions an HSPL set among the IT resources.
+        @param hsplSet: The HSPL set.
+        @return: The list of the IT resource identifiers and their HSPL sets, sorted by identifier and without the IT
+                 resources with no HSPLs. The HSPL set is returned as it is if a single IT resource is available.
+        """
+        if len(self.capacities) == 1:
+            return [(next(iter(self.capacities)), hsplSet)]
+        hspls = hsplSet.findall("{%s}hspl" % getHSPLNamespace())
+        shards = {}
+        for hspl, identifier in zip(hspls, self.getIdentifiers([getShardKey(i) for i in hspls])):
+            if identifier not in shards:
+                # A copy of the HSPL set with its context only, since the original one must not change.
+                shard = etree.Element(hsplSet.tag, nsmap=hsplSet.nsmap)
+                for i in hsplSet:
+                    if i.tag != "{%s}hspl" % getHSPLNamespace():
+                        shard.append(copy.deepcopy(i))
+                shards[identifier] = shard
+            shards[identifier].append(copy.deepcopy(hspl))
+        return sorted(shards.items())
@@ -20,6 +20,7 @@ Rate limit plug-in.
 
 from cybertop.plugins import ActionPlugin
 from cybertop.util import getHSPLNamespace
+from cybertop.endpoint import getEndpoint
 
 class ActionDrop(ActionPlugin):
     """
@@ -38,20 +39,20 @@ class ActionDrop(ActionPlugin):
         count = 0
         for i in hsplSet:
             if i.tag == "{%s}hspl" % getHSPLNamespace():
-                subjectParts = i.findtext("{%s}subject" % getHSPLNamespace()).split(":")
-                objectParts = i.findtext("{%s}object" % getHSPLNamespace()).split(":")
+                subjectEndpoint = getEndpoint(i.findtext("{%s}subject" % getHSPLNamespace()))
+                objectEndpoint = getEndpoint(i.findtext("{%s}object" % getHSPLNamespace()))
                 protocol = i.findtext("{%s}traffic-constraints/{%s}type" % (getHSPLNamespace(), getHSPLNamespace()))
                 if protocol == "TCP+UDP":
                     count += 1
-                    self.createFilteringRule(configuration, count, "drop", direction = "inbound", sourceAddress = objectParts[0],
-                        sourcePort = objectParts[1], destinationAddress = subjectParts[0], destinationPort = subjectParts[1],
+                    self.createFilteringRule(configuration, count, "drop", direction = "inbound", sourceAddress = objectEndpoint.address,
+                        sourcePort = objectEndpoint.port, destinationAddress = subjectEndpoint.address, destinationPort = subjectEndpoint.port,
                         protocol = "TCP")
                     count += 1
-                    self.createFilteringRule(configuration, count, "drop", direction = "inbound", sourceAddress = objectParts[0],
-                        sourcePort = objectParts[1], destinationAddress = subjectParts[0], destinationPort = subjectParts[1],
+                    self.createFilteringRule(configuration, count, "drop", direction = "inbound", sourceAddress = objectEndpoint.address,
+                        sourcePort = objectEndpoint.port, destinationAddress = subjectEndpoint.address, destinationPort = subjectEndpoint.port,
                         protocol = "UDP")
                 else:
                     count += 1
-                    self.createFilteringRule(configuration, count, "drop", direction = "inbound", sourceAddress = objectParts[0],
-                        sourcePort = objectParts[1], destinationAddress = subjectParts[0], destinationPort = subjectParts[1],
+                    self.createFilteringRule(configuration, count, "drop", direction = "inbound", sourceAddress = objectEndpoint.address,
+                        sourcePort = objectEndpoint.port, destinationAddress = subjectEndpoint.address, destinationPort = subjectEndpoint.port,
                         protocol = protocol)
@@ -20,17 +20,13 @@ Rate limit plug-in.
 
 from cybertop.plugins import ActionPlugin
 from cybertop.util import getHSPLNamespace
+from cybertop.endpoint import getEndpoint
 
 class ActionLimit(ActionPlugin):
     """
     Translates an IT resource to perform the rate limiting of some packets.
     """
     
-    # The fall-back value for the TCP max connections.
-    MAX_CONNECTIONS = 20
-    # The fall-back value for the TCP rate limit.
-    RATE_LIMIT = "100kbit/s"
-    
     def configureITResource(self, itResource, hsplSet):
         """
         Configures an IT resource.wi        
@@ -48,48 +44,48 @@ class ActionLimit(ActionPlugin):
         count = 0
         for i in hsplSet:
             if i.tag == "{%s}hspl" % getHSPLNamespace():
-                subjectParts = i.findtext("{%s}subject" % getHSPLNamespace()).split(":")
-                objectParts = i.findtext("{%s}object" % getHSPLNamespace()).split(":")
+                subjectEndpoint = getEndpoint(i.findtext("{%s}subject" % getHSPLNamespace()))
+                objectEndpoint = getEndpoint(i.findtext("{%s}object" % getHSPLNamespace()))
                 protocol = i.findtext("{%s}traffic-constraints/{%s}type" % (getHSPLNamespace(), getHSPLNamespace()))
                 maxConnections = i.findtext("{%s}traffic-constraints/{%s}max-connections" % (getHSPLNamespace(), getHSPLNamespace()))
                 if maxConnections is None:
-                    maxConnections = self.configParser.get("limit", "maxConnections", fallback = self.MAX_CONNECTIONS)
+                    maxConnections = self.settings.limitMaxConnections
                 rateLimit = i.findtext("{%s}traffic-constraints/{%s}rate-limit" % (getHSPLNamespace(), getHSPLNamespace()))
                 if rateLimit is None:
-                    rateLimit = self.configParser.get("limit", "maxConnections", fallback = self.RATE_LIMIT)
+                    rateLimit = self.settings.limitRateLimit
                     
                 if protocol == "TCP+UDP":
                     count += 1
-                    self.createFilteringRule(configuration, count, "accept", direction = "inbound", sourceAddress = objectParts[0],
-                        sourcePort = objectParts[1], destinationAddress = subjectParts[0], destinationPort = subjectParts[1],
+                    self.createFilteringRule(configuration, count, "accept", direction = "inbound", sourceAddress = objectEndpoint.address,
+                        sourcePort = objectEndpoint.port, destinationAddress = subjectEndpoint.address, destinationPort = subjectEndpoint.port,
                         protocol = "TCP", maxConnections = maxConnections, rateLimit = rateLimit)
                     count += 1
-                    self.createFilteringRule(configuration, count, "reject", direction = "inbound", sourceAddress = objectParts[0],
-                        sourcePort = objectParts[1], destinationAddress = subjectParts[0], destinationPort = subjectParts[1],
+                    self.createFilteringRule(configuration, count, "reject", direction = "inbound", sourceAddress = objectEndpoint.address,
+                        sourcePort = objectEndpoint.port, destinationAddress = subjectEndpoint.address, destinationPort = subjectEndpoint.port,
                         protocol = "TCP")
                     count += 1
-                    self.createFilteringRule(configuration, count, "accept", direction = "inbound", sourceAddress = objectParts[0],
-                        sourcePort = objectParts[1], destinationAddress = subjectParts[0], destinationPort = subjectParts[1],
+                    self.createFilteringRule(configuration, count, "accept", direction = "inbound", sourceAddress = objectEndpoint.address,
+                        sourcePort = objectEndpoint.port, destinationAddress = subjectEndpoint.address, destinationPort = subjectEndpoint.port,
                         protocol = "UDP", rateLimit = rateLimit)
                     count += 1
-                    self.createFilteringRule(configuration, count, "reject", direction = "inbound", sourceAddress = objectParts[0],
-                        sourcePort = objectParts[1], destinationAddress = subjectParts[0], destinationPort = subjectParts[1],
+                    self.createFilteringRule(configuration, count, "reject", direction = "inbound", sourceAddress = objectEndpoint.address,
+                        sourcePort = objectEndpoint.port, destinationAddress = subjectEndpoint.address, destinationPort = subjectEndpoint.port,
                         protocol = "UDP")
                 elif protocol == "TCP":
                     count += 1
-                    self.createFilteringRule(configuration, count, "accept", direction = "inbound", sourceAddress = objectParts[0],
-                        sourcePort = objectParts[1], destinationAddress = subjectParts[0], destinationPort = subjectParts[1],
+                    self.createFilteringRule(configuration, count, "accept", direction = "inbound", sourceAddress = objectEndpoint.address,
+                        sourcePort = objectEndpoint.port, destinationAddress = subjectEndpoint.address, destinationPort = subjectEndpoint.port,
                         protocol = protocol, maxConnections = maxConnections, rateLimit = rateLimit)
                     count += 1
-                    self.createFilteringRule(configuration, count, "reject", direction = "inbound", sourceAddress = objectParts[0],
-                        sourcePort = objectParts[1], destinationAddress = subjectParts[0], destinationPort = subjectParts[1],
+                    self.createFilteringRule(configuration, count, "reject", direction = "inbound", sourceAddress = objectEndpoint.address,
+                        sourcePort = objectEndpoint.port, destinationAddress = subjectEndpoint.address, destinationPort = subjectEndpoint.port,
                         protocol = protocol)
                 else:
                     count += 1
-                    self.createFilteringRule(configuration, count, "accept", direction = "inbound", sourceAddress = objectParts[0],
-                        sourcePort = objectParts[1], destinationAddress = subjectParts[0], destinationPort = subjectParts[1],
+                    self.createFilteringRule(configuration, count, "accept", direction = "inbound", sourceAddress = objectEndpoint.address,
+                        sourcePort = objectEndpoint.port, destinationAddress = subjectEndpoint.address, destinationPort = subjectEndpoint.port,
                         protocol = protocol, rateLimit = rateLimit)
                     count += 1
-                    self.createFilteringRule(configuration, count, "reject", direction = "inbound", sourceAddress = objectParts[0],
-                        sourcePort = objectParts[1], destinationAddress = subjectParts[0], destinationPort = subjectParts[1],
+                    self.createFilteringRule(configuration, count, "reject", direction = "inbound", sourceAddress = objectEndpoint.address,
+                        sourcePort = objectEndpoint.port, destinationAddress = subjectEndpoint.address, destinationPort = subjectEndpoint.port,
                         protocol = protocol)
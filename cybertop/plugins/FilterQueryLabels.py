@@ -0,0 +1,37 @@
+# Copyright 2018 Politecnico di Torino
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Query labels filter plug-in.
+
+@author: Daniele Canavese
+"""
+
+from cybertop.plugins import FilterPlugin
+from cybertop.queries import getComparison
+
+class FilterQueryLabels(FilterPlugin):
+    """
+    Filters an attack event based on the query labels.
+    """
+    
+    def filter(self, value, attackEvent):
+        """
+        Filters an attack event.
+        @param value: The optional value for the filter.
+        @param attackEvent: The attack event to analyze.
+        @return: True if the event must be accepted, False if the event must be discarded.
+        """
+        compare, number = getComparison(value)
+        return compare(attackEvent.fields["queryFeatures"].labels, number)
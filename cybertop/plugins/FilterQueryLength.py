@@ -11,15 +11,15 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-import re
 
 """
-Input packets filter plug-in.
+Query length filter plug-in.
 
 @author: Daniele Canavese
 """
 
 from cybertop.plugins import FilterPlugin
+from cybertop.queries import getComparison
 
 class FilterQueryLength(FilterPlugin):
     """
@@ -33,22 +33,5 @@ class FilterQueryLength(FilterPlugin):
         @param attackEvent: The attack event to analyze.
         @return: True if the event must be accepted, False if the event must be discarded.
         """
-        queryLength = len(attackEvent.fields["query"])
-        groups = re.findall("(==|!=|<|<=|>|>=)(\d+)", value)
-        relationship = groups[0][0]
-        number = int(groups[0][1])
-
-        if relationship == "==" and queryLength == number:
-            return True
-        elif relationship == "!=" and queryLength != number:
-            return True
-        elif relationship == "<" and queryLength < number:
-            return True
-        elif relationship == "<=" and queryLength <= number:
-            return True
-        elif relationship == ">" and queryLength > number:
-            return True
-        elif relationship == ">=" and queryLength >= number:
-            return True
-        else:
-            return False
+        compare, number = getComparison(value)
+        return compare(attackEvent.fields["queryFeatures"].length, number)
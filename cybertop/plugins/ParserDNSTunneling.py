@@ -13,21 +13,23 @@
 # limitations under the License.
 
 """
-DoS attack events parser plug-in.
+DNS tunneling attack events parser plug-in.
 
 @author: Daniele Canavese
 """
 
 from cybertop.plugins import ParserPlugin
 from cybertop.attacks import AttackEvent
+from cybertop.endpoint import formatEndpoint
+from cybertop.queries import getQueryFeatures
 import re
 from cybertop.log import LOG
 from dateutil import parser
 import ipaddress
 
-class ParserDoS(ParserPlugin):
+class ParserDNSTunneling(ParserPlugin):
     """
-    Parses a DoS attack event.
+    Parses a DNS tunneling attack event.
     """
 
     def parse(self, fileName, count, line):
@@ -48,6 +50,37 @@ class ParserDoS(ParserPlugin):
         if parts == [""]:
             return None
 
+        return self.__getEvent(fileName, count, parts)
+
+    def parse_fields(self, fileName, count, fields):
+        """
+        Parses an already split event.
+        @param fileName: The current file name or None if this is a list.
+        @param count: The current line count.
+        @param fields: The list of event fields.
+        @return: The attack event or None if this event should be silently ignored.
+        @raise IOError: if the fields contain something invalid.
+        """
+
+        # A field may contain several parts, such as the date and time of the timestamp.
+        parts = [j for i in fields for j in i.split()]
+
+        # A comment may follow some empty fields, as it may follow some spaces in a line.
+        if len(parts) == 0 or parts[0].startswith("#"):
+            return None
+
+        return self.__getEvent(fileName, count, parts)
+
+    def __getEvent(self, fileName, count, parts):
+        """
+        Creates an attack event.
+        @param fileName: The current file name or None if this is a list.
+        @param count: The current line count.
+        @param parts: The event parts.
+        @return: The attack event or None if this event should be silently ignored.
+        @raise IOError: if the parts contain something invalid.
+        """
+
         try:
             timestamp = parser.parse("%s %s %s %s" % (parts[0], parts[1], parts[2], parts[3].split('.')[0]))
             frameLength = int(parts[6])
@@ -57,9 +90,10 @@ class ParserDoS(ParserPlugin):
             queryType = int(parts[10])
             queryResponseCode = int(parts[11])
 
-            attackEvent = AttackEvent(timestamp, "%s:*" % destinationAddress, "0.0.0.0/0:53")
+            attackEvent = AttackEvent(timestamp, formatEndpoint(destinationAddress, "*"), "0.0.0.0/0:53")
             attackEvent.fields["frameLength"] = frameLength
             attackEvent.fields["query"] = query
+            attackEvent.fields["queryFeatures"] = getQueryFeatures(query)
             attackEvent.fields["queryClass"] = queryClass
             attackEvent.fields["queryType"] = queryType
             attackEvent.fields["queryResponseCode"] = queryResponseCode
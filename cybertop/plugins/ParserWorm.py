@@ -20,6 +20,7 @@ Worm attack events parser plug-in.
 
 from cybertop.plugins import ParserPlugin
 from cybertop.attacks import AttackEvent
+from cybertop.endpoint import formatEndpoint
 import re
 from cybertop.log import LOG
 from dateutil import parser
@@ -48,6 +49,37 @@ class ParserWorm(ParserPlugin):
         if parts == [""]:
             return None
 
+        return self.__getEvent(fileName, count, parts)
+
+    def parse_fields(self, fileName, count, fields):
+        """
+        Parses an already split event.
+        @param fileName: The current file name or None if this is a list.
+        @param count: The current line count.
+        @param fields: The list of event fields.
+        @return: The attack event or None if this event should be silently ignored.
+        @raise IOError: if the fields contain something invalid.
+        """
+
+        # A field may contain several parts, such as the date and time of the timestamp.
+        parts = [j for i in fields for j in i.split()]
+
+        # A comment may follow some empty fields, as it may follow some spaces in a line.
+        if len(parts) == 0 or parts[0].startswith("#"):
+            return None
+
+        return self.__getEvent(fileName, count, parts)
+
+    def __getEvent(self, fileName, count, parts):
+        """
+        Creates an attack event.
+        @param fileName: The current file name or None if this is a list.
+        @param count: The current line count.
+        @param parts: The event parts.
+        @return: The attack event or None if this event should be silently ignored.
+        @raise IOError: if the parts contain something invalid.
+        """
+
         try:
             timestamp = parser.parse("%s %s" % (parts[0], parts[1]))
             sourceAddress = ipaddress.ip_address(parts[9])
@@ -60,7 +92,7 @@ class ParserWorm(ParserPlugin):
             outputPackets = int(parts[16])
             outputBytes = int(parts[17])
 
-            attackEvent = AttackEvent(timestamp, "%s:%d" % (sourceAddress, sourcePort), "%s:%d" % (destinationAddress, destinationPort))
+            attackEvent = AttackEvent(timestamp, formatEndpoint(sourceAddress, sourcePort), formatEndpoint(destinationAddress, destinationPort))
             attackEvent.fields["protocol"] = protocol
             attackEvent.fields["inputPackets"] = inputPackets
             attackEvent.fields["inputBytes"] = inputBytes
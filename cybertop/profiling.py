@@ -0,0 +1,234 @@
+# Copyright 2018 Politecnico di Torino
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+On-demand CPU and memory profiling of the remediations.
+
+@author: Daniele Canavese
+"""
+
+import contextlib
+import cProfile
+import itertools
+import os
+import re
+import signal
+import threading
+import time
+import tracemalloc
+from cybertop.log import LOG
+
+
+class Profiler(object):
+    """
+    Profiles the next remediations on request. When requested, e.g. with SIGUSR1, the next attacks are reasoned on under
+    cProfile and tracemalloc, and their CPU profile and top allocation sites are dumped in a directory. Nothing is
+    measured otherwise.
+    """
+
+    # The signals toggling the profiling and dumping a memory snapshot.
+    TOGGLE_SIGNAL = getattr(signal, "SIGUSR1", None)
+    SNAPSHOT_SIGNAL = getattr(signal, "SIGUSR2", None)
+
+    def __init__(self):
+        """
+        Constructor. The profiler is disabled until configured.
+        """
+        self.directory = None
+        self.attacks = 10
+        self.topAllocations = 25
+        self.__remaining = 0
+        # Reentrant, since the signal handlers can interrupt the main thread while holding it.
+        self.__lock = threading.RLock()
+        # Only one attack at a time can be profiled.
+        self.__busy = threading.Lock()
+        self.__handlers = {}
+        self.__sequence = itertools.count(1)
+
+    def setup(self, configParser):
+        """
+        Configures the profiler and, if enabled and called from the main thread, installs the signal handlers. The
+        worker processes forked later inherit them.
+        @param configParser: The configuration parser.
+        """
+        self.directory = configParser.get("global", "profilingDirectory", fallback=None)
+        self.attacks = configParser.getint("global", "profilingAttacks", fallback=10)
+        self.topAllocations = configParser.getint("global", "profilingTopAllocations", fallback=25)
+        if self.directory is None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        if threading.current_thread() is threading.main_thread() and self.TOGGLE_SIGNAL is not None:
+            for signalNumber, handler in ((self.TOGGLE_SIGNAL, self.__onToggle),
+                                          (self.SNAPSHOT_SIGNAL, self.__onSnapshot)):
+                if signalNumber not in self.__handlers:
+                    self.__handlers[signalNumber] = signal.signal(signalNumber, handler)
+            LOG.info("Profiling enabled: send SIGUSR1 to profile the next %d attacks, SIGUSR2 to dump the memory.",
+                     self.attacks)
+
+    def close(self):
+        """
+        Stops the profiling and restores the previous signal handlers.
+        """
+        self.stop()
+        for signalNumber, handler in self.__handlers.items():
+            signal.signal(signalNumber, handler)
+        self.__handlers = {}
+
+    def isActive(self):
+        """
+        Checks if the next attacks will be profiled.
+        @return: True if some attacks are still to be profiled, False otherwise.
+        """
+        return self.__remaining > 0
+
+    def start(self, attacks=None):
+        """
+        Profiles the next attacks.
+        @param attacks: The number of attacks to profile or None to use the configured one.
+        @raise ValueError: If the profiler is not configured.
+        """
+        if self.directory is None:
+            raise ValueError("No profiling directory configured")
+        with self.__lock:
+            self.__remaining = self.attacks if attacks is None else attacks
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+        LOG.info("Profiling the next %d attacks in '%s'.", self.__remaining, self.directory)
+
+    def stop(self):
+        """
+        Stops profiling the next attacks.
+        """
+        with self.__lock:
+            self.__remaining = 0
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+
+    @contextlib.contextmanager
+    def profile(self, identifier, attackType):
+        """
+        Profiles the reasoning on an attack, if requested. The dumps are written when the context is left.
+        @param identifier: The attack id.
+        @param attackType: The attack type.
+        """
+        # A plain attribute check, so that nothing is paid while the profiling is off.
+        if self.__remaining <= 0 or not self.__acquire():
+            yield
+            return
+        try:
+            before = tracemalloc.take_snapshot() if tracemalloc.is_tracing() else None
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                yield
+            finally:
+                profiler.disable()
+                prefix = self.__getDumpPrefix(identifier, attackType)
+                profiler.dump_stats(prefix + ".prof")
+                if before is not None and tracemalloc.is_tracing():
+                    self.__writeAllocations(prefix + ".malloc.txt", tracemalloc.take_snapshot(), before)
+                LOG.info("Profile of the attack %s (%s) written to '%s'.", identifier, attackType, prefix + ".prof")
+        finally:
+            self.__release()
+
+    def writeSnapshot(self, tag="snapshot"):
+        """
+        Dumps the top allocation sites of the whole process.
+        @param tag: The tag of the dump file name.
+        @return: The dump file name or None if the memory is not being traced.
+        """
+        if self.directory is None or not tracemalloc.is_tracing():
+            return None
+        fileName = self.__getDumpPrefix(tag, None) + ".malloc.txt"
+        self.__writeAllocations(fileName, tracemalloc.take_snapshot())
+        LOG.info("Memory snapshot written to '%s'.", fileName)
+        return fileName
+
+    def __acquire(self):
+        """
+        Reserves the profiling of an attack.
+        @return: True if the attack must be profiled, False otherwise.
+        """
+        with self.__lock:
+            if self.__remaining <= 0 or not self.__busy.acquire(False):
+                return False
+            self.__remaining -= 1
+            return True
+
+    def __release(self):
+        """
+        Ends the profiling of an attack, stopping the memory tracing after the last one.
+        """
+        self.__busy.release()
+        with self.__lock:
+            if self.__remaining <= 0 and tracemalloc.is_tracing():
+                tracemalloc.stop()
+                LOG.info("Profiling completed.")
+
+    def __getDumpPrefix(self, identifier, attackType):
+        """
+        Retrieves the common prefix of the dumps of an attack.
+        @param identifier: The attack id.
+        @param attackType: The attack type or None.
+        @return: The path of the dumps, without extension.
+        """
+        tag = str(identifier) if attackType is None else "%s-%s" % (identifier, attackType)
+        tag = re.sub(r"[^\w.-]+", "_", tag)
+        return os.path.join(self.directory, "%s-%d-%d-%s" % (time.strftime("%Y%m%d-%H%M%S"), os.getpid(),
+                                                              next(self.__sequence), tag))
+
+    def __writeAllocations(self, fileName, snapshot, before=None):
+        """
+        Writes the top allocation sites.
+        @param fileName: The dump file name.
+        @param snapshot: The memory snapshot.
+        @param before: The snapshot taken at the beginning of the attack, to also report the allocation growth, or None.
+        """
+        filters = (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib*>"))
+        snapshot = snapshot.filter_traces(filters)
+        with open(fileName, "w") as f:
+            if before is not None:
+                f.write("Top %d allocation sites grown during the attack:\n" % self.topAllocations)
+                for i in snapshot.compare_to(before.filter_traces(filters), "lineno")[:self.topAllocations]:
+                    f.write("%s\n" % i)
+                f.write("\n")
+            f.write("Top %d allocation sites:\n" % self.topAllocations)
+            for i in snapshot.statistics("lineno")[:self.topAllocations]:
+                f.write("%s\n" % i)
+
+    def __onToggle(self, signalNumber, frame):
+        """
+        Starts or stops the profiling on SIGUSR1.
+        @param signalNumber: The signal number.
+        @param frame: The interrupted frame.
+        """
+        if self.isActive():
+            LOG.info("Profiling stopped.")
+            self.stop()
+        else:
+            self.start()
+
+    def __onSnapshot(self, signalNumber, frame):
+        """
+        Dumps a memory snapshot on SIGUSR2, starting the memory tracing if needed.
+        @param signalNumber: The signal number.
+        @param frame: The interrupted frame.
+        """
+        if self.writeSnapshot() is None:
+            tracemalloc.start()
+            LOG.info("Memory tracing started, the next SIGUSR2 will dump the allocations.")
+
+
+# The global profiler.
+PROFILER = Profiler()
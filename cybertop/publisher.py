@@ -0,0 +1,161 @@
+# Copyright 2018 Politecnico di Torino
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Dashboard publishing.
+
+@author: Daniele Canavese
+"""
+
+import threading
+import time
+import pika
+import pika.exceptions
+from cybertop.metrics import METRICS
+from cybertop.log import LOG
+
+
+class PublishRejected(IOError):
+    """
+    Raised when the broker negatively acknowledges a message. Unlike an unreachable dashboard, retrying the same message
+    is pointless.
+    """
+
+
+class DashboardPublisher(object):
+    """
+    A long-lived publisher towards the dashboard AMQP exchange. The connection is opened on the first message, the
+    exchange is declared only once per connection and every message is confirmed by the broker. Broken connections are
+    transparently re-opened.
+    """
+
+    # The number of times a message is retried on a fresh connection.
+    PUBLISH_ATTEMPTS = 2
+
+    def __init__(self, host, port, exchange, topic, connectionAttempts, retryDelay, connectionFactory=None):
+        """
+        Constructor.
+        @param host: The dashboard host.
+        @param port: The dashboard port.
+        @param exchange: The dashboard exchange.
+        @param topic: The dashboard topic.
+        @param connectionAttempts: The number of connection attempts.
+        @param retryDelay: The delay in seconds between two connection attempts.
+        @param connectionFactory: The callable used to open a connection from the connection parameters or None to use a
+                                  pika blocking connection.
+        """
+        self.host = host
+        self.port = port
+        self.exchange = exchange
+        self.topic = topic
+        self.parameters = pika.ConnectionParameters(host=host, port=port, connection_attempts=connectionAttempts,
+                                                    retry_delay=retryDelay, blocked_connection_timeout=300)
+        if connectionFactory is None:
+            self.connectionFactory = pika.BlockingConnection
+        else:
+            self.connectionFactory = connectionFactory
+        self.__connection = None
+        self.__channel = None
+        self.__lock = threading.Lock()
+
+    def publish(self, message, headers=None):
+        """
+        Publishes a message and waits for the broker confirmation.
+        @param message: The message body.
+        @param headers: The optional AMQP headers.
+        @raise PublishRejected: When the broker rejects the message.
+        @raise IOError: When the message cannot be delivered.
+        """
+        if headers is None:
+            properties = None
+        else:
+            properties = pika.BasicProperties(headers=headers)
+
+        with self.__lock:
+            start = time.monotonic()
+            for attempt in range(1, self.PUBLISH_ATTEMPTS + 1):
+                try:
+                    channel = self.__getChannel()
+                    confirmed = channel.basic_publish(exchange=self.exchange, routing_key=self.topic, body=message,
+                                                      properties=properties)
+                except pika.exceptions.NackError:
+                    confirmed = False
+                except pika.exceptions.AMQPError as e:
+                    METRICS.increment("cybertop_dashboard_publish_failures_total", reason="connection")
+                    LOG.warning("Dashboard publishing failed (attempt %d): %s" % (attempt, repr(e)))
+                    self.__reset()
+                    continue
+
+                # Old pika versions report a negative acknowledgment with False instead of an exception.
+                if confirmed is False:
+                    METRICS.increment("cybertop_dashboard_publish_failures_total", reason="nack")
+                    LOG.error("The dashboard rejected the remediation")
+                    raise PublishRejected("The dashboard rejected the remediation")
+                METRICS.increment("cybertop_dashboard_published_total")
+                METRICS.observe("cybertop_dashboard_publish_seconds", time.monotonic() - start)
+                LOG.debug("Dashboard RabbitMQ exchange: " + self.exchange + " topic: " + self.topic)
+                return
+            raise IOError("Unable to deliver the remediation to the dashboard at %s:%d" % (self.host, self.port))
+
+    def close(self):
+        """
+        Closes the connection, if any.
+        """
+        with self.__lock:
+            if self.__connection is not None:
+                try:
+                    if self.__connection.is_open:
+                        self.__connection.close()
+                except pika.exceptions.AMQPError:
+                    pass
+                LOG.info("Connection with the dashboard closed")
+            self.__connection = None
+            self.__channel = None
+
+    def isConnected(self):
+        """
+        Checks if the connection is currently open.
+        @return: True if the publisher is connected, False otherwise.
+        """
+        return self.__connection is not None and self.__connection.is_open
+
+    def __getChannel(self):
+        """
+        Retrieves the channel, opening the connection if needed. It must be called with the lock held.
+        @return: The channel.
+        """
+        if self.__channel is not None and self.__channel.is_open and self.__connection.is_open:
+            return self.__channel
+
+        self.__reset()
+        self.__connection = self.connectionFactory(self.parameters)
+        METRICS.increment("cybertop_dashboard_connections_total")
+        self.__channel = self.__connection.channel()
+        self.__channel.exchange_declare(exchange=self.exchange, exchange_type="topic")
+        self.__channel.confirm_delivery()
+        LOG.info("Connected to the dashboard at " + self.host + ":" + str(self.port))
+        return self.__channel
+
+    def __reset(self):
+        """
+        Drops the current connection. It must be called with the lock held.
+        """
+        if self.__connection is not None:
+            try:
+                if self.__connection.is_open:
+                    self.__connection.close()
+            except pika.exceptions.AMQPError:
+                pass
+        self.__connection = None
+        self.__channel = None
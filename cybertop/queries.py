@@ -0,0 +1,71 @@
+# Copyright 2018 Politecnico di Torino
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+DNS query features, computed once per query when the attack events are parsed.
+
+@author: Daniele Canavese
+"""
+
+import collections
+import functools
+import math
+import operator
+import re
+
+# The comparison operators of the filter values.
+OPERATORS = {"==": operator.eq, "!=": operator.ne, "<": operator.lt, "<=": operator.le, ">": operator.gt,
+             ">=": operator.ge}
+
+
+class QueryFeatures(collections.namedtuple("QueryFeatures", ("length", "digits", "labels", "longestLabel",
+                                                             "entropy", "domain"))):
+    """
+    The features of a DNS query: its length, its number of digits, its number of labels, the length of its longest
+    label, its Shannon entropy in bits per character and its registered domain, that is its last two labels.
+    """
+
+    __slots__ = ()
+
+
+@functools.lru_cache(maxsize=65536)
+def getQueryFeatures(query):
+    """
+    Computes the features of a DNS query. The same query always returns the same object, until it is evicted from
+    the cache.
+    @param query: The DNS query.
+    @return: The query features.
+    """
+    labels = [i for i in query.split(".") if i != ""]
+    entropy = 0.0
+    for i in collections.Counter(query).values():
+        probability = i / len(query)
+        entropy -= probability * math.log2(probability)
+
+    return QueryFeatures(len(query), sum(c.isdigit() for c in query), len(labels),
+                         max((len(i) for i in labels), default=0), entropy, ".".join(labels[-2:]).lower())
+
+
+@functools.lru_cache(maxsize=1024)
+def getComparison(value):
+    """
+    Parses the value of a numeric filter, such as <=63 or >3.5.
+    @param value: The filter value.
+    @return: The comparison function and the number to compare with.
+    @raise ValueError: If the value is not valid.
+    """
+    match = re.fullmatch("\s*(==|!=|<=|<|>=|>)\s*(\d+(\.\d+)?)\s*", value)
+    if match is None:
+        raise ValueError("Invalid filter value '%s'" % value)
+    return OPERATORS[match.group(1)], float(match.group(2)) if match.group(3) else int(match.group(2))
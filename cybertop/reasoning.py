@@ -0,0 +1,412 @@
+# Copyright 2018 Politecnico di Torino
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Attack reasoning, possibly carried out by a pool of worker threads or processes.
+
+@author: Daniele Canavese
+"""
+
+import multiprocessing
+import multiprocessing.pool
+import threading
+import time
+from configparser import ConfigParser
+from lxml import etree
+from cybertop.plugins import getPluginManager
+from cybertop.parsing import Parser
+from cybertop.recipes import RecipesReasoner
+from cybertop.hspl import HSPLReasoner
+from cybertop.mspl import MSPLReasoner
+from cybertop.config import Configuration
+from cybertop.watcher import refreshPlugins
+from cybertop.metrics import METRICS
+from cybertop.metrics import StageTimer
+from cybertop.profiling import PROFILER
+from cybertop.util import getHSPLNamespace
+from cybertop.util import getMSPLNamespace
+from cybertop.util import getHSPLXSDFile
+from cybertop.util import getMSPLXSDFile
+from cybertop.util import getRecipeXSDFile
+from cybertop.util import getLandscapeXSDFile
+from cybertop.util import getSchema
+from cybertop.log import LOG
+
+# The reasoners of a worker process.
+_reasoners = None
+
+
+def getRemediation(parser, recipesReasoner, hsplReasoner, msplReasoner, attack, timestamp, builders,
+                   landscapeFileName):
+    """
+    Finalizes the remediation of an attack whose events were already turned into HSPLs.
+    @param parser: The parser.
+    @param recipesReasoner: The recipes reasoner.
+    @param hsplReasoner: The HSPL reasoner.
+    @param msplReasoner: The MSPL reasoner.
+    @param attack: The attack, without its events.
+    @param timestamp: The attack timestamp.
+    @param builders: The HSPL builders of the candidate recipes.
+    @param landscapeFileName: The name of the landscape file to parse.
+    @return: The HSPL set and MSPL set that can mitigate the attack. It is None if the attack is not manageable.
+    @raise SyntaxError: When the generated XML is not valid.
+    """
+    with PROFILER.profile(attack.identifier, attack.type):
+        timer = StageTimer(attack.type, attack.severity)
+        landscape = parser.getLandscape(landscapeFileName)
+        LOG.debug("Got landscape")
+        timer.lap("landscape")
+        # The recipes too strict for all the events are skipped.
+        builders = [i for i in builders if i.count > 0]
+        recipes = recipesReasoner.getEnforceableRecipes(set(i.recipe for i in builders), landscape)
+        LOG.debug("Got recipes")
+        timer.lap("recipes")
+        builders = [i for i in builders if i.recipe in recipes]
+        hsplSet = hsplReasoner.getHSPLsFromBuilders(attack.severity, attack.type, timestamp, builders)
+        LOG.debug("Got HSPL set")
+        timer.lap("hspl")
+        msplSet = msplReasoner.getMSPLs(hsplSet, landscape, attack.anomaly_name)
+        LOG.debug("Got MSPL set")
+        timer.lap("mspl")
+        return _finishRemediation(timer, hsplSet, msplSet)
+
+
+def getAttackRemediation(parser, recipesReasoner, hsplReasoner, msplReasoner, attack, landscapeFileName):
+    """
+    Computes the remediation of an attack with all its events.
+    @param parser: The parser.
+    @param recipesReasoner: The recipes reasoner.
+    @param hsplReasoner: The HSPL reasoner.
+    @param msplReasoner: The MSPL reasoner.
+    @param attack: The attack.
+    @param landscapeFileName: The name of the landscape file to parse.
+    @return: The HSPL set and MSPL set that can mitigate the attack. It is None if the attack is not manageable.
+    @raise SyntaxError: When the generated XML is not valid.
+    """
+    with PROFILER.profile(attack.identifier, attack.type):
+        timer = StageTimer(attack.type, attack.severity)
+        landscape = parser.getLandscape(landscapeFileName)
+        LOG.debug("Got landscape")
+        timer.lap("landscape")
+        recipes = recipesReasoner.getRecipes(attack, landscape)
+        LOG.debug("Got recipes")
+        timer.lap("recipes")
+        hsplSet = hsplReasoner.getHSPLs(attack, recipes, landscape)
+        LOG.debug("Got HSPL set")
+        timer.lap("hspl")
+        msplSet = msplReasoner.getMSPLs(hsplSet, landscape, attack.anomaly_name)
+        LOG.debug("Got MSPL set")
+        timer.lap("mspl")
+        return _finishRemediation(timer, hsplSet, msplSet)
+
+
+def _finishRemediation(timer, hsplSet, msplSet):
+    """
+    Accounts the end of the remediation of an attack.
+    @param timer: The stage timer of the attack.
+    @param hsplSet: The HSPL set or None.
+    @param msplSet: The MSPL set or None.
+    @return: The HSPL set and MSPL set or None if the attack is not manageable.
+    """
+    timer.finish()
+    if hsplSet is None or msplSet is None:
+        return None
+    timer.count("cybertop_hspls_total", len(hsplSet.findall(".//{%s}hspl" % getHSPLNamespace())))
+    timer.count("cybertop_mspl_rules_total", len(msplSet.findall(".//{%s}rule" % getMSPLNamespace())))
+    return [hsplSet, msplSet]
+
+
+def getFileRemediation(parser, recipesReasoner, hsplReasoner, msplReasoner, attackFileName, landscapeFileName):
+    """
+    Computes the remediation of an attack file.
+    @param parser: The parser.
+    @param recipesReasoner: The recipes reasoner.
+    @param hsplReasoner: The HSPL reasoner.
+    @param msplReasoner: The MSPL reasoner.
+    @param attackFileName: The name of the attack file to parse.
+    @param landscapeFileName: The name of the landscape file to parse.
+    @return: The HSPL set and MSPL set that can mitigate the attack. It is None if the attack is not manageable.
+    @raise IOError: If the attack file is not valid.
+    @raise SyntaxError: When the generated XML is not valid.
+    """
+    attack = parser.getAttackFromFile(attackFileName)
+    return getAttackRemediation(parser, recipesReasoner, hsplReasoner, msplReasoner, attack, landscapeFileName)
+
+
+def _serialize(r):
+    """
+    Serializes a remediation.
+    @param r: The HSPL set and MSPL set or None.
+    @return: The serialized HSPL set and MSPL set or None.
+    """
+    if r is None:
+        return None
+    else:
+        return etree.tostring(r[0]), etree.tostring(r[1])
+
+
+def getReasoners(configParser, configuration=None):
+    """
+    Loads the plug-ins and creates the reasoners.
+    @param configParser: The configuration parser.
+    @param configuration: The configuration shared by the reasoners or None to create one from the configuration
+                          parser.
+    @return: The parser, the recipes reasoner, the HSPL reasoner and the MSPL reasoner.
+    """
+    pluginManager = getPluginManager()
+    if configuration is None:
+        configuration = Configuration(configParser)
+    return (Parser(configParser, pluginManager), RecipesReasoner(configParser, pluginManager),
+            HSPLReasoner(configParser, pluginManager, configuration),
+            MSPLReasoner(configParser, pluginManager, configuration))
+
+
+def warmUp(parser, recipesReasoner, landscapeFileName):
+    """
+    Loads the recipes, the landscape and the XML schemas, so that the first attack does not wait for them. The errors
+    are only logged, since the files can still be fixed before the first attack.
+    @param parser: The parser.
+    @param recipesReasoner: The recipes reasoner.
+    @param landscapeFileName: The name of the landscape file to parse or None.
+    """
+    start = time.perf_counter()
+    try:
+        for i in (getRecipeXSDFile(), getLandscapeXSDFile(), getHSPLXSDFile(), getMSPLXSDFile()):
+            getSchema(i)
+        recipesReasoner.getRecipesVersion()
+        if landscapeFileName is not None:
+            parser.getLandscape(landscapeFileName)
+    except Exception as e:
+        LOG.warning("Unable to preload the reasoning data: %s", str(e))
+        return
+    LOG.debug("Reasoning data preloaded in %.3f s.", time.perf_counter() - start)
+
+
+def getConfigurationDictionary(configParser):
+    """
+    Converts a configuration into a form that can be sent to a worker process.
+    @param configParser: The configuration parser.
+    @return: The configuration, as a dictionary of sections.
+    """
+    return dict((i, dict(configParser.items(i, raw=True))) for i in configParser.sections())
+
+
+def _initializeWorker(configuration):
+    """
+    Loads the reasoners of a worker process.
+    @param configuration: The configuration, as a dictionary of sections.
+    """
+    global _reasoners
+    # The metrics inherited from the main process must not be sent back.
+    METRICS.reset()
+    configParser = ConfigParser()
+    configParser.read_dict(configuration)
+    _reasoners = getReasoners(configParser)
+    warmUp(_reasoners[0], _reasoners[1], configParser.get("global", "landscapeFile", fallback=None))
+
+
+def _getSerializedRemediation(attack, timestamp, states, landscapeFileName, settings):
+    """
+    Finalizes the remediation of an attack in a worker process.
+    @param attack: The attack, without its events.
+    @param timestamp: The attack timestamp.
+    @param states: The contents of the HSPL builders.
+    @param landscapeFileName: The name of the landscape file to parse.
+    @param settings: The settings of the main process.
+    @return: The serialized HSPL set and MSPL set that can mitigate the attack, which is None if the attack is not
+             manageable, and the metrics of the job.
+    @raise SyntaxError: When the generated XML is not valid.
+    """
+    parser, recipesReasoner, hsplReasoner, msplReasoner = _reasoners
+    # A worker process runs one job at a time, so the settings and the plug-ins can be replaced for each of them.
+    hsplReasoner.configuration.update(settings)
+    refreshPlugins(*_reasoners)
+    builders = [hsplReasoner.getBuilderFromState(i) for i in states]
+    r = _serialize(getRemediation(parser, recipesReasoner, hsplReasoner, msplReasoner, attack, timestamp, builders,
+                                  landscapeFileName))
+    # The metrics of the job are accounted by the main process.
+    return r, METRICS.drain()
+
+
+def _getSerializedFileRemediation(attackFileName, landscapeFileName, settings):
+    """
+    Computes the remediation of an attack file in a worker process.
+    @param attackFileName: The name of the attack file to parse.
+    @param landscapeFileName: The name of the landscape file to parse.
+    @param settings: The settings of the main process.
+    @return: The serialized HSPL set and MSPL set that can mitigate the attack, which is None if the attack is not
+             manageable, and the metrics of the job.
+    @raise IOError: If the attack file is not valid.
+    @raise SyntaxError: When the generated XML is not valid.
+    """
+    _reasoners[2].configuration.update(settings)
+    refreshPlugins(*_reasoners)
+    r = _serialize(getFileRemediation(*(_reasoners + (attackFileName, landscapeFileName))))
+    return r, METRICS.drain()
+
+
+class ReasoningPool(object):
+    """
+    A pool of workers finalizing the remediations of the attacks in background. The worker threads share the reasoners
+    of the caller, while the worker processes load their own ones and exchange the HSPLs in serialized form, so that
+    several attacks can be reasoned on at the same time on different cores.
+    """
+
+    # The worker kinds.
+    THREAD = "thread"
+    PROCESS = "process"
+
+    def __init__(self, kind, size, configParser, parser, recipesReasoner, hsplReasoner, msplReasoner):
+        """
+        Constructor.
+        @param kind: The worker kind, that is "thread" or "process".
+        @param size: The number of workers.
+        @param configParser: The configuration parser.
+        @param parser: The parser.
+        @param recipesReasoner: The recipes reasoner.
+        @param hsplReasoner: The HSPL reasoner.
+        @param msplReasoner: The MSPL reasoner.
+        @raise ValueError: If the worker kind is unknown.
+        """
+        self.kind = kind
+        self.size = size
+        self.parser = parser
+        self.recipesReasoner = recipesReasoner
+        self.hsplReasoner = hsplReasoner
+        self.msplReasoner = msplReasoner
+        self.__lock = threading.Lock()
+        self.__active = 0
+
+        if kind == self.PROCESS:
+            self.__pool = multiprocessing.Pool(size, _initializeWorker, (getConfigurationDictionary(configParser),))
+        elif kind == self.THREAD:
+            self.__pool = multiprocessing.pool.ThreadPool(size)
+        else:
+            raise ValueError("Unknown worker kind '%s'" % kind)
+        LOG.info("Started %d reasoning %s workers.", size, kind)
+
+    def submit(self, attack, timestamp, builders, landscapeFileName, callback, errorCallback):
+        """
+        Finalizes the remediation of an attack in background. The callbacks are called from a thread of the pool, so
+        they should return quickly.
+        @param attack: The attack, without its events.
+        @param timestamp: The attack timestamp.
+        @param builders: The HSPL builders of the candidate recipes. With the worker threads, they must not be used
+                         until a callback is called.
+        @param landscapeFileName: The name of the landscape file to parse.
+        @param callback: The function called with the HSPL set and MSPL set, or None if the attack is not manageable.
+        @param errorCallback: The function called with the exception raised by the reasoning.
+        """
+        if self.kind == self.PROCESS:
+            function = _getSerializedRemediation
+            # The builders keep the settings they were created with.
+            if len(builders) > 0:
+                settings = builders[0].settings
+            else:
+                settings = self.hsplReasoner.configuration.settings
+            args = (attack, timestamp, [i.getState() for i in builders], landscapeFileName, settings)
+        else:
+            function = getRemediation
+            args = (self.parser, self.recipesReasoner, self.hsplReasoner, self.msplReasoner, attack, timestamp,
+                    builders, landscapeFileName)
+        self.__submit(function, args, callback, errorCallback)
+
+    def submitFile(self, attackFileName, landscapeFileName, callback, errorCallback):
+        """
+        Computes the remediation of an attack file in background. The callbacks are called from a thread of the pool,
+        so they should return quickly.
+        @param attackFileName: The name of the attack file to parse.
+        @param landscapeFileName: The name of the landscape file to parse.
+        @param callback: The function called with the HSPL set and MSPL set, or None if the attack is not manageable.
+        @param errorCallback: The function called with the exception raised by the reasoning.
+        """
+        if self.kind == self.PROCESS:
+            function = _getSerializedFileRemediation
+            args = (attackFileName, landscapeFileName, self.hsplReasoner.configuration.settings)
+        else:
+            function = getFileRemediation
+            args = (self.parser, self.recipesReasoner, self.hsplReasoner, self.msplReasoner, attackFileName,
+                    landscapeFileName)
+        self.__submit(function, args, callback, errorCallback)
+
+    def __submit(self, function, args, callback, errorCallback):
+        """
+        Runs a job in the pool.
+        @param function: The job function.
+        @param args: The job arguments.
+        @param callback: The function called with the remediation.
+        @param errorCallback: The function called with the exception raised by the job.
+        """
+        start = time.monotonic()
+        self.__updateActive(1)
+
+        def onResult(r):
+            self.__done(start, "success")
+            if self.kind == self.PROCESS:
+                r, metrics = r
+                METRICS.merge(metrics)
+                if r is not None:
+                    r = [etree.fromstring(r[0]), etree.fromstring(r[1])]
+            self.__call(callback, r)
+
+        def onError(e):
+            self.__done(start, "error")
+            self.__call(errorCallback, e)
+
+        self.__pool.apply_async(function, args, callback=onResult, error_callback=onError)
+
+    def getActiveCount(self):
+        """
+        Retrieves the number of jobs submitted and not yet completed.
+        @return: The number of active jobs.
+        """
+        with self.__lock:
+            return self.__active
+
+    def close(self):
+        """
+        Waits for the submitted jobs and stops the workers.
+        """
+        self.__pool.close()
+        self.__pool.join()
+
+    def __done(self, start, result):
+        """
+        Accounts a completed job.
+        @param start: The job submission time.
+        @param result: The job result, that is "success" or "error".
+        """
+        self.__updateActive(-1)
+        METRICS.increment("cybertop_reasoning_jobs_total", result=result)
+        METRICS.observe("cybertop_reasoning_job_seconds", time.monotonic() - start)
+
+    def __updateActive(self, delta):
+        """
+        Updates the number of active jobs.
+        @param delta: The variation of the active jobs.
+        """
+        with self.__lock:
+            self.__active += delta
+            METRICS.set("cybertop_reasoning_jobs_active", self.__active)
+
+    def __call(self, function, argument):
+        """
+        Calls a callback, an exception would otherwise stop the delivery of the results of the pool.
+        @param function: The callback.
+        @param argument: The callback argument.
+        """
+        try:
+            function(argument)
+        except BaseException as e:
+            LOG.critical("Reasoning callback failed: %s", str(e))
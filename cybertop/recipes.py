@@ -24,7 +24,9 @@ import os
 from lxml import etree
 from cybertop.util import getRecipeDirectory
 from cybertop.util import getRecipeXSDFile
+from cybertop.util import getSchema
 from cybertop.util import getRecipeNamespace
+from cybertop.util import getContentHash
 from cybertop.log import LOG
 
 class RecipesReasoner(object):
@@ -40,7 +42,63 @@ class RecipesReasoner(object):
         """
         self.configParser = configParser
         self.pluginManager = pluginManager
-    
+        # The modification stamps of the recipe files, their content hash and their parsed recipe sets.
+        self.__recipeSets = None
+        # The artifacts derived from the recipes, dropped whenever the recipes change: the compiled filters and the
+        # actions of the recipes, and the last landscape with its enforceable actions.
+        self.__filters = {}
+        self.__actions = {}
+        self.__enforceableActions = (None, None)
+
+    def __getRecipeSets(self):
+        """
+        Retrieves the valid recipe sets. The recipe files are hashed again only if one of them is modified, and parsed
+        again only if their content changes.
+        @return: The list of recipe sets, as tuples of minimum severity, maximum severity, attack type and recipes.
+        @raise FileNotFoundError: if the recipe directory cannot be read.
+        """
+        return self.__getRecipeSetsEntry()[2]
+
+    def __getRecipeSetsEntry(self):
+        """
+        Retrieves the valid recipe sets and their version.
+        @return: The modification stamps of the recipe files, the recipes version and the list of recipe sets.
+        @raise FileNotFoundError: if the recipe directory cannot be read.
+        """
+        recipesDirectory = getRecipeDirectory()
+        paths = sorted(os.path.join(recipesDirectory, i) for i in os.listdir(recipesDirectory) if i.endswith(".xml"))
+        stamp = []
+        for path in paths:
+            status = os.stat(path)
+            stamp.append((path, status.st_mtime_ns, status.st_size))
+        if self.__recipeSets is not None and self.__recipeSets[0] == stamp:
+            return self.__recipeSets
+        version = getContentHash(paths)
+        if self.__recipeSets is not None and self.__recipeSets[1] == version:
+            # Only touched, the recipes and their artifacts are kept.
+            self.__recipeSets = (stamp, version, self.__recipeSets[2])
+            return self.__recipeSets
+
+        # Parses the XML schema.
+        schema = getSchema(getRecipeXSDFile())
+        parser = etree.XMLParser(schema = schema)
+
+        recipeSets = []
+        # We find all the valid recipes.
+        for path in paths:
+            try:
+                recipeSet = etree.parse(path, parser).getroot()
+                recipeSets.append((int(recipeSet.attrib["minSeverity"]), int(recipeSet.attrib["maxSeverity"]),
+                                   recipeSet.attrib["type"], recipeSet.getchildren()))
+            except etree.XMLSyntaxError:
+                LOG.warning("The file '%s' is an invalid recipe.", path)
+        LOG.info("%d recipe files read.", len(recipeSets))
+        self.__recipeSets = (stamp, version, recipeSets)
+        self.__filters = {}
+        self.__actions = {}
+        self.__enforceableActions = (None, None)
+        return self.__recipeSets
+
     def __getRecipes(self, attack):
         """
         Retrieves all the recipes that can be used to mitigate an attack.
@@ -49,31 +107,16 @@ class RecipesReasoner(object):
         @raise IOError: if a file or directory cannot be read.
         """
         try:
-            # Parses the XML schema.
-            schema = etree.XMLSchema(etree.parse(getRecipeXSDFile()))
-            parser = etree.XMLParser(schema = schema)
-        
             recipes = set()
-            recipesDirectory = getRecipeDirectory()
-            # We find all the valid recipes.
-            for file in os.listdir(recipesDirectory):
-                if file.endswith(".xml"):
-                    path = os.path.join(recipesDirectory, file)
-                    try:
-                        recipeSet = etree.parse(path, parser).getroot()
-                        minSeverity = int(recipeSet.attrib["minSeverity"])
-                        maxSeverity = int(recipeSet.attrib["maxSeverity"])
-                        attackType = recipeSet.attrib["type"]
-                        if attack.type == attackType and attack.severity >= minSeverity and attack.severity <= maxSeverity:
-                            recipes.update(recipeSet.getchildren())
-                    except etree.XMLSyntaxError:
-                        LOG.warning("The file '%s' is an invalid recipe.", path)
-                        
+            for minSeverity, maxSeverity, attackType, recipeSet in self.__getRecipeSets():
+                if attack.type == attackType and attack.severity >= minSeverity and attack.severity <= maxSeverity:
+                    recipes.update(recipeSet)
+
             LOG.debug("Found %s suitable recipes.", len(recipes))
             return recipes
         except FileNotFoundError:
-            raise IOError("Unable to read the recipe directory '%s'" % recipesDirectory)
-        
+            raise IOError("Unable to read the recipe directory '%s'" % getRecipeDirectory())
+
     def __filterNonEnforceableRecipes(self, recipes, landscape):
         """
         Filters the recipes that cannot be enforced.
@@ -81,18 +124,9 @@ class RecipesReasoner(object):
         @param landscape: The landscape.
         @return: The recipes that can be enforced. It can be an empty list.
         """
-        validRecipes = set()
-        for i in recipes:
-            recipeAction = i.findtext("{%s}action" % getRecipeNamespace())
-            for j in self.pluginManager.getPluginsOfCategory("Action"):
-                pluginAction = j.details.get("Core", "Action")
-                pluginCapabilities = set(re.split("\s*,\s*", j.details.get("Core", "Capabilities")))
-                if recipeAction == pluginAction:
-                    for capabilities in landscape.values():
-                        if pluginCapabilities.issubset(capabilities):
-                            validRecipes.add(i)
-                            break
-        
+        enforceableActions = self.__getEnforceableActions(landscape)
+        validRecipes = set(i for i in recipes if self.__getAction(i) in enforceableActions)
+
         notEnforceable = len(recipes) - len(validRecipes)
         if notEnforceable == 1:
             LOG.debug("Removed %d non-enforceable recipe, %d remaining.", notEnforceable, len(validRecipes))
@@ -110,30 +144,11 @@ class RecipesReasoner(object):
         validRecipes = set()
 
         for i in recipes:
-            recipeFilters = i.find("{%s}filters" % getRecipeNamespace())
-            evaluation = "or"
-            if recipeFilters is None:
-                validRecipes.add(i)
-            else:
-                if "evaluation" in recipeFilters.attrib.keys():
-                    evaluation = recipeFilters.attrib["evaluation"]
-                for j in attack.events:
-                    if evaluation == "or":
-                        test = False
-                    else:
-                        test = True
-                    for k in self.pluginManager.getPluginsOfCategory("Filter"):
-                        pluginTag = k.details.get("Core", "Tag")
-                        filterValues = recipeFilters.findall("{%s}%s" % (getRecipeNamespace(), pluginTag))
-                        for l in filterValues:
-                            t = k.plugin_object.filter(l.text, j)
-                            if evaluation == "or":
-                                test = test or t
-                            else:
-                                test = test and t
-                    if not test:
-                        validRecipes.add(i)
-                        break
+            recipeFilter = self.getRecipeFilter(i)
+            for j in attack.events:
+                if recipeFilter.accept(j):
+                    validRecipes.add(i)
+                    break
 
         tooStrict = len(recipes) - len(validRecipes)
         if tooStrict == 1:
@@ -142,6 +157,49 @@ class RecipesReasoner(object):
             LOG.debug("Removed %d too strict recipes, %d remaining.", tooStrict, len(validRecipes))
         return validRecipes
 
+    def __getAction(self, recipe):
+        """
+        Retrieves the action of a recipe.
+        @param recipe: The recipe.
+        @return: The recipe action.
+        """
+        action = self.__actions.get(recipe)
+        if action is None:
+            action = recipe.findtext("{%s}action" % getRecipeNamespace())
+            self.__actions[recipe] = action
+        return action
+
+    def __getEnforceableActions(self, landscape):
+        """
+        Retrieves the actions that an action plug-in can enforce on some IT resource of a landscape.
+        @param landscape: The landscape, which is computed again only if it is a different object from the last one.
+        @return: The set of enforceable actions.
+        """
+        lastLandscape, actions = self.__enforceableActions
+        if lastLandscape is landscape:
+            return actions
+        actions = set()
+        for j in self.pluginManager.getPluginsOfCategory("Action"):
+            pluginCapabilities = set(re.split("\s*,\s*", j.details.get("Core", "Capabilities")))
+            for capabilities in landscape.values():
+                if pluginCapabilities.issubset(capabilities):
+                    actions.add(j.details.get("Core", "Action"))
+                    break
+        self.__enforceableActions = (landscape, actions)
+        return actions
+
+    def getRecipeFilter(self, recipe):
+        """
+        Retrieves the compiled filters of a recipe, which are shared until the recipes change.
+        @param recipe: The recipe.
+        @return: The recipe filter.
+        """
+        recipeFilter = self.__filters.get(recipe)
+        if recipeFilter is None:
+            recipeFilter = RecipeFilter(recipe, self.pluginManager)
+            self.__filters[recipe] = recipeFilter
+        return recipeFilter
+
     def getRecipes(self, attack, landscape):
         """
         Retrieves all the recipe that can be used to mitigate an attack.
@@ -159,3 +217,91 @@ class RecipesReasoner(object):
         else:
             LOG.info("%d recipes chosen.", len(recipes))
             return recipes
+
+    def getCandidateRecipes(self, attack):
+        """
+        Retrieves all the recipes suitable for the type and severity of an attack, without looking at its events. They
+        are the starting point for the incremental processing of an attack.
+        @param attack: The attack to mitigate.
+        @return: The set of candidate recipes.
+        @raise IOError: if a file or directory cannot be read.
+        """
+        return self.__getRecipes(attack)
+
+    def getEnforceableRecipes(self, recipes, landscape):
+        """
+        Retrieves the recipes that can be enforced in a landscape.
+        @param recipes: The recipes to filter.
+        @param landscape: The landscape.
+        @return: The recipes that can be enforced. It can be an empty list.
+        """
+        recipes = self.__filterNonEnforceableRecipes(recipes, landscape)
+        LOG.info("%d recipes chosen.", len(recipes))
+        return recipes
+
+    def setPluginManager(self, pluginManager):
+        """
+        Replaces the plug-in manager, dropping the artifacts compiled with the previous plug-ins.
+        @param pluginManager: The new plug-in manager.
+        """
+        self.pluginManager = pluginManager
+        self.__filters = {}
+        self.__enforceableActions = (None, None)
+
+    def getRecipesVersion(self):
+        """
+        Retrieves the version of the recipes, that is the hash of the recipe files.
+        @return: the recipes version.
+        @raise IOError: if a file or directory cannot be read.
+        """
+        try:
+            return self.__getRecipeSetsEntry()[1]
+        except FileNotFoundError:
+            raise IOError("Unable to read the recipe directory '%s'" % getRecipeDirectory())
+
+class RecipeFilter(object):
+    """
+    The filters of a recipe, evaluated one event at a time.
+    """
+
+    def __init__(self, recipe, pluginManager):
+        """
+        Constructor.
+        @param recipe: The recipe.
+        @param pluginManager: The plug-in manager.
+        """
+        self.recipe = recipe
+        self.evaluation = "or"
+        # The list of filter plug-ins and values to check, None if the recipe has no filters.
+        self.filters = None
+
+        recipeFilters = recipe.find("{%s}filters" % getRecipeNamespace())
+        if recipeFilters is not None:
+            if "evaluation" in recipeFilters.attrib.keys():
+                self.evaluation = recipeFilters.attrib["evaluation"]
+            self.filters = []
+            for i in pluginManager.getPluginsOfCategory("Filter"):
+                pluginTag = i.details.get("Core", "Tag")
+                for j in recipeFilters.findall("{%s}%s" % (getRecipeNamespace(), pluginTag)):
+                    self.filters.append((i.plugin_object, j.text))
+
+    def accept(self, event):
+        """
+        Checks if an event must be mitigated by the recipe.
+        @param event: The attack event to check.
+        @return: True if the event is not discarded by the filters, False otherwise.
+        """
+        if self.filters is None:
+            return True
+
+        # The filters have no side effects, so the evaluation can stop as soon as the result is known.
+        if self.evaluation == "or":
+            for plugin, value in self.filters:
+                if plugin.filter(value, event):
+                    return False
+            return True
+        else:
+            for plugin, value in self.filters:
+                if not plugin.filter(value, event):
+                    return True
+            return False
@@ -0,0 +1,213 @@
+# Copyright 2018 Politecnico di Torino
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Registry of the attacks in progress.
+
+@author: Daniele Canavese
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from cybertop.metrics import METRICS
+from cybertop.log import LOG
+
+
+class AttackRegistry(object):
+    """
+    A bounded registry of the attacks in progress, indexed by their keys. The attacks idle for too long, or the least
+    recently active ones when the registry is full, are evicted and optionally finalized. When too many events are
+    buffered in memory, the largest buffers are spilled to temporary files.
+    The registry can also contain None values, used for the attacks that cannot be handled.
+    """
+
+    def __init__(self, maxCount=1000, maxBufferedEvents=100000, idleTimeout=3600, spoolDirectory=None,
+                 evictionCallback=None):
+        """
+        Constructor.
+        @param maxCount: The maximum number of attacks in progress, 0 for no limit.
+        @param maxBufferedEvents: The maximum number of events buffered in memory for all the attacks, 0 for no limit.
+        @param idleTimeout: The number of seconds after which an attack without messages is evicted, 0 to never evict
+                            the idle attacks.
+        @param spoolDirectory: The directory of the temporary files or None to use the default one.
+        @param evictionCallback: The function called with the key and the attack info of each evicted attack or None
+                                 to simply discard them. The callback owns the attack info, so it must close it, even
+                                 if the reasoning is carried out later in background.
+        """
+        self.maxCount = maxCount
+        self.maxBufferedEvents = maxBufferedEvents
+        self.idleTimeout = idleTimeout
+        self.spoolDirectory = spoolDirectory
+        self.evictionCallback = evictionCallback
+        # Maps the keys to [attack info, last activity time, buffered events], from the least recently active.
+        self.__attacks = OrderedDict()
+        self.__bufferedEvents = 0
+        self.__lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self.__lock:
+            return key in self.__attacks
+
+    def __getitem__(self, key):
+        with self.__lock:
+            return self.__attacks[key][0]
+
+    def __len__(self):
+        with self.__lock:
+            return len(self.__attacks)
+
+    def __setitem__(self, key, attackInfo):
+        """
+        Registers a new attack, evicting the least recently active one if the registry is full.
+        @param key: The attack key.
+        @param attackInfo: The attack info or None if the attack cannot be handled.
+        """
+        self.put(key, attackInfo)
+
+    def put(self, key, attackInfo, evictionCallback=None):
+        """
+        Registers a new attack, evicting the least recently active one if the registry is full.
+        @param key: The attack key.
+        @param attackInfo: The attack info or None if the attack cannot be handled.
+        @param evictionCallback: The function called with the key and the attack info of each attack evicted to make
+                                 room, instead of the registry one, or None to use the registry one.
+        """
+        evicted = []
+        with self.__lock:
+            if key in self.__attacks:
+                self.__remove(key)
+            while self.maxCount > 0 and len(self.__attacks) >= self.maxCount:
+                oldestKey = next(iter(self.__attacks))
+                evicted.append((oldestKey, self.__remove(oldestKey)))
+                METRICS.increment("cybertop_attacks_evicted_total", reason="capacity")
+            self.__attacks[key] = [attackInfo, time.monotonic(), 0]
+            self.__updateGauges()
+
+        for i in evicted:
+            LOG.warning("Too many attacks in progress, the attack '%s' has been evicted", i[0])
+            self.__evict(*i, evictionCallback)
+
+    def pop(self, key):
+        """
+        Removes an attack.
+        @param key: The attack key.
+        @return: The attack info.
+        @raise KeyError: If the attack is not registered.
+        """
+        with self.__lock:
+            if key not in self.__attacks:
+                raise KeyError(key)
+            attackInfo = self.__remove(key)
+            self.__updateGauges()
+            return attackInfo
+
+    def addEvent(self, key, event):
+        """
+        Adds an event to an attack, spilling the largest event buffers if too many events are buffered.
+        @param key: The attack key.
+        @param event: The event fields.
+        @raise KeyError: If the attack is not registered.
+        """
+        with self.__lock:
+            entry = self.__attacks[key]
+            self.__attacks.move_to_end(key)
+            entry[1] = time.monotonic()
+            attackInfo = entry[0]
+            if attackInfo is None:
+                return
+            attackInfo.addEvent(event)
+            bufferedEvents = attackInfo.getBufferedEvents()
+            self.__bufferedEvents += bufferedEvents - entry[2]
+            entry[2] = bufferedEvents
+
+            while self.maxBufferedEvents > 0 and self.__bufferedEvents > self.maxBufferedEvents:
+                largest = max(self.__attacks.values(), key=lambda i: i[2])
+                if largest[2] == 0:
+                    break
+                spilled = largest[0].spill(self.spoolDirectory)
+                LOG.debug("%d buffered events spilled to disk", spilled)
+                METRICS.increment("cybertop_attacks_spilled_events_total", spilled)
+                self.__bufferedEvents -= largest[2]
+                largest[2] = 0
+            self.__updateGauges()
+
+    def expire(self):
+        """
+        Evicts the idle attacks.
+        @return: The number of evicted attacks.
+        """
+        if self.idleTimeout <= 0:
+            return 0
+
+        evicted = []
+        limit = time.monotonic() - self.idleTimeout
+        with self.__lock:
+            while len(self.__attacks) > 0:
+                oldestKey, oldest = next(iter(self.__attacks.items()))
+                if oldest[1] > limit:
+                    break
+                evicted.append((oldestKey, self.__remove(oldestKey)))
+                METRICS.increment("cybertop_attacks_evicted_total", reason="idle")
+            self.__updateGauges()
+
+        for i in evicted:
+            LOG.warning("No messages received for the attack '%s' in %d seconds, evicted", i[0], self.idleTimeout)
+            self.__evict(*i)
+        return len(evicted)
+
+    def getBufferedEvents(self):
+        """
+        Retrieves the number of events buffered in memory.
+        @return: The number of buffered events.
+        """
+        with self.__lock:
+            return self.__bufferedEvents
+
+    def __remove(self, key):
+        """
+        Removes an attack. It must be called with the lock held.
+        @param key: The attack key.
+        @return: The attack info.
+        """
+        attackInfo, _, bufferedEvents = self.__attacks.pop(key)
+        self.__bufferedEvents -= bufferedEvents
+        return attackInfo
+
+    def __evict(self, key, attackInfo, evictionCallback=None):
+        """
+        Handles an evicted attack.
+        @param key: The attack key.
+        @param attackInfo: The attack info.
+        @param evictionCallback: The function handling the evicted attack or None to use the registry one.
+        """
+        if attackInfo is None:
+            return
+        if evictionCallback is None:
+            evictionCallback = self.evictionCallback
+        if evictionCallback is None:
+            attackInfo.close()
+            return
+        # The callback closes the attack info, possibly after a background reasoning that still needs its spool files.
+        try:
+            evictionCallback(key, attackInfo)
+        except BaseException as e:
+            LOG.error("Unable to finalize the evicted attack '%s': %s", key, str(e))
+
+    def __updateGauges(self):
+        """
+        Updates the registry gauges. It must be called with the lock held.
+        """
+        METRICS.set("cybertop_attacks_active", len(self.__attacks))
+        METRICS.set("cybertop_attacks_buffered_events", self.__bufferedEvents)
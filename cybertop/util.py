@@ -18,7 +18,14 @@ Utility stuff for the whole CyberTop tool.
 @author: Marco De Benedictis, Daniele Canavese
 """
 
-from pkg_resources import resource_filename
+import hashlib
+import os
+import threading
+from lxml import etree
+try:
+    from importlib.resources import files as _getResources
+except ImportError:
+    _getResources = None
 
 # The plug-in directory.
 PLUGIN_DIRECTORY = "plugins"
@@ -42,26 +49,50 @@ MSPL_XSD_FILE = "xsd/mspl.xsd"
 MSPL_NAMESPACE = "http://security.polito.it/shield/mspl"
 # The XSI namespace.
 XSI_NAMESPACE = "http://www.w3.org/2001/XMLSchema-instance"
+
+# The compiled XML schemas of each thread, since the lxml validators must not be shared among threads.
+_schemas = threading.local()
 # The PID file.
 PID_FILE = "/tmp/cybertop.pid"
 # The configuration file.
 CONFIGURATION_FILE="/etc/cybertop.cfg"
 # The version.
 VERSION="1.0"
+# The plug-in manifest file name.
+PLUGIN_MANIFEST_FILE = "plugins.json"
+
+def _getResourceFileName(packageName, resourceName):
+    """
+    Retrieve the path of a resource of a package, without importing pkg_resources, which is slow to load.
+    @param packageName: The package name.
+    @param resourceName: The relative resource name.
+    @return: The path of the resource.
+    """
+    if _getResources is None:
+        return os.path.join(os.path.dirname(os.path.abspath(__file__)), resourceName)
+    return str(_getResources(packageName.rpartition(".")[0] or packageName).joinpath(resourceName))
+
+def getPluginManifestFile():
+    """
+    Retrieve the path of the plug-in manifest, in the user cache directory.
+    @return: The path of the requested file.
+    """
+    cacheDirectory = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cacheDirectory, "cybertop", PLUGIN_MANIFEST_FILE)
 
 def getPluginDirectory():
     """
     Retrieve the path of the plug-ins directory.
     @return: The path of the requested directory.
     """
-    return resource_filename(__name__, PLUGIN_DIRECTORY)
+    return _getResourceFileName(__name__, PLUGIN_DIRECTORY)
 
 def getRecipeDirectory():
     """
     Retrieve the path of the recipes directory.
     @return: The path of the requested directory.
     """
-    return resource_filename(__name__, RECIPE_DIRECTORY)
+    return _getResourceFileName(__name__, RECIPE_DIRECTORY)
 
 def getRecipeNamespace():
     """
@@ -75,14 +106,14 @@ def getRecipeXSDFile():
     Retrieve the path of the recipe XSD file.
     @return: The path of the requested file.
     """
-    return resource_filename(__name__, RECIPE_XSD_FILE)
+    return _getResourceFileName(__name__, RECIPE_XSD_FILE)
 
 def getLandscapeXSDFile():
     """
     Retrieve the path of the landscape XSD file.
     @return: The path of the requested file.
     """
-    return resource_filename(__name__, LANDSCAPE_XSD_FILE)
+    return _getResourceFileName(__name__, LANDSCAPE_XSD_FILE)
 
 def getLandscapeNamespace():
     """
@@ -96,7 +127,7 @@ def getHSPLXSDFile():
     Retrieve the path of the HSPL XSD file.
     @return: The path of the requested file.
     """
-    return resource_filename(__name__, HSPL_XSD_FILE)
+    return _getResourceFileName(__name__, HSPL_XSD_FILE)
 
 def getHSPLNamespace():
     """
@@ -110,7 +141,7 @@ def getMSPLXSDFile():
     Retrieve the path of the MSPL XSD file.
     @return: The path of the requested file.
     """
-    return resource_filename(__name__, MSPL_XSD_FILE)
+    return _getResourceFileName(__name__, MSPL_XSD_FILE)
 
 def getMSPLNamespace():
     """
@@ -146,3 +177,33 @@ def getVersion():
     @return: The version number.
     """
     return VERSION
+
+def getContentHash(fileNames):
+    """
+    Computes a hash of the content of some files.
+    @param fileNames: The names of the files to use.
+    @return: The hexadecimal hash of the file contents.
+    """
+    h = hashlib.sha256()
+    for i in fileNames:
+        h.update(i.encode())
+        h.update(b"\0")
+        with open(i, "rb") as f:
+            h.update(f.read())
+        h.update(b"\0")
+    return h.hexdigest()
+
+def getSchema(fileName):
+    """
+    Retrieves a compiled XML schema, which is loaded only once per thread.
+    @param fileName: The name of the XSD file.
+    @return: The XML schema.
+    """
+    schemas = getattr(_schemas, "schemas", None)
+    if schemas is None:
+        schemas = _schemas.schemas = {}
+    schema = schemas.get(fileName)
+    if schema is None:
+        schema = etree.XMLSchema(etree.parse(fileName))
+        schemas[fileName] = schema
+    return schema
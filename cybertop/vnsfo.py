@@ -11,30 +11,208 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-import requests
+
+"""
+Integration with the vNSFO API, used to find the running instances of the IT resources.
+
+@author: Daniele Canavese
+"""
+
+import threading
+import time
 from cybertop.log import LOG
+from cybertop.metrics import METRICS
+
+# The path of the running instances list.
+RUNNING_PATH = "/vnsf/r4/running"
+# The maximum number of pooled connections to the vNSFO.
+POOL_SIZE = 4
+
+# The clients, one per vNSFO configuration.
+_clients = {}
+_clientsLock = threading.Lock()
+
+
+def findRunningIdentifier(instances, vnfd_id, attack_name):
+    """
+    Finds the first running instance of an IT resource able to mitigate an attack.
+    @param instances: The running instances list, as returned by the vNSFO.
+    @param vnfd_id: The IT resource identifier.
+    @param attack_name: The attack name.
+    @return: The running instance identifier or None if nothing matches.
+    """
+    for vnsf in instances:
+        target_vnf = vnsf['vnfd_id'][:-5].lower()
+        if vnfd_id[:-5].lower() in target_vnf and attack_name.lower() in target_vnf:
+            LOG.info("Found instance=" + vnsf['vnfr_id'] + " for attack=" + attack_name)
+            return vnsf['vnfr_id']
+    LOG.info("No running instance found from VNSFO API.")
+    return None
+
+
+class VNSFOClient(object):
+    """
+    A vNSFO client. The connections are pooled and the running instances list is cached: once older than the TTL, the
+    cached list is still used while a background thread refreshes it, so only the very first lookup (or one after
+    a failed fetch with nothing cached) waits for the vNSFO. Concurrent lookups share a single request.
+    """
+
+    def __init__(self, baseURL, timeout, ttl):
+        """
+        Constructor.
+        @param baseURL: The vNSFO base URL.
+        @param timeout: The request timeout, in seconds.
+        @param ttl: The time after which the running instances list is refreshed, in seconds.
+        """
+        self.baseURL = baseURL
+        self.timeout = timeout
+        self.ttl = ttl
+        self.__session = None
+        self.__lock = threading.Condition()
+        # The cached running instances list, when it was fetched and if a fetch is in progress.
+        self.__instances = None
+        self.__fetched = None
+        self.__fetching = False
+
+    def getRunningIdentifier(self, vnfd_id, attack_name):
+        """
+        Retrieves the running instance of an IT resource able to mitigate an attack.
+        @param vnfd_id: The IT resource identifier.
+        @param attack_name: The attack name.
+        @return: The running instance identifier or None if not available.
+        """
+        return self.getRunningIdentifiers([vnfd_id], attack_name)[vnfd_id]
+
+    def getRunningIdentifiers(self, vnfd_ids, attack_name):
+        """
+        Retrieves the running instances of several IT resources able to mitigate an attack, with a single running
+        instances list.
+        @param vnfd_ids: The IT resource identifiers.
+        @param attack_name: The attack name.
+        @return: A dictionary mapping the IT resource identifiers to their running instance identifiers, None if not
+                 available.
+        """
+        instances = self.getInstances()
+        if instances is None:
+            return dict.fromkeys(vnfd_ids)
+        return dict((i, findRunningIdentifier(instances, i, attack_name)) for i in vnfd_ids)
+
+    def getInstances(self):
+        """
+        Retrieves the running instances list, from the cache if possible.
+        @return: The running instances list or None if the vNSFO is not reachable and nothing is cached.
+        """
+        with self.__lock:
+            if self.__instances is not None:
+                if time.monotonic() - self.__fetched < self.ttl:
+                    METRICS.increment("cybertop_vnsfo_cache_total", result = "hit")
+                elif not self.__fetching:
+                    METRICS.increment("cybertop_vnsfo_cache_total", result = "stale")
+                    self.__fetching = True
+                    threading.Thread(target = self.__refresh, name = "vnsfo-refresh", daemon = True).start()
+                return self.__instances
+
+            METRICS.increment("cybertop_vnsfo_cache_total", result = "miss")
+            if self.__fetching:
+                # Somebody else is already fetching the list.
+                while self.__fetching:
+                    self.__lock.wait()
+                return self.__instances
+            self.__fetching = True
+
+        return self.__refresh()
+
+    def close(self):
+        """
+        Releases the pooled connections.
+        """
+        with self.__lock:
+            if self.__session is not None:
+                self.__session.close()
+                self.__session = None
+
+    def __refresh(self):
+        """
+        Fetches the running instances list and caches it. A failure keeps the cached list, if any.
+        @return: The running instances list or None if the vNSFO is not reachable and nothing is cached.
+        """
+        instances = self.__fetch()
+        with self.__lock:
+            if instances is not None:
+                self.__instances = instances
+                self.__fetched = time.monotonic()
+            self.__fetching = False
+            self.__lock.notify_all()
+            return self.__instances
+
+    def __fetch(self):
+        """
+        Fetches the running instances list from the vNSFO.
+        @return: The running instances list or None if the vNSFO is not reachable.
+        """
+        url = self.baseURL + RUNNING_PATH
+        LOG.info("VNSFO API call: " + url)
+        try:
+            response = self.__getSession().get(url, verify=False, timeout=self.timeout)
+            LOG.info("VNSFO API response: " + response.text)
+            instances = response.json()["vnsf"]
+            METRICS.increment("cybertop_vnsfo_requests_total", result = "success")
+            return instances
+        except Exception as e:
+            LOG.critical("VNSFO API error: " + str(e))
+            METRICS.increment("cybertop_vnsfo_requests_total", result = "failure")
+            return None
+
+    def __getSession(self):
+        """
+        Retrieves the HTTP session, creating it if needed.
+        @return: The HTTP session.
+        """
+        with self.__lock:
+            if self.__session is None:
+                # requests is slow to import and only needed with the vNSFO integration.
+                import requests
+                self.__session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections = 1, pool_maxsize = POOL_SIZE)
+                self.__session.mount("http://", adapter)
+                self.__session.mount("https://", adapter)
+            return self.__session
+
+
+def getClient(baseURL, timeout, ttl):
+    """
+    Retrieves the shared client of a vNSFO, so that its connections and cache survive the attacks.
+    @param baseURL: The vNSFO base URL.
+    @param timeout: The request timeout, in seconds.
+    @param ttl: The time after which the running instances list is refreshed, in seconds.
+    @return: The client.
+    """
+    key = (baseURL, timeout, ttl)
+    with _clientsLock:
+        if key not in _clients:
+            _clients[key] = VNSFOClient(baseURL, timeout, ttl)
+        return _clients[key]
+
+
+def closeClients():
+    """
+    Releases the connections of all the shared clients and forgets them.
+    """
+    with _clientsLock:
+        for i in _clients.values():
+            i.close()
+        _clients.clear()
 
 
-def retrieve_vnsfr_id(vnsfo_base_url, vnfd_id, attack_name, timeout):
-    LOG.info("Request vNSFO API call for vnsfd_id=" + vnfd_id +
-             " and attack type=" + attack_name)
-    url = vnsfo_base_url + "/vnsf/r4/running"
-    LOG.info("VNSFO API call: " + url)
-
-    try:
-        response = requests.get(url, verify=False, timeout=timeout)
-        LOG.info("VNSFO API response: " + response.text)
-        vnsfs = response.json()["vnsf"]
-
-        # search for first running instance which matches the query
-        for vnsf in vnsfs:
-            target_vnf = vnsf['vnfd_id'][:-5].lower()
-            if vnfd_id[:-5].lower() in target_vnf and attack_name.lower() in target_vnf:
-                LOG.info("Found instance=" + vnsf['vnfr_id'] +
-                         " for attack=" + attack_name)
-                return vnsf['vnfr_id']
-        LOG.info("No running instance found from VNSFO API.")
-        return None
-    except Exception as e:
-        LOG.critical("VNSFO API error: " + str(e))
-        return None
+def retrieve_vnsfr_id(vnsfo_base_url, vnfd_id, attack_name, timeout, ttl=0):
+    """
+    Retrieves the running instance of an IT resource able to mitigate an attack.
+    @param vnsfo_base_url: The vNSFO base URL.
+    @param vnfd_id: The IT resource identifier.
+    @param attack_name: The attack name.
+    @param timeout: The request timeout, in seconds.
+    @param ttl: The time after which the running instances list is refreshed, in seconds.
+    @return: The running instance identifier or None if not available.
+    """
+    LOG.info("Request vNSFO API call for vnsfd_id=" + vnfd_id + " and attack type=" + attack_name)
+    return getClient(vnsfo_base_url, timeout, ttl).getRunningIdentifier(vnfd_id, attack_name)
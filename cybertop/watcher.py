@@ -0,0 +1,176 @@
+# Copyright 2018 Politecnico di Torino
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Hot reload of the recipes, the landscape and the plug-ins.
+
+@author: Daniele Canavese
+"""
+
+import threading
+import time
+from cybertop.plugins import getPluginManager
+from cybertop.plugins import getPluginStamps
+from cybertop.metrics import METRICS
+from cybertop.log import LOG
+
+
+class ArtifactWatcher(object):
+    """
+    Periodically checks the recipes, the landscape and the plug-ins, and reloads the changed ones in background. The
+    reasoners replace each of them with a single assignment, so an attack sees either the old or the new version, and
+    the attacks in progress are kept. Every reload increments the artifacts generation.
+    """
+
+    # The artifact names.
+    RECIPES = "recipes"
+    LANDSCAPE = "landscape"
+    PLUGINS = "plugins"
+
+    def __init__(self, configParser, parser, recipesReasoner, hsplReasoner, msplReasoner, interval=5, callback=None):
+        """
+        Constructor. It also starts the background thread, unless the interval is 0.
+        @param configParser: The configuration parser, where the landscape file name is read at each check.
+        @param parser: The parser.
+        @param recipesReasoner: The recipes reasoner.
+        @param hsplReasoner: The HSPL reasoner.
+        @param msplReasoner: The MSPL reasoner.
+        @param interval: The number of seconds between two checks, 0 to only check on demand.
+        @param callback: The function called with the reloaded artifact names, or None.
+        """
+        self.configParser = configParser
+        self.reasoners = (parser, recipesReasoner, hsplReasoner, msplReasoner)
+        self.interval = interval
+        self.callback = callback
+        self.generation = 1
+        self.__versions = {}
+        self.__errors = {}
+        self.__lock = threading.Lock()
+        self.__stopping = threading.Event()
+        self.__thread = None
+        # The artifacts loaded at startup are the first generation.
+        self.__check()
+        METRICS.set("cybertop_artifacts_generation", self.generation)
+        if interval > 0:
+            self.__thread = threading.Thread(target=self.__checkLoop, name="cybertop-artifacts", daemon=True)
+            self.__thread.start()
+            LOG.info("Checking the recipes, the landscape and the plug-ins every %d seconds.", interval)
+
+    def check(self):
+        """
+        Reloads the changed artifacts.
+        @return: The list of the reloaded artifact names.
+        """
+        with self.__lock:
+            start = time.perf_counter()
+            changed = self.__check()
+            if len(changed) == 0:
+                return changed
+            self.generation += 1
+            METRICS.set("cybertop_artifacts_generation", self.generation)
+            for i in changed:
+                METRICS.increment("cybertop_artifact_reloads_total", artifact=i)
+            LOG.info("Reloaded the %s in %.3f s, artifacts generation %d.", " and the ".join(changed),
+                     time.perf_counter() - start, self.generation)
+        if self.callback is not None:
+            self.callback(changed)
+        return changed
+
+    def close(self):
+        """
+        Stops the background checks.
+        """
+        self.__stopping.set()
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+
+    def __check(self):
+        """
+        Reloads the changed artifacts, without accounting them.
+        @return: The list of the reloaded artifact names.
+        """
+        parser, recipesReasoner, _, _ = self.reasoners
+        changed = []
+        try:
+            if refreshPlugins(*self.reasoners):
+                changed.append(self.PLUGINS)
+            self.__errors.pop(self.PLUGINS, None)
+        except Exception as e:
+            # A broken plug-in module can raise anything while imported.
+            self.__logError(self.PLUGINS, e)
+        # The reasoners parse the recipes and the landscape again only if their content changed.
+        self.__update(self.RECIPES, recipesReasoner.getRecipesVersion, (), changed)
+        landscapeFileName = self.configParser.get("global", "landscapeFile", fallback=None)
+        if landscapeFileName is not None:
+            self.__update(self.LANDSCAPE, parser.getLandscapeVersion, (landscapeFileName,), changed)
+        return changed
+
+    def __update(self, artifact, function, args, changed):
+        """
+        Reloads an artifact, if needed, and records its version.
+        @param artifact: The artifact name.
+        @param function: The function loading the artifact and returning its version.
+        @param args: The function arguments.
+        @param changed: The list of the reloaded artifact names, where the artifact is added if its version changed.
+        """
+        try:
+            version = (args, function(*args))
+        except (IOError, SyntaxError) as e:
+            self.__logError(artifact, e)
+            return
+        self.__errors.pop(artifact, None)
+        if artifact in self.__versions and self.__versions[artifact] != version:
+            changed.append(artifact)
+        self.__versions[artifact] = version
+
+    def __logError(self, artifact, error):
+        """
+        Logs an error while reloading an artifact, only once until the error changes, since the artifact is checked
+        again at every interval.
+        @param artifact: The artifact name.
+        @param error: The exception.
+        """
+        if self.__errors.get(artifact) != str(error):
+            self.__errors[artifact] = str(error)
+            LOG.error("Cannot reload the %s: %s", artifact, str(error))
+
+    def __checkLoop(self):
+        """
+        Checks the artifacts until the watcher is closed.
+        """
+        while not self.__stopping.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                LOG.error("Cannot check the recipes, the landscape and the plug-ins: %s", str(e))
+
+
+def refreshPlugins(parser, recipesReasoner, hsplReasoner, msplReasoner):
+    """
+    Reloads the plug-ins if some of them were added, removed or modified, and hands them to the reasoners.
+    @param parser: The parser.
+    @param recipesReasoner: The recipes reasoner.
+    @param hsplReasoner: The HSPL reasoner.
+    @param msplReasoner: The MSPL reasoner.
+    @return: True if the plug-ins were reloaded, False otherwise.
+    """
+    if parser.pluginManager.stamps is None or parser.pluginManager.stamps == getPluginStamps():
+        return False
+    pluginManager = getPluginManager()
+    parser.pluginManager = pluginManager
+    recipesReasoner.setPluginManager(pluginManager)
+    hsplReasoner.pluginManager = pluginManager
+    msplReasoner.pluginManager = pluginManager
+    return True
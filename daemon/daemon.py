@@ -29,7 +29,11 @@ def start(args):
     """Start action of the daemon
     """
     cybertop = CyberTop(args.conf, args.log_conf)
-    cybertop.start()
+    try:
+        cybertop.start()
+    finally:
+        # Spools the remediations not yet delivered.
+        cybertop.close()
 
 
 class CyberTopDaemon(object):
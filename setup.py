@@ -41,13 +41,18 @@ setup(
         'yapsy',
         'lxml',
         'python-dateutil',
-        'pika'
+        'pika>=1.0.0,<2'
     ],
 
     extras_require={
         'dev': ['check-manifest'],
         'test': ['coverage'],
     },
+    entry_points={
+        'console_scripts': [
+            'cybertop-batch=cybertop.batch:main',
+        ],
+    },
     test_suite="tests",
     include_package_data = True,
     zip_safe = False,
@@ -0,0 +1,240 @@
+# Copyright 2018 Politecnico di Torino
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+An in-process stand-in for the AMQP broker, used by the tests and the benchmarks.
+
+@author: Daniele Canavese
+"""
+
+import threading
+import pika.exceptions
+
+
+class FakeBroker(object):
+    """
+    A fake AMQP broker mimicking the pika blocking API for the publishers and the asynchronous one for the consumers.
+    """
+
+    def __init__(self, messages=None):
+        """
+        Creates a broker that is up and running.
+        @param messages: The message bodies delivered to the consumers or None if there are no messages.
+        """
+        self.up = True
+        self.nack = False
+        # The number of the next messages to reject.
+        self.nacks = 0
+        self.connections = []
+        self.declaredExchanges = []
+        self.published = []
+        self.messages = messages if messages is not None else []
+        self.acks = []
+        self.prefetch = None
+        self.done = threading.Event()
+
+    def connect(self, parameters):
+        """
+        Opens a connection. It can be used as the connection factory of a publisher.
+        @param parameters: The connection parameters.
+        @return: The connection.
+        @raise AMQPConnectionError: When the broker is down.
+        """
+        if not self.up:
+            raise pika.exceptions.AMQPConnectionError("The fake broker is down")
+        connection = FakeConnection(self)
+        self.connections.append(connection)
+        return connection
+
+    def connectAsync(self, parameters, on_open_callback, on_open_error_callback, on_close_callback, custom_ioloop):
+        """
+        Opens an asynchronous connection. It can be used as the connection factory of an ingestion engine.
+        @param parameters: The connection parameters.
+        @param on_open_callback: The function called with the connection once open.
+        @param on_open_error_callback: The function called if the connection cannot be opened.
+        @param on_close_callback: The function called with the connection and the reason once closed.
+        @param custom_ioloop: The asyncio event loop.
+        @return: The connection.
+        """
+        connection = FakeAsyncConnection(self, custom_ioloop, on_close_callback)
+        custom_ioloop.call_soon(on_open_callback, connection)
+        return connection
+
+    def dropConnections(self):
+        """
+        Abruptly closes all the connections.
+        """
+        for i in self.connections:
+            i.is_open = False
+
+    def getBodies(self):
+        """
+        Retrieves the bodies of the published messages.
+        @return: The list of bodies.
+        """
+        return [i[2] for i in self.published]
+
+
+class FakeConnection(object):
+    """
+    A fake blocking connection.
+    """
+
+    def __init__(self, broker):
+        self.broker = broker
+        self.is_open = True
+
+    def channel(self):
+        return FakeChannel(self)
+
+    def close(self):
+        self.is_open = False
+
+
+class FakeChannel(object):
+    """
+    A fake blocking channel.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.is_open = True
+        self.confirms = False
+
+    def exchange_declare(self, exchange, exchange_type):
+        self.__check()
+        self.connection.broker.declaredExchanges.append(exchange)
+
+    def confirm_delivery(self):
+        self.__check()
+        self.confirms = True
+
+    def basic_publish(self, exchange, routing_key, body, properties=None):
+        self.__check()
+        if self.connection.broker.nack or self.connection.broker.nacks > 0:
+            self.connection.broker.nacks = max(0, self.connection.broker.nacks - 1)
+            raise pika.exceptions.NackError([])
+        if properties is None:
+            headers = None
+        else:
+            headers = properties.headers
+        self.connection.broker.published.append((exchange, routing_key, body, headers))
+
+    def close(self):
+        self.is_open = False
+
+    def __check(self):
+        if not self.connection.is_open or not self.connection.broker.up:
+            self.connection.is_open = False
+            raise pika.exceptions.StreamLostError("Connection lost")
+
+
+class FakeMethod(object):
+    """
+    A fake AMQP delivery method.
+    """
+
+    def __init__(self, deliveryTag):
+        self.delivery_tag = deliveryTag
+
+
+class FakeConsumerChannel(object):
+    """
+    A fake consuming channel, recording the acknowledgment frames with the broker semantics: the delivery tags start
+    at 1, an unknown tag closes the channel and a multiple acknowledgment of the tag 0 acknowledges all the
+    outstanding messages.
+    """
+
+    def __init__(self):
+        self.is_open = True
+        self.frames = []
+        self.acks = []
+        self.__lastTag = 0
+        self.__outstanding = set()
+
+    def deliver(self):
+        """
+        Delivers a message.
+        @return: The delivery method of the message.
+        """
+        self.__lastTag += 1
+        self.__outstanding.add(self.__lastTag)
+        return FakeMethod(self.__lastTag)
+
+    def basic_ack(self, delivery_tag=0, multiple=False):
+        self.frames.append((delivery_tag, multiple))
+        if multiple and delivery_tag == 0:
+            acked = sorted(self.__outstanding)
+        elif delivery_tag not in self.__outstanding:
+            self.is_open = False
+            raise pika.exceptions.ChannelClosedByBroker(406, "PRECONDITION_FAILED - unknown delivery tag %d" %
+                                                        delivery_tag)
+        elif multiple:
+            acked = sorted(i for i in self.__outstanding if i <= delivery_tag)
+        else:
+            acked = [delivery_tag]
+        self.__outstanding.difference_update(acked)
+        self.acks += acked
+        return acked
+
+
+class FakeAsyncChannel(FakeConsumerChannel):
+    """
+    A fake asynchronous channel, delivering the messages of a fake broker.
+    """
+
+    def __init__(self, broker, loop):
+        FakeConsumerChannel.__init__(self)
+        self.broker = broker
+        self.loop = loop
+
+    def exchange_declare(self, exchange, exchange_type, callback):
+        self.loop.call_soon(callback, None)
+
+    def queue_declare(self, queue, durable, callback):
+        self.loop.call_soon(callback, None)
+
+    def queue_bind(self, queue, exchange, routing_key, callback):
+        self.loop.call_soon(callback, None)
+
+    def basic_qos(self, prefetch_count):
+        self.broker.prefetch = prefetch_count
+
+    def basic_consume(self, queue, on_message_callback):
+        for body in self.broker.messages:
+            self.loop.call_soon(on_message_callback, self, self.deliver(), None, body)
+
+    def basic_ack(self, delivery_tag=0, multiple=False):
+        self.broker.acks += FakeConsumerChannel.basic_ack(self, delivery_tag, multiple)
+        if len(self.broker.acks) == len(self.broker.messages):
+            self.broker.done.set()
+
+
+class FakeAsyncConnection(object):
+    """
+    A fake asynchronous connection.
+    """
+
+    def __init__(self, broker, loop, onClose):
+        self.broker = broker
+        self.loop = loop
+        self.onClose = onClose
+        self.is_open = True
+
+    def channel(self, on_open_callback):
+        self.loop.call_soon(on_open_callback, FakeAsyncChannel(self.broker, self.loop))
+
+    def close(self):
+        self.is_open = False
+        self.loop.call_soon(self.onClose, self, None)
@@ -0,0 +1,99 @@
+# Copyright 2018 Politecnico di Torino
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Tests for the batched acknowledgments.
+
+@author: Daniele Canavese
+"""
+
+import sys
+sys.path.append("..")
+
+import unittest
+from cybertop.acks import AckBatcher
+from cybertop.acks import AckCountdown
+from tests.fakebroker import FakeConsumerChannel
+
+
+class TestAckBatcher(unittest.TestCase):
+    """
+    Tests the batched acknowledgments.
+    """
+
+    def test_count(self):
+        """
+        Tests the batches triggered by the number of processed messages.
+        """
+        channel = FakeConsumerChannel()
+        batcher = AckBatcher(channel, 3, 1.0)
+        for i in range(1, 8):
+            batcher.receive(channel.deliver().delivery_tag)
+            batcher.complete(i)
+        self.assertEqual([(3, True), (6, True)], channel.frames)
+        self.assertEqual(1, batcher.getPendingCount())
+        batcher.flush()
+        self.assertEqual([(3, True), (6, True), (7, True)], channel.frames)
+        self.assertEqual(0, batcher.getPendingCount())
+
+    def test_inProgress(self):
+        """
+        Tests a message still in progress, such as a stop message waiting for its remediation.
+        """
+        channel = FakeConsumerChannel()
+        batcher = AckBatcher(channel, 2, 1.0)
+        for i in range(1, 6):
+            batcher.receive(channel.deliver().delivery_tag)
+        for i in (1, 2, 4, 5):
+            batcher.complete(i)
+        # The message 3 blocks the batch.
+        self.assertEqual([(2, True)], channel.frames)
+        batcher.flush(False)
+        self.assertEqual([(2, True)], channel.frames)
+        batcher.flush()
+        self.assertEqual([(2, True), (4, False), (5, False)], channel.frames)
+        batcher.complete(3)
+        batcher.flush()
+        self.assertEqual([(2, True), (4, False), (5, False), (3, True)], channel.frames)
+
+    def test_nothingCompleted(self):
+        """
+        Tests that nothing is acknowledged while no message is completed, since a multiple acknowledgment of the tag 0
+        would acknowledge them all.
+        """
+        channel = FakeConsumerChannel()
+        batcher = AckBatcher(channel, 2, 1.0)
+        batcher.receive(channel.deliver().delivery_tag)
+        batcher.flush()
+        self.assertEqual([], channel.frames)
+        batcher.complete(1)
+        batcher.flush()
+        self.assertEqual([(1, True)], channel.frames)
+
+    def test_countdown(self):
+        """
+        Tests the acknowledgment of a message made of several parts.
+        """
+        acks = []
+        countdown = AckCountdown(lambda: acks.append(True))
+        countdown.add()
+        countdown.add()
+        countdown.done()
+        countdown.done()
+        self.assertEqual([], acks)
+        countdown.done()
+        self.assertEqual([True], acks)
+
+if __name__ == "__main__":
+    unittest.main()
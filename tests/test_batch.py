@@ -0,0 +1,88 @@
+# Copyright 2018 Politecnico di Torino
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Tests for the offline batch processing.
+
+@author: Daniele Canavese
+"""
+
+import sys
+sys.path.append("..")
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from configparser import ConfigParser
+from lxml import etree
+from cybertop.batch import runBatch
+from cybertop.batch import main
+from cybertop.cybertop import CyberTop
+from tests.test_cybertop import getTestFilePath
+
+
+class TestBatch(unittest.TestCase):
+    """
+    Tests the batch processing.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.outputDirectory = os.path.join(self.directory, "out")
+        for i in ("High-DoS-1.csv", "High-DoS-4.csv", "landscape1.xml"):
+            shutil.copy(getTestFilePath(i), self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_batch(self):
+        """
+        Tests the remediation of a directory.
+        """
+        configParser = ConfigParser()
+        configParser.read(getTestFilePath("cybertop.cfg"))
+        output = io.StringIO()
+        results = runBatch(configParser, self.directory, self.outputDirectory, 2, getTestFilePath("landscape1.xml"),
+                           output=output)
+
+        self.assertEqual(["High-DoS-1.csv", "High-DoS-4.csv"], sorted(os.path.basename(i.fileName) for i in results))
+        self.assertTrue(all(i.remediated and i.error is None and i.events > 0 for i in results))
+        self.assertEqual(["High-DoS-1.hspl.xml", "High-DoS-1.mspl.xml", "High-DoS-4.hspl.xml", "High-DoS-4.mspl.xml"],
+                         sorted(os.listdir(self.outputDirectory)))
+        self.assertIn("2 files (0 errors)", output.getvalue())
+
+        # The HSPL sets are the ones of the online processing, in any order, while the MSPL rules are randomly split
+        # among the vNSFs.
+        cyberTop = CyberTop(getTestFilePath("cybertop.cfg"), getTestFilePath("logging.ini"))
+        self.addCleanup(cyberTop.close)
+        [hsplSet, _] = cyberTop.getMSPLsFromFile(getTestFilePath("High-DoS-4.csv"), getTestFilePath("landscape1.xml"))
+        with open(os.path.join(self.outputDirectory, "High-DoS-4.hspl.xml"), "rb") as f:
+            written = etree.fromstring(f.read(), etree.XMLParser(remove_blank_text=True))
+        self.assertEqual(sorted(etree.tostring(i) for i in hsplSet), sorted(etree.tostring(i) for i in written))
+
+    def test_error(self):
+        """
+        Tests the exit status with an invalid attack file.
+        """
+        with open(os.path.join(self.directory, "High-Carrier pigeon-1.csv"), "w") as f:
+            f.write("invalid\n")
+        status = main([self.directory, "--out", self.outputDirectory, "--jobs", "1", "-c",
+                       getTestFilePath("cybertop.cfg"), "--landscape", getTestFilePath("landscape1.xml")])
+        self.assertEqual(1, status)
+        self.assertEqual(4, len(os.listdir(self.outputDirectory)))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,158 @@
+# Copyright 2018 Politecnico di Torino
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Tests for the configuration snapshots and their reload.
+
+@author: Daniele Canavese
+"""
+
+import sys
+sys.path.append("..")
+
+import os
+import pickle
+import signal
+import tempfile
+import threading
+import time
+import unittest
+from configparser import ConfigParser
+from cybertop.config import Configuration
+from cybertop.config import Settings
+from cybertop.cybertop import CyberTop
+from cybertop.util import getHSPLNamespace
+from tests.test_cybertop import getTestFilePath
+
+
+class TestSettings(unittest.TestCase):
+    """
+    Tests the settings validation.
+    """
+
+    def setUp(self):
+        self.configParser = ConfigParser()
+        self.configParser.read(getTestFilePath("cybertop.cfg"))
+
+    def test_values(self):
+        settings = Settings(self.configParser)
+        self.assertIs(True, settings.hsplMergeWithSubnets)
+        self.assertEqual(10, settings.hsplMergingThreshold)
+        self.assertEqual("MSPL", settings.dashboardContent)
+        self.assertEqual(25, settings.limitMaxConnections)
+        self.assertEqual("150kbit/s", settings.limitRateLimit)
+        self.assertFalse(settings.vnsfoEnabled)
+        with self.assertRaises(AttributeError):
+            settings.hsplMergingThreshold = 5
+        with self.assertRaises(AttributeError):
+            settings.other = 5
+        self.assertEqual(settings.__getstate__(), pickle.loads(pickle.dumps(settings)).__getstate__())
+
+    def test_invalid(self):
+        for option, value in (("dashboardContent", "XML"), ("hsplMergingThreshold", "-1"),
+                              ("hsplMergingMinBits", "20"), ("hsplMergingMinBitsIPv6", "129"),
+                              ("hsplMergeInclusions", "maybe")):
+            configParser = ConfigParser()
+            configParser.read_dict(self.configParser)
+            configParser.set("global", option, value)
+            with self.assertRaises(ValueError, msg=option):
+                Settings(configParser)
+
+
+class TestReload(unittest.TestCase):
+    """
+    Tests the configuration reload.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.fileName = os.path.join(self.directory.name, "cybertop.cfg")
+        with open(getTestFilePath("cybertop.cfg")) as f:
+            self.configuration = f.read()
+        with open(self.fileName, "w") as f:
+            f.write(self.configuration)
+        self.cyberTop = CyberTop(self.fileName, getTestFilePath("logging.ini"))
+
+    def tearDown(self):
+        self.cyberTop.close()
+        self.directory.cleanup()
+
+    def __write(self, **options):
+        configuration = self.configuration
+        for option, value in options.items():
+            configuration = configuration.replace("\n%s = " % option, "\n%s = %s\n#" % (option, value))
+        with open(self.fileName, "w") as f:
+            f.write(configuration)
+
+    def __getObjects(self):
+        r = self.cyberTop.getMSPLsFromFile(getTestFilePath("Very low-DoS-5.csv"), getTestFilePath("landscape1.xml"))
+        return r[0][0].findall(".//{%s}object" % getHSPLNamespace())
+
+    def test_reload(self):
+        self.assertEqual(6, len(self.__getObjects()))
+        self.__write(hsplMergeInclusions="off", hsplMergeWithAnyPorts="off", hsplMergeWithSubnets="off")
+        self.assertTrue(self.cyberTop.configuration.reload())
+        self.assertGreater(len(self.__getObjects()), 6)
+
+    def test_invalid(self):
+        settings = self.cyberTop.configuration.settings
+        self.__write(hsplMergingThreshold="-1")
+        self.assertFalse(self.cyberTop.configuration.reload())
+        self.assertIs(settings, self.cyberTop.configuration.settings)
+
+    def test_inFlight(self):
+        recipes = self.cyberTop.recipesReasoner.getRecipes(
+            self.cyberTop.parser.getAttackFromFile(getTestFilePath("Very low-DoS-4.csv")),
+            self.cyberTop.parser.getLandscape(getTestFilePath("landscape1.xml")))
+        builders = self.cyberTop.hsplReasoner.getBuilders(recipes)
+        self.__write(hsplMergeWithSubnets="off")
+        self.cyberTop.configuration.reload()
+        self.assertTrue(builders[0].settings.hsplMergeWithSubnets)
+        self.assertFalse(self.cyberTop.hsplReasoner.configuration.settings.hsplMergeWithSubnets)
+        self.assertIs(self.cyberTop.hsplReasoner.configuration, self.cyberTop.msplReasoner.configuration)
+
+    @unittest.skipIf(Configuration.RELOAD_SIGNAL is None, "no SIGHUP")
+    def test_signal(self):
+        self.__write(dashboardContent="HSPL")
+        self.cyberTop.watch()
+        os.kill(os.getpid(), signal.SIGHUP)
+        self.assertTrue(self.__waitSettings(lambda i: i.dashboardContent == "HSPL"))
+
+    @unittest.skipIf(Configuration.RELOAD_SIGNAL is None, "no SIGHUP")
+    def test_signalThread(self):
+        threads = []
+        configuration = Configuration(self.cyberTop.configParser, self.fileName,
+                                      lambda: threads.append(threading.current_thread()))
+        configuration.watch()
+        try:
+            os.kill(os.getpid(), signal.SIGHUP)
+            for _ in range(100):
+                if len(threads) > 0:
+                    break
+                time.sleep(0.02)
+        finally:
+            configuration.close()
+        self.assertEqual(1, len(threads))
+        self.assertIsNot(threading.main_thread(), threads[0])
+
+    def __waitSettings(self, condition):
+        for _ in range(100):
+            if condition(self.cyberTop.configuration.settings):
+                return True
+            time.sleep(0.02)
+        return False
+
+
+if __name__ == "__main__":
+    unittest.main()
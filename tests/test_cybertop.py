@@ -25,7 +25,11 @@ sys.path.append("..")
 from cybertop.util import getHSPLNamespace
 import unittest
 from cybertop.cybertop import CyberTop
+from cybertop.cybertop import AttackInfo
+from lxml import etree
 import os
+import shutil
+import tempfile
 
 def getTestFilePath(filename):
     """
@@ -52,6 +56,7 @@ class BasicTest(unittest.TestCase):
         @param expectedObjectPorts: The expected object port list or None if this test must be skipped.
         """
         cyberTop = CyberTop(getTestFilePath("cybertop.cfg"), getTestFilePath("logging.ini"))
+        self.addCleanup(cyberTop.close)
     
         r = cyberTop.getMSPLsFromFile(getTestFilePath(attackFile), getTestFilePath(landscapeFile))
         self.assertIsNotNone(r)
@@ -109,6 +114,7 @@ class BasicTest(unittest.TestCase):
         @param expectedObjects: The list of expected objects.
         """
         cyberTop = CyberTop(getTestFilePath("cybertop.cfg"), getTestFilePath("logging.ini"))
+        self.addCleanup(cyberTop.close)
     
         r = cyberTop.getMSPLsFromFile(getTestFilePath(attackFile), getTestFilePath(landscapeFile))
         self.assertIsNotNone(r)
@@ -360,6 +366,54 @@ class TestHSPLMerging(BasicTest):
             "91.211.1.8/31:*",
             "91.211.1.10/31:*"])
 
+    def test_mergeAnyPortsIPv6(self):
+        """
+        Tests that any ports merging with IPv6 addresses.
+        """
+        self._doObjectTest("Very low-DoS-14.csv", "landscape1.xml", 10, ["[2001:db8:91:211::64]:*"])
+
+    def test_mergeSubnetsIPv6(self):
+        """
+        Tests the subnets merging with IPv6 addresses.
+        """
+        self._doObjectTest("Very low-DoS-15.csv", "landscape1.xml", 10, [
+            "[2001:db8:91:211::/127]:*",
+            "[2001:db8:91:211::2/127]:*",
+            "[2001:db8:91:211::4/127]:*",
+            "[2001:db8:91:211::6/127]:*",
+            "[2001:db8:91:211::8/127]:*",
+            "[2001:db8:91:211::a/127]:*"])
+
+    def test_mergeAnyPortsWithInclusionsIPv6(self):
+        """
+        Tests that any ports merging with some inclusions and IPv6 addresses.
+        """
+        self._doObjectTest("Very low-DoS-16.csv", "landscape1.xml", 10, ["[2001:db8:91:211::]:*"])
+
+    def test_mergeSubnetsWithInclusionsIPv6(self):
+        """
+        Tests the subnets merging with some inclusions and IPv6 addresses.
+        """
+        self._doObjectTest("Very low-DoS-17.csv", "landscape1.xml", 10, [
+            "[2001:db8:91:211::/127]:*",
+            "[2001:db8:91:211::2/127]:*",
+            "[2001:db8:91:211::4/127]:*",
+            "[2001:db8:91:211::6/127]:*",
+            "[2001:db8:91:211::8/127]:*",
+            "[2001:db8:91:211::a/127]:*"])
+
+    def test_mergeAllIPv6(self):
+        """
+        Tests the any ports and subnets merging with some inclusions and IPv6 addresses.
+        """
+        self._doObjectTest("Very low-DoS-18.csv", "landscape1.xml", 10, [
+            "[2001:db8:91:211::/127]:*",
+            "[2001:db8:91:211::2/127]:*",
+            "[2001:db8:91:211::4/127]:*",
+            "[2001:db8:91:211::6/127]:*",
+            "[2001:db8:91:211::8/127]:*",
+            "[2001:db8:91:211::a/127]:*"])
+
     def test_mergeBig1(self):
         """
         Big test #1!
@@ -453,5 +507,155 @@ class TestCSVParser(BasicTest):
         self._doHSPLTest("High-DoS-9.csv", "landscape1.xml", 2, ["TCP"] * 5, ["drop"] * 5)
         self._doHSPLTest("High-DoS-9.csv", "landscape1.xml", 2, ["TCP"] * 5, ["limit"] * 5)
 
+class TestPolicyCache(BasicTest):
+    """
+    Tests the reuse of the remediations of the attacks already seen.
+    """
+
+    def test_hit(self):
+        """
+        Tests that the same attack is computed only once.
+        """
+        cyberTop = CyberTop(getTestFilePath("cybertop.cfg"), getTestFilePath("logging.ini"))
+        self.addCleanup(cyberTop.close)
+
+        [hspls1, mspls1] = cyberTop.getMSPLsFromFile(getTestFilePath("High-DoS-4.csv"), getTestFilePath("landscape2.xml"))
+        self.assertEqual(0.0, cyberTop.policyCache.getHitRatio())
+        # The returned trees are copies, so they can be freely edited.
+        hspls1.clear()
+        [hspls2, mspls2] = cyberTop.getMSPLsFromFile(getTestFilePath("High-DoS-4.csv"), getTestFilePath("landscape2.xml"))
+        self.assertEqual(1, cyberTop.policyCache.getHits())
+        self.assertEqual(0.5, cyberTop.policyCache.getHitRatio())
+        self.assertGreater(len(hspls2), 0)
+        self.assertEqual(etree.tostring(mspls1), etree.tostring(mspls2))
+
+    def test_miss(self):
+        """
+        Tests that different attacks and landscapes are not mixed up.
+        """
+        cyberTop = CyberTop(getTestFilePath("cybertop.cfg"), getTestFilePath("logging.ini"))
+        self.addCleanup(cyberTop.close)
+
+        cyberTop.getMSPLsFromFile(getTestFilePath("High-DoS-4.csv"), getTestFilePath("landscape1.xml"))
+        cyberTop.getMSPLsFromFile(getTestFilePath("High-DoS-4.csv"), getTestFilePath("landscape2.xml"))
+        cyberTop.getMSPLsFromFile(getTestFilePath("High-DoS-1.csv"), getTestFilePath("landscape2.xml"))
+        self.assertEqual(0, cyberTop.policyCache.getHits())
+        self.assertEqual(3, cyberTop.policyCache.getMisses())
+
+class TestArtifacts(BasicTest):
+    """
+    Tests the reuse of the parsed landscapes and recipes.
+    """
+
+    def test_landscape(self):
+        """
+        Tests that a landscape is parsed again only when its content changes.
+        """
+        cyberTop = CyberTop(getTestFilePath("cybertop.cfg"), getTestFilePath("logging.ini"))
+        self.addCleanup(cyberTop.close)
+        with tempfile.TemporaryDirectory() as directory:
+            fileName = os.path.join(directory, "landscape.xml")
+            shutil.copy(getTestFilePath("landscape1.xml"), fileName)
+            landscape1 = cyberTop.parser.getLandscape(fileName)
+            version1 = cyberTop.parser.getLandscapeVersion(fileName)
+            # A touched file is hashed again, but not parsed.
+            os.utime(fileName, ns=(0, 0))
+            self.assertIs(landscape1, cyberTop.parser.getLandscape(fileName))
+            self.assertEqual(version1, cyberTop.parser.getLandscapeVersion(fileName))
+            shutil.copy(getTestFilePath("landscape2.xml"), fileName)
+            os.utime(fileName, ns=(1, 1))
+            landscape2 = cyberTop.parser.getLandscape(fileName)
+            self.assertIsNot(landscape1, landscape2)
+            self.assertNotEqual(version1, cyberTop.parser.getLandscapeVersion(fileName))
+            self.assertEqual(cyberTop.parser.getLandscape(getTestFilePath("landscape2.xml")), landscape2)
+
+    def test_recipes(self):
+        """
+        Tests that the recipe artifacts are shared and depend on the landscape.
+        """
+        cyberTop = CyberTop(getTestFilePath("cybertop.cfg"), getTestFilePath("logging.ini"))
+        self.addCleanup(cyberTop.close)
+        attack = cyberTop.parser.getAttackFromFile(getTestFilePath("High-DoS-4.csv"))
+        recipes = cyberTop.recipesReasoner.getCandidateRecipes(attack)
+        self.assertGreater(len(recipes), 0)
+        recipe = next(iter(recipes))
+        self.assertIs(cyberTop.recipesReasoner.getRecipeFilter(recipe), cyberTop.recipesReasoner.getRecipeFilter(recipe))
+        self.assertEqual(cyberTop.recipesReasoner.getRecipesVersion(), cyberTop.recipesReasoner.getRecipesVersion())
+        enforceable = cyberTop.recipesReasoner.getEnforceableRecipes(recipes, {})
+        self.assertEqual(0, len(enforceable))
+        landscape = cyberTop.parser.getLandscape(getTestFilePath("landscape1.xml"))
+        enforceable = cyberTop.recipesReasoner.getEnforceableRecipes(recipes, landscape)
+        self.assertGreater(len(enforceable), 0)
+
+class TestAttackInfo(BasicTest):
+    """
+    Tests the incremental processing of the attacks received from the DARE.
+    """
+
+    def __getHSPLs(self, hsplRecommendations):
+        """
+        Retrieves the content of some HSPL recommendations, ignoring the HSPL names.
+        @param hsplRecommendations: The HSPL recommendations.
+        @return: The sorted list of HSPL sets, each one is a sorted list of (subject, action, object, constraints).
+        """
+        hsplSets = []
+        for hsplSet in hsplRecommendations:
+            hspls = []
+            for i in hsplSet.findall("{%s}hspl" % getHSPLNamespace()):
+                hspls.append((i.findtext("{%s}subject" % getHSPLNamespace()), i.findtext("{%s}action" % getHSPLNamespace()),
+                              i.findtext("{%s}object" % getHSPLNamespace()),
+                              etree.tostring(i.find("{%s}traffic-constraints" % getHSPLNamespace()))))
+            hsplSets.append(sorted(hspls))
+        return sorted(hsplSets)
+
+    def __doTest(self, attackFile, attackType):
+        """
+        Checks that an incrementally processed attack produces the same HSPLs of the whole attack file.
+        @param attackFile: The attack file to read.
+        @param attackType: The attack type, as reported by the DARE.
+        """
+        cyberTop = CyberTop(getTestFilePath("cybertop.cfg"), getTestFilePath("logging.ini"))
+        self.addCleanup(cyberTop.close)
+        cyberTop.policyCache = None
+        [hspls1, _] = cyberTop.getMSPLsFromFile(getTestFilePath(attackFile), getTestFilePath("landscape1.xml"))
+
+        attackInfo = AttackInfo(1, "high", attackType, cyberTop.parser, cyberTop.recipesReasoner, cyberTop.hsplReasoner)
+        with open(getTestFilePath(attackFile), "rt") as f:
+            for line in f:
+                attackInfo.addEvent(line.rstrip("\r\n").split("\t"))
+        self.assertGreater(attackInfo.getEventsCount(), 0)
+        [hspls2, _] = cyberTop.getMSPLsFromAttackInfo(attackInfo, getTestFilePath("landscape1.xml"))
+
+        self.assertEqual(self.__getHSPLs(hspls1), self.__getHSPLs(hspls2))
+
+    def test_DoS(self):
+        """
+        Tests a DoS attack.
+        """
+        self.__doTest("High-DoS-1.csv", "DoS")
+
+    def test_DNSTunneling(self):
+        """
+        Tests a DNS tunneling attack, whose recipes have some filters.
+        """
+        self.__doTest("High-DNS tunneling-1.csv", "DNS tunneling")
+
+    def test_worm(self):
+        """
+        Tests a worm attack.
+        """
+        self.__doTest("High-Worm-1.csv", "Worm")
+
+    def test_invalidEvent(self):
+        """
+        Tests that an invalid event is reported when the attack stops.
+        """
+        cyberTop = CyberTop(getTestFilePath("cybertop.cfg"), getTestFilePath("logging.ini"))
+        self.addCleanup(cyberTop.close)
+        attackInfo = AttackInfo(1, "high", "DoS", cyberTop.parser, cyberTop.recipesReasoner, cyberTop.hsplReasoner)
+        attackInfo.addEvent(["header"])
+        attackInfo.addEvent(["garbage"])
+        self.assertRaises(IOError, cyberTop.getMSPLsFromAttackInfo, attackInfo, getTestFilePath("landscape1.xml"))
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,213 @@
+# Copyright 2018 Politecnico di Torino
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Tests for the DARE messages decoding.
+
+@author: Daniele Canavese
+"""
+
+import sys
+sys.path.append("..")
+
+import unittest
+from cybertop.cybertop import CyberTop
+from cybertop.decoding import DAREMessage
+from cybertop.decoding import MessageDecoder
+from tests.fakebroker import FakeConsumerChannel
+from tests.test_cybertop import getTestFilePath
+
+
+class TestDecoder(unittest.TestCase):
+    """
+    Tests the DARE message decoder.
+    """
+
+    def test_decode(self):
+        """
+        Tests the start, event and stop messages.
+        """
+        decoder = MessageDecoder()
+        message = decoder.decode(b"12,Very  Low,DoS,start")
+        self.assertEqual(DAREMessage.START, message.kind)
+        self.assertEqual(12, message.identifier)
+        self.assertEqual("very low", message.severity)
+        self.assertEqual("DoS", message.attackType)
+        self.assertEqual("12-very low-DoS", message.getKey())
+
+        message = decoder.decode(b"12,very low,DoS,2017-08-09 17:33:00,2017,8\r\n")
+        self.assertEqual(DAREMessage.EVENT, message.kind)
+        self.assertEqual(["2017-08-09 17:33:00", "2017", "8"], message.fields)
+
+        message = decoder.decode(b"12,very low,DoS,stop")
+        self.assertEqual(DAREMessage.STOP, message.kind)
+
+        self.assertIsNone(decoder.decode(b"12,very low,DoS,pause"))
+        self.assertIsNone(decoder.decode(b"xx,very low,DoS,start"))
+        self.assertIsNone(decoder.decode(b"12,medium,DoS,start"))
+        self.assertIsNone(decoder.decode(b"garbage"))
+
+    def test_dialect(self):
+        """
+        Tests the dialect learning.
+        """
+        decoder = MessageDecoder()
+        decoder.decode("1,high,DoS,start")
+        self.assertEqual(",", decoder.dialect.delimiter)
+        message = decoder.decode('1,high,DoS,"a,b",c')
+        self.assertEqual(["a,b", "c"], message.fields)
+
+        # A different sender is detected.
+        message = decoder.decode("1;high;DoS;stop")
+        self.assertEqual(DAREMessage.STOP, message.kind)
+        self.assertEqual(";", decoder.dialect.delimiter)
+
+        decoder.reset()
+        self.assertIsNone(decoder.dialect)
+
+    def test_batch(self):
+        """
+        Tests the batched messages.
+        """
+        decoder = MessageDecoder()
+        messages = decoder.decodeAll(b"3,high,DoS,start\n3,high,DoS,a,b\r\n\n3,high,DoS,stop\ngarbage\n")
+        self.assertEqual(4, len(messages))
+        self.assertEqual("3,high,DoS,start", messages[0][0])
+        self.assertEqual([DAREMessage.START, DAREMessage.EVENT, DAREMessage.STOP],
+                         [i[1].kind for i in messages[:3]])
+        self.assertEqual(["a", "b"], messages[1][1].fields)
+        self.assertIsNone(messages[3][1])
+        self.assertEqual(1, len(decoder.decodeAll("3,high,DoS,stop")))
+
+
+class TestParseFields(unittest.TestCase):
+    """
+    Tests the parsing of the already split events.
+    """
+
+    def __checkFile(self, attackType, fileName):
+        cyberTop = CyberTop(getTestFilePath("cybertop.cfg"), getTestFilePath("logging.ini"))
+        self.addCleanup(cyberTop.close)
+        lines = []
+        fields = []
+        with open(getTestFilePath(fileName), "rt") as f:
+            for line in f:
+                lines.append(line)
+                fields.append(line.rstrip("\r\n").split("\t"))
+        attack1 = cyberTop.parser.getAttackFromList(1, 3, attackType, lines, attackType)
+        attack2 = cyberTop.parser.getAttackFromList(1, 3, attackType, fields, attackType)
+        self.assertGreater(len(attack1.events), 0)
+        self.assertEqual(len(attack1.events), len(attack2.events))
+        for event1, event2 in zip(attack1.events, attack2.events):
+            self.assertEqual(event1.timestamp, event2.timestamp)
+            self.assertEqual(event1.attacker, event2.attacker)
+            self.assertEqual(event1.target, event2.target)
+            self.assertEqual(event1.fields, event2.fields)
+
+    def test_DoS(self):
+        """
+        Tests the DoS parser.
+        """
+        self.__checkFile("DoS", "High-DoS-1.csv")
+
+    def test_comments(self):
+        """
+        Tests the comments after some empty fields, as in the DARE messages.
+        """
+        cyberTop = CyberTop(getTestFilePath("cybertop.cfg"), getTestFilePath("logging.ini"))
+        self.addCleanup(cyberTop.close)
+        for attackType in ("DoS", "DNS tunneling", "Worm", "Cryptocurrency Mining"):
+            plugin = cyberTop.parser.getParserPlugin(attackType)
+            self.assertIsNone(plugin.plugin_object.parse_fields(None, 2, ["", "", "# Comment"]), attackType)
+            self.assertIsNone(plugin.plugin_object.parse_fields(None, 2, ["", " "]), attackType)
+
+    def test_DNSTunneling(self):
+        """
+        Tests the DNS tunneling parser.
+        """
+        self.__checkFile("DNS tunneling", "High-DNS tunneling-1.csv")
+
+    def test_worm(self):
+        """
+        Tests the worm parser.
+        """
+        self.__checkFile("Worm", "High-Worm-1.csv")
+
+    def test_cryptomining(self):
+        """
+        Tests the cryptomining parser.
+        """
+        self.__checkFile("Cryptocurrency Mining", "Low-Cryptocurrency Mining-1.csv")
+
+
+class TestProcessMessage(unittest.TestCase):
+    """
+    Tests the processing of the DARE messages.
+    """
+
+    def test_attack(self):
+        """
+        Tests a whole attack received through the queue.
+        """
+        cyberTop = CyberTop(getTestFilePath("cybertop.cfg"), getTestFilePath("logging.ini"))
+        self.addCleanup(cyberTop.close)
+        cyberTop.configParser.set("global", "landscapeFile", getTestFilePath("landscape1.xml"))
+        sent = []
+        cyberTop.send = lambda hsplSet, msplSet: sent.append((hsplSet, msplSet))
+        channel = FakeConsumerChannel()
+
+        messages = [b"4,high,DoS,start"]
+        with open(getTestFilePath("High-DoS-4.csv"), "rt") as f:
+            for line in f:
+                messages.append(("4,high,DoS," + ",".join(line.rstrip("\r\n").split("\t"))).encode())
+        messages.append(b"4,high,DoS,stop")
+        for body in messages:
+            cyberTop.processMessage(channel, channel.deliver(), None, body)
+
+        self.assertEqual(list(range(1, len(messages) + 1)), channel.acks)
+        self.assertEqual(0, len(cyberTop.attacks))
+        self.assertEqual(1, len(sent))
+        [hsplSet, _] = cyberTop.getMSPLsFromFile(getTestFilePath("High-DoS-4.csv"), getTestFilePath("landscape1.xml"))
+        self.assertEqual(len(hsplSet), len(sent[0][0]))
+
+    def test_batch(self):
+        """
+        Tests a whole attack received in batches, with batched acknowledgments.
+        """
+        cyberTop = CyberTop(getTestFilePath("cybertop.cfg"), getTestFilePath("logging.ini"))
+        self.addCleanup(cyberTop.close)
+        cyberTop.configParser.set("global", "landscapeFile", getTestFilePath("landscape1.xml"))
+        cyberTop.ackBatchSize = 4
+        sent = []
+        cyberTop.send = lambda hsplSet, msplSet: sent.append((hsplSet, msplSet))
+        channel = FakeConsumerChannel()
+
+        lines = ["4,high,DoS,start"]
+        with open(getTestFilePath("High-DoS-4.csv"), "rt") as f:
+            for line in f:
+                lines.append("4,high,DoS," + ",".join(line.rstrip("\r\n").split("\t")))
+        lines.append("4,high,DoS,stop")
+        bodies = ["\n".join(lines[i:i + 3]).encode() for i in range(0, len(lines), 3)]
+        for body in bodies:
+            cyberTop.processMessage(channel, channel.deliver(), None, body)
+        cyberTop.flushAcknowledgments()
+
+        self.assertEqual(list(range(1, len(bodies) + 1)), sorted(channel.acks))
+        self.assertLess(len(channel.frames), len(bodies))
+        self.assertEqual(1, len(sent))
+        [hsplSet, _] = cyberTop.getMSPLsFromFile(getTestFilePath("High-DoS-4.csv"), getTestFilePath("landscape1.xml"))
+        self.assertEqual(len(hsplSet), len(sent[0][0]))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+# Copyright 2018 Politecnico di Torino
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Tests for the delta policies.
+
+@author: Daniele Canavese
+"""
+
+import sys
+sys.path.append("..")
+
+import os
+import tempfile
+import unittest
+from cybertop.cybertop import CyberTop
+from cybertop.delta import PolicyStore
+from cybertop.delta import DeltaReasoner
+from cybertop.util import getHSPLNamespace
+from cybertop.util import getMSPLNamespace
+from tests.test_cybertop import getTestFilePath
+
+
+class TestDelta(unittest.TestCase):
+    """
+    Tests the delta computation.
+    """
+
+    def setUp(self):
+        self.cyberTop = CyberTop(getTestFilePath("cybertop.cfg"), getTestFilePath("logging.ini"))
+        self.addCleanup(self.cyberTop.close)
+
+    def _getMSPLs(self, attackFile):
+        """
+        Generates a remediation.
+        @param attackFile: The attack file to read.
+        @return: The HSPL and MSPL recommendations.
+        """
+        return self.cyberTop.getMSPLsFromFile(getTestFilePath(attackFile), getTestFilePath("landscape2.xml"))
+
+    def _count(self, recommendations, path):
+        """
+        Counts the elements in some recommendations.
+        @param recommendations: The recommendations or None.
+        @param path: The path of the elements to count.
+        @return: The number of elements.
+        """
+        if recommendations is None:
+            return 0
+        return len(recommendations.findall(path))
+
+    def test_unchanged(self):
+        """
+        Tests that the same remediation is pushed only once.
+        """
+        deltaReasoner = DeltaReasoner(self.cyberTop.configParser, PolicyStore())
+
+        [hspls, mspls] = self._getMSPLs("High-DoS-4.csv")
+        delta = deltaReasoner.getDelta(hspls, mspls)
+        self.assertIsNotNone(delta)
+        self.assertEqual(self._count(delta.addedHSPLs, "*/{%s}hspl" % getHSPLNamespace()),
+                         self._count(hspls, "*/{%s}hspl" % getHSPLNamespace()))
+        self.assertIsNone(delta.removedHSPLs)
+        self.assertIsNone(delta.removedMSPLs)
+        deltaReasoner.commit(delta)
+
+        [hspls, mspls] = self._getMSPLs("High-DoS-4.csv")
+        self.assertIsNone(deltaReasoner.getDelta(hspls, mspls))
+
+    def test_changed(self):
+        """
+        Tests that only the differences are pushed.
+        """
+        deltaReasoner = DeltaReasoner(self.cyberTop.configParser, PolicyStore())
+
+        [hspls, mspls] = self._getMSPLs("Very high-DoS-1.csv")
+        deltaReasoner.commit(deltaReasoner.getDelta(hspls, mspls))
+
+        [hspls, mspls] = self._getMSPLs("Very high-DoS-3.csv")
+        delta = deltaReasoner.getDelta(hspls, mspls)
+        self.assertIsNotNone(delta)
+        rulePath = "*/{%s}it-resource/{%s}configuration/{%s}rule" % (getMSPLNamespace(), getMSPLNamespace(),
+                                                                    getMSPLNamespace())
+        added = self._count(delta.addedMSPLs, rulePath)
+        removed = self._count(delta.removedMSPLs, rulePath)
+        self.assertGreater(added + removed, 0)
+        self.assertLessEqual(added, self._count(mspls, rulePath))
+
+    def test_persistence(self):
+        """
+        Tests that the policy store survives a restart.
+        """
+        fileName = os.path.join(tempfile.mkdtemp(), "policies.json")
+        deltaReasoner = DeltaReasoner(self.cyberTop.configParser, PolicyStore(fileName))
+        [hspls, mspls] = self._getMSPLs("High-DoS-4.csv")
+        deltaReasoner.commit(deltaReasoner.getDelta(hspls, mspls))
+
+        deltaReasoner = DeltaReasoner(self.cyberTop.configParser, PolicyStore(fileName))
+        [hspls, mspls] = self._getMSPLs("High-DoS-4.csv")
+        self.assertIsNone(deltaReasoner.getDelta(hspls, mspls))
+
+if __name__ == "__main__":
+    unittest.main()
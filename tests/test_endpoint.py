@@ -0,0 +1,114 @@
+# Copyright 2018 Politecnico di Torino
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Tests for the attack endpoints.
+
+@author: Daniele Canavese
+"""
+
+import sys
+sys.path.append("..")
+
+import unittest
+from cybertop.endpoint import PrefixTrie
+from cybertop.endpoint import formatEndpoint
+from cybertop.endpoint import getEndpoint
+
+
+class TestEndpoint(unittest.TestCase):
+    """
+    Tests the endpoint parsing.
+    """
+
+    def test_address(self):
+        endpoint = getEndpoint("10.0.0.1:80")
+        self.assertEqual("10.0.0.1", endpoint.address)
+        self.assertEqual(0x0A000001, endpoint.network)
+        self.assertEqual(32, endpoint.prefixLength)
+        self.assertEqual("80", endpoint.port)
+        self.assertFalse(endpoint.isWildcard())
+        self.assertFalse(endpoint.isAnyPort())
+        self.assertEqual("10.0.0.1:80", str(endpoint))
+        self.assertIs(endpoint, getEndpoint("10.0.0.1:80"))
+        self.assertEqual({endpoint}, {getEndpoint("10.0.0.1:80"), endpoint})
+
+    def test_network(self):
+        endpoint = getEndpoint("10.0.0.0/24:any")
+        self.assertEqual(24, endpoint.prefixLength)
+        self.assertTrue(endpoint.isAnyPort())
+        self.assertEqual("10.0.0.0/24:*", str(endpoint.withAnyPort()))
+        self.assertEqual("10.0.0.0/16:*", str(endpoint.getSupernet(16)))
+        self.assertEqual("10.0.0.0/24:*", str(getEndpoint("10.0.0.7:53").getSupernet(24)))
+        with self.assertRaises(ValueError):
+            getEndpoint("10.0.0.1/24:*")
+
+    def test_wildcard(self):
+        endpoint = getEndpoint("*:*")
+        self.assertTrue(endpoint.isWildcard())
+        self.assertEqual("*", endpoint.address)
+        self.assertIsNone(getEndpoint("10.0.0.1").port)
+        self.assertIsNone(getEndpoint("host:80"))
+
+    def test_ipv6(self):
+        endpoint = getEndpoint("[2001:db8::1]:80")
+        self.assertEqual("2001:db8::1", endpoint.address)
+        self.assertEqual(6, endpoint.version)
+        self.assertEqual(128, endpoint.prefixLength)
+        self.assertEqual("80", endpoint.port)
+        self.assertEqual("[2001:db8::1]:80", str(endpoint))
+        self.assertEqual("[2001:db8::/64]:*", str(endpoint.getSupernet(64)))
+        self.assertEqual("[2001:db8::1]:*", formatEndpoint(endpoint.address, "*"))
+        self.assertEqual(4, getEndpoint("10.0.0.1:80").version)
+        self.assertIsNone(getEndpoint("[10.0.0.1]:80"))
+        self.assertIsNone(getEndpoint("[2001:db8::1]80"))
+
+
+class TestPrefixTrie(unittest.TestCase):
+    """
+    Tests the prefix tries.
+    """
+
+    def __getTrie(self, version, endpoints):
+        trie = PrefixTrie(version)
+        for i in endpoints:
+            trie.add(getEndpoint(i), i)
+        return trie
+
+    def __find(self, trie, text, port="*"):
+        endpoint = getEndpoint(text)
+        return trie.find(endpoint.network, endpoint.prefixLength, port)
+
+    def test_ipv4(self):
+        endpoints = ["10.0.0.1:80", "10.0.0.2:80", "10.0.0.3:22", "10.0.1.1:80", "10.0.0.0/30:*"]
+        trie = self.__getTrie(4, endpoints)
+        self.assertEqual(set(endpoints), self.__find(trie, "0.0.0.0/0:*"))
+        self.assertEqual(set(endpoints) - {"10.0.1.1:80"}, self.__find(trie, "10.0.0.0/24:*"))
+        self.assertEqual({"10.0.0.1:80", "10.0.0.2:80"}, self.__find(trie, "10.0.0.0/24:*", "80"))
+        self.assertEqual({"10.0.0.2:80", "10.0.0.3:22"}, self.__find(trie, "10.0.0.2/31:*"))
+        self.assertEqual(set(), self.__find(trie, "10.0.2.0/24:*"))
+        trie.remove(getEndpoint("10.0.0.2:80"), "10.0.0.2:80")
+        self.assertEqual({"10.0.0.3:22"}, self.__find(trie, "10.0.0.2/31:*"))
+
+    def test_ipv6(self):
+        endpoints = ["[2001:db8::1]:80", "[2001:db8::2]:80", "[2001:db8:0:1::1]:80", "[2001:db9::1]:80"]
+        trie = self.__getTrie(6, endpoints)
+        self.assertEqual(set(endpoints[:3]), self.__find(trie, "[2001:db8::/32]:*"))
+        self.assertEqual(set(endpoints[:2]), self.__find(trie, "[2001:db8::/64]:*"))
+        self.assertEqual({endpoints[1]}, self.__find(trie, "[2001:db8::2]:*"))
+        self.assertEqual(set(endpoints), self.__find(trie, "[::/0]:*"))
+
+
+if __name__ == "__main__":
+    unittest.main()
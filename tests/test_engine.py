@@ -0,0 +1,128 @@
+# Copyright 2018 Politecnico di Torino
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Tests for the event loop based ingestion.
+
+@author: Daniele Canavese
+"""
+
+import sys
+sys.path.append("..")
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from cybertop.cybertop import CyberTop
+from cybertop.engine import IngestionEngine
+from tests.fakebroker import FakeBroker
+from tests.test_cybertop import getTestFilePath
+
+
+def getAttackMessages(identifier, fileName):
+    """
+    Converts a DoS attack file into the DARE messages announcing it.
+    @param identifier: The attack id.
+    @param fileName: The attack file name.
+    @return: The list of message bodies.
+    """
+    prefix = "%d,high,DoS," % identifier
+    messages = [(prefix + "start").encode()]
+    with open(getTestFilePath(fileName), "rt") as f:
+        for line in f:
+            messages.append((prefix + ",".join(line.rstrip("\r\n").split("\t"))).encode())
+    messages.append((prefix + "stop").encode())
+    return messages
+
+
+class TestIngestionEngine(unittest.TestCase):
+    """
+    Tests the ingestion engine.
+    """
+
+    def __getCyberTop(self):
+        cyberTop = CyberTop(getTestFilePath("cybertop.cfg"), getTestFilePath("logging.ini"))
+        self.addCleanup(cyberTop.close)
+        cyberTop.configParser.set("global", "landscapeFile", getTestFilePath("landscape1.xml"))
+        cyberTop.sent = []
+        cyberTop.send = lambda hsplSet, msplSet: cyberTop.sent.append((hsplSet, msplSet))
+        return cyberTop
+
+    def __run(self, engine, inputMethod, done):
+        """
+        Runs an engine until an event is set.
+        """
+        def wait():
+            done.wait(60)
+            engine.stop()
+
+        thread = threading.Thread(target=wait)
+        thread.start()
+        engine.run(inputMethod)
+        thread.join()
+
+    def test_queue(self):
+        """
+        Tests the queue input.
+        """
+        cyberTop = self.__getCyberTop()
+        broker = FakeBroker(getAttackMessages(1, "High-DoS-4.csv") + getAttackMessages(2, "High-DoS-1.csv"))
+        engine = IngestionEngine(cyberTop, connectionFactory=broker.connectAsync)
+        self.__run(engine, "queue", broker.done)
+
+        self.assertEqual(list(range(1, len(broker.messages) + 1)), sorted(broker.acks))
+        self.assertEqual(100, broker.prefetch)
+        self.assertEqual(2, len(cyberTop.sent))
+        self.assertEqual(0, len(cyberTop.attacks))
+
+    def test_csv(self):
+        """
+        Tests the folder input.
+        """
+        cyberTop = self.__getCyberTop()
+        directory = tempfile.mkdtemp()
+        cyberTop.configParser.set("global", "watchedDirectory", directory)
+        cyberTop.configParser.set("global", "folderDumpDirectory", directory)
+        done = threading.Event()
+        cyberTop.send = lambda hsplSet, msplSet: done.set()
+        engine = IngestionEngine(cyberTop)
+
+        def write():
+            # Waits for the watch to be in place.
+            while engine.loop is None or not engine.loop.is_running():
+                done.wait(0.01)
+            done.wait(0.5)
+            shutil.copy(getTestFilePath("High-DoS-4.csv"), os.path.join(directory, "High-DoS-4.csv"))
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        try:
+            self.__run(engine, "csv", done)
+        finally:
+            writer.join()
+            shutil.rmtree(directory)
+        self.assertTrue(done.is_set())
+
+    def test_unknownInput(self):
+        """
+        Tests an unknown input method.
+        """
+        engine = IngestionEngine(self.__getCyberTop())
+        with self.assertRaises(ValueError):
+            engine.run("carrier pigeon")
+
+if __name__ == "__main__":
+    unittest.main()
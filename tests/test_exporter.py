@@ -0,0 +1,97 @@
+# Copyright 2018 Politecnico di Torino
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Tests for the metrics export.
+
+@author: Daniele Canavese
+"""
+
+import sys
+sys.path.append("..")
+
+import os
+import tempfile
+import unittest
+import urllib.request
+from cybertop.cybertop import CyberTop
+from cybertop.exporter import MetricsExporter
+from cybertop.exporter import formatMetrics
+from cybertop.metrics import Metrics
+from cybertop.metrics import METRICS
+from cybertop.reasoning import getFileRemediation
+from tests.test_cybertop import getTestFilePath
+
+
+class TestExporter(unittest.TestCase):
+    """
+    Tests the Prometheus text format and its export.
+    """
+
+    def __getMetrics(self):
+        metrics = Metrics()
+        metrics.increment("cybertop_events_total", 3, type="DoS", severity="3")
+        metrics.set("cybertop_attacks_active", 2)
+        metrics.observe("cybertop_stage_seconds", 0.02, stage="parse", type="DNS \"tunneling\"", severity="1")
+        return metrics
+
+    def test_format(self):
+        text = formatMetrics(self.__getMetrics())
+        self.assertIn("# TYPE cybertop_events_total counter\n", text)
+        self.assertIn("cybertop_events_total{severity=\"3\",type=\"DoS\"} 3.0\n", text)
+        self.assertIn("# TYPE cybertop_attacks_active gauge\ncybertop_attacks_active 2.0\n", text)
+        self.assertIn("# TYPE cybertop_stage_seconds histogram\n", text)
+        labels = "severity=\"1\",stage=\"parse\",type=\"DNS \\\"tunneling\\\"\""
+        self.assertIn("cybertop_stage_seconds_bucket{%s,le=\"0.01\"} 0.0\n" % labels, text)
+        self.assertIn("cybertop_stage_seconds_bucket{%s,le=\"0.05\"} 1.0\n" % labels, text)
+        self.assertIn("cybertop_stage_seconds_bucket{%s,le=\"+Inf\"} 1.0\n" % labels, text)
+        self.assertIn("cybertop_stage_seconds_count{%s} 1.0\n" % labels, text)
+
+    def test_http(self):
+        exporter = MetricsExporter(0, metrics=self.__getMetrics())
+        try:
+            with urllib.request.urlopen("http://127.0.0.1:%d/metrics" % exporter.getPort()) as response:
+                self.assertTrue(response.headers["Content-Type"].startswith("text/plain"))
+                self.assertIn("cybertop_attacks_active 2.0", response.read().decode())
+        finally:
+            exporter.close()
+
+    def test_textFile(self):
+        with tempfile.TemporaryDirectory() as directory:
+            fileName = os.path.join(directory, "cybertop.prom")
+            exporter = MetricsExporter(textFileName=fileName, interval=60, metrics=self.__getMetrics())
+            exporter.close()
+            with open(fileName) as f:
+                self.assertIn("cybertop_attacks_active 2.0", f.read())
+            self.assertEqual(["cybertop.prom"], os.listdir(directory))
+
+    def test_stages(self):
+        cyberTop = CyberTop(getTestFilePath("cybertop.cfg"), getTestFilePath("logging.ini"))
+        self.addCleanup(cyberTop.close)
+        METRICS.reset()
+        r = getFileRemediation(cyberTop.parser, cyberTop.recipesReasoner, cyberTop.hsplReasoner,
+                               cyberTop.msplReasoner, getTestFilePath("High-DoS-4.csv"),
+                               getTestFilePath("landscape1.xml"))
+        self.assertIsNotNone(r)
+        for stage in ("parse", "landscape", "recipes", "hspl", "mspl"):
+            histogram = METRICS.getHistogram("cybertop_stage_seconds", stage=stage, type="DoS", severity="3")
+            self.assertEqual(1, histogram.count, stage)
+        self.assertEqual(1, METRICS.getHistogram("cybertop_remediation_seconds", type="DoS", severity="3").count)
+        self.assertGreater(METRICS.get("cybertop_events_total", type="DoS", severity="3"), 0)
+        self.assertGreater(METRICS.get("cybertop_hspls_total", type="DoS", severity="3"), 0)
+        self.assertGreater(METRICS.get("cybertop_mspl_rules_total", type="DoS", severity="3"), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,157 @@
+# Copyright 2018 Politecnico di Torino
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Tests for the folder ingestion.
+
+@author: Daniele Canavese
+"""
+
+import sys
+sys.path.append("..")
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from cybertop.cybertop import CyberTop
+from cybertop.folder import FolderIngestion
+from tests.test_cybertop import getTestFilePath
+
+
+class TestFolderIngestion(unittest.TestCase):
+    """
+    Tests the folder ingestion.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.dumpDirectory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        shutil.rmtree(self.dumpDirectory)
+
+    def __getCyberTop(self, kind="thread"):
+        cyberTop = CyberTop(getTestFilePath("cybertop.cfg"), getTestFilePath("logging.ini"))
+        self.addCleanup(cyberTop.close)
+        cyberTop.configParser.set("global", "landscapeFile", getTestFilePath("landscape1.xml"))
+        cyberTop.configParser.set("global", "watchedDirectory", self.directory)
+        cyberTop.configParser.set("global", "folderDumpDirectory", self.dumpDirectory)
+        cyberTop.configParser.set("global", "folderWorkerKind", kind)
+        cyberTop.configParser.set("global", "folderDebounce", "0.2")
+        cyberTop.sent = []
+        cyberTop.send = lambda hsplSet, msplSet: cyberTop.sent.append((hsplSet, msplSet))
+        return cyberTop
+
+    def __copy(self, fileName, name=None):
+        shutil.copy(getTestFilePath(fileName), os.path.join(self.directory, fileName if name is None else name))
+
+    def __checkDumps(self, *names):
+        self.assertEqual(sorted(j for i in names for j in (i + ".hspl.xml", i + ".mspl.xml")),
+                         sorted(os.listdir(self.dumpDirectory)))
+
+    def test_backlog(self):
+        """
+        Tests the files already in the directory.
+        """
+        self.__copy("High-DoS-4.csv")
+        self.__copy("High-DoS-1.csv")
+        self.__copy("landscape1.xml")
+        self.__copy("High-DoS-4.csv", ".High-DoS-4.csv")
+        cyberTop = self.__getCyberTop()
+        ingestion = FolderIngestion(cyberTop)
+        self.assertEqual(2, ingestion.scan())
+        ingestion.close()
+
+        self.assertEqual(2, len(cyberTop.sent))
+        self.__checkDumps("High-DoS-1", "High-DoS-4")
+
+    def test_process(self):
+        """
+        Tests the worker processes.
+        """
+        self.__copy("High-DoS-4.csv")
+        self.__copy("High-DoS-1.csv")
+        cyberTop = self.__getCyberTop("process")
+        ingestion = FolderIngestion(cyberTop)
+        ingestion.scan()
+        ingestion.close()
+
+        self.assertEqual(2, len(cyberTop.sent))
+        self.__checkDumps("High-DoS-1", "High-DoS-4")
+
+    def test_debounce(self):
+        """
+        Tests the debouncing of the file events.
+        """
+        cyberTop = self.__getCyberTop()
+        ingestion = FolderIngestion(cyberTop)
+        self.__copy("High-DoS-4.csv")
+        fileName = os.path.join(self.directory, "High-DoS-4.csv")
+        for _ in range(3):
+            ingestion.notify(fileName)
+        ingestion.notify(os.path.join(self.directory, "notes.txt"))
+        self.assertEqual(0, ingestion.poll())
+        self.assertEqual(1, ingestion.getPendingCount())
+        time.sleep(0.3)
+        self.assertEqual(1, ingestion.poll())
+        ingestion.close()
+
+        self.assertEqual(1, len(cyberTop.sent))
+        self.assertEqual(0, ingestion.getPendingCount())
+
+    def test_dumpFileNames(self):
+        """
+        Tests the dump names without a dump directory.
+        """
+        cyberTop = self.__getCyberTop()
+        cyberTop.configParser.remove_option("global", "folderDumpDirectory")
+        ingestion = FolderIngestion(cyberTop)
+        self.assertEqual(["hspls-High-DoS-1.dump", "mspls-High-DoS-1.dump"],
+                         ingestion.getDumpFileNames(os.path.join(self.directory, "High-DoS-1.csv")))
+        cyberTop.configParser.remove_option("global", "hsplsFile")
+        cyberTop.configParser.remove_option("global", "msplsFile")
+        self.assertEqual([None, None], ingestion.getDumpFileNames("High-DoS-1.csv"))
+        ingestion.close()
+
+    def test_run(self):
+        """
+        Tests the directory watching.
+        """
+        self.__copy("High-DoS-4.csv")
+        cyberTop = self.__getCyberTop()
+        ingestion = FolderIngestion(cyberTop)
+
+        def write():
+            while len(cyberTop.sent) < 1:
+                time.sleep(0.01)
+            self.__copy("High-DoS-1.csv")
+            while len(cyberTop.sent) < 2:
+                time.sleep(0.01)
+            ingestion.stop()
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        ingestion.run()
+        writer.join()
+        ingestion.close()
+
+        self.assertEqual(2, len(cyberTop.sent))
+        self.__checkDumps("High-DoS-1", "High-DoS-4")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,189 @@
+# Copyright 2018 Politecnico di Torino
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Tests for the asynchronous remediation delivery.
+
+@author: Daniele Canavese
+"""
+
+import sys
+sys.path.append("..")
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from cybertop.metrics import METRICS
+from cybertop.outbox import Outbox
+from cybertop.publisher import DashboardPublisher
+from tests.fakebroker import FakeBroker
+
+
+class TestOutbox(unittest.TestCase):
+    """
+    Tests the outbox.
+    """
+
+    def setUp(self):
+        self.broker = FakeBroker()
+        self.publisher = DashboardPublisher("localhost", 5672, "dashboard", "policy", 1, 0, self.broker.connect)
+        self.spoolDirectory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.spoolDirectory)
+
+    def __waitFor(self, condition, timeout=5):
+        end = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > end:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def test_delivery(self):
+        """
+        Tests the background delivery.
+        """
+        outbox = Outbox(self.publisher, 10, self.spoolDirectory, 0.05)
+        for i in range(5):
+            outbox.put("message %d" % i)
+        outbox.put("delta", {"delta": "add"})
+        self.assertTrue(outbox.flush(5))
+        outbox.close()
+        self.assertEqual(["message %d" % i for i in range(5)] + ["delta"], self.broker.getBodies())
+        self.assertEqual({"delta": "add"}, self.broker.published[-1][3])
+        self.assertEqual(0, outbox.getDepth())
+        self.assertEqual(1, len(self.broker.connections))
+
+    def test_spool(self):
+        """
+        Tests that the messages are spooled while the dashboard is down and replayed in order.
+        """
+        self.broker.up = False
+        outbox = Outbox(self.publisher, 10, self.spoolDirectory, 0.05)
+        for i in range(5):
+            outbox.put("message %d" % i)
+        self.assertTrue(self.__waitFor(lambda: METRICS.get("cybertop_outbox_spool_depth") > 0))
+        self.assertEqual(5, outbox.getDepth())
+        self.assertGreater(METRICS.get("cybertop_outbox_oldest_age_seconds"), 0)
+
+        self.broker.up = True
+        outbox.put("message 5")
+        self.assertTrue(self.__waitFor(lambda: outbox.getDepth() == 0))
+        outbox.close()
+        self.assertEqual(["message %d" % i for i in range(6)], self.broker.getBodies())
+        self.assertEqual([], os.listdir(self.spoolDirectory))
+
+    def test_restart(self):
+        """
+        Tests that the spooled messages survive a restart.
+        """
+        self.broker.up = False
+        outbox = Outbox(self.publisher, 10, self.spoolDirectory, 0.05)
+        outbox.put("first")
+        outbox.put("second")
+        outbox.close()
+        self.assertEqual(2, len(os.listdir(self.spoolDirectory)))
+
+        self.broker.up = True
+        outbox = Outbox(self.publisher, 10, self.spoolDirectory, 0.05)
+        self.assertTrue(self.__waitFor(lambda: outbox.getDepth() == 0))
+        outbox.close()
+        self.assertEqual(["first", "second"], self.broker.getBodies())
+
+    def test_memory(self):
+        """
+        Tests the in-memory spool, used when no spool directory is available.
+        """
+        self.broker.up = False
+        dropped = METRICS.get("cybertop_outbox_dropped_total")
+        outbox = Outbox(self.publisher, 2, None, 0.05)
+        for i in range(6):
+            outbox.put("message %d" % i)
+        self.assertLessEqual(outbox.getDepth(), 4)
+        dropped = METRICS.get("cybertop_outbox_dropped_total") - dropped
+        self.assertGreaterEqual(dropped, 2)
+        self.broker.up = True
+        self.assertTrue(self.__waitFor(lambda: outbox.getDepth() == 0))
+        outbox.close()
+        self.assertEqual(6 - dropped, len(self.broker.getBodies()))
+        self.assertEqual("message 5", self.broker.getBodies()[-1])
+
+    def test_close(self):
+        """
+        Tests that the queued messages are delivered before closing, even without a spool directory.
+        """
+        outbox = Outbox(self.publisher, 1000, None, 0.05)
+        for i in range(20):
+            outbox.put("message %d" % i)
+        outbox.close()
+        self.assertEqual(["message %d" % i for i in range(20)], self.broker.getBodies())
+
+    def test_callback(self):
+        """
+        Tests that the delivery callbacks are called only once the messages are delivered, even after a spooling.
+        """
+        delivered = []
+        self.broker.up = False
+        outbox = Outbox(self.publisher, 10, self.spoolDirectory, 0.05)
+        outbox.put("first", None, lambda: delivered.append("first"))
+        outbox.put("second")
+        self.assertTrue(self.__waitFor(lambda: len(os.listdir(self.spoolDirectory)) == 1))
+        self.assertEqual([], delivered)
+        self.broker.up = True
+        self.assertTrue(self.__waitFor(lambda: outbox.getDepth() == 0))
+        outbox.close()
+        self.assertEqual(["first"], delivered)
+
+    def test_rejected(self):
+        """
+        Tests that a message rejected by the dashboard is dropped without blocking the following ones.
+        """
+        delivered = []
+        dropped = METRICS.get("cybertop_outbox_dropped_total")
+        self.broker.nacks = 1
+        outbox = Outbox(self.publisher, 10, self.spoolDirectory, 0.05)
+        outbox.put("rejected", None, lambda: delivered.append("rejected"))
+        outbox.put("accepted", None, lambda: delivered.append("accepted"))
+        self.assertTrue(outbox.flush(5))
+        outbox.close()
+        self.assertEqual(["accepted"], self.broker.getBodies())
+        self.assertEqual(["accepted"], delivered)
+        self.assertEqual(dropped + 1, METRICS.get("cybertop_outbox_dropped_total"))
+        self.assertEqual([], os.listdir(self.spoolDirectory))
+
+    def test_rejectedSpool(self):
+        """
+        Tests that a spooled message rejected by the dashboard is removed from the spool.
+        """
+        self.broker.up = False
+        outbox = Outbox(self.publisher, 10, self.spoolDirectory, 0.05)
+        outbox.put("rejected")
+        outbox.put("accepted")
+        outbox.close()
+        self.assertEqual(2, len(os.listdir(self.spoolDirectory)))
+
+        self.broker.up = True
+        self.broker.nacks = 1
+        outbox = Outbox(self.publisher, 10, self.spoolDirectory, 0.05)
+        self.assertTrue(self.__waitFor(lambda: outbox.getDepth() == 0))
+        outbox.close()
+        self.assertEqual(["accepted"], self.broker.getBodies())
+        self.assertEqual([], os.listdir(self.spoolDirectory))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+# Copyright 2018 Politecnico di Torino
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Tests for the placement of the HSPLs on the IT resources.
+
+@author: Daniele Canavese
+"""
+
+import sys
+sys.path.append("..")
+
+import unittest
+from cybertop.config import Settings
+from cybertop.cybertop import CyberTop
+from cybertop.placement import LOAD_FACTOR
+from cybertop.placement import ShardRing
+from cybertop.util import getHSPLNamespace
+from cybertop.util import getMSPLNamespace
+from tests.test_cybertop import getTestFilePath
+
+
+class TestShardRing(unittest.TestCase):
+    """
+    Tests the consistent hashing ring.
+    """
+
+    def setUp(self):
+        self.keys = ["10.%d.%d.0/24:*" % (i // 256, i % 256) for i in range(6000)]
+
+    def test_capacities(self):
+        capacities = {"a": 2, "b": 1, "c": 1}
+        identifiers = ShardRing(capacities).getIdentifiers(self.keys)
+        for identifier, capacity in capacities.items():
+            share = len(self.keys) * capacity / 4
+            self.assertLessEqual(identifiers.count(identifier), LOAD_FACTOR * share + 1)
+            self.assertGreater(identifiers.count(identifier), share / 2)
+        self.assertEqual(identifiers, ShardRing(capacities).getIdentifiers(self.keys))
+
+    def test_stability(self):
+        before = ShardRing({"a": 1, "b": 1, "c": 1, "d": 1}).getIdentifiers(self.keys)
+        after = ShardRing({"a": 1, "b": 1, "c": 1}).getIdentifiers(self.keys)
+        kept = [i for i in before if i != "d"]
+        moved = sum(1 for i, j in zip(before, after) if i != "d" and i != j)
+        self.assertLess(moved, len(kept) / 10)
+
+    def test_sameKey(self):
+        identifiers = ShardRing({"a": 1, "b": 1}).getIdentifiers(["10.0.0.0/24:*"] * 2 + self.keys[:8])
+        self.assertEqual(identifiers[0], identifiers[1])
+
+
+class TestSharding(unittest.TestCase):
+    """
+    Tests the MSPL sets shared among several IT resources.
+    """
+
+    def setUp(self):
+        self.cyberTop = CyberTop(getTestFilePath("cybertop.cfg"), getTestFilePath("logging.ini"))
+
+    def tearDown(self):
+        self.cyberTop.close()
+
+    def __getRules(self, landscapeFile):
+        [hspls, mspls] = self.cyberTop.getMSPLsFromFile(getTestFilePath("Very low-DoS-5.csv"),
+                                                         getTestFilePath(landscapeFile))
+        rules = {}
+        for i in mspls[0].findall("{%s}it-resource" % getMSPLNamespace()):
+            rules[i.attrib["id"]] = len(i.findall(".//{%s}rule" % getMSPLNamespace()))
+        return len(hspls[0].findall("{%s}hspl" % getHSPLNamespace())), rules
+
+    def test_shards(self):
+        hspls, rules = self.__getRules("landscape1.xml")
+        self.assertEqual(["vNSF-filtering"], list(rules))
+        shardedHSPLs, shardedRules = self.__getRules("landscape3.xml")
+        self.assertEqual(hspls, shardedHSPLs)
+        self.assertGreater(len(shardedRules), 1)
+        self.assertEqual(sum(rules.values()), sum(shardedRules.values()))
+
+    def test_disabled(self):
+        self.cyberTop.configParser.set("global", "msplSharding", "off")
+        self.cyberTop.configuration.update(Settings(self.cyberTop.configParser))
+        _, rules = self.__getRules("landscape3.xml")
+        self.assertEqual(["vNSF-filtering-1"], list(rules))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+# Copyright 2018 Politecnico di Torino
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Tests for the plug-in manifest.
+
+@author: Daniele Canavese
+"""
+
+import sys
+sys.path.append("..")
+
+import json
+import os
+import tempfile
+import unittest
+from cybertop.plugins import ActionPlugin
+from cybertop.plugins import getPluginManager
+
+
+def getSummary(pluginManager):
+    """
+    Summarizes the plug-ins of a registry.
+    @param pluginManager: The plug-in registry.
+    @return: The sorted list of categories, names, class names and attack types.
+    """
+    summary = []
+    for category in ("Action", "Parser", "Filter"):
+        for i in pluginManager.getPluginsOfCategory(category):
+            summary.append((category, i.name, type(i.plugin_object).__name__, i.details.get("Core", "Attack",
+                                                                                           fallback=None)))
+    return sorted(summary)
+
+
+class TestPluginManifest(unittest.TestCase):
+    """
+    Tests the loading of the plug-ins from the manifest.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.manifestFileName = os.path.join(self.directory.name, "plugins.json")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_manifest(self):
+        scanned = getPluginManager(self.manifestFileName)
+        self.assertTrue(os.path.exists(self.manifestFileName))
+        loaded = getPluginManager(self.manifestFileName)
+        self.assertEqual(getSummary(scanned), getSummary(loaded))
+        self.assertEqual(4, len(loaded.getPluginsOfCategory("Parser")))
+        for i in loaded.getPluginsOfCategory("Action"):
+            self.assertIsInstance(i.plugin_object, ActionPlugin)
+
+    def test_stale(self):
+        getPluginManager(self.manifestFileName)
+        with open(self.manifestFileName) as f:
+            manifest = json.load(f)
+        # A plug-in changed after the manifest was written.
+        stamp = next(iter(manifest["stamps"]))
+        manifest["stamps"][stamp][0] -= 1
+        manifest["plugins"] = []
+        with open(self.manifestFileName, "w") as f:
+            json.dump(manifest, f)
+        self.assertEqual(13, len(getPluginManager(self.manifestFileName).getAllPlugins()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+# Copyright 2018 Politecnico di Torino
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Tests for the on-demand profiling.
+
+@author: Daniele Canavese
+"""
+
+import sys
+sys.path.append("..")
+
+import os
+import pstats
+import signal
+import tempfile
+import tracemalloc
+import unittest
+from cybertop.cybertop import CyberTop
+from cybertop.profiling import PROFILER
+from cybertop.reasoning import getFileRemediation
+from tests.test_cybertop import getTestFilePath
+
+
+class TestProfiler(unittest.TestCase):
+    """
+    Tests the profiling of the remediations.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cyberTop = CyberTop(getTestFilePath("cybertop.cfg"), getTestFilePath("logging.ini"))
+        self.addCleanup(self.cyberTop.close)
+        self.cyberTop.configParser.set("global", "profilingDirectory", self.directory.name)
+        self.cyberTop.configParser.set("global", "profilingAttacks", "2")
+        PROFILER.setup(self.cyberTop.configParser)
+
+    def tearDown(self):
+        PROFILER.close()
+        PROFILER.directory = None
+        self.directory.cleanup()
+
+    def __remediate(self):
+        getFileRemediation(self.cyberTop.parser, self.cyberTop.recipesReasoner, self.cyberTop.hsplReasoner,
+                           self.cyberTop.msplReasoner, getTestFilePath("High-DoS-4.csv"),
+                           getTestFilePath("landscape1.xml"))
+
+    def __getFileNames(self, extension):
+        return sorted(i for i in os.listdir(self.directory.name) if i.endswith(extension))
+
+    def test_disabled(self):
+        self.__remediate()
+        self.assertEqual([], os.listdir(self.directory.name))
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_nextAttacks(self):
+        PROFILER.start()
+        for _ in range(3):
+            self.__remediate()
+        profiles = self.__getFileNames(".prof")
+        self.assertEqual(2, len(profiles))
+        self.assertEqual(2, len(self.__getFileNames(".malloc.txt")))
+        self.assertTrue(profiles[0].endswith("-DoS.prof"))
+        stats = pstats.Stats(os.path.join(self.directory.name, profiles[0]))
+        self.assertTrue(any(i[2] == "getHSPLs" for i in stats.stats))
+        self.assertFalse(PROFILER.isActive())
+        self.assertFalse(tracemalloc.is_tracing())
+
+    @unittest.skipIf(PROFILER.TOGGLE_SIGNAL is None, "no SIGUSR1")
+    def test_signals(self):
+        os.kill(os.getpid(), signal.SIGUSR1)
+        self.assertTrue(PROFILER.isActive())
+        os.kill(os.getpid(), signal.SIGUSR2)
+        self.assertEqual(1, len(self.__getFileNames(".malloc.txt")))
+        os.kill(os.getpid(), signal.SIGUSR1)
+        self.assertFalse(PROFILER.isActive())
+        self.__remediate()
+        self.assertEqual([], self.__getFileNames(".prof"))
+
+
+if __name__ == "__main__":
+    unittest.main()
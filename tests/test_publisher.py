@@ -0,0 +1,123 @@
+# Copyright 2018 Politecnico di Torino
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Tests for the dashboard publishing.
+
+@author: Daniele Canavese
+"""
+
+import sys
+sys.path.append("..")
+
+import unittest
+from cybertop.cybertop import CyberTop
+from cybertop.delta import PolicyStore
+from cybertop.delta import DeltaReasoner
+from cybertop.outbox import Outbox
+from cybertop.publisher import DashboardPublisher
+from cybertop.publisher import PublishRejected
+from tests.fakebroker import FakeBroker
+from tests.test_cybertop import getTestFilePath
+
+
+class TestPublisher(unittest.TestCase):
+    """
+    Tests the dashboard publisher.
+    """
+
+    def setUp(self):
+        self.broker = FakeBroker()
+        self.publisher = DashboardPublisher("localhost", 5672, "dashboard", "policy", 1, 0, self.broker.connect)
+
+    def test_persistentConnection(self):
+        """
+        Tests that several messages share the same connection.
+        """
+        for i in range(10):
+            self.publisher.publish("message %d" % i)
+        self.assertEqual(1, len(self.broker.connections))
+        self.assertEqual(["dashboard"], self.broker.declaredExchanges)
+        self.assertEqual(10, len(self.broker.published))
+        self.assertTrue(self.publisher.isConnected())
+        self.publisher.close()
+        self.assertFalse(self.publisher.isConnected())
+
+    def test_reconnect(self):
+        """
+        Tests that a broken connection is re-opened.
+        """
+        self.publisher.publish("first")
+        self.broker.dropConnections()
+        self.publisher.publish("second")
+        self.assertEqual(2, len(self.broker.connections))
+        self.assertEqual(["first", "second"], self.broker.getBodies())
+
+    def test_failures(self):
+        """
+        Tests that undelivered messages are reported.
+        """
+        self.broker.up = False
+        self.assertRaises(IOError, self.publisher.publish, "lost")
+        self.broker.up = True
+        self.broker.nack = True
+        self.assertRaises(PublishRejected, self.publisher.publish, "rejected")
+        self.assertEqual([], self.broker.published)
+
+    def test_send(self):
+        """
+        Tests the remediation delivery, with and without deltas.
+        """
+        cyberTop = CyberTop(getTestFilePath("cybertop.cfg"), getTestFilePath("logging.ini"))
+        self.addCleanup(cyberTop.close)
+        cyberTop.publisher = self.publisher
+        [hspls, mspls] = cyberTop.getMSPLsFromFile(getTestFilePath("High-DoS-4.csv"), getTestFilePath("landscape2.xml"))
+
+        cyberTop.send(hspls, mspls)
+        self.assertEqual(1, len(self.broker.published))
+        self.assertIsNone(self.broker.published[0][3])
+
+        cyberTop.deltaReasoner = DeltaReasoner(cyberTop.configParser, PolicyStore())
+        cyberTop.send(hspls, mspls)
+        cyberTop.send(hspls, mspls)
+        self.assertEqual(2, len(self.broker.published))
+        self.assertEqual({"delta": "add"}, self.broker.published[1][3])
+        self.assertEqual(1, len(self.broker.connections))
+
+    def test_sendOutbox(self):
+        """
+        Tests that a delta queued in the outbox is recorded as pushed only once delivered.
+        """
+        cyberTop = CyberTop(getTestFilePath("cybertop.cfg"), getTestFilePath("logging.ini"))
+        self.addCleanup(cyberTop.close)
+        cyberTop.publisher = self.publisher
+        policyStore = PolicyStore()
+        cyberTop.deltaReasoner = DeltaReasoner(cyberTop.configParser, policyStore)
+        [hspls, mspls] = cyberTop.getMSPLsFromFile(getTestFilePath("High-DoS-4.csv"), getTestFilePath("landscape2.xml"))
+
+        self.broker.up = False
+        cyberTop.outbox = Outbox(self.publisher, 10, None, 0.05)
+        cyberTop.send(hspls, mspls)
+        cyberTop.outbox.close(0.2)
+        self.assertEqual(0, len(policyStore))
+
+        self.broker.up = True
+        cyberTop.outbox = Outbox(self.publisher, 10, None, 0.05)
+        cyberTop.send(hspls, mspls)
+        cyberTop.outbox.close()
+        self.assertEqual({"delta": "add"}, self.broker.published[0][3])
+        self.assertGreater(len(policyStore), 0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+# Copyright 2018 Politecnico di Torino
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Tests for the DNS query features and filters.
+
+@author: Daniele Canavese
+"""
+
+import sys
+sys.path.append("..")
+
+import datetime
+import os
+import tempfile
+import unittest
+from cybertop.attacks import AttackEvent
+from cybertop.plugins import getPluginManager
+from cybertop.queries import getComparison
+from cybertop.queries import getQueryFeatures
+
+
+class TestQueryFeatures(unittest.TestCase):
+    """
+    Tests the DNS query features.
+    """
+
+    def test_features(self):
+        """
+        Tests the features of a DNS query.
+        """
+        features = getQueryFeatures("d1eoo1tco6rr5e.cloudfront.net")
+        self.assertEqual(29, features.length)
+        self.assertEqual(4, features.digits)
+        self.assertEqual(3, features.labels)
+        self.assertEqual(14, features.longestLabel)
+        self.assertEqual("cloudfront.net", features.domain)
+        self.assertIs(features, getQueryFeatures("d1eoo1tco6rr5e.cloudfront.net"))
+
+    def test_entropy(self):
+        """
+        Tests the entropy of the DNS queries, even the empty ones.
+        """
+        self.assertEqual(0, getQueryFeatures("aaaa").entropy)
+        self.assertAlmostEqual(2, getQueryFeatures("abcd").entropy)
+        self.assertEqual(0, getQueryFeatures("").entropy)
+        self.assertEqual(0, getQueryFeatures("").labels)
+
+    def test_comparison(self):
+        """
+        Tests the parsing of the numeric filter values.
+        """
+        compare, number = getComparison("<=63")
+        self.assertTrue(compare(63, number))
+        self.assertFalse(compare(64, number))
+        compare, number = getComparison(">3.5")
+        self.assertEqual(3.5, number)
+        self.assertTrue(compare(3.6, number))
+        with self.assertRaises(ValueError):
+            getComparison("=>3")
+
+
+class TestQueryFilters(unittest.TestCase):
+    """
+    Tests the DNS query filter plug-ins.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        pluginManager = getPluginManager(os.path.join(self.directory.name, "plugins.json"))
+        self.filters = dict((i.details.get("Core", "Tag"), i.plugin_object)
+                            for i in pluginManager.getPluginsOfCategory("Filter"))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_filters(self):
+        """
+        Tests the DNS query filter plug-ins on an attack event.
+        """
+        event = AttackEvent(datetime.datetime.now(), "10.0.0.1:*", "0.0.0.0/0:53")
+        event.fields["queryFeatures"] = getQueryFeatures("zuxga0123456789.t1.olympiakara.com")
+        self.assertTrue(self.filters["query-length"].filter("==34", event))
+        self.assertTrue(self.filters["query-digits"].filter(">=10", event))
+        self.assertFalse(self.filters["query-labels"].filter("<4", event))
+        self.assertTrue(self.filters["query-label-length"].filter("==15", event))
+        self.assertTrue(self.filters["query-entropy"].filter(">3.5", event))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,137 @@
+# Copyright 2018 Politecnico di Torino
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Tests for the reasoning workers.
+
+@author: Daniele Canavese
+"""
+
+import sys
+sys.path.append("..")
+
+import threading
+import unittest
+from cybertop.cybertop import AttackInfo
+from cybertop.cybertop import CyberTop
+from cybertop.reasoning import ReasoningPool
+from tests.fakebroker import FakeConsumerChannel
+from tests.test_cybertop import getTestFilePath
+
+
+def getAttackInfo(cyberTop, fileName):
+    """
+    Creates the attack info of a DoS attack file.
+    @param cyberTop: The CyberTop instance.
+    @param fileName: The attack file name.
+    @return: The attack info.
+    """
+    attackInfo = AttackInfo(1, "high", "DoS", cyberTop.parser, cyberTop.recipesReasoner, cyberTop.hsplReasoner)
+    with open(getTestFilePath(fileName), "rt") as f:
+        for line in f:
+            attackInfo.addEvent(line.rstrip("\r\n").split("\t"))
+    return attackInfo
+
+
+class TestReasoningPool(unittest.TestCase):
+    """
+    Tests the reasoning in background.
+    """
+
+    def __reason(self, kind, landscapeFileName):
+        cyberTop = CyberTop(getTestFilePath("cybertop.cfg"), getTestFilePath("logging.ini"))
+        self.addCleanup(cyberTop.close)
+        pool = ReasoningPool(kind, 2, cyberTop.configParser, cyberTop.parser, cyberTop.recipesReasoner,
+                             cyberTop.hsplReasoner, cyberTop.msplReasoner)
+        results = []
+        errors = []
+        done = threading.Event()
+        attackInfo = getAttackInfo(cyberTop, "High-DoS-4.csv")
+
+        def onResult(r):
+            results.append(r)
+            done.set()
+
+        def onError(e):
+            errors.append(e)
+            done.set()
+
+        pool.submit(attackInfo.getAttack(), attackInfo.getTimestamp(), attackInfo.getBuilders(), landscapeFileName,
+                    onResult, onError)
+        self.assertTrue(done.wait(60))
+        pool.close()
+        self.assertEqual(0, pool.getActiveCount())
+        return cyberTop, results, errors
+
+    def __checkRemediation(self, kind):
+        landscapeFileName = getTestFilePath("landscape1.xml")
+        cyberTop, results, errors = self.__reason(kind, landscapeFileName)
+        self.assertEqual([], errors)
+        self.assertEqual(1, len(results))
+        cyberTop.policyCache = None
+        [hsplSet, msplSet] = cyberTop.getMSPLsFromAttackInfo(getAttackInfo(cyberTop, "High-DoS-4.csv"),
+                                                             landscapeFileName)
+        self.assertEqual(len(hsplSet), len(results[0][0]))
+        self.assertEqual(len(msplSet), len(results[0][1]))
+
+    def test_thread(self):
+        """
+        Tests the worker threads.
+        """
+        self.__checkRemediation(ReasoningPool.THREAD)
+
+    def test_process(self):
+        """
+        Tests the worker processes.
+        """
+        self.__checkRemediation(ReasoningPool.PROCESS)
+
+    def test_error(self):
+        """
+        Tests a failed reasoning.
+        """
+        _, results, errors = self.__reason(ReasoningPool.THREAD, getTestFilePath("missing.xml"))
+        self.assertEqual([], results)
+        self.assertEqual(1, len(errors))
+
+    def test_attack(self):
+        """
+        Tests the deferred acknowledgment of a stop message.
+        """
+        cyberTop = CyberTop(getTestFilePath("cybertop.cfg"), getTestFilePath("logging.ini"))
+        cyberTop.configParser.set("global", "landscapeFile", getTestFilePath("landscape1.xml"))
+        cyberTop.reasoningPool = ReasoningPool(ReasoningPool.THREAD, 2, cyberTop.configParser, cyberTop.parser,
+                                               cyberTop.recipesReasoner, cyberTop.hsplReasoner,
+                                               cyberTop.msplReasoner)
+        sent = []
+        cyberTop.send = lambda hsplSet, msplSet: sent.append((hsplSet, msplSet))
+        channel = FakeConsumerChannel()
+
+        messages = []
+        for identifier in range(3):
+            prefix = "%d,high,DoS," % identifier
+            messages.append((prefix + "start").encode())
+            with open(getTestFilePath("High-DoS-4.csv"), "rt") as f:
+                for line in f:
+                    messages.append((prefix + ",".join(line.rstrip("\r\n").split("\t"))).encode())
+            messages.append((prefix + "stop").encode())
+        for body in messages:
+            cyberTop.processMessage(channel, channel.deliver(), None, body)
+        cyberTop.close()
+
+        self.assertEqual(list(range(1, len(messages) + 1)), sorted(channel.acks))
+        self.assertEqual(3, len(sent))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,181 @@
+# Copyright 2018 Politecnico di Torino
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Tests for the registry of the attacks in progress.
+
+@author: Daniele Canavese
+"""
+
+import sys
+sys.path.append("..")
+
+import time
+import unittest
+from cybertop.cybertop import AttackInfo
+from cybertop.cybertop import CyberTop
+from cybertop.metrics import METRICS
+from cybertop.reasoning import ReasoningPool
+from cybertop.registry import AttackRegistry
+from cybertop.util import getHSPLNamespace
+from tests.test_cybertop import getTestFilePath
+
+
+class TestRegistry(unittest.TestCase):
+    """
+    Tests the attack registry.
+    """
+
+    def setUp(self):
+        self.cyberTop = CyberTop(getTestFilePath("cybertop.cfg"), getTestFilePath("logging.ini"))
+        self.addCleanup(self.cyberTop.close)
+        self.cyberTop.policyCache = None
+        self.events = []
+        with open(getTestFilePath("High-DoS-1.csv"), "rt") as f:
+            for line in f:
+                self.events.append(line.rstrip("\r\n").split("\t"))
+
+    def __getAttackInfo(self, identifier, severity="high"):
+        return AttackInfo(identifier, severity, "DoS", self.cyberTop.parser, self.cyberTop.recipesReasoner,
+                          self.cyberTop.hsplReasoner)
+
+    def __getHSPLs(self, hsplRecommendations):
+        return sorted((i.findtext("{%s}subject" % getHSPLNamespace()), i.findtext("{%s}object" % getHSPLNamespace()))
+                      for i in hsplRecommendations.iter("{%s}hspl" % getHSPLNamespace()))
+
+    def test_capacity(self):
+        """
+        Tests that the least recently active attack is evicted when the registry is full.
+        """
+        evicted = []
+        registry = AttackRegistry(2, 0, 0, None, lambda key, attackInfo: evicted.append(key))
+        registry["1"] = self.__getAttackInfo(1)
+        registry["2"] = self.__getAttackInfo(2)
+        registry.addEvent("1", self.events[1])
+        registry["3"] = self.__getAttackInfo(3)
+        self.assertEqual(["2"], evicted)
+        self.assertEqual(2, len(registry))
+        self.assertIn("1", registry)
+        self.assertNotIn("2", registry)
+        self.assertEqual(2, METRICS.get("cybertop_attacks_active"))
+
+    def test_idle(self):
+        """
+        Tests the eviction of the idle attacks.
+        """
+        evicted = []
+        registry = AttackRegistry(0, 0, 0.2, None, lambda key, attackInfo: evicted.append(key))
+        registry["1"] = self.__getAttackInfo(1)
+        registry["2"] = None
+        self.assertEqual(0, registry.expire())
+        time.sleep(0.3)
+        registry.addEvent("1", self.events[1])
+        self.assertEqual(1, registry.expire())
+        self.assertEqual([], evicted)
+        self.assertEqual(1, len(registry))
+        time.sleep(0.3)
+        self.assertEqual(1, registry.expire())
+        self.assertEqual(["1"], evicted)
+        self.assertEqual(0, len(registry))
+
+    def test_spill(self):
+        """
+        Tests that the spilled events produce the same remediation.
+        """
+        events = []
+        with open(getTestFilePath("Very high-DoS-4.csv"), "rt") as f:
+            for line in f:
+                events.append(line.rstrip("\r\n").split("\t"))
+        registry = AttackRegistry(0, 50, 0)
+        registry["1"] = self.__getAttackInfo(1, "very high")
+        for i in events:
+            registry.addEvent("1", i)
+        self.assertLessEqual(registry.getBufferedEvents(), 50)
+        self.assertGreater(METRICS.get("cybertop_attacks_spilled_events_total"), 0)
+        [hspls1, _] = self.cyberTop.getMSPLsFromAttackInfo(registry.pop("1"), getTestFilePath("landscape1.xml"))
+        self.assertEqual(0, registry.getBufferedEvents())
+
+        attackInfo = self.__getAttackInfo(1, "very high")
+        for i in events:
+            attackInfo.addEvent(i)
+        [hspls2, _] = self.cyberTop.getMSPLsFromAttackInfo(attackInfo, getTestFilePath("landscape1.xml"))
+        self.assertEqual(self.__getHSPLs(hspls2), self.__getHSPLs(hspls1))
+
+    def test_autoFinalize(self):
+        """
+        Tests the remediation of the evicted attacks.
+        """
+        self.cyberTop.configParser.set("global", "landscapeFile", getTestFilePath("landscape1.xml"))
+        sent = []
+        self.cyberTop.send = lambda hsplSet, msplSet: sent.append(hsplSet)
+        registry = AttackRegistry(1, 0, 0, None, self.cyberTop.finalizeAttack)
+        registry["1"] = self.__getAttackInfo(1)
+        for i in self.events:
+            registry.addEvent("1", i)
+        registry["2"] = self.__getAttackInfo(2)
+        self.assertEqual(1, len(sent))
+        self.assertGreater(len(sent[0]), 0)
+
+    def test_autoFinalizeThreads(self):
+        """
+        Tests the remediation of the evicted attacks with spilled events, reasoned on in background.
+        """
+        events = []
+        with open(getTestFilePath("Very high-DoS-4.csv"), "rt") as f:
+            for line in f:
+                events.append(line.rstrip("\r\n").split("\t"))
+        self.cyberTop.configParser.set("global", "landscapeFile", getTestFilePath("landscape1.xml"))
+        self.cyberTop.reasoningPool = ReasoningPool(ReasoningPool.THREAD, 2, self.cyberTop.configParser,
+                                                    self.cyberTop.parser, self.cyberTop.recipesReasoner,
+                                                    self.cyberTop.hsplReasoner, self.cyberTop.msplReasoner)
+        sent = []
+        self.cyberTop.send = lambda hsplSet, msplSet: sent.append(hsplSet)
+        registry = AttackRegistry(1, 50, 0, None, self.cyberTop.finalizeAttack)
+        registry["1"] = self.__getAttackInfo(1, "very high")
+        for i in events:
+            registry.addEvent("1", i)
+        registry["2"] = self.__getAttackInfo(2)
+        self.cyberTop.reasoningPool.close()
+        self.cyberTop.reasoningPool = None
+
+        attackInfo = self.__getAttackInfo(1, "very high")
+        for i in events:
+            attackInfo.addEvent(i)
+        [hspls, _] = self.cyberTop.getMSPLsFromAttackInfo(attackInfo, getTestFilePath("landscape1.xml"))
+        self.assertEqual(1, len(sent))
+        self.assertEqual(self.__getHSPLs(hspls), self.__getHSPLs(sent[0]))
+
+    def test_autoFinalizeHandle(self):
+        """
+        Tests that the attacks evicted by a start message are finalized by the caller finalization function.
+        """
+        self.cyberTop.configParser.set("global", "landscapeFile", getTestFilePath("landscape1.xml"))
+        sent = []
+        self.cyberTop.send = lambda hsplSet, msplSet: sent.append(hsplSet)
+        self.cyberTop.attacks = AttackRegistry(1, 0, 0, None, self.cyberTop.finalizeAttack)
+        finalized = []
+        messages = ["1,high,DoS,start"] + ["1,high,DoS," + ",".join(i) for i in self.events] + ["2,high,DoS,start"]
+        for i in messages:
+            self.cyberTop.handleMessage(i.encode(), lambda: None,
+                                        lambda key, attackInfo, done=None: finalized.append((attackInfo, done)))
+        self.assertEqual([], sent)
+        self.assertEqual(1, len(finalized))
+        self.assertIsNone(finalized[0][1])
+        self.cyberTop.finalizeAttack("1", finalized[0][0])
+        self.assertEqual(1, len(sent))
+        self.assertGreater(len(sent[0]), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
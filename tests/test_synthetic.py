@@ -0,0 +1,70 @@
+# Copyright 2018 Politecnico di Torino
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Tests for the synthetic attack generator.
+
+@author: Daniele Canavese
+"""
+
+import sys
+sys.path.append("..")
+
+import random
+import shutil
+import tempfile
+import unittest
+from configparser import ConfigParser
+from benchmarks.synthetic import AttackerPool
+from benchmarks.synthetic import ATTACK_TYPES
+from benchmarks.synthetic import getAttackFileName
+from benchmarks.synthetic import writeAttack
+from cybertop.reasoning import getReasoners
+from tests.test_cybertop import getTestFilePath
+
+
+class TestSynthetic(unittest.TestCase):
+    """
+    Tests the synthetic attacks.
+    """
+
+    def test_parse(self):
+        """
+        Tests that the synthetic attacks are read by the parser plug-ins.
+        """
+        configParser = ConfigParser()
+        configParser.read(getTestFilePath("cybertop.cfg"))
+        parser = getReasoners(configParser)[0]
+        directory = tempfile.mkdtemp()
+        try:
+            for i, attackType in enumerate(sorted(ATTACK_TYPES)):
+                fileName = getAttackFileName(directory, "High", attackType, i + 1)
+                writeAttack(fileName, attackType, 500, 50, "zipf", ports=3, tcpRatio=0.5, seed=i)
+                attack = parser.getAttackFromFile(fileName)
+                self.assertEqual(attackType, attack.type)
+                self.assertEqual(3, attack.severity)
+                self.assertEqual(500, len(attack.events))
+        finally:
+            shutil.rmtree(directory)
+
+    def test_clustered(self):
+        """
+        Tests the attackers clustered in /24 networks.
+        """
+        pool = AttackerPool(random.Random(0), 600, "clustered")
+        self.assertEqual(600, len(set(pool.addresses)))
+        self.assertEqual(3, len(set(i.rsplit(".", 1)[0] for i in pool.addresses)))
+
+if __name__ == "__main__":
+    unittest.main()
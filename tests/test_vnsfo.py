@@ -0,0 +1,202 @@
+# Copyright 2018 Politecnico di Torino
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Tests for the vNSFO client, against a local stub of the vNSFO API.
+
+@author: Daniele Canavese
+"""
+
+import sys
+sys.path.append("..")
+
+import http.server
+import json
+import socketserver
+import threading
+import time
+import unittest
+from cybertop.config import Settings
+from cybertop.cybertop import CyberTop
+from cybertop.metrics import METRICS
+from cybertop.util import getMSPLNamespace
+from cybertop.vnsfo import RUNNING_PATH
+from cybertop.vnsfo import VNSFOClient
+from tests.test_cybertop import getTestFilePath
+
+
+class StubServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    """
+    A stub of the vNSFO API, serving a running instances list and counting the requests.
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        http.server.HTTPServer.__init__(self, ("127.0.0.1", 0), StubHandler)
+        self.instances = [{"vnfd_id": "vnsf-filtering-dos_vnfd", "vnfr_id": "running-1"}]
+        self.requests = 0
+        self.delay = 0
+        self.thread = threading.Thread(target = self.serve_forever, daemon = True)
+        self.thread.start()
+
+    def getURL(self):
+        return "http://127.0.0.1:%d" % self.server_address[1]
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    """
+    The request handler of the vNSFO stub.
+    """
+
+    def do_GET(self):
+        self.server.requests += 1
+        time.sleep(self.server.delay)
+        if self.path != RUNNING_PATH:
+            self.send_error(404)
+            return
+        body = json.dumps({"vnsf": self.server.instances}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestVNSFOClient(unittest.TestCase):
+    """
+    Tests the vNSFO client.
+    """
+
+    def setUp(self):
+        self.server = StubServer()
+
+    def tearDown(self):
+        self.server.close()
+
+    def __waitRequests(self, requests):
+        for _ in range(100):
+            if self.server.requests >= requests:
+                return
+            time.sleep(0.02)
+
+    def test_lookup(self):
+        client = VNSFOClient(self.server.getURL(), 5, 60)
+        self.assertEqual("running-1", client.getRunningIdentifier("vNSF-filtering", "DoS"))
+        self.assertIsNone(client.getRunningIdentifier("vNSF-filtering", "Worm"))
+        self.assertEqual({"vNSF-filtering": "running-1", "vNSF-monitoring": None},
+                         client.getRunningIdentifiers(["vNSF-filtering", "vNSF-monitoring"], "DoS"))
+        self.assertEqual(1, self.server.requests)
+        client.close()
+
+    def test_concurrent(self):
+        self.server.delay = 0.2
+        client = VNSFOClient(self.server.getURL(), 5, 60)
+        results = []
+        threads = [threading.Thread(target = lambda: results.append(client.getRunningIdentifier("vNSF-filtering",
+                                                                                                "DoS")))
+                   for _ in range(8)]
+        for i in threads:
+            i.start()
+        for i in threads:
+            i.join()
+        self.assertEqual(["running-1"] * 8, results)
+        self.assertEqual(1, self.server.requests)
+        client.close()
+
+    def test_staleWhileRevalidate(self):
+        client = VNSFOClient(self.server.getURL(), 5, 0.1)
+        self.assertEqual("running-1", client.getRunningIdentifier("vNSF-filtering", "DoS"))
+        self.server.instances = [{"vnfd_id": "vnsf-filtering-dos_vnfd", "vnfr_id": "running-2"}]
+        self.server.delay = 0.2
+        time.sleep(0.15)
+        # The stale list is returned at once, while it is refreshed in background.
+        start = time.monotonic()
+        self.assertEqual("running-1", client.getRunningIdentifier("vNSF-filtering", "DoS"))
+        self.assertLess(time.monotonic() - start, 0.1)
+        self.__waitRequests(2)
+        time.sleep(0.3)
+        self.assertEqual("running-2", client.getRunningIdentifier("vNSF-filtering", "DoS"))
+        client.close()
+
+    def test_unreachable(self):
+        client = VNSFOClient(self.server.getURL(), 1, 0)
+        self.assertEqual("running-1", client.getRunningIdentifier("vNSF-filtering", "DoS"))
+        self.server.close()
+        # The last list is kept when the vNSFO goes away.
+        client.getRunningIdentifier("vNSF-filtering", "DoS")
+        time.sleep(0.2)
+        self.assertEqual("running-1", client.getRunningIdentifier("vNSF-filtering", "DoS"))
+        client.close()
+        self.assertIsNone(VNSFOClient(self.server.getURL(), 1, 0).getRunningIdentifier("vNSF-filtering", "DoS"))
+        self.server = StubServer()
+
+
+class TestVNSFOIntegration(unittest.TestCase):
+    """
+    Tests the running instances in the MSPLs.
+    """
+
+    def setUp(self):
+        self.server = StubServer()
+        self.cyberTop = CyberTop(getTestFilePath("cybertop.cfg"), getTestFilePath("logging.ini"))
+        self.cyberTop.configParser.set("vnsfo", "enable_vnsfo_api_call", "true")
+        self.cyberTop.configParser.set("vnsfo", "vnsfo_base_url", self.server.getURL())
+        self.cyberTop.configuration.update(Settings(self.cyberTop.configParser))
+
+    def tearDown(self):
+        self.cyberTop.close()
+        self.server.close()
+
+    def __getIdentifiers(self, fileName, landscapeFile):
+        [_, mspls] = self.cyberTop.getMSPLsFromFile(getTestFilePath(fileName), getTestFilePath(landscapeFile))
+        return sorted(i.attrib["id"] for i in mspls[0].findall("{%s}it-resource" % getMSPLNamespace()))
+
+    def test_running(self):
+        self.assertEqual(["running-1"], self.__getIdentifiers("Very low-DoS-5.csv", "landscape1.xml"))
+        self.assertEqual(["running-1"], self.__getIdentifiers("Very low-DoS-4.csv", "landscape1.xml"))
+        self.assertEqual(1, self.server.requests)
+
+    def test_policyCache(self):
+        self.__getIdentifiers("Very low-DoS-5.csv", "landscape1.xml")
+        self.__getIdentifiers("Very low-DoS-5.csv", "landscape1.xml")
+        self.assertEqual(0, self.cyberTop.policyCache.getHits())
+        self.assertEqual(0, self.cyberTop.policyCache.getMisses())
+
+    def test_stage(self):
+        """
+        Tests that the vNSFO stage is labelled with the attack type and severity.
+        """
+        METRICS.reset()
+        self.__getIdentifiers("Very low-DoS-5.csv", "landscape1.xml")
+        self.assertEqual(1, METRICS.getHistogram("cybertop_stage_seconds", stage="vnsfo", type="DoS",
+                                                 severity="1").count)
+
+    def test_shards(self):
+        self.server.instances = [{"vnfd_id": "vnsf-filtering-1-dos_vnfd", "vnfr_id": "running-1"},
+                                 {"vnfd_id": "vnsf-filtering-2-dos_vnfd", "vnfr_id": "running-2"}]
+        identifiers = self.__getIdentifiers("Very low-DoS-5.csv", "landscape3.xml")
+        self.assertIn("running-1", identifiers)
+        self.assertEqual(1, self.server.requests)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+# Copyright 2018 Politecnico di Torino
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Tests for the hot reload of the recipes, the landscape and the plug-ins.
+
+@author: Daniele Canavese
+"""
+
+import sys
+sys.path.append("..")
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from cybertop.cybertop import CyberTop
+from cybertop.metrics import METRICS
+from cybertop.watcher import ArtifactWatcher
+from tests.test_cybertop import getTestFilePath
+
+
+class TestArtifactWatcher(unittest.TestCase):
+    """
+    Tests the reload of the changed artifacts.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.landscapeFileName = os.path.join(self.directory.name, "landscape.xml")
+        shutil.copy(getTestFilePath("landscape1.xml"), self.landscapeFileName)
+        self.cyberTop = CyberTop(getTestFilePath("cybertop.cfg"), getTestFilePath("logging.ini"))
+        self.cyberTop.configParser.set("global", "landscapeFile", self.landscapeFileName)
+
+    def tearDown(self):
+        self.cyberTop.close()
+        self.directory.cleanup()
+
+    def __getWatcher(self, interval=0):
+        return ArtifactWatcher(self.cyberTop.configParser, self.cyberTop.parser, self.cyberTop.recipesReasoner,
+                               self.cyberTop.hsplReasoner, self.cyberTop.msplReasoner, interval)
+
+    def __editLandscape(self, fileName):
+        shutil.copy(fileName, self.landscapeFileName)
+        # The modification time could be unchanged on coarse file systems.
+        stat = os.stat(self.landscapeFileName)
+        os.utime(self.landscapeFileName, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+
+    def test_landscape(self):
+        watcher = self.__getWatcher()
+        self.assertEqual([], watcher.check())
+        self.assertEqual(1, watcher.generation)
+        reloads = METRICS.get("cybertop_artifact_reloads_total", artifact="landscape")
+        self.__editLandscape(getTestFilePath("landscape2.xml"))
+        self.assertEqual(["landscape"], watcher.check())
+        self.assertEqual(2, watcher.generation)
+        self.assertEqual(2, METRICS.get("cybertop_artifacts_generation"))
+        self.assertEqual(reloads + 1, METRICS.get("cybertop_artifact_reloads_total", artifact="landscape"))
+        # The reasoning finds the new landscape already parsed.
+        self.assertEqual({"vNSF-filtering": {"filtering.basic"}},
+                         self.cyberTop.parser.getLandscape(self.landscapeFileName))
+        self.assertEqual([], watcher.check())
+
+    def test_invalidLandscape(self):
+        watcher = self.__getWatcher()
+        with open(self.landscapeFileName, "w") as f:
+            f.write("<landscape")
+        self.assertEqual([], watcher.check())
+        self.__editLandscape(getTestFilePath("landscape2.xml"))
+        self.assertEqual(["landscape"], watcher.check())
+
+    def test_plugins(self):
+        watcher = self.__getWatcher()
+        pluginManager = self.cyberTop.parser.pluginManager
+        # A plug-in changed since the plug-ins were loaded.
+        pluginManager.stamps = dict(pluginManager.stamps, added=[0, 0])
+        self.assertEqual(["plugins"], watcher.check())
+        for i in (self.cyberTop.parser, self.cyberTop.recipesReasoner, self.cyberTop.hsplReasoner,
+                  self.cyberTop.msplReasoner):
+            self.assertIsNot(pluginManager, i.pluginManager)
+        self.assertIs(self.cyberTop.parser.pluginManager, self.cyberTop.msplReasoner.pluginManager)
+        self.assertEqual(len(pluginManager.getAllPlugins()), len(self.cyberTop.parser.pluginManager.getAllPlugins()))
+        r = self.cyberTop.getMSPLsFromFile(getTestFilePath("High-DoS-4.csv"), self.landscapeFileName)
+        self.assertIsNotNone(r)
+
+    def test_background(self):
+        watcher = self.__getWatcher(0.05)
+        try:
+            self.__editLandscape(getTestFilePath("landscape2.xml"))
+            deadline = time.time() + 5
+            while watcher.generation == 1 and time.time() < deadline:
+                time.sleep(0.05)
+            self.assertEqual(2, watcher.generation)
+        finally:
+            watcher.close()
+
+
+if __name__ == "__main__":
+    unittest.main()